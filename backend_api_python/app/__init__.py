@@ -4,6 +4,7 @@ QuantDinger Python API - Flask application factory.
 from flask import Flask
 from flask_cors import CORS
 import logging
+import threading
 import traceback
 
 from app.utils.logger import setup_logger, get_logger
@@ -19,6 +20,8 @@ _hama_scheduler = None
 _tv_cache_manager = None
 _tv_scheduler = None
 _hama_brave_monitor = None
+_backtest_job_manager = None
+_backtest_job_manager_lock = threading.Lock()
 
 
 def get_trading_executor():
@@ -39,6 +42,17 @@ def get_pending_order_worker():
     return _pending_order_worker
 
 
+def get_backtest_job_manager():
+    """Get the backtest job manager singleton (worker threads start on first submit)."""
+    global _backtest_job_manager
+    if _backtest_job_manager is None:
+        with _backtest_job_manager_lock:
+            if _backtest_job_manager is None:
+                from app.services.backtest_jobs import BacktestJobManager
+                _backtest_job_manager = BacktestJobManager()
+    return _backtest_job_manager
+
+
 def get_reflection_worker():
     """Get the reflection verification worker singleton."""
     global _reflection_worker
@@ -89,6 +103,15 @@ def start_pending_order_worker():
         logger.error(f"Failed to start pending order worker: {e}")
 
 
+def reconcile_backtest_jobs():
+    """Fail async backtest jobs left queued/running by a previous process (they would stay stuck forever)."""
+    try:
+        from app.services.backtest_jobs import reconcile_interrupted_jobs
+        reconcile_interrupted_jobs()
+    except Exception as e:
+        logger.error(f"Failed to reconcile backtest jobs: {e}")
+
+
 def restore_running_strategies():
     """
     Restore running strategies on startup.
@@ -556,6 +579,7 @@ def create_app(config_name='default'):
         # 6. 启动其他后台任务
         start_pending_order_worker()
         start_reflection_worker()
+        reconcile_backtest_jobs()
         restore_running_strategies()
 
         # 7. 启动截图缓存 Worker (已暂停)
@@ -3,6 +3,7 @@
 支持多种市场的K线数据获取
 """
 from app.data_sources.factory import DataSourceFactory
+from app.data_sources.kline_batch import KlineBatch
 
-__all__ = ['DataSourceFactory']
+__all__ = ['DataSourceFactory', 'KlineBatch']
 
@@ -3,9 +3,10 @@
 定义统一的数据源接口
 """
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
 from datetime import datetime, timedelta
 
+from app.data_sources.kline_batch import KlineBatch
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -36,7 +37,7 @@ class BaseDataSource(ABC):
         timeframe: str,
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """
         获取K线数据
         
@@ -47,8 +48,8 @@ class BaseDataSource(ABC):
             before_time: 获取此时间之前的数据（Unix时间戳，秒）
             
         Returns:
-            K线数据列表，格式:
-            [{"time": int, "open": float, "high": float, "low": float, "close": float, "volume": float}, ...]
+            KlineBatch（按时间升序），列: time(int 秒), open, high, low, close, volume；
+            下标取单根K线仍得到 {"time": int, "open": float, ...}
         """
         pass
 
@@ -102,38 +103,27 @@ class BaseDataSource(ABC):
     
     def filter_and_limit(
         self,
-        klines: List[Dict[str, Any]],
+        klines: Union[KlineBatch, List[Dict[str, Any]]],
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """
         过滤和限制K线数据
         
         Args:
-            klines: K线数据列表
+            klines: K线数据（KlineBatch 或 list-of-dict）
             limit: 最大数量
             before_time: 过滤此时间之后的数据
             
         Returns:
-            处理后的K线数据
+            处理后的K线数据（KlineBatch，按时间升序，保留最新的 limit 根）
         """
-        # 按时间排序
-        klines.sort(key=lambda x: x['time'])
-        
-        # 过滤时间
-        if before_time:
-            klines = [k for k in klines if k['time'] < before_time]
-        
-        # 限制数量（取最新的）
-        if len(klines) > limit:
-            klines = klines[-limit:]
-        
-        return klines
+        return KlineBatch.coerce(klines).filter_and_limit(limit, before_time)
     
     def log_result(
         self,
         symbol: str,
-        klines: List[Dict[str, Any]],
+        klines: Union[KlineBatch, List[Dict[str, Any]]],
         timeframe: str
     ):
         """记录获取结果日志"""
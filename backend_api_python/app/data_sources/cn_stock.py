@@ -12,6 +12,7 @@ import requests
 import yfinance as yf
 
 from app.data_sources.base import BaseDataSource
+from app.data_sources.kline_batch import KlineBatch
 from app.data_sources.us_stock import USStockDataSource
 from app.utils.logger import get_logger
 from app.utils.http import get_retry_session
@@ -197,7 +198,7 @@ class AShareDataSource(BaseDataSource, TencentDataMixin):
         timeframe: str,
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """Fetch A-Share Kline data."""
         klines = []
         
@@ -222,10 +223,10 @@ class AShareDataSource(BaseDataSource, TencentDataMixin):
         if HAS_AKSHARE and timeframe in self.AKSHARE_PERIOD_MAP:
             klines = self._fetch_akshare(symbol, timeframe, limit, before_time)
             if klines:
-                return klines
+                return KlineBatch.coerce(klines)
         
         logger.warning(f"AShare {symbol} data fetch failed")
-        return klines
+        return KlineBatch.coerce(klines)
     
     def _to_tencent_symbol(self, symbol: str) -> Optional[str]:
         """转换为腾讯财经格式"""
@@ -402,7 +403,7 @@ class HShareDataSource(BaseDataSource, TencentDataMixin):
         timeframe: str,
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """获取港股K线数据"""
         klines = []
         
@@ -438,14 +439,14 @@ class HShareDataSource(BaseDataSource, TencentDataMixin):
         if HAS_AKSHARE and timeframe in ('1D', '1W'):
             klines = self._fetch_akshare(symbol, timeframe, limit, before_time)
             if klines:
-                return klines
+                return KlineBatch.coerce(klines)
         
         # 分钟级数据获取失败提示
         if timeframe not in ('1D', '1W'):
             logger.warning(f"HK stock {symbol}: minute-level data is not supported (data source limitations)")
         else:
             logger.warning(f"HK stock {symbol}: data fetch failed (timeframe: {timeframe})")
-        return klines
+        return KlineBatch.coerce(klines)
     
     def _to_tencent_symbol(self, symbol: str) -> str:
         """转换为腾讯财经格式"""
@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 import ccxt
 
 from app.data_sources.base import BaseDataSource, TIMEFRAME_SECONDS
+from app.data_sources.kline_batch import KlineBatch
 from app.utils.logger import get_logger
 from app.config import CCXTConfig, APIKeys
 
@@ -71,9 +72,9 @@ class CryptoDataSource(BaseDataSource):
         timeframe: str,
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """获取加密货币K线数据"""
-        klines = []
+        klines = KlineBatch.empty()
         
         try:
             ccxt_timeframe = self.TIMEFRAME_MAP.get(timeframe, '1d')
@@ -98,20 +99,10 @@ class CryptoDataSource(BaseDataSource):
             
             if not ohlcv:
                 logger.warning(f"CCXT returned no K-lines: {symbol_pair}")
-                return []
+                return KlineBatch.empty()
             
-            # 转换数据格式
-            for candle in ohlcv:
-                if len(candle) < 6:
-                    continue
-                klines.append(self.format_kline(
-                    timestamp=int(candle[0] / 1000),  # 毫秒转秒
-                    open_price=candle[1],
-                    high=candle[2],
-                    low=candle[3],
-                    close=candle[4],
-                    volume=candle[5]
-                ))
+            # 转换数据格式（整批转为列数组，毫秒转秒）
+            klines = KlineBatch.from_ohlcv(ohlcv, time_unit='ms')
             
             # 过滤和限制
             klines = self.filter_and_limit(klines, limit, before_time)
@@ -5,6 +5,8 @@
 from typing import Dict, List, Any, Optional
 
 from app.data_sources.base import BaseDataSource
+from app.data_sources.kline_batch import KlineBatch
+from app.data_sources.kline_store import get_kline_store, kline_store_enabled
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -78,7 +80,7 @@ class DataSourceFactory:
         timeframe: str,
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """
         获取K线数据的便捷方法
         
@@ -90,17 +92,23 @@ class DataSourceFactory:
             before_time: 获取此时间之前的数据
             
         Returns:
-            K线数据列表
+            KlineBatch（按时间升序）；路由返回 JSON 时用 to_list()
         """
         try:
             source = cls.get_source(market)
-            klines = source.get_kline(symbol, timeframe, limit, before_time)
+            klines = None
+            if kline_store_enabled():
+                # 本地K线存储：已收盘K线从本地读取，只向上游拉取缺失的头尾部分
+                try:
+                    klines = get_kline_store().get_kline(source, market, symbol, timeframe, limit, before_time)
+                except Exception as e:
+                    logger.warning(f"Kline store failed for {market}:{symbol}:{timeframe}, fetching directly: {e}")
+            if klines is None:
+                klines = source.get_kline(symbol, timeframe, limit, before_time)
             
-            # 确保数据按时间排序
-            klines.sort(key=lambda x: x['time'])
-            
-            return klines
+            # 确保数据按时间排序（已有序时不复制）
+            return KlineBatch.coerce(klines).sorted()
         except Exception as e:
             logger.error(f"Failed to fetch K-lines {market}:{symbol} - {str(e)}")
-            return []
+            return KlineBatch.empty()
 
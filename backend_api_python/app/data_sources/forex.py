@@ -7,7 +7,10 @@ from datetime import datetime, timedelta
 import time
 import requests
 
+import numpy as np
+
 from app.data_sources.base import BaseDataSource, TIMEFRAME_SECONDS
+from app.data_sources.kline_batch import KlineBatch
 from app.utils.logger import get_logger
 from app.config import TiingoConfig, APIKeys
 
@@ -64,7 +67,7 @@ class ForexDataSource(BaseDataSource):
         timeframe: str,
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """
         获取外汇K线数据
         
@@ -78,7 +81,7 @@ class ForexDataSource(BaseDataSource):
         api_key = APIKeys.TIINGO_API_KEY
         if not api_key:
             logger.error("Tiingo API key is not configured")
-            return []
+            return KlineBatch.empty()
             
         try:
             # 1. 解析 Symbol
@@ -91,7 +94,7 @@ class ForexDataSource(BaseDataSource):
             resample_freq = self.TIMEFRAME_MAP.get(timeframe)
             if not resample_freq:
                 logger.warning(f"Tiingo does not support timeframe: {timeframe}")
-                return []
+                return KlineBatch.empty()
             
             # 3. 计算时间范围
             if before_time:
@@ -126,7 +129,7 @@ class ForexDataSource(BaseDataSource):
             
             if response.status_code == 403: # 具体的权限错误
                  logger.error("Tiingo API permission error (403): check whether your API key is valid and has access to this dataset.")
-                 return []
+                 return KlineBatch.empty()
                  
             response.raise_for_status()
             data = response.json()
@@ -148,9 +151,9 @@ class ForexDataSource(BaseDataSource):
             
             if not isinstance(data, list):
                 logger.warning(f"Tiingo response is not a list: {data}")
-                return []
+                return KlineBatch.empty()
                 
-            klines = []
+            times = []
             for item in data:
                 # 解析时间: "2023-01-01T00:00:00.000Z"
                 dt_str = item.get('date')
@@ -161,19 +164,19 @@ class ForexDataSource(BaseDataSource):
                     dt_str = dt_str[:-1]
                 
                 dt = datetime.fromisoformat(dt_str)
-                ts = int(dt.timestamp())
-                
-                klines.append({
-                    'time': ts,
-                    'open': float(item.get('open')),
-                    'high': float(item.get('high')),
-                    'low': float(item.get('low')),
-                    'close': float(item.get('close')),
-                    'volume': 0.0 # Tiingo FX 通常没有 volume
-                })
+                times.append(int(dt.timestamp()))
+            
+            klines = KlineBatch(
+                times,
+                [float(item.get('open')) for item in data],
+                [float(item.get('high')) for item in data],
+                [float(item.get('low')) for item in data],
+                [float(item.get('close')) for item in data],
+                np.zeros(len(data))  # Tiingo FX 通常没有 volume
+            )
             
             # 按时间排序
-            klines.sort(key=lambda x: x['time'])
+            klines = klines.sorted()
             
             # 过滤
             if len(klines) > limit:
@@ -184,7 +187,7 @@ class ForexDataSource(BaseDataSource):
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Tiingo API request failed: {e}")
-            return []
+            return KlineBatch.empty()
         except Exception as e:
             logger.error(f"Failed to process Tiingo data: {e}")
-            return []
+            return KlineBatch.empty()
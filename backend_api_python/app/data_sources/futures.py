@@ -10,6 +10,7 @@ import ccxt
 import yfinance as yf
 
 from app.data_sources.base import BaseDataSource, TIMEFRAME_SECONDS
+from app.data_sources.kline_batch import KlineBatch
 from app.utils.logger import get_logger
 from app.config import CCXTConfig, APIKeys
 
@@ -112,7 +113,7 @@ class FuturesDataSource(BaseDataSource):
         timeframe: str,
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """
         获取期货K线数据
         
@@ -134,7 +135,7 @@ class FuturesDataSource(BaseDataSource):
         timeframe: str,
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """使用yfinance获取传统期货数据"""
         try:
             # 转换symbol格式
@@ -166,21 +167,10 @@ class FuturesDataSource(BaseDataSource):
             
             if df.empty:
                 logger.warning(f"No data: {yf_symbol}")
-                return []
+                return KlineBatch.empty()
             
             # 转换格式
-            klines = []
-            for index, row in df.iterrows():
-                klines.append({
-                    'time': int(index.timestamp()),
-                    'open': float(row['Open']),
-                    'high': float(row['High']),
-                    'low': float(row['Low']),
-                    'close': float(row['Close']),
-                    'volume': float(row['Volume'])
-                })
-            
-            klines.sort(key=lambda x: x['time'])
+            klines = KlineBatch.from_dataframe(df).sorted()
             if len(klines) > limit:
                 klines = klines[-limit:]
             
@@ -189,7 +179,7 @@ class FuturesDataSource(BaseDataSource):
             
         except Exception as e:
             logger.error(f"Failed to fetch traditional futures data: {e}")
-            return []
+            return KlineBatch.empty()
     
     def _get_crypto_futures(
         self,
@@ -197,7 +187,7 @@ class FuturesDataSource(BaseDataSource):
         timeframe: str,
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """使用CCXT获取加密货币期货数据"""
         try:
             # 确保symbol格式正确
@@ -223,21 +213,12 @@ class FuturesDataSource(BaseDataSource):
                 )
             
             # 转换格式
-            klines = []
-            for candle in ohlcv:
-                klines.append({
-                    'time': int(candle[0] / 1000),
-                    'open': float(candle[1]),
-                    'high': float(candle[2]),
-                    'low': float(candle[3]),
-                    'close': float(candle[4]),
-                    'volume': float(candle[5])
-                })
+            klines = KlineBatch.from_ohlcv(ohlcv, time_unit='ms', round_values=False)
             
             # logger.info(f"获取到 {len(klines)} 条加密货币期货数据")
             return klines
             
         except Exception as e:
             logger.error(f"Failed to fetch crypto futures data: {e}")
-            return []
+            return KlineBatch.empty()
 
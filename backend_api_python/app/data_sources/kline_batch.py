@@ -0,0 +1,195 @@
+"""
+列式K线批次 KlineBatch
+
+数据源、K线存储、KlineService、回测与策略执行之间统一传递 KlineBatch，而不是每根K线一个 dict：
+- 六列 NumPy 数组（time 为 int64 秒级时间戳，其余为 float64）
+- to_dataframe() 直接以列数组构建 DataFrame，不逐行复制
+- to_list() / to_columns() 作为 JSON 适配层（路由响应、缓存）
+- 兼容旧的 list-of-dict 用法：len()、bool()、下标取单根K线得到 dict、切片得到 KlineBatch、迭代得到 dict
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+KLINE_COLUMNS = ('time', 'open', 'high', 'low', 'close', 'volume')
+_PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+
+
+class KlineBatch:
+    """列式K线数据（按列存储的 OHLCV）"""
+
+    __slots__ = KLINE_COLUMNS
+
+    def __init__(self, time, open, high, low, close, volume):
+        self.time = np.asarray(time, dtype=np.int64)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+
+    # ---- constructors ----
+
+    @classmethod
+    def empty(cls) -> 'KlineBatch':
+        return cls(*([np.empty(0)] * len(KLINE_COLUMNS)))
+
+    @classmethod
+    def from_arrays(cls, time, open, high, low, close, volume, round_values: bool = True) -> 'KlineBatch':
+        """
+        由列数组构建，round_values=True 时与 BaseDataSource.format_kline 的精度一致
+        （价格 4 位小数，成交量 2 位小数）。
+        """
+        batch = cls(time, open, high, low, close, volume)
+        if round_values:
+            for col in _PRICE_COLUMNS:
+                setattr(batch, col, np.round(getattr(batch, col), 4))
+            batch.volume = np.round(batch.volume, 2)
+        return batch
+
+    @classmethod
+    def from_ohlcv(cls, rows: Sequence[Sequence[Any]], time_unit: str = 'ms', round_values: bool = True) -> 'KlineBatch':
+        """由 CCXT 风格的 [[ts, o, h, l, c, v], ...] 构建；time_unit='ms' 时转换为秒。"""
+        rows = [r[:6] for r in rows if r is not None and len(r) >= 6]
+        if not rows:
+            return cls.empty()
+        arr = np.array(rows, dtype=np.float64)
+        ts = arr[:, 0]
+        if time_unit == 'ms':
+            ts = ts / 1000
+        return cls.from_arrays(
+            ts.astype(np.int64), arr[:, 1], arr[:, 2], arr[:, 3], arr[:, 4], arr[:, 5], round_values=round_values
+        )
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, round_values: bool = False) -> 'KlineBatch':
+        """
+        由 yfinance 风格的 DataFrame（DatetimeIndex + Open/High/Low/Close/Volume 列）构建，
+        naive 时间按 UTC 处理（与 Timestamp.timestamp() 一致）。
+        """
+        if df is None or df.empty:
+            return cls.empty()
+        times = pd.to_datetime(df.index, utc=True)
+        ts = (times - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+        return cls.from_arrays(
+            np.asarray(ts, dtype=np.int64),
+            df['Open'].to_numpy(dtype=np.float64),
+            df['High'].to_numpy(dtype=np.float64),
+            df['Low'].to_numpy(dtype=np.float64),
+            df['Close'].to_numpy(dtype=np.float64),
+            df['Volume'].to_numpy(dtype=np.float64),
+            round_values=round_values
+        )
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> 'KlineBatch':
+        """由旧格式 [{'time':..., 'open':...}, ...] 构建（数值保持原样）"""
+        records = list(records)
+        if not records:
+            return cls.empty()
+        return cls(*[[r.get(col) or 0 for r in records] for col in KLINE_COLUMNS])
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Sequence[Any]]) -> 'KlineBatch':
+        """to_columns() 的逆操作"""
+        if not columns:
+            return cls.empty()
+        return cls(*[columns.get(col) or [] for col in KLINE_COLUMNS])
+
+    @classmethod
+    def coerce(cls, klines: Union['KlineBatch', Iterable[Dict[str, Any]], None]) -> 'KlineBatch':
+        """KlineBatch 原样返回，list-of-dict 转换为 KlineBatch"""
+        if isinstance(klines, KlineBatch):
+            return klines
+        if not klines:
+            return cls.empty()
+        return cls.from_records(klines)
+
+    @classmethod
+    def concat(cls, batches: Iterable['KlineBatch']) -> 'KlineBatch':
+        batches = [b for b in batches if b is not None and len(b)]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+        return cls(*[np.concatenate([getattr(b, col) for b in batches]) for col in KLINE_COLUMNS])
+
+    # ---- transforms (return new batches; arrays are shared where possible) ----
+
+    def take(self, indexer) -> 'KlineBatch':
+        return KlineBatch(*[getattr(self, col)[indexer] for col in KLINE_COLUMNS])
+
+    def copy(self) -> 'KlineBatch':
+        return KlineBatch(*[getattr(self, col).copy() for col in KLINE_COLUMNS])
+
+    def sorted(self) -> 'KlineBatch':
+        """按时间升序（已有序时直接返回自身，不复制）"""
+        if len(self.time) < 2 or bool(np.all(self.time[1:] >= self.time[:-1])):
+            return self
+        return self.take(np.argsort(self.time, kind='stable'))
+
+    def before(self, before_time: Optional[int]) -> 'KlineBatch':
+        """保留 time < before_time 的K线（要求已按时间升序）"""
+        if not before_time or not len(self.time) or self.time[-1] < int(before_time):
+            return self
+        return self.take(self.time < int(before_time))
+
+    def since(self, start_time: int) -> 'KlineBatch':
+        """保留 time >= start_time 的K线（要求已按时间升序）"""
+        if not len(self.time) or self.time[0] >= int(start_time):
+            return self
+        return self.take(self.time >= int(start_time))
+
+    def filter_and_limit(self, limit: int, before_time: Optional[int] = None) -> 'KlineBatch':
+        """与 BaseDataSource.filter_and_limit 语义一致：排序、过滤 before_time、保留最新 limit 根"""
+        batch = self.sorted().before(before_time)
+        if limit and len(batch) > limit:
+            batch = batch[-limit:]
+        return batch
+
+    # ---- adapters ----
+
+    def to_dataframe(self, index: bool = True, utc: bool = False) -> pd.DataFrame:
+        """
+        转换为 DataFrame（列数组不复制）。
+
+        index=True 时以 time 转换出的 DatetimeIndex 为索引（utc=True 为 tz-aware UTC），
+        否则 time 作为普通列保留为秒级时间戳。
+        """
+        data = {col: getattr(self, col) for col in KLINE_COLUMNS[1:]}
+        if not index:
+            return pd.DataFrame({'time': self.time, **data}, copy=False)
+        idx = pd.DatetimeIndex(pd.to_datetime(self.time, unit='s', utc=utc), name='time')
+        return pd.DataFrame(data, index=idx, copy=False)
+
+    def to_columns(self) -> Dict[str, List[Any]]:
+        """列式 JSON 结构 {'time': [...], 'open': [...], ...}"""
+        return {col: getattr(self, col).tolist() for col in KLINE_COLUMNS}
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """旧格式 list-of-dict（用于 JSON 响应）"""
+        cols = [getattr(self, col).tolist() for col in KLINE_COLUMNS]
+        return [dict(zip(KLINE_COLUMNS, row)) for row in zip(*cols)]
+
+    # ---- list-of-dict compatibility ----
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def __bool__(self) -> bool:
+        return len(self.time) > 0
+
+    def __getitem__(self, item):
+        if isinstance(item, slice) or isinstance(item, np.ndarray):
+            return self.take(item)
+        i = int(item)
+        return {col: getattr(self, col)[i].item() for col in KLINE_COLUMNS}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.to_list())
+
+    def __repr__(self) -> str:
+        if not len(self):
+            return 'KlineBatch(0 bars)'
+        return f"KlineBatch({len(self)} bars, {int(self.time[0])}..{int(self.time[-1])})"
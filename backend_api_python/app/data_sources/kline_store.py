@@ -0,0 +1,339 @@
+"""
+本地K线存储（OHLCV candle store）
+
+DataSourceFactory.get_kline 的本地持久层：已收盘的K线按 (market, symbol, timeframe, time)
+存入独立的 SQLite 文件（默认 data/kline_store.db，WITHOUT ROWID 表按主键聚簇，区间查询即顺序读），
+并用 coverage 区间记录“这段时间内上游的K线已全部落盘”。
+
+请求 limit 根 before_time 之前的K线时：
+1. 尾部：覆盖区间末端到请求末端之间的缺口较小时，只向上游拉取缺口（增量补齐）；
+   没有可衔接的覆盖区间时，按原方式整段拉取一次并落盘。
+2. 头部：覆盖区间内K线不足 limit 根时，只向上游拉取更早的缺少部分。
+3. 组装：从本地读取已覆盖部分，未“稳定”的最新K线（默认最近 2 根）始终来自上游，不落盘。
+
+每根K线带 updated_at（仅在 OHLCV 实际变化时更新），data_version() 据此给出某区间的数据版本，
+回测结果缓存用它判断补缺口 / 上游修正是否改变了回测所用的数据。
+
+配置：
+- KLINE_STORE_ENABLED: 是否启用（默认 true）
+- KLINE_STORE_FILE: 存储文件路径（默认与主库同目录的 kline_store.db）
+- KLINE_STORE_SETTLE_BARS: 距当前时间多少根以内的K线视为未稳定（默认 2）
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.data_sources.base import BaseDataSource, TIMEFRAME_SECONDS
+from app.data_sources.kline_batch import KLINE_COLUMNS, KlineBatch
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DEFAULT_STORE_FILE = os.path.join(_BASE_DIR, 'data', 'kline_store.db')
+
+
+class KlineStore:
+    """本地K线存储 + 增量同步"""
+
+    def __init__(self, db_path: Optional[str] = None, settle_bars: Optional[int] = None):
+        self.db_path = db_path or (os.getenv('KLINE_STORE_FILE') or '').strip() or _DEFAULT_STORE_FILE
+        try:
+            self.settle_bars = max(1, int(settle_bars or os.getenv('KLINE_STORE_SETTLE_BARS', '2')))
+        except Exception:
+            self.settle_bars = 2
+        self._locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._initialized = False
+
+    # ---- public API ----
+
+    def get_kline(
+        self,
+        source: BaseDataSource,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        limit: int,
+        before_time: Optional[int] = None
+    ) -> KlineBatch:
+        """
+        与 BaseDataSource.get_kline 语义一致：返回 before_time 之前最新的 limit 根K线（按时间升序）。
+        """
+        limit = int(limit or 0)
+        if limit <= 0:
+            return KlineBatch.empty()
+        key = (market, symbol, timeframe)
+        with self._key_lock(key):
+            return self._get_kline_locked(source, key, limit, before_time)
+
+    def stats(self, market: str, symbol: str, timeframe: str) -> Dict[str, Any]:
+        """某个 (market, symbol, timeframe) 的本地存储概况"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MIN(time), MAX(time) FROM klines WHERE market = ? AND symbol = ? AND timeframe = ?",
+                (market, symbol, timeframe)
+            ).fetchone()
+            intervals = self._load_intervals(conn, (market, symbol, timeframe))
+        return {
+            'bars': row[0] or 0,
+            'firstTime': row[1],
+            'lastTime': row[2],
+            'coverage': [{'start': s, 'end': e, 'headComplete': bool(h)} for s, e, h in intervals],
+        }
+
+    def data_version(self, market: str, symbol: str, timeframe: str, start_time: int, end_time: int) -> Tuple[int, int]:
+        """
+        [start_time, end_time] 内已落盘K线的 (根数, 最近一次写入时间)。
+
+        补齐缺口会增加根数，上游修正已有K线会推进 updated_at；两者不变即本地数据未变。
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MAX(updated_at) FROM klines "
+                "WHERE market = ? AND symbol = ? AND timeframe = ? AND time >= ? AND time <= ?",
+                (market, symbol, timeframe, int(start_time), int(end_time))
+            ).fetchone()
+        return int(row[0] or 0), int(row[1] or 0)
+
+    # ---- sync logic ----
+
+    def _get_kline_locked(
+        self,
+        source: BaseDataSource,
+        key: Tuple[str, str, str],
+        limit: int,
+        before_time: Optional[int]
+    ) -> KlineBatch:
+        tf = TIMEFRAME_SECONDS.get(key[2], 86400)
+        now = int(time.time())
+        # 只有 settled 之前开盘的K线才视为已收盘且上游不会再修正，可以落盘
+        settled = now - self.settle_bars * tf
+        end = min(int(before_time), settled) if before_time else settled
+
+        fresh = KlineBatch.empty()  # 本次从上游拿到的数据（含未稳定K线）
+        fetched_tail = False
+
+        with self._connect() as conn:
+            intervals = self._load_intervals(conn, key)
+            current = self._find_covering(intervals, end)
+
+            # 1. 尾部：增量补齐或整段拉取
+            if current is None:
+                below = [iv for iv in intervals if iv[1] < end]
+                nearest = max(below, key=lambda iv: iv[1]) if below else None
+                gap_bars = math.ceil((end - nearest[1]) / tf) + self.settle_bars + 2 if nearest else None
+                if nearest is not None and gap_bars < limit:
+                    fresh = self._fetch_and_store(conn, source, key, gap_bars, before_time, end)
+                else:
+                    fresh = self._fetch_and_store(conn, source, key, limit, before_time, end)
+                fetched_tail = True
+                intervals = self._load_intervals(conn, key)
+                current = self._find_covering(intervals, end)
+
+            if current is None:
+                # 上游无数据或数据与已有区间不衔接且不足以形成覆盖：直接返回上游结果
+                return fresh.filter_and_limit(limit, before_time)
+
+            # 2. 头部：覆盖区间内不足 limit 根时向前补
+            start, _, head_complete = current
+            have = conn.execute(
+                "SELECT COUNT(*) FROM klines WHERE market = ? AND symbol = ? AND timeframe = ? AND time >= ? AND time < ?",
+                (*key, start, end)
+            ).fetchone()[0]
+            if have < limit and not head_complete:
+                need = limit - have + 1
+                head = self._fetch_and_store(conn, source, key, need, start, start)
+                if not head:
+                    self._mark_head_complete(conn, key, start)
+                intervals = self._load_intervals(conn, key)
+                current = self._find_covering(intervals, end) or current
+
+            # 3. 组装：本地已覆盖部分 + 未稳定的最新K线
+            rows = conn.execute(
+                """
+                SELECT time, open, high, low, close, volume FROM klines
+                WHERE market = ? AND symbol = ? AND timeframe = ? AND time >= ? AND time < ?
+                ORDER BY time DESC LIMIT ?
+                """,
+                (*key, current[0], end, limit)
+            ).fetchall()
+
+        stored = KlineBatch(*zip(*reversed(rows))) if rows else KlineBatch.empty()
+        if before_time is None or int(before_time) > end:
+            if not fetched_tail:
+                fresh = KlineBatch.coerce(
+                    source.get_kline(key[1], key[2], min(limit, self.settle_bars + 2), before_time)
+                ).sorted()
+            stored = KlineBatch.concat([stored, fresh.since(end)])
+        return stored.filter_and_limit(limit, before_time)
+
+    def _fetch_and_store(
+        self,
+        conn: sqlite3.Connection,
+        source: BaseDataSource,
+        key: Tuple[str, str, str],
+        limit: int,
+        before_time: Optional[int],
+        end: int
+    ) -> KlineBatch:
+        """
+        向上游拉取 before_time 之前的 limit 根K线，把 end 之前的部分落盘并登记覆盖区间。
+
+        覆盖区间为 [首根时间, end)；若上游恰好返回 limit 根（可能被截断），保守地只登记到最后一根K线。
+        """
+        klines = KlineBatch.coerce(source.get_kline(key[1], key[2], limit, before_time)).sorted()
+        if not klines:
+            return klines
+        closed = klines.before(end)
+        if closed:
+            now = time.time_ns() // 1000  # 微秒：同一秒内的多次修正也能区分
+            # 只有 OHLCV 实际变化时才改写并推进 updated_at（重复拉取同样的数据不会让结果缓存失效）
+            conn.executemany(
+                """
+                INSERT INTO klines (market, symbol, timeframe, time, open, high, low, close, volume, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(market, symbol, timeframe, time) DO UPDATE SET
+                    open = excluded.open, high = excluded.high, low = excluded.low,
+                    close = excluded.close, volume = excluded.volume, updated_at = excluded.updated_at
+                WHERE open IS NOT excluded.open OR high IS NOT excluded.high OR low IS NOT excluded.low
+                   OR close IS NOT excluded.close OR volume IS NOT excluded.volume
+                """,
+                [(*key, *row, now) for row in zip(*(getattr(closed, col).tolist() for col in KLINE_COLUMNS))]
+            )
+            tf = TIMEFRAME_SECONDS.get(key[2], 86400)
+            cover_end = end if len(klines) < limit else min(end, int(closed.time[-1]) + tf)
+            self._add_interval(conn, key, int(closed.time[0]), cover_end, head_complete=False)
+            conn.commit()
+        return klines
+
+    # ---- coverage intervals ----
+
+    def _load_intervals(self, conn: sqlite3.Connection, key: Tuple[str, str, str]) -> List[Tuple[int, int, int]]:
+        return [tuple(r) for r in conn.execute(
+            "SELECT start_time, end_time, head_complete FROM kline_coverage "
+            "WHERE market = ? AND symbol = ? AND timeframe = ? ORDER BY start_time",
+            key
+        ).fetchall()]
+
+    @staticmethod
+    def _find_covering(intervals: List[Tuple[int, int, int]], end: int) -> Optional[Tuple[int, int, int]]:
+        for iv in intervals:
+            if iv[0] < end <= iv[1]:
+                return iv
+        return None
+
+    def _add_interval(self, conn: sqlite3.Connection, key: Tuple[str, str, str], start: int, end: int, head_complete: bool) -> None:
+        """登记 [start, end) 并与重叠/相邻的区间合并"""
+        if end <= start:
+            return
+        overlapping = conn.execute(
+            "SELECT start_time, end_time, head_complete FROM kline_coverage "
+            "WHERE market = ? AND symbol = ? AND timeframe = ? AND start_time <= ? AND end_time >= ?",
+            (*key, end, start)
+        ).fetchall()
+        new_start, new_end, new_head = start, end, int(head_complete)
+        for s, e, h in overlapping:
+            if s < new_start:
+                new_start, new_head = s, h
+            elif s == new_start:
+                new_head = max(new_head, h)
+            new_end = max(new_end, e)
+        conn.execute(
+            "DELETE FROM kline_coverage WHERE market = ? AND symbol = ? AND timeframe = ? AND start_time <= ? AND end_time >= ?",
+            (*key, end, start)
+        )
+        conn.execute(
+            "INSERT INTO kline_coverage (market, symbol, timeframe, start_time, end_time, head_complete) VALUES (?, ?, ?, ?, ?, ?)",
+            (*key, new_start, new_end, new_head)
+        )
+
+    def _mark_head_complete(self, conn: sqlite3.Connection, key: Tuple[str, str, str], start: int) -> None:
+        """上游在 start 之前已无更多K线（如新上市品种、数据源历史长度上限）"""
+        conn.execute(
+            "UPDATE kline_coverage SET head_complete = 1 WHERE market = ? AND symbol = ? AND timeframe = ? AND start_time = ?",
+            (*key, start)
+        )
+        conn.commit()
+
+    # ---- infra ----
+
+    def _key_lock(self, key: Tuple[str, str, str]) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._locks[key] = lock
+            return lock
+
+    @contextmanager
+    def _connect(self):
+        if not self._initialized:
+            self._init_schema()
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_schema(self) -> None:
+        parent = os.path.dirname(self.db_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS klines (
+                market TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                time INTEGER NOT NULL, -- candle open time (seconds)
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                volume REAL,
+                updated_at INTEGER DEFAULT 0, -- last time OHLCV changed (microseconds)
+                PRIMARY KEY (market, symbol, timeframe, time)
+            ) WITHOUT ROWID
+            """)
+            columns = {r[1] for r in conn.execute("PRAGMA table_info(klines)").fetchall()}
+            if 'updated_at' not in columns:
+                conn.execute("ALTER TABLE klines ADD COLUMN updated_at INTEGER DEFAULT 0")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS kline_coverage (
+                market TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                start_time INTEGER NOT NULL, -- all upstream candles with start_time <= time < end_time are stored
+                end_time INTEGER NOT NULL,
+                head_complete INTEGER DEFAULT 0, -- upstream has no candles before start_time
+                PRIMARY KEY (market, symbol, timeframe, start_time)
+            )
+            """)
+            conn.commit()
+            self._initialized = True
+        finally:
+            conn.close()
+
+
+_kline_store: Optional[KlineStore] = None
+_kline_store_lock = threading.Lock()
+
+
+def kline_store_enabled() -> bool:
+    return os.getenv('KLINE_STORE_ENABLED', 'true').lower() == 'true'
+
+
+def get_kline_store() -> KlineStore:
+    global _kline_store
+    if _kline_store is None:
+        with _kline_store_lock:
+            if _kline_store is None:
+                _kline_store = KlineStore()
+    return _kline_store
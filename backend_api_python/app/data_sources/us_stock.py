@@ -5,9 +5,12 @@
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 
+import numpy as np
+import pandas as pd
 import yfinance as yf
 
 from app.data_sources.base import BaseDataSource
+from app.data_sources.kline_batch import KlineBatch
 from app.utils.logger import get_logger
 from app.config import APIKeys, YFinanceConfig
 
@@ -60,9 +63,9 @@ class USStockDataSource(BaseDataSource):
         timeframe: str,
         limit: int,
         before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """获取美股K线数据"""
-        klines = []
+        klines = KlineBatch.empty()
         
         try:
             interval = self.INTERVAL_MAP.get(timeframe, '1d')
@@ -125,9 +128,9 @@ class USStockDataSource(BaseDataSource):
         start_date: datetime,
         end_date: datetime,
         limit: int
-    ) -> List[Dict[str, Any]]:
+    ) -> KlineBatch:
         """使用 finnhub 获取日线数据"""
-        klines = []
+        klines = KlineBatch.empty()
         try:
             start_ts = int(start_date.timestamp())
             end_ts = int(end_date.timestamp())
@@ -136,24 +139,17 @@ class USStockDataSource(BaseDataSource):
             candles = self.finnhub_client.stock_candles(symbol, 'D', start_ts, end_ts)
             
             if candles and candles.get('s') == 'ok':
-                for i in range(len(candles['t'])):
-                    klines.append(self.format_kline(
-                        timestamp=candles['t'][i],
-                        open_price=candles['o'][i],
-                        high=candles['h'][i],
-                        low=candles['l'][i],
-                        close=candles['c'][i],
-                        volume=candles['v'][i]
-                    ))
+                klines = KlineBatch.from_arrays(
+                    candles['t'], candles['o'], candles['h'], candles['l'], candles['c'], candles['v']
+                )
                 # logger.info(f"Finnhub 返回 {len(klines)} 条数据")
         except Exception as e:
             logger.error(f"Finnhub fetch failed: {e}")
         
         return klines
     
-    def _convert_dataframe(self, df, limit: int) -> List[Dict[str, Any]]:
-        """转换 DataFrame 为K线列表"""
-        klines = []
+    def _convert_dataframe(self, df, limit: int) -> KlineBatch:
+        """转换 DataFrame 为 KlineBatch（整列转换，不逐行构造 dict）"""
         df = df.tail(limit).reset_index()
         
         # 确定时间列名（日线是 Date，分钟级是 Datetime）
@@ -167,7 +163,24 @@ class USStockDataSource(BaseDataSource):
         
         if time_col is None:
             logger.warning(f"Unable to determine time column; available columns: {df.columns.tolist()}")
-            return klines
+            return KlineBatch.empty()
+        
+        try:
+            # naive 时间按 UTC 处理，与 Timestamp.timestamp() 一致
+            times = pd.to_datetime(df[time_col], utc=True, errors='coerce')
+            valid = times.notna().to_numpy()
+            ts = ((times[valid] - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+            return KlineBatch.from_arrays(
+                ts,
+                df['Open'].to_numpy(dtype=np.float64)[valid],
+                df['High'].to_numpy(dtype=np.float64)[valid],
+                df['Low'].to_numpy(dtype=np.float64)[valid],
+                df['Close'].to_numpy(dtype=np.float64)[valid],
+                df['Volume'].to_numpy(dtype=np.float64)[valid]
+            )
+        except Exception as e:
+            logger.debug(f"Failed to convert yfinance DataFrame: {e}")
+            return KlineBatch.empty()
         
         for _, row in df.iterrows():
             try:
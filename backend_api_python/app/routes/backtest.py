@@ -1,14 +1,16 @@
 """
 Backtest API routes
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, stream_with_context, request, jsonify
 from datetime import datetime
+from queue import Empty
 import traceback
 import json
 import time
 import os
 
 from app.services.backtest import BacktestService
+from app.services.backtest_jobs import BacktestQueueFull, JOB_KIND_SWEEP, TERMINAL_STATUSES
 from app.utils.logger import get_logger
 from app.utils.db import get_db_connection
 import requests
@@ -82,6 +84,96 @@ def _normalize_lang(lang: str | None) -> str:
     return l2 if l2 in supported else "zh-CN"
 
 
+def _parse_backtest_request(data: dict) -> dict:
+    """
+    Parse and validate common backtest request params.
+
+    Raises:
+        ValueError: missing params or date range exceeds the timeframe limit.
+    """
+    user_id = int(data.get('userid') or data.get('userId') or 1)
+    indicator_code = data.get('indicatorCode', '')
+    indicator_id = data.get('indicatorId')
+    symbol = data.get('symbol', '')
+    market = data.get('market', '')
+    timeframe = data.get('timeframe', '1D')
+    start_date_str = data.get('startDate', '')
+    end_date_str = data.get('endDate', '')
+
+    # If frontend only provides indicatorId, load code from local DB.
+    if (not indicator_code or not str(indicator_code).strip()) and indicator_id:
+        try:
+            iid = int(indicator_id)
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute("SELECT code FROM qd_indicator_codes WHERE id = ?", (iid,))
+                row = cur.fetchone()
+                cur.close()
+            if row and row.get('code'):
+                indicator_code = row.get('code')
+        except Exception:
+            pass
+
+    # 参数验证
+    if not all([indicator_code, symbol, market, timeframe, start_date_str, end_date_str]):
+        raise ValueError('Missing required parameters')
+
+    # 开始日期：当天的 00:00:00；结束日期：当天的 23:59:59，确保包含整天的数据
+    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+
+    # 根据周期设置不同的时间范围限制
+    days_diff = (end_date - start_date).days
+    if timeframe == '1m':
+        max_days = 30  # 1分钟K线最多1个月
+        max_range_text = '1 month'
+    elif timeframe == '5m':
+        max_days = 180  # 5分钟K线最多6个月
+        max_range_text = '6 months'
+    elif timeframe in ['15m', '30m']:
+        max_days = 365  # 15分钟和30分钟K线最多1年
+        max_range_text = '1 year'
+    else:  # 1H, 4H, 1D, 1W
+        max_days = 1095  # 1小时及以上最多3年
+        max_range_text = '3 years'
+
+    if days_diff > max_days:
+        raise ValueError(
+            f'Backtest range exceeds limit: timeframe {timeframe} supports up to {max_range_text} '
+            f'({max_days} days), but you selected {days_diff} days'
+        )
+
+    return {
+        'user_id': user_id,
+        'indicator_id': indicator_id,
+        'indicator_code': indicator_code,
+        'market': market,
+        'symbol': symbol,
+        'timeframe': timeframe,
+        'start_date_str': start_date_str,
+        'end_date_str': end_date_str,
+        'start_date': start_date,
+        'end_date': end_date,
+        'initial_capital': float(data.get('initialCapital', 10000)),
+        'commission': float(data.get('commission', 0.001)),
+        'slippage': float(data.get('slippage', 0.0)),
+        'leverage': int(data.get('leverage', 1)),
+        'trade_direction': data.get('tradeDirection', 'long'),  # long, short, both
+        'strategy_config': data.get('strategyConfig') or {},
+        # useCache=false 绕过结果缓存强制重算
+        'use_cache': str(data.get('useCache', True)).lower() not in ('false', '0', 'no'),
+    }
+
+
+def _service_kwargs(params: dict) -> dict:
+    """Map parsed request params to BacktestService.run keyword arguments."""
+    keys = [
+        'indicator_code', 'market', 'symbol', 'timeframe', 'start_date', 'end_date',
+        'initial_capital', 'commission', 'slippage', 'leverage', 'trade_direction', 'strategy_config'
+    ]
+    return {k: params[k] for k in keys}
+
+
 @backtest_bp.route('/backtest', methods=['POST'])
 def run_backtest():
     """
@@ -107,92 +199,25 @@ def run_backtest():
                 'data': None
             }), 400
         
-        # Extract params
-        user_id = int(data.get('userid') or data.get('userId') or 1)
-        indicator_code = data.get('indicatorCode', '')
-        indicator_id = data.get('indicatorId')
-        symbol = data.get('symbol', '')
-        market = data.get('market', '')
-        timeframe = data.get('timeframe', '1D')
-        start_date_str = data.get('startDate', '')
-        end_date_str = data.get('endDate', '')
-        initial_capital = float(data.get('initialCapital', 10000))
-        commission = float(data.get('commission', 0.001))
-        slippage = float(data.get('slippage', 0.0))
-        leverage = int(data.get('leverage', 1))
-        trade_direction = data.get('tradeDirection', 'long')  # long, short, both
-        strategy_config = data.get('strategyConfig') or {}
-        
-        # (Debug) log received params if needed
-        
-        # If frontend only provides indicatorId, load code from local DB.
-        if (not indicator_code or not str(indicator_code).strip()) and indicator_id:
-            try:
-                iid = int(indicator_id)
-                with get_db_connection() as db:
-                    cur = db.cursor()
-                    cur.execute("SELECT code FROM qd_indicator_codes WHERE id = ?", (iid,))
-                    row = cur.fetchone()
-                    cur.close()
-                if row and row.get('code'):
-                    indicator_code = row.get('code')
-            except Exception:
-                pass
+        params = _parse_backtest_request(data)
+        user_id = params['user_id']
+        indicator_id = params['indicator_id']
+        market = params['market']
+        symbol = params['symbol']
+        timeframe = params['timeframe']
+        start_date_str = params['start_date_str']
+        end_date_str = params['end_date_str']
+        initial_capital = params['initial_capital']
+        commission = params['commission']
+        slippage = params['slippage']
+        leverage = params['leverage']
+        trade_direction = params['trade_direction']
+        strategy_config = params['strategy_config']
 
-        # 参数验证
-        if not all([indicator_code, symbol, market, timeframe, start_date_str, end_date_str]):
-            return jsonify({
-                'code': 0,
-                'msg': 'Missing required parameters',
-                'data': None
-            }), 400
-        
-        # 转换日期
-        # 开始日期：当天的 00:00:00
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        # 结束日期：当天的 23:59:59，确保包含整天的数据
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-        
-        # 验证时间范围限制
-        days_diff = (end_date - start_date).days
-        
-        # 根据周期设置不同的时间限制
-        if timeframe == '1m':
-            max_days = 30  # 1分钟K线最多1个月
-            max_range_text = '1 month'
-        elif timeframe == '5m':
-            max_days = 180  # 5分钟K线最多6个月
-            max_range_text = '6 months'
-        elif timeframe in ['15m', '30m']:
-            max_days = 365  # 15分钟和30分钟K线最多1年
-            max_range_text = '1 year'
-        else:  # 1H, 4H, 1D, 1W
-            max_days = 1095  # 1小时及以上最多3年
-            max_range_text = '3 years'
-        
-        if days_diff > max_days:
-            return jsonify({
-                'code': 0,
-                'msg': f'Backtest range exceeds limit: timeframe {timeframe} supports up to {max_range_text} ({max_days} days), but you selected {days_diff} days',
-                'data': None
-            }), 400
-        
-        
         # 执行回测
-        result = backtest_service.run(
-            indicator_code=indicator_code,
-            market=market,
-            symbol=symbol,
-            timeframe=timeframe,
-            start_date=start_date,
-            end_date=end_date,
-            initial_capital=initial_capital,
-            commission=commission,
-            slippage=slippage,
-            leverage=leverage,
-            trade_direction=trade_direction,
-            strategy_config=strategy_config
-        )
+        # 缓存键在运行前确定（含K线数据版本），结果缓存与落库使用同一个键
+        cache_key = backtest_service.result_cache_key(**_service_kwargs(params))
+        result = backtest_service.run(use_cache=params['use_cache'], cache_key=cache_key, **_service_kwargs(params))
 
         # Persist backtest run for AI optimization / history
         run_id = None
@@ -205,8 +230,8 @@ def run_backtest():
                     INSERT INTO qd_backtest_runs
                     (user_id, indicator_id, market, symbol, timeframe, start_date, end_date,
                      initial_capital, commission, slippage, leverage, trade_direction,
-                     strategy_config, status, error_message, result_json, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     strategy_config, status, error_message, result_json, cache_key, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     """,
                     (
                         user_id,
@@ -225,6 +250,7 @@ def run_backtest():
                         'success',
                         '',
                         json.dumps(result or {}, ensure_ascii=False),
+                        cache_key,
                         now_ts
                     )
                 )
@@ -301,6 +327,219 @@ def run_backtest():
         }), 500
 
 
+@backtest_bp.route('/backtest/sweep', methods=['POST'])
+def run_backtest_sweep():
+    """
+    Parameter-sweep backtest: fetch klines and run the indicator once, then simulate
+    every strategyConfig combination of paramGrid in a process pool.
+
+    Runs as an asynchronous job (a sweep easily outlives the request timeout). Returns a jobId;
+    poll /backtest/jobs/<jobId> or subscribe to /backtest/jobs/<jobId>/events for progress
+    (barsProcessed/barsTotal count parameter combinations) and the ranked result, and cancel
+    via /backtest/jobs/<jobId>/cancel.
+
+    Params:
+        (same as /backtest)
+        paramGrid: dict, dotted strategyConfig path -> list of values (required), e.g.
+            {"risk.stopLossPct": [0.02, 0.05], "scale.trendAdd.stepPct": [0.01, 0.02]}
+        sortBy: Ranking metric (default totalReturn)
+        topN: Number of ranked rows to return (default 50, max 1000)
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'code': 0,
+                'msg': 'Request body is required',
+                'data': None
+            }), 400
+
+        params = _parse_backtest_request(data)
+        param_grid = data.get('paramGrid') or {}
+        sort_by = str(data.get('sortBy') or 'totalReturn')
+        combos = backtest_service.validate_sweep(param_grid, sort_by)
+        params.update({
+            'kind': JOB_KIND_SWEEP,
+            'param_grid': param_grid,
+            'sort_by': sort_by,
+            'top_n': max(1, min(int(data.get('topN') or 50), 1000)),
+        })
+
+        from app import get_backtest_job_manager
+        job = get_backtest_job_manager().submit(params)
+        return jsonify({
+            'code': 1,
+            'msg': 'Sweep job submitted',
+            'data': {
+                'jobId': job.job_id,
+                'runId': job.job_id,
+                'status': job.status,
+                'combinations': len(combos)
+            }
+        })
+
+    except BacktestQueueFull as e:
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 429
+    except ValueError as e:
+        logger.warning(f"Invalid sweep parameters: {str(e)}")
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 400
+    except Exception as e:
+        logger.error(f"Submit backtest sweep failed: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'code': 0, 'msg': f'Submit backtest sweep failed: {str(e)}', 'data': None}), 500
+
+
+@backtest_bp.route('/backtest/jobs', methods=['POST'])
+def submit_backtest_job():
+    """
+    Submit a backtest as an asynchronous job (same params as /backtest).
+
+    Returns immediately with a jobId (= qd_backtest_runs.id). Poll /backtest/jobs/<jobId>
+    or subscribe to /backtest/jobs/<jobId>/events (SSE) for progress and the final result.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'code': 0,
+                'msg': 'Request body is required',
+                'data': None
+            }), 400
+
+        params = _parse_backtest_request(data)
+        from app import get_backtest_job_manager
+        job = get_backtest_job_manager().submit(params)
+        return jsonify({
+            'code': 1,
+            'msg': 'Backtest job submitted',
+            'data': {
+                'jobId': job.job_id,
+                'runId': job.job_id,
+                'status': job.status
+            }
+        })
+
+    except BacktestQueueFull as e:
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 429
+    except ValueError as e:
+        logger.warning(f"Invalid backtest parameters: {str(e)}")
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 400
+    except Exception as e:
+        logger.error(f"Submit backtest job failed: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'code': 0, 'msg': f'Submit backtest job failed: {str(e)}', 'data': None}), 500
+
+
+@backtest_bp.route('/backtest/jobs/<int:job_id>', methods=['GET'])
+def get_backtest_job(job_id: int):
+    """
+    Get job status and progress. The result is included once the job succeeded.
+    """
+    try:
+        from app import get_backtest_job_manager
+        status = get_backtest_job_manager().get_status(job_id, include_result=True)
+        if status is None:
+            return jsonify({'code': 0, 'msg': 'Backtest job not found', 'data': None}), 404
+        return jsonify({'code': 1, 'msg': 'success', 'data': status})
+    except Exception as e:
+        logger.error(f"Get backtest job failed: {str(e)}")
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 500
+
+
+@backtest_bp.route('/backtest/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_backtest_job(job_id: int):
+    """Cancel a queued or running job."""
+    try:
+        from app import get_backtest_job_manager
+        manager = get_backtest_job_manager()
+        if not manager.cancel(job_id):
+            status = manager.get_status(job_id)
+            if status is None:
+                return jsonify({'code': 0, 'msg': 'Backtest job not found', 'data': None}), 404
+            return jsonify({
+                'code': 0,
+                'msg': f"Backtest job cannot be cancelled (status: {status.get('status')})",
+                'data': status
+            }), 409
+        return jsonify({'code': 1, 'msg': 'Cancel requested', 'data': manager.get_status(job_id)})
+    except Exception as e:
+        logger.error(f"Cancel backtest job failed: {str(e)}")
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 500
+
+
+@backtest_bp.route('/backtest/jobs/<int:job_id>/events')
+def backtest_job_events(job_id: int):
+    """
+    SSE progress stream for a backtest job.
+
+    Events:
+        status:    current snapshot (sent on connect and when the job starts running)
+        progress:  {stage, barsProcessed, barsTotal, progress, trades, ...}
+        done:      final snapshot (status success/failed/cancelled); the stream closes after it
+        heartbeat: keep-alive
+    """
+    from app import get_backtest_job_manager
+    manager = get_backtest_job_manager()
+
+    def event_stream():
+        client_queue = manager.subscribe(job_id)
+        try:
+            # Subscribe first, then send the snapshot, so no transition is missed in between.
+            snapshot = manager.get_status(job_id)
+            if snapshot is None:
+                yield f"event: error\ndata: {json.dumps({'message': 'Backtest job not found'})}\n\n"
+                return
+            if client_queue is None or snapshot.get('status') in TERMINAL_STATUSES:
+                # Finished, or owned by another process: only the persisted status is available.
+                yield f"event: done\ndata: {json.dumps(snapshot)}\n\n"
+                return
+            yield f"event: status\ndata: {json.dumps(snapshot)}\n\n"
+
+            while True:
+                try:
+                    event, payload = client_queue.get(timeout=15)
+                except Empty:
+                    yield f"event: heartbeat\ndata: {json.dumps({'timestamp': time.time()})}\n\n"
+                    continue
+
+                # Progress ticks can outpace a slow client: only forward the latest one.
+                if event == 'progress':
+                    try:
+                        while True:
+                            nxt = client_queue.get_nowait()
+                            event, payload = nxt
+                            if event != 'progress':
+                                break
+                    except Empty:
+                        pass
+
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+                if event == 'done':
+                    return
+        except GeneratorExit:
+            logger.info(f"Backtest job {job_id} SSE client disconnected")
+        finally:
+            if client_queue is not None:
+                manager.unsubscribe(job_id, client_queue)
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 禁用 Nginx 缓冲
+            "Connection": "keep-alive"
+        }
+    )
+
+
+@backtest_bp.route('/backtest/cache/stats', methods=['GET'])
+def get_backtest_cache_stats():
+    """Backtest result cache statistics (entries, bytes, hit ratio)."""
+    from app.services.backtest_cache import get_backtest_result_cache
+    return jsonify({'code': 1, 'msg': 'success', 'data': get_backtest_result_cache().stats()})
+
+
 @backtest_bp.route('/backtest/history', methods=['POST'])
 def get_backtest_history():
     """
@@ -103,9 +103,30 @@ def _calc_pnl_percent(entry_price: float, size: float, pnl: float, leverage: flo
         return 0.0
 
 
-def _compute_performance_stats(trades: List[Dict[str, Any]]) -> Dict[str, Any]:
+def _empty_performance_stats() -> Dict[str, Any]:
+    return {
+        "total_trades": 0,
+        "winning_trades": 0,
+        "losing_trades": 0,
+        "win_rate": 0.0,
+        "total_profit": 0.0,
+        "total_loss": 0.0,
+        "profit_factor": 0.0,
+        "avg_win": 0.0,
+        "avg_loss": 0.0,
+        "avg_trade": 0.0,
+        "max_win": 0.0,
+        "max_loss": 0.0,
+        "max_drawdown": 0.0,
+        "max_drawdown_pct": 0.0,
+        "best_day": 0.0,
+        "worst_day": 0.0,
+    }
+
+
+def _compute_performance_stats(agg: Dict[str, Any], day_to_profit: Dict[str, float]) -> Dict[str, Any]:
     """
-    Compute performance statistics from trade history.
+    Compute performance statistics from a qd_pnl_strategy aggregate row (full trade history).
     Returns: {
         total_trades, winning_trades, losing_trades, win_rate,
         total_profit, total_loss, profit_factor,
@@ -113,76 +134,30 @@ def _compute_performance_stats(trades: List[Dict[str, Any]]) -> Dict[str, Any]:
         max_win, max_loss, max_drawdown, max_drawdown_pct
     }
     """
-    total_trades = len(trades)
-    if total_trades == 0:
-        return {
-            "total_trades": 0,
-            "winning_trades": 0,
-            "losing_trades": 0,
-            "win_rate": 0.0,
-            "total_profit": 0.0,
-            "total_loss": 0.0,
-            "profit_factor": 0.0,
-            "avg_win": 0.0,
-            "avg_loss": 0.0,
-            "avg_trade": 0.0,
-            "max_win": 0.0,
-            "max_loss": 0.0,
-            "max_drawdown": 0.0,
-            "max_drawdown_pct": 0.0,
-            "best_day": 0.0,
-            "worst_day": 0.0,
-        }
-
-    profits = [_safe_float(t.get("profit"), 0.0) for t in trades]
-    wins = [p for p in profits if p > 0]
-    losses = [p for p in profits if p < 0]
-
-    winning_trades = len(wins)
-    losing_trades = len(losses)
-    win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0.0
-
-    total_profit = sum(wins) if wins else 0.0
-    total_loss = abs(sum(losses)) if losses else 0.0
+    total_trades = _safe_int((agg or {}).get("trades"), 0)
+    if total_trades <= 0:
+        return _empty_performance_stats()
+
+    winning_trades = _safe_int(agg.get("wins"), 0)
+    losing_trades = _safe_int(agg.get("losses"), 0)
+    win_rate = winning_trades / total_trades * 100
+
+    total_profit = _safe_float(agg.get("gross_profit"), 0.0)
+    total_loss = _safe_float(agg.get("gross_loss"), 0.0)
     profit_factor = (total_profit / total_loss) if total_loss > 0 else (total_profit if total_profit > 0 else 0.0)
 
     avg_win = (total_profit / winning_trades) if winning_trades > 0 else 0.0
     avg_loss = (total_loss / losing_trades) if losing_trades > 0 else 0.0
-    avg_trade = sum(profits) / total_trades if total_trades > 0 else 0.0
-
-    max_win = max(profits) if profits else 0.0
-    max_loss = min(profits) if profits else 0.0
-
-    # Calculate max drawdown from cumulative equity
-    cumulative = []
-    acc = 0.0
-    for p in profits:
-        acc += p
-        cumulative.append(acc)
-
-    peak = 0.0
-    max_drawdown = 0.0
-    for val in cumulative:
-        if val > peak:
-            peak = val
-        dd = peak - val
-        if dd > max_drawdown:
-            max_drawdown = dd
+    avg_trade = _safe_float(agg.get("pnl"), 0.0) / total_trades
 
+    # Drawdown state is maintained per trade (cumulative pnl vs. running peak starting at 0)
+    max_drawdown = _safe_float(agg.get("max_drawdown"), 0.0)
+    peak = _safe_float(agg.get("equity_peak"), 0.0)
     max_drawdown_pct = (max_drawdown / peak * 100) if peak > 0 else 0.0
 
     # Best/worst day
-    day_profits: Dict[str, float] = {}
-    for t in trades:
-        ts = _safe_int(t.get("created_at"), 0)
-        if ts <= 0:
-            continue
-        day = time.strftime("%Y-%m-%d", time.localtime(ts))
-        profit = _safe_float(t.get("profit"), 0.0)
-        day_profits[day] = day_profits.get(day, 0.0) + profit
-
-    best_day = max(day_profits.values()) if day_profits else 0.0
-    worst_day = min(day_profits.values()) if day_profits else 0.0
+    best_day = max(day_to_profit.values()) if day_to_profit else 0.0
+    worst_day = min(day_to_profit.values()) if day_to_profit else 0.0
 
     return {
         "total_trades": total_trades,
@@ -195,8 +170,8 @@ def _compute_performance_stats(trades: List[Dict[str, Any]]) -> Dict[str, Any]:
         "avg_win": round(avg_win, 2),
         "avg_loss": round(avg_loss, 2),
         "avg_trade": round(avg_trade, 2),
-        "max_win": round(max_win, 2),
-        "max_loss": round(max_loss, 2),
+        "max_win": round(_safe_float(agg.get("max_win"), 0.0), 2),
+        "max_loss": round(_safe_float(agg.get("max_loss"), 0.0), 2),
         "max_drawdown": round(max_drawdown, 2),
         "max_drawdown_pct": round(max_drawdown_pct, 2),
         "best_day": round(best_day, 2),
@@ -204,43 +179,25 @@ def _compute_performance_stats(trades: List[Dict[str, Any]]) -> Dict[str, Any]:
     }
 
 
-def _compute_strategy_stats(trades: List[Dict[str, Any]], strategies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _compute_strategy_stats(sid_to_agg: Dict[int, Dict[str, Any]], strategies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
-    Compute per-strategy statistics.
-    Only includes strategies that still exist (not deleted).
+    Compute per-strategy statistics from qd_pnl_strategy rows.
+    Only includes strategies that still exist (not deleted) and have trades.
     """
-    # Build set of existing strategy IDs
-    existing_strategy_ids: set = set()
-    sid_to_name: Dict[int, str] = {}
-    sid_to_capital: Dict[int, float] = {}
+    result = []
     for s in strategies:
         sid = _safe_int(s.get("id"), 0)
-        if sid > 0:
-            existing_strategy_ids.add(sid)
-            sid_to_name[sid] = str(s.get("strategy_name") or f"Strategy_{sid}")
-            sid_to_capital[sid] = _safe_float(s.get("initial_capital"), 0.0)
-
-    # Group trades by strategy (only for existing strategies)
-    sid_to_trades: Dict[int, List[Dict[str, Any]]] = {}
-    for t in trades:
-        sid = _safe_int(t.get("strategy_id"), 0)
-        # Skip trades from deleted strategies
-        if sid not in existing_strategy_ids:
+        agg = sid_to_agg.get(sid)
+        if sid <= 0 or not agg or _safe_int(agg.get("trades"), 0) <= 0:
             continue
-        if sid not in sid_to_trades:
-            sid_to_trades[sid] = []
-        sid_to_trades[sid].append(t)
-
-    result = []
-    for sid, strades in sid_to_trades.items():
-        stats = _compute_performance_stats(strades)
-        total_pnl = sum(_safe_float(t.get("profit"), 0.0) for t in strades)
-        capital = sid_to_capital.get(sid, 0.0)
+        stats = _compute_performance_stats(agg, {})
+        total_pnl = _safe_float(agg.get("pnl"), 0.0)
+        capital = _safe_float(s.get("initial_capital"), 0.0)
         roi = (total_pnl / capital * 100) if capital > 0 else 0.0
 
         result.append({
             "strategy_id": sid,
-            "strategy_name": sid_to_name.get(sid, f"Strategy_{sid}"),
+            "strategy_name": str(s.get("strategy_name") or f"Strategy_{sid}"),
             "total_trades": stats["total_trades"],
             "win_rate": stats["win_rate"],
             "profit_factor": stats["profit_factor"],
@@ -332,7 +289,19 @@ def summary():
                 }
             )
 
-        # Recent trades (best-effort)
+        # Realized PnL aggregates (maintained per trade, see app/services/trade_aggregates.py):
+        # O(strategies + days) regardless of trade history size.
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute("SELECT * FROM qd_pnl_strategy")
+            sid_to_agg = {_safe_int(r.get("strategy_id"), 0): r for r in (cur.fetchall() or [])}
+            cur.execute("SELECT day, pnl FROM qd_pnl_daily WHERE strategy_id = 0 ORDER BY day")
+            day_rows = cur.fetchall() or []
+            cur.execute("SELECT hour, trades, pnl FROM qd_pnl_hourly")
+            hour_rows = cur.fetchall() or []
+            cur.close()
+
+        # Recent trades (list only)
         with get_db_connection() as db:
             cur = db.cursor()
             cur.execute(
@@ -341,17 +310,22 @@ def summary():
                 FROM qd_strategy_trades t
                 LEFT JOIN qd_strategies_trading s ON s.id = t.strategy_id
                 ORDER BY t.created_at DESC
-                LIMIT 500
+                LIMIT 100
                 """
             )
             recent_trades = cur.fetchall() or []
             cur.close()
 
+        # Daily PnL chart (realized profit per local day)
+        day_to_profit: Dict[str, float] = {str(r.get("day")): _safe_float(r.get("pnl"), 0.0) for r in day_rows}
+        daily_pnl_chart = [{"date": d, "profit": float(v)} for d, v in sorted(day_to_profit.items())]
+
         # Compute performance statistics
-        perf_stats = _compute_performance_stats(recent_trades)
+        overall = sid_to_agg.get(0) or {}
+        perf_stats = _compute_performance_stats(overall, day_to_profit)
 
         # Compute per-strategy statistics
-        strategy_stats = _compute_strategy_stats(recent_trades, strategies)
+        strategy_stats = _compute_strategy_stats(sid_to_agg, strategies)
 
         # Total equity/pnl (best-effort)
         total_initial_capital = 0.0
@@ -362,25 +336,10 @@ def summary():
                 pass
 
         # Include realized PnL from trades
-        total_realized_pnl = sum(_safe_float(t.get("profit"), 0.0) for t in recent_trades)
+        total_realized_pnl = _safe_float(overall.get("pnl"), 0.0)
         total_pnl = float(total_unrealized_pnl + total_realized_pnl)
         total_equity = float(total_initial_capital + total_pnl)
 
-        # Daily PnL chart (uses realized profit field if present, otherwise 0)
-        # Keep output stable even if profit is mostly empty.
-        day_to_profit: Dict[str, float] = {}
-        for trow in recent_trades:
-            ts = _safe_int(trow.get("created_at"), 0)
-            if ts <= 0:
-                continue
-            day = time.strftime("%Y-%m-%d", time.localtime(ts))
-            try:
-                p = float(trow.get("profit") or 0.0)
-            except Exception:
-                p = 0.0
-            day_to_profit[day] = float(day_to_profit.get(day, 0.0) + p)
-        daily_pnl_chart = [{"date": d, "profit": float(v)} for d, v in sorted(day_to_profit.items())]
-
         # Strategy performance pie (use unrealized pnl by strategy as best-effort)
         sid_to_unreal: Dict[int, float] = {}
         sid_to_name: Dict[int, str] = {}
@@ -392,28 +351,18 @@ def summary():
 
         # Monthly returns for heatmap
         month_to_profit: Dict[str, float] = {}
-        for trow in recent_trades:
-            ts = _safe_int(trow.get("created_at"), 0)
-            if ts <= 0:
-                continue
-            month = time.strftime("%Y-%m", time.localtime(ts))
-            try:
-                p = float(trow.get("profit") or 0.0)
-            except Exception:
-                p = 0.0
+        for d, p in day_to_profit.items():
+            month = d[:7]
             month_to_profit[month] = month_to_profit.get(month, 0.0) + p
         monthly_returns = [{"month": m, "profit": round(v, 2)} for m, v in sorted(month_to_profit.items())]
 
         # Hourly distribution
         hour_to_count: Dict[int, int] = {}
         hour_to_profit: Dict[int, float] = {}
-        for trow in recent_trades:
-            ts = _safe_int(trow.get("created_at"), 0)
-            if ts <= 0:
-                continue
-            hour = int(time.strftime("%H", time.localtime(ts)))
-            hour_to_count[hour] = hour_to_count.get(hour, 0) + 1
-            hour_to_profit[hour] = hour_to_profit.get(hour, 0.0) + _safe_float(trow.get("profit"), 0.0)
+        for r in hour_rows:
+            hour = _safe_int(r.get("hour"), -1)
+            hour_to_count[hour] = _safe_int(r.get("trades"), 0)
+            hour_to_profit[hour] = _safe_float(r.get("pnl"), 0.0)
         hourly_distribution = [
             {"hour": h, "count": hour_to_count.get(h, 0), "profit": round(hour_to_profit.get(h, 0.0), 2)}
             for h in range(24)
@@ -486,7 +435,7 @@ def summary():
                     "hourly_distribution": hourly_distribution,
                     "calendar_months": calendar_months,  # Monthly calendar data
                     # Lists
-                    "recent_trades": recent_trades[:100],  # Limit for frontend
+                    "recent_trades": recent_trades,  # Limit for frontend
                     "current_positions": current_positions,
                 },
             }
@@ -21,6 +21,10 @@ from flask import Blueprint, Response, jsonify, request
 import pandas as pd
 import numpy as np
 
+from app.services.indicator_sandbox import (
+    SandboxCodeError, SandboxMemoryError, SandboxTimeoutError, get_indicator_sandbox
+)
+from app.utils.code_cache import invalidate_indicator_code
 from app.utils.db import get_db_connection
 from app.utils.logger import get_logger
 import requests
@@ -29,11 +33,25 @@ logger = get_logger(__name__)
 
 indicator_bp = Blueprint("indicator", __name__)
 
+# verifyCode 只跑 mock 数据，超时设得较短
+VERIFY_CODE_TIMEOUT_SEC = 10
+
 
 def _now_ts() -> int:
     return int(time.time())
 
 
+def _invalidate_cached_code(cur, indicator_id: int) -> None:
+    """指标代码被修改 / 删除前，移除旧代码的编译缓存"""
+    try:
+        cur.execute("SELECT code FROM qd_indicator_codes WHERE id = ?", (indicator_id,))
+        row = cur.fetchone()
+        if row:
+            invalidate_indicator_code(row.get("code"))
+    except Exception as e:
+        logger.debug(f"invalidate indicator code cache failed: {e}")
+
+
 def _parse_user_id(userid) -> int:
     """
     解析用户 ID，兼容整数和字符串类型
@@ -227,6 +245,7 @@ def save_indicator():
         with get_db_connection() as db:
             cur = db.cursor()
             if indicator_id and indicator_id > 0:
+                _invalidate_cached_code(cur, indicator_id)
                 cur.execute(
                     """
                     UPDATE qd_indicator_codes
@@ -270,6 +289,7 @@ def delete_indicator():
 
         with get_db_connection() as db:
             cur = db.cursor()
+            _invalidate_cached_code(cur, indicator_id)
             cur.execute(
                 "DELETE FROM qd_indicator_codes WHERE id = ? AND user_id = ? AND (is_buy IS NULL OR is_buy = 0)",
                 (indicator_id, user_id),
@@ -302,38 +322,59 @@ def verify_code():
         # 1. Generate mock data
         df = _generate_mock_df()
         
-        # 2. Prepare execution environment
-        exec_env = {
-            'df': df.copy(),
-            'pd': pd,
-            'np': np,
-            'output': None
-        }
-        
-        # 3. Execute code
-        try:
-            exec(code, exec_env)
-        except SyntaxError as e:
-            return jsonify({
-                "code": 0, 
-                "msg": f"Syntax Error at line {e.lineno}: {e.msg}", 
-                "data": {"type": "SyntaxError", "line": e.lineno, "details": str(e)}
-            })
-        except Exception as e:
-            # Capture traceback for better debugging
-            tb = traceback.format_exc()
-            # Extract the line number from the exec() call in the traceback if possible
-            # This is tricky because the traceback includes the backend frames. 
-            # We'll just return the exception message.
-            return jsonify({
-                "code": 0, 
-                "msg": f"Runtime Error: {str(e)}", 
-                "data": {"type": type(e).__name__, "details": tb}
-            })
+        # 2. Execute code in the sandbox process pool (enforced timeout / memory cap)
+        sandbox = get_indicator_sandbox()
+        if sandbox.enabled:
+            try:
+                result = sandbox.run(
+                    code, df, variables={'output': None}, timeout=VERIFY_CODE_TIMEOUT_SEC,
+                    allowed_modules=None, expose_series=False, indicator_functions=False
+                )
+                output = result.output
+            except SandboxCodeError as e:
+                if e.error_type == 'SyntaxError':
+                    return jsonify({
+                        "code": 0, 
+                        "msg": f"Syntax Error at line {e.lineno}: {e.message}", 
+                        "data": {"type": "SyntaxError", "line": e.lineno, "details": e.details}
+                    })
+                return jsonify({
+                    "code": 0, 
+                    "msg": f"Runtime Error: {e.message}", 
+                    "data": {"type": e.error_type, "details": e.details}
+                })
+            except (SandboxTimeoutError, SandboxMemoryError) as e:
+                return jsonify({
+                    "code": 0, 
+                    "msg": f"Runtime Error: {str(e)}", 
+                    "data": {"type": type(e).__name__, "details": str(e)}
+                })
+        else:
+            exec_env = {
+                'df': df.copy(),
+                'pd': pd,
+                'np': np,
+                'output': None
+            }
+            try:
+                exec(code, exec_env)
+            except SyntaxError as e:
+                return jsonify({
+                    "code": 0, 
+                    "msg": f"Syntax Error at line {e.lineno}: {e.msg}", 
+                    "data": {"type": "SyntaxError", "line": e.lineno, "details": str(e)}
+                })
+            except Exception as e:
+                # Capture traceback for better debugging
+                tb = traceback.format_exc()
+                return jsonify({
+                    "code": 0, 
+                    "msg": f"Runtime Error: {str(e)}", 
+                    "data": {"type": type(e).__name__, "details": tb}
+                })
+            output = exec_env.get('output')
             
-        # 4. Check output
-        output = exec_env.get('output')
-        
+        # 3. Check output
         if output is None:
             return jsonify({
                 "code": 0, 
@@ -633,8 +674,7 @@ def get_ma100():
             }), 400
         
         # 计算 MA100
-        import pandas as pd
-        df = pd.DataFrame(kline_data, columns=['time', 'open', 'high', 'low', 'close', 'volume'])
+        df = kline_data.to_dataframe(index=False)
         df['ma100'] = df['close'].rolling(window=100).mean()
         
         # 获取最新的数据
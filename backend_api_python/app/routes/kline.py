@@ -69,7 +69,7 @@ def get_kline():
         return jsonify({
             'code': 1,
             'msg': 'success',
-            'data': klines
+            'data': klines.to_list()
         })
         
     except Exception as e:
@@ -119,3 +119,16 @@ def get_price():
             'data': None
         }), 500
 
+
+
+@kline_bp.route('/kline/stats', methods=['GET'])
+def get_kline_stats():
+    """K线请求合并与区间缓存统计"""
+    return jsonify({
+        'code': 1,
+        'msg': 'success',
+        'data': {
+            'singleflight': kline_service.get_singleflight_stats(),
+            'windowCache': kline_service.get_window_cache_stats(),
+        }
+    })
@@ -30,6 +30,11 @@ CONFIG_SCHEMA = {
             {'key': 'PYTHON_API_HOST', 'label': '监听地址', 'type': 'text', 'default': '0.0.0.0'},
             {'key': 'PYTHON_API_PORT', 'label': '端口', 'type': 'number', 'default': '5000'},
             {'key': 'PYTHON_API_DEBUG', 'label': '调试模式', 'type': 'boolean', 'default': 'False'},
+            {'key': 'SQLITE_WAL', 'label': 'SQLite WAL模式', 'type': 'boolean', 'default': 'True'},
+            {'key': 'SQLITE_CACHE_SIZE_KB', 'label': 'SQLite页缓存(KB/连接)', 'type': 'number', 'default': '16384'},
+            {'key': 'SQLITE_POOL_IDLE_PER_THREAD', 'label': 'SQLite每线程复用连接数(0=关闭)', 'type': 'number', 'default': '2'},
+            {'key': 'DB_WRITE_QUEUE_ENABLED', 'label': '数据库批量写入队列', 'type': 'boolean', 'default': 'True'},
+            {'key': 'DB_WRITE_FLUSH_MS', 'label': '批量写入提交间隔(毫秒)', 'type': 'number', 'default': '50'},
         ]
     },
     'worker': {
@@ -37,6 +42,14 @@ CONFIG_SCHEMA = {
         'items': [
             {'key': 'ENABLE_PENDING_ORDER_WORKER', 'label': '启用订单处理Worker', 'type': 'boolean', 'default': 'True'},
             {'key': 'PENDING_ORDER_STALE_SEC', 'label': '订单超时时间(秒)', 'type': 'number', 'default': '90'},
+            {'key': 'PENDING_ORDER_STALE_SWEEP_SEC', 'label': '超时订单回收间隔(秒)', 'type': 'number', 'default': '30'},
+            {'key': 'PENDING_ORDER_POLL_SEC', 'label': '订单兜底轮询间隔(秒)', 'type': 'number', 'default': '5'},
+            {'key': 'PENDING_ORDER_WAKEUP_PORT', 'label': '跨进程唤醒端口(0=关闭)', 'type': 'number', 'default': '0'},
+            {'key': 'LIVE_CLIENT_IDLE_SEC', 'label': '交易所客户端空闲回收(秒)', 'type': 'number', 'default': '600'},
+            {'key': 'LIVE_RATE_LIMIT_ENABLED', 'label': '交易所请求限频', 'type': 'boolean', 'default': 'True'},
+            {'key': 'LIVE_RATE_LIMIT_SAFETY', 'label': '限频安全系数(0.1-1)', 'type': 'number', 'default': '0.8'},
+            {'key': 'LIVE_USER_STREAM_ENABLED', 'label': '订单成交WebSocket推送(Binance合约/OKX)', 'type': 'boolean', 'default': 'False'},
+            {'key': 'PENDING_ORDER_WORKERS', 'label': '订单并发分发线程数', 'type': 'number', 'default': '8'},
         ]
     },
     'notification': {
@@ -73,7 +86,21 @@ CONFIG_SCHEMA = {
         'items': [
             {'key': 'DISABLE_RESTORE_RUNNING_STRATEGIES', 'label': '禁用自动恢复策略', 'type': 'boolean', 'default': 'False'},
             {'key': 'STRATEGY_TICK_INTERVAL_SEC', 'label': '策略Tick间隔(秒)', 'type': 'number', 'default': '10'},
+            {'key': 'STRATEGY_SCHEDULER_ENABLED', 'label': '启用策略调度器', 'type': 'boolean', 'default': 'True'},
+            {'key': 'STRATEGY_SCHEDULER_WORKERS', 'label': '调度器工作线程数', 'type': 'number', 'default': '8'},
+            {'key': 'INDICATOR_INCREMENTAL_ENABLED', 'label': '启用增量指标计算', 'type': 'boolean', 'default': 'True'},
+            {'key': 'INDICATOR_PARITY_CHECK_TICKS', 'label': '增量指标全量比对间隔(tick)', 'type': 'number', 'default': '60'},
+            {'key': 'INDICATOR_SANDBOX_ENABLED', 'label': '指标沙箱进程池', 'type': 'boolean', 'default': 'True'},
+            {'key': 'INDICATOR_SANDBOX_WORKERS', 'label': '沙箱进程数', 'type': 'number', 'default': '2'},
+            {'key': 'INDICATOR_SANDBOX_MAX_RSS_MB', 'label': '沙箱进程内存上限(MB)', 'type': 'number', 'default': '1024'},
+            {'key': 'INDICATOR_SANDBOX_MAX_RUNS', 'label': '沙箱进程回收前执行次数', 'type': 'number', 'default': '200'},
+            {'key': 'INDICATOR_EXEC_TIMEOUT_SEC', 'label': '实盘指标执行超时(秒)', 'type': 'number', 'default': '30'},
             {'key': 'PRICE_CACHE_TTL_SEC', 'label': '价格缓存TTL(秒)', 'type': 'number', 'default': '10'},
+            {'key': 'CANDLE_CLOSE_SETTLE_SEC', 'label': 'K线收盘后刷新延迟(秒)', 'type': 'number', 'default': '2'},
+            {'key': 'STRATEGY_WARMUP_CONCURRENCY', 'label': '策略启动并发数', 'type': 'number', 'default': '4'},
+            {'key': 'STRATEGY_SNAPSHOT_ENABLED', 'label': '策略状态快照(快速重启)', 'type': 'boolean', 'default': 'True'},
+            {'key': 'STRATEGY_SNAPSHOT_INTERVAL_SEC', 'label': '策略快照间隔(秒)', 'type': 'number', 'default': '60'},
+            {'key': 'POSITION_CACHE_TTL_SEC', 'label': '持仓缓存TTL(秒)', 'type': 'number', 'default': '60'},
         ]
     },
     'proxy': {
@@ -542,6 +542,36 @@ def preview_compile():
         return jsonify({'code': 0, 'msg': str(e)}), 500
 
 
+@strategy_bp.route('/strategies/runtime-stats', methods=['GET'])
+def get_runtime_stats():
+    """实盘运行时统计：策略调度器、触发索引、持仓缓存、状态快照、挂单分发队列、交易所客户端池与限频、数据库连接复用与写入队列"""
+    try:
+        from app import get_pending_order_worker
+        from app.services.live_trading.client_pool import get_client_pool
+        from app.services.live_trading.rate_limit import get_rate_limiter
+        from app.services.db_write_queue import get_db_write_queue
+        from app.utils.db import get_db_pool_stats
+        executor = get_trading_executor()
+        return jsonify({
+            'code': 1,
+            'msg': 'success',
+            'data': {
+                'scheduler': executor.get_scheduler_stats(),
+                'triggerIndex': executor.trigger_index.stats(),
+                'positionCache': executor.position_cache.stats(),
+                'snapshots': executor.snapshots.stats(),
+                'pendingOrders': get_pending_order_worker().stats(),
+                'exchangeClients': get_client_pool().stats(),
+                'rateLimits': get_rate_limiter().stats(),
+                'database': get_db_pool_stats(),
+                'dbWrites': get_db_write_queue().stats(),
+            }
+        })
+    except Exception as e:
+        logger.error(f"get_runtime_stats failed: {str(e)}")
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 500
+
+
 @strategy_bp.route('/strategies/notifications', methods=['GET'])
 def get_strategy_notifications():
     """
@@ -1,19 +1,67 @@
 """
 回测服务
 """
+import copy
+import hashlib
+import itertools
 import math
+import os
+import threading
+import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
 
 import pandas as pd
 import numpy as np
 
 from app.data_sources import DataSourceFactory
+from app.data_sources.kline_store import get_kline_store, kline_store_enabled
+from app.services.backtest_cache import get_backtest_result_cache, make_cache_key
+from app.services.incremental_indicators import get_indicator_functions
+from app.services.indicator_sandbox import SandboxError, get_indicator_sandbox
+from app.utils.code_cache import get_code_cache, get_safe_builtins
 from app.utils.logger import get_logger
+from app.utils.mp_worker import get_worker_context
+from app.utils.shared_arrays import attach_shared_arrays, pack_shared_arrays
 
 logger = get_logger(__name__)
 
+# 回测指标脚本允许导入的模块
+BACKTEST_ALLOWED_MODULES = ('numpy', 'pandas', 'math', 'json', 'datetime', 'time')
+# 参数扫描可调整的 strategyConfig 顶层分组
+SWEEP_CONFIG_SECTIONS = ('execution', 'risk', 'position', 'scale')
+# 参数扫描支持的排序指标
+SWEEP_SORT_KEYS = (
+    'totalReturn', 'annualReturn', 'maxDrawdown', 'sharpeRatio',
+    'winRate', 'profitFactor', 'totalTrades', 'totalProfit'
+)
+
+# ==================== 参数扫描 worker（子进程） ====================
+# 子进程通过 initializer 挂载父进程创建的共享内存，之后每个任务只传递参数组合，
+# K线与信号数组零拷贝复用，不随任务序列化。
+_sweep_shm = None
+_sweep_arrays: Dict[str, np.ndarray] = {}
+_sweep_context: Dict[str, Any] = {}
+
+# 同时运行的参数扫描数上限：每个扫描占用一个 CPU 核数大小的进程池（BACKTEST_SWEEP_CONCURRENCY）
+try:
+    SWEEP_CONCURRENCY = max(1, int(os.getenv('BACKTEST_SWEEP_CONCURRENCY', '1')))
+except Exception:
+    SWEEP_CONCURRENCY = 1
+_sweep_slots = threading.BoundedSemaphore(SWEEP_CONCURRENCY)
+
+
+def _sweep_worker_init(shm_name: str, layout: List[tuple], context: Dict[str, Any]):
+    global _sweep_shm, _sweep_arrays, _sweep_context
+    _sweep_shm, _sweep_arrays = attach_shared_arrays(shm_name, layout)
+    _sweep_context = context
+
+
+def _sweep_worker_run(strategy_config: Dict[str, Any]) -> Dict[str, Any]:
+    return BacktestService()._run_sweep_case(_sweep_arrays, strategy_config, _sweep_context)
+
 
 class BacktestService:
     """回测服务"""
@@ -92,7 +140,10 @@ class BacktestService:
         slippage: float = 0.0,  # 理想回测环境，不考虑滑点
         leverage: int = 1,
         trade_direction: str = 'long',
-        strategy_config: Optional[Dict[str, Any]] = None
+        strategy_config: Optional[Dict[str, Any]] = None,
+        progress_callback: Optional[Callable[[str, int, int, int], None]] = None,
+        use_cache: bool = True,
+        cache_key: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         运行回测
@@ -107,18 +158,41 @@ class BacktestService:
             initial_capital: 初始资金
             commission: 手续费率
             slippage: 滑点
+            progress_callback: 可选进度回调 (stage, bars_done, bars_total, trades_count)，
+                stage 依次为 fetch / indicator / simulate / metrics；回调抛出的异常会中断回测（用于取消）
+            use_cache: 是否使用结果缓存（False 时强制重新计算，但仍会刷新缓存）
+            cache_key: 调用方在运行前算好的 result_cache_key（需要把同一个键落库时传入）；
+                缺省时在取数前计算。结果总是存到这个键下，而不是按运行结束时的数据版本重算
             
         Returns:
             回测结果
         """
+        # 0. 结果缓存：相同代码/参数/K线版本直接返回已保存的结果
+        result_cache = get_backtest_result_cache()
+        if not result_cache.enabled:
+            cache_key = None
+        else:
+            if cache_key is None:
+                cache_key = self.result_cache_key(
+                    indicator_code, market, symbol, timeframe, start_date, end_date,
+                    initial_capital, commission, slippage, leverage, trade_direction, strategy_config
+                )
+            if use_cache:
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    return cached
         
         # 1. 获取K线数据
+        if progress_callback:
+            progress_callback('fetch', 0, 0, 0)
         df = self._fetch_kline_data(market, symbol, timeframe, start_date, end_date)
         if df.empty:
             raise ValueError("回测日期范围内没有K线数据")
         
         
         # 2. 执行指标代码获取信号（传入回测参数）
+        if progress_callback:
+            progress_callback('indicator', 0, len(df), 0)
         backtest_params = {
             'leverage': leverage,
             'initial_capital': initial_capital,
@@ -126,17 +200,292 @@ class BacktestService:
             'trade_direction': trade_direction
         }
         signals = self._execute_indicator(indicator_code, df, backtest_params)
+        # 指标阶段可能耗时较长：结束后立即再检查一次（取消请求不必等到模拟循环的第一个进度点）
+        if progress_callback:
+            progress_callback('simulate', 0, len(df), 0)
         
-        # 3. 模拟交易
-        equity_curve, trades, total_commission = self._simulate_trading(
-            df, signals, initial_capital, commission, slippage, leverage, trade_direction, strategy_config
+        # 3. 模拟交易（equity 为与 df.index 对齐的 float64 数组）
+        equity, trades, total_commission = self._simulate_trading(
+            df, signals, initial_capital, commission, slippage, leverage, trade_direction, strategy_config,
+            progress_callback=progress_callback
         )
-        
+
         # 4. 计算指标
-        metrics = self._calculate_metrics(equity_curve, trades, initial_capital, timeframe, start_date, end_date, total_commission)
+        if progress_callback:
+            progress_callback('metrics', len(df), len(df), len(trades))
+        metrics = self._calculate_metrics(equity, trades, initial_capital, timeframe, start_date, end_date, total_commission)
+
+        # 5. 格式化结果（仅对抽样后的权益点格式化时间）
+        result = self._format_result(metrics, self._format_equity_curve(df.index, equity), trades)
+        if cache_key:
+            result_cache.put(cache_key, result)
+        return result
+
+    def result_cache_key(
+        self,
+        indicator_code: str,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        start_date: datetime,
+        end_date: datetime,
+        initial_capital: float = 10000.0,
+        commission: float = 0.001,
+        slippage: float = 0.0,
+        leverage: int = 1,
+        trade_direction: str = 'long',
+        strategy_config: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        回测结果缓存键（内容寻址）
+
+        strategy_config 按 _parse_simulation_config 归一化，写法不同但语义相同的配置
+        （如 entryPct 30 与 0.3、缺省字段与默认值）得到同一个键。
+        """
+        return make_cache_key({
+            'code': hashlib.sha256((indicator_code or '').encode('utf-8')).hexdigest(),
+            'market': market,
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'initial_capital': float(initial_capital),
+            'commission': float(commission),
+            'slippage': float(slippage),
+            'leverage': int(leverage),
+            'trade_direction': trade_direction,
+            'strategy': self._parse_simulation_config(strategy_config, leverage),
+            'data_version': self._kline_data_version(market, symbol, timeframe, start_date, end_date),
+        })
+
+    def _kline_data_version(self, market: str, symbol: str, timeframe: str, start_date: datetime, end_date: datetime) -> str:
+        """
+        K线数据版本：回测区间内最后一根可能已收盘K线的序号 + 本地K线存储中该区间的 (根数, 最近写入时间)。
+
+        - 区间包含当前时间时，每收盘一根新K线序号加一（最新几根未落盘的K线来自上游）；
+        - 补齐缺口、上游修正历史K线会改变本地存储的根数 / updated_at，缓存随之失效。
+        """
+        tf_seconds = self.TIMEFRAME_SECONDS.get(timeframe, 86400)
+        horizon = min(end_date.timestamp(), time.time())
+        version = str(int(horizon // tf_seconds))
+        if kline_store_enabled():
+            try:
+                bars, updated_at = get_kline_store().data_version(
+                    market, symbol, timeframe, int(start_date.timestamp()), int(end_date.timestamp())
+                )
+                version += f":{bars}:{updated_at}"
+            except Exception as e:
+                logger.warning(f"Kline store version lookup failed for {market}:{symbol}:{timeframe}: {e}")
+        return version
+    
+    def run_sweep(
+        self,
+        indicator_code: str,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        start_date: datetime,
+        end_date: datetime,
+        param_grid: Dict[str, List[Any]],
+        initial_capital: float = 10000.0,
+        commission: float = 0.001,
+        slippage: float = 0.0,
+        leverage: int = 1,
+        trade_direction: str = 'long',
+        strategy_config: Optional[Dict[str, Any]] = None,
+        sort_by: str = 'totalReturn',
+        top_n: int = 50,
+        max_workers: Optional[int] = None,
+        progress_callback: Optional[Callable[[str, int, int, int], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        参数扫描回测：K线与指标只计算一次，再对 strategyConfig 参数网格批量模拟
+        
+        OHLC 与信号数组放入共享内存，由进程池并行执行各参数组合，仅回传指标。
         
-        # 5. 格式化结果
-        return self._format_result(metrics, equity_curve, trades)
+        Args:
+            param_grid: 参数网格，键为 strategyConfig 中的点分路径，值为候选列表，例如
+                {"risk.stopLossPct": [0.02, 0.05], "risk.trailing.enabled": [true, false]}
+            strategy_config: 基础配置，网格参数在其上覆盖
+            sort_by: 排序指标（降序），见 SWEEP_SORT_KEYS
+            top_n: 返回的结果条数
+            max_workers: 进程数，默认取 BACKTEST_SWEEP_WORKERS 或 CPU 核数
+            progress_callback: 可选进度回调 (stage, done, total, 0)；扫描阶段 done/total 为参数组合数，
+                回调抛出异常时取消尚未开始的组合并中止扫描
+            
+        Returns:
+            排名后的指标表
+        """
+        combos = self.validate_sweep(param_grid, sort_by)
+        configs = [self._apply_sweep_params(strategy_config, combo) for combo in combos]
+        started = time.time()
+
+        # 1. 获取K线数据并执行一次指标
+        if progress_callback:
+            progress_callback('fetch', 0, 0, 0)
+        df = self._fetch_kline_data(market, symbol, timeframe, start_date, end_date)
+        if df.empty:
+            raise ValueError("回测日期范围内没有K线数据")
+        if progress_callback:
+            progress_callback('indicator', 0, len(df), 0)
+        backtest_params = {
+            'leverage': leverage,
+            'initial_capital': initial_capital,
+            'commission': commission,
+            'trade_direction': trade_direction
+        }
+        signals = self._execute_indicator(indicator_code, df, backtest_params)
+
+        # 2. 准备共享数组
+        arrays = {
+            'open': df['open'].to_numpy(dtype=np.float64) if 'open' in df.columns else df['close'].to_numpy(dtype=np.float64),
+            'high': df['high'].to_numpy(dtype=np.float64),
+            'low': df['low'].to_numpy(dtype=np.float64),
+            'close': df['close'].to_numpy(dtype=np.float64),
+        }
+        for key, arr in self._normalize_signals(signals, len(df), trade_direction).items():
+            arrays[key] = arr.astype(bool) if key in ('open_long', 'close_long', 'open_short', 'close_short', 'add_long', 'add_short') else arr.astype(np.float64)
+        context = {
+            'initial_capital': initial_capital,
+            'commission': commission,
+            'slippage': slippage,
+            'leverage': leverage,
+            'trade_direction': trade_direction,
+            'timeframe': timeframe,
+            'start_date': start_date,
+            'end_date': end_date,
+        }
+
+        # 3. 并行模拟（受 BACKTEST_SWEEP_CONCURRENCY 限制，排队期间仍响应取消）
+        if max_workers is None:
+            max_workers = int(os.getenv('BACKTEST_SWEEP_WORKERS', '0') or 0) or (os.cpu_count() or 1)
+        max_workers = max(1, min(int(max_workers), len(configs)))
+        total = len(configs)
+
+        while not _sweep_slots.acquire(timeout=1.0):
+            if progress_callback:
+                progress_callback('sweep_wait', 0, total, 0)
+        try:
+            if progress_callback:
+                progress_callback('sweep', 0, total, 0)
+            if max_workers == 1:
+                rows = []
+                for cfg in configs:
+                    rows.append(self._run_sweep_case(arrays, cfg, context))
+                    if progress_callback:
+                        progress_callback('sweep', len(rows), total, 0)
+            else:
+                rows = self._run_sweep_pool(arrays, configs, context, max_workers, progress_callback)
+        finally:
+            _sweep_slots.release()
+
+        # 4. 排名
+        for combo, row in zip(combos, rows):
+            row['params'] = combo
+        rows.sort(key=lambda r: r.get(sort_by, 0), reverse=True)
+        for rank, row in enumerate(rows, start=1):
+            row['rank'] = rank
+
+        return {
+            'total': len(rows),
+            'bars': len(df),
+            'sortBy': sort_by,
+            'workers': max_workers,
+            'elapsedSec': round(time.time() - started, 2),
+            'results': rows[:max(1, int(top_n or 50))]
+        }
+
+    def validate_sweep(self, param_grid: Dict[str, List[Any]], sort_by: str = 'totalReturn') -> List[Dict[str, Any]]:
+        """校验扫描参数（提交任务前调用），返回展开后的参数组合；不合法时抛出 ValueError"""
+        if sort_by not in SWEEP_SORT_KEYS:
+            raise ValueError(f"Unsupported sortBy: {sort_by}")
+        return self._expand_param_grid(param_grid)
+
+    def _run_sweep_pool(
+        self,
+        arrays: Dict[str, np.ndarray],
+        configs: List[Dict[str, Any]],
+        context: Dict[str, Any],
+        max_workers: int,
+        progress_callback: Optional[Callable[[str, int, int, int], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """进程池执行参数组合；进度回调抛出异常时取消排队中的组合（已在执行的块跑完后退出）"""
+        shm, layout = pack_shared_arrays(arrays)
+        # spawn：避免在多线程的 Web/执行器进程中 fork；worker 不重新导入入口脚本（见 mp_worker）
+        pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=get_worker_context(),
+            initializer=_sweep_worker_init,
+            initargs=(shm.name, layout, context)
+        )
+        try:
+            chunksize = max(1, len(configs) // (max_workers * 4))
+            rows = []
+            for row in pool.map(_sweep_worker_run, configs, chunksize=chunksize):
+                rows.append(row)
+                if progress_callback and (len(rows) % chunksize == 0 or len(rows) == len(configs)):
+                    progress_callback('sweep', len(rows), len(configs), 0)
+            pool.shutdown(wait=True)
+            return rows
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _expand_param_grid(self, param_grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+        """展开参数网格为组合列表，校验路径与组合数上限（BACKTEST_SWEEP_MAX_COMBINATIONS）"""
+        if not isinstance(param_grid, dict) or not param_grid:
+            raise ValueError("paramGrid is required")
+        for path, values in param_grid.items():
+            if str(path).split('.')[0] not in SWEEP_CONFIG_SECTIONS or len(str(path).split('.')) < 2:
+                raise ValueError(f"Invalid paramGrid key: {path}")
+            if not isinstance(values, list) or not values:
+                raise ValueError(f"paramGrid[{path}] must be a non-empty list")
+
+        max_combos = int(os.getenv('BACKTEST_SWEEP_MAX_COMBINATIONS', '5000'))
+        total = 1
+        for values in param_grid.values():
+            total *= len(values)
+        if total > max_combos:
+            raise ValueError(f"paramGrid expands to {total} combinations, exceeds limit {max_combos}")
+
+        paths = list(param_grid.keys())
+        return [dict(zip(paths, values)) for values in itertools.product(*param_grid.values())]
+
+    def _apply_sweep_params(self, strategy_config: Optional[Dict[str, Any]], combo: Dict[str, Any]) -> Dict[str, Any]:
+        """将点分路径参数覆盖到基础 strategyConfig 的副本上"""
+        cfg = copy.deepcopy(strategy_config or {})
+        for path, value in combo.items():
+            node = cfg
+            keys = path.split('.')
+            for key in keys[:-1]:
+                if not isinstance(node.get(key), dict):
+                    node[key] = {}
+                node = node[key]
+            node[keys[-1]] = value
+        return cfg
+
+    def _run_sweep_case(self, arrays: Dict[str, np.ndarray], strategy_config: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """执行单个参数组合，仅返回指标（不格式化权益曲线与交易时间）"""
+        signals = {k: v for k, v in arrays.items() if k not in ('open', 'high', 'low', 'close')}
+        equity, trades, total_commission = self._simulate_trading_arrays(
+            arrays['open'], arrays['high'], arrays['low'], arrays['close'], signals,
+            context['initial_capital'], context['commission'], context['slippage'],
+            context['leverage'], context['trade_direction'], strategy_config
+        )
+        metrics = self._calculate_metrics(
+            equity, trades, context['initial_capital'], context['timeframe'],
+            context['start_date'], context['end_date'], total_commission
+        )
+        row = {}
+        for key, value in metrics.items():
+            value = float(value) if isinstance(value, float) else value
+            if isinstance(value, float) and not np.isfinite(value):
+                value = 0
+            row[key] = value
+        return row
     
     def _fetch_kline_data(
         self,
@@ -169,17 +518,8 @@ class BacktestService:
             logger.warning("未获取到K线数据")
             return pd.DataFrame()
         
-        if kline_data:
-            first_time = datetime.fromtimestamp(kline_data[0]['time'])
-            last_time = datetime.fromtimestamp(kline_data[-1]['time'])
-        
-        # 转换为DataFrame
-        df = pd.DataFrame(kline_data)
-        df['time'] = pd.to_datetime(df['time'], unit='s')
-        df = df.set_index('time')
-        
-        if len(df) > 0:
-            pass
+        # 转换为DataFrame（列数组直接构建，不逐行复制）
+        df = kline_data.to_dataframe()
         
         # 过滤日期范围
         df = df[(df.index >= start_date) & (df.index <= end_date)].copy()
@@ -203,248 +543,1275 @@ class BacktestService:
         signals = pd.Series(0, index=df.index)
         
         try:
-            # 准备执行环境
-            local_vars = {
-                'df': df.copy(),
-                'open': df['open'],
-                'high': df['high'],
-                'low': df['low'],
-                'close': df['close'],
-                'volume': df['volume'],
-                'signals': signals,
-                'np': np,
-                'pd': pd,
-            }
-            
-            # 添加回测参数到执行环境（如果提供了）
-            if backtest_params:
-                local_vars['backtest_params'] = backtest_params
-                local_vars['leverage'] = backtest_params.get('leverage', 1)
-                local_vars['initial_capital'] = backtest_params.get('initial_capital', 10000)
-                local_vars['commission'] = backtest_params.get('commission', 0.0002)
-                local_vars['trade_direction'] = backtest_params.get('trade_direction', 'both')
-            
-            # 添加技术指标函数
-            local_vars.update(self._get_indicator_functions())
-            
-            # 添加安全的内置函数（保留完整的 builtins 以支持 lambda 等语法）
-            # 但移除危险的函数如 eval, exec, open 等
-            import builtins
-            
-            # 创建受限的 __import__ 函数，只允许导入已经加载的安全模块
-            def safe_import(name, *args, **kwargs):
-                """只允许导入 numpy, pandas, math, json 等安全模块"""
-                allowed_modules = ['numpy', 'pandas', 'math', 'json', 'datetime', 'time']
-                if name in allowed_modules or name.split('.')[0] in allowed_modules:
-                    return builtins.__import__(name, *args, **kwargs)
-                raise ImportError(f"不允许导入模块: {name}")
-            
-            safe_builtins = {k: getattr(builtins, k) for k in dir(builtins) 
-                           if not k.startswith('_') and k not in [
-                               'eval', 'exec', 'compile', 'open', 'input',
-                               'help', 'exit', 'quit',
-                               'copyright', 'credits', 'license'
-                           ]}
-            
-            # 添加受限的 __import__
-            safe_builtins['__import__'] = safe_import
-            
-            # 创建统一的执行环境（globals 和 locals 使用同一个字典）
-            # 这样函数内部才能访问到 np, pd 等变量
-            exec_env = local_vars.copy()
-            exec_env['__builtins__'] = safe_builtins
-            
-            # 预执行 import 语句，确保 np 和 pd 可用
-            pre_import_code = """
-import numpy as np
-import pandas as pd
-"""
-            exec(pre_import_code, exec_env)
-            
-            # 安全检查：验证代码不包含危险操作
-            from app.utils.safe_exec import validate_code_safety
-            is_safe, error_msg = validate_code_safety(code)
+            # 安全检查：验证代码不包含危险操作（结果随编译缓存按代码哈希保存，同一份代码只检查一次）
+            is_safe, error_msg = get_code_cache().get(code).check_safety(code)
             if not is_safe:
                 logger.error(f"回测代码安全检查失败: {error_msg}")
                 raise ValueError(f"代码包含不安全操作: {error_msg}")
+
+            variables = {}
+            # 添加回测参数到执行环境（如果提供了）
+            if backtest_params:
+                variables['backtest_params'] = backtest_params
+                variables['leverage'] = backtest_params.get('leverage', 1)
+                variables['initial_capital'] = backtest_params.get('initial_capital', 10000)
+                variables['commission'] = backtest_params.get('commission', 0.0002)
+                variables['trade_direction'] = backtest_params.get('trade_direction', 'both')
+
+            sandbox = get_indicator_sandbox()
+            if sandbox.enabled:
+                # 在预热的子进程中执行（强制超时与内存上限，不占用当前线程）
+                try:
+                    result = sandbox.run(
+                        code, df, variables=variables,
+                        timeout=60,  # 回测允许更长时间（60秒）
+                        allowed_modules=BACKTEST_ALLOWED_MODULES
+                    )
+                except SandboxError as e:
+                    raise RuntimeError(f"代码执行失败: {e}")
+                executed_df = result.df if result.df is not None else df
+                output_obj = result.output
+            else:
+                executed_df, output_obj = self._execute_indicator_inprocess(code, df, variables)
+
+            # Validation: if chart signals are provided, df['buy']/df['sell'] must exist for backtest normalization.
+            # This keeps indicator scripts simple and consistent (chart=buy/sell, execution=normalized in backend).
+            has_output_signals = isinstance(output_obj, dict) and isinstance(output_obj.get('signals'), list) and len(output_obj.get('signals')) > 0
+            if has_output_signals and not all(col in executed_df.columns for col in ['buy', 'sell']):
+                raise ValueError(
+                    "Invalid indicator script: output['signals'] is provided, but df['buy'] and df['sell'] are missing. "
+                    "Please set df['buy'] and df['sell'] as boolean columns (len == len(df))."
+                )
             
-            # 安全执行用户代码（带超时）
-            from app.utils.safe_exec import safe_exec_code
-            exec_result = safe_exec_code(
-                code=code,
-                exec_globals=exec_env,
-                exec_locals=exec_env,
-                timeout=60  # 回测允许更长时间（60秒）
-            )
+            # Extract signals from executed df
+            if all(col in executed_df.columns for col in ['open_long', 'close_long', 'open_short', 'close_short']):
+                
+                signals = {
+                    'open_long': executed_df['open_long'].fillna(False).astype(bool),
+                    'close_long': executed_df['close_long'].fillna(False).astype(bool),
+                    'open_short': executed_df['open_short'].fillna(False).astype(bool),
+                    'close_short': executed_df['close_short'].fillna(False).astype(bool)
+                }
+                
+                # Convention: backtest uses 4-way signals only.
+                # Position sizing, TP/SL, trailing, etc must be handled by strategy_config / strategy logic.
+            elif all(col in executed_df.columns for col in ['buy', 'sell']):
+                # Simple buy/sell signals (recommended for indicator authors)
+                signals = {
+                    'buy': executed_df['buy'].fillna(False).astype(bool),
+                    'sell': executed_df['sell'].fillna(False).astype(bool)
+                }
             
-            if not exec_result['success']:
-                raise RuntimeError(f"代码执行失败: {exec_result['error']}")
+            else:
+                raise ValueError(
+                    "Indicator must define either 4-way columns "
+                    "(df['open_long'], df['close_long'], df['open_short'], df['close_short']) "
+                    "or simple columns (df['buy'], df['sell'])."
+                )
             
-            # Get the executed df
-            executed_df = exec_env.get('df', df)
+        except Exception as e:
+            logger.error(f"指标代码执行错误: {e}")
+            logger.error(traceback.format_exc())
+        
+        return signals
+    
+    def _execute_indicator_inprocess(self, code: str, df: pd.DataFrame, variables: Dict[str, Any]) -> tuple:
+        """进程内执行指标代码（INDICATOR_SANDBOX_ENABLED=false 时使用），返回 (executed_df, output)"""
+        signals = pd.Series(0, index=df.index)
+        # 准备执行环境
+        local_vars = {
+            'df': df.copy(),
+            'open': df['open'],
+            'high': df['high'],
+            'low': df['low'],
+            'close': df['close'],
+            'volume': df['volume'],
+            'signals': signals,
+            'np': np,
+            'pd': pd,
+        }
+        local_vars.update(variables)
+        
+        # 添加技术指标函数
+        local_vars.update(self._get_indicator_functions())
+        
+        # 受限 builtins（移除 eval, exec, open 等，只允许导入安全模块）按模块列表缓存
+        # globals 和 locals 使用同一个字典，这样函数内部才能访问到 np, pd 等变量
+        exec_env = local_vars.copy()
+        exec_env['__builtins__'] = get_safe_builtins(BACKTEST_ALLOWED_MODULES)
+        
+        # 安全执行用户代码（带超时；非主线程下超时不生效）
+        from app.utils.safe_exec import safe_exec_code
+        exec_result = safe_exec_code(
+            code=get_code_cache().get(code).code_obj,
+            exec_globals=exec_env,
+            exec_locals=exec_env,
+            timeout=60  # 回测允许更长时间（60秒）
+        )
+        
+        if not exec_result['success']:
+            raise RuntimeError(f"代码执行失败: {exec_result['error']}")
+        
+        return exec_env.get('df', df), exec_env.get('output')
+
+    def _get_indicator_functions(self) -> Dict:
+        """获取技术指标函数（与实盘共用同一份定义）"""
+        return get_indicator_functions()
+    
+    def _simulate_trading(
+        self,
+        df: pd.DataFrame,
+        signals,
+        initial_capital: float,
+        commission: float,
+        slippage: float,
+        leverage: int = 1,
+        trade_direction: str = 'long',
+        strategy_config: Optional[Dict[str, Any]] = None,
+        progress_callback: Optional[Callable[[str, int, int, int], None]] = None
+    ) -> tuple:
+        """
+        模拟交易
+        
+        Args:
+            signals: 信号，可以是 pd.Series (旧格式) 或 dict (新格式四种信号)
+            trade_direction: 交易方向
+                - 'long': 只做多 (buy->sell)
+                - 'short': 只做空 (sell->buy, 收益反向)
+                - 'both': 双向 (buy->sell做多 + sell->buy做空)
+
+        Returns:
+            (equity, trades, total_commission)，equity 为与 df.index 对齐的 float64 数组
+        """
+        norm = self._normalize_signals(signals, len(df), trade_direction)
+
+        close_arr = df['close'].to_numpy(dtype=np.float64)
+        open_arr = df['open'].to_numpy(dtype=np.float64) if 'open' in df.columns else close_arr
+        equity, trades, total_commission = self._simulate_trading_arrays(
+            open_arr,
+            df['high'].to_numpy(dtype=np.float64),
+            df['low'].to_numpy(dtype=np.float64),
+            close_arr,
+            norm, initial_capital, commission, slippage, leverage, trade_direction, strategy_config,
+            progress_callback=progress_callback
+        )
+        self._format_trade_times(df.index, trades)
+        return equity, trades, total_commission
+
+    def _normalize_signals(self, signals, length: int, trade_direction: str = 'both') -> Dict[str, np.ndarray]:
+        """
+        将 4-way 或 buy/sell 信号统一为 4-way 信号数组（numpy）
+
+        Mapping rules:
+        - long: buy=open_long, sell=close_long
+        - short: sell=open_short, buy=close_short
+        - both: buy=open_long+close_short, sell=open_short+close_long
+        """
+        if not isinstance(signals, dict):
+            raise ValueError("signals must be a dict (either 4-way or buy/sell).")
+
+        def to_bool(values) -> np.ndarray:
+            return pd.Series(values).fillna(False).astype(bool).to_numpy()
+
+        if all(k in signals for k in ['open_long', 'close_long', 'open_short', 'close_short']):
+            # 4-way 信号原样透传（包括可选的 *_price / add_* / position_size 列）
+            return {k: np.asarray(v) for k, v in signals.items()}
+
+        if not all(k in signals for k in ['buy', 'sell']):
+            raise ValueError("signals dict must contain either 4-way keys or buy/sell keys.")
+
+        buy = to_bool(signals['buy'])
+        sell = to_bool(signals['sell'])
+
+        td = str(trade_direction or 'both').lower()
+        if td not in ['long', 'short', 'both']:
+            td = 'both'
+
+        none = np.zeros(length, dtype=bool)
+        if td == 'long':
+            return {'open_long': buy, 'close_long': sell, 'open_short': none, 'close_short': none.copy()}
+        if td == 'short':
+            return {'open_long': none, 'close_long': none.copy(), 'open_short': sell, 'close_short': buy}
+        return {'open_long': buy, 'close_long': sell, 'open_short': sell, 'close_short': buy}
+
+    def _parse_simulation_config(self, strategy_config: Optional[Dict[str, Any]], leverage: int) -> Dict[str, Any]:
+        """
+        解析回测弹窗的 strategyConfig（signals + parameters = strategy）为模拟引擎参数
+
+        风控/加减仓百分比按保证金口径定义：换算为价格触发阈值需要除以杠杆倍数
+        （例如 10x + 5% 止损，意味着约 0.5% 的不利价格波动）。
+        """
+        cfg = strategy_config or {}
+        exec_cfg = cfg.get('execution') or {}
+        risk_cfg = cfg.get('risk') or {}
+        trailing_cfg = risk_cfg.get('trailing') or {}
+        pos_cfg = cfg.get('position') or {}
+        scale_cfg = cfg.get('scale') or {}
+
+        lev = max(int(leverage or 1), 1)
+        signal_timing = str(exec_cfg.get('signalTiming') or 'next_bar_open').strip().lower()
+
+        # 与 _simulate_trading_new_format 保持一致：activationPct 未配置时不回退为 takeProfitPct
+        # （旧实现中的回退逻辑随后被重新计算覆盖，实际从未生效）。
+        params = {
+            'next_bar_open': signal_timing in ['next_bar_open', 'next_open', 'nextopen', 'next'],
+            'stop_loss_pct_eff': float(risk_cfg.get('stopLossPct') or 0.0) / lev,
+            'take_profit_pct_eff': float(risk_cfg.get('takeProfitPct') or 0.0) / lev,
+            'trailing_enabled': bool(trailing_cfg.get('enabled')),
+            'trailing_pct_eff': float(trailing_cfg.get('pct') or 0.0) / lev,
+            'trailing_activation_pct_eff': float(trailing_cfg.get('activationPct') or 0.0) / lev,
+        }
+
+        entry_pct_cfg = float(pos_cfg.get('entryPct') or 1.0)  # expected 0~1
+        # Accept both 0~1 and 0~100 inputs (some clients may send percent units).
+        if entry_pct_cfg > 1:
+            entry_pct_cfg = entry_pct_cfg / 100.0
+        params['entry_pct'] = max(0.0, min(entry_pct_cfg, 1.0))
+
+        for name, key in [('trend_add', 'trendAdd'), ('dca_add', 'dcaAdd'),
+                          ('trend_reduce', 'trendReduce'), ('adverse_reduce', 'adverseReduce')]:
+            rule = scale_cfg.get(key) or {}
+            params[f'{name}_enabled'] = bool(rule.get('enabled'))
+            params[f'{name}_step_pct_eff'] = float(rule.get('stepPct') or 0.0) / lev
+            params[f'{name}_size_pct'] = float(rule.get('sizePct') or 0.0)
+            params[f'{name}_max_times'] = int(rule.get('maxTimes') or 0)
+
+        # Prevent logical conflict: trend scale-in and mean-reversion scale-in should not run together.
+        if params['trend_add_enabled'] and params['dca_add_enabled']:
+            params['dca_add_enabled'] = False
+
+        return params
+
+    def _simulate_trading_arrays(
+        self,
+        open_arr: np.ndarray,
+        high_arr: np.ndarray,
+        low_arr: np.ndarray,
+        close_arr: np.ndarray,
+        signals: Dict[str, np.ndarray],
+        initial_capital: float,
+        commission: float,
+        slippage: float,
+        leverage: int = 1,
+        trade_direction: str = 'both',
+        strategy_config: Optional[Dict[str, Any]] = None,
+        progress_callback: Optional[Callable[[str, int, int, int], None]] = None
+    ) -> tuple:
+        """
+        基于 NumPy 数组的交易模拟引擎
+
+        状态机与 _simulate_trading_new_format 完全一致（止损/止盈/移动止盈、趋势/DCA 加仓、减仓、
+        爆仓、next_bar_open 执行时机），但不再逐行 iterrows 构造 Series，也不在每根K线上格式化时间：
+        - 权益写入预分配的 float64 数组，最后统一按 2 位小数取整
+        - 交易记录中的 'time' 暂存为K线下标，由 _format_trade_times 在输出时格式化
+
+        Args:
+            open_arr/high_arr/low_arr/close_arr: OHLC 数组（等长）
+            signals: 4-way 信号数组（见 _normalize_signals）
+            progress_callback: 可选进度回调，约每 1% 的K线调用一次 ('simulate', i, n, len(trades))
+
+        Returns:
+            (equity, trades, total_commission)
+        """
+        n = len(close_arr)
+        equity = np.zeros(n, dtype=np.float64)
+        unrounded_idx = []  # 旧引擎在这些K线上记录的是未取整的权益，需保持一致
+        trades = []
+        total_commission_paid = 0
+        is_liquidated = False
+        liquidation_price = 0
+        min_capital_to_trade = 1.0  # 余额低于该值则视为赔光，不再开新单
+
+        capital = float(initial_capital)
+        position = 0  # 正数=多头持仓，负数=空头持仓
+        entry_price = 0  # 平均开仓价格
+        position_type = None  # 'long' or 'short'
+
+        p = self._parse_simulation_config(strategy_config, leverage)
+        next_bar_open = p['next_bar_open']
+        stop_loss_pct_eff = p['stop_loss_pct_eff']
+        take_profit_pct_eff = p['take_profit_pct_eff']
+        trailing_enabled = p['trailing_enabled']
+        trailing_pct_eff = p['trailing_pct_eff']
+        trailing_activation_pct_eff = p['trailing_activation_pct_eff']
+        entry_pct_cfg = p['entry_pct']
+
+        trend_add_enabled = p['trend_add_enabled']
+        trend_add_step_pct_eff = p['trend_add_step_pct_eff']
+        trend_add_size_pct = p['trend_add_size_pct']
+        trend_add_max_times = p['trend_add_max_times']
+        dca_add_enabled = p['dca_add_enabled']
+        dca_add_step_pct_eff = p['dca_add_step_pct_eff']
+        dca_add_size_pct = p['dca_add_size_pct']
+        dca_add_max_times = p['dca_add_max_times']
+        trend_reduce_enabled = p['trend_reduce_enabled']
+        trend_reduce_step_pct_eff = p['trend_reduce_step_pct_eff']
+        trend_reduce_size_pct = p['trend_reduce_size_pct']
+        trend_reduce_max_times = p['trend_reduce_max_times']
+        adverse_reduce_enabled = p['adverse_reduce_enabled']
+        adverse_reduce_step_pct_eff = p['adverse_reduce_step_pct_eff']
+        adverse_reduce_size_pct = p['adverse_reduce_size_pct']
+        adverse_reduce_max_times = p['adverse_reduce_max_times']
+
+        trend_add_on = trend_add_enabled and trend_add_step_pct_eff > 0 and trend_add_size_pct > 0
+        dca_add_on = dca_add_enabled and dca_add_step_pct_eff > 0 and dca_add_size_pct > 0
+        trend_reduce_on = trend_reduce_enabled and trend_reduce_step_pct_eff > 0 and trend_reduce_size_pct > 0
+        adverse_reduce_on = adverse_reduce_enabled and adverse_reduce_step_pct_eff > 0 and adverse_reduce_size_pct > 0
+        trailing_on = trailing_enabled and trailing_pct_eff > 0
+
+        # State: used for trailing exits and scale-in/scale-out anchor levels
+        highest_since_entry = None
+        lowest_since_entry = None
+        trend_add_times = 0
+        dca_add_times = 0
+        trend_reduce_times = 0
+        adverse_reduce_times = 0
+        last_trend_add_anchor = None
+        last_dca_add_anchor = None
+        last_trend_reduce_anchor = None
+        last_adverse_reduce_anchor = None
+
+        def bool_arr(key):
+            return np.asarray(signals[key]).astype(bool)
+
+        def price_arr(key):
+            if key in signals:
+                return np.asarray(signals[key], dtype=np.float64)
+            return np.zeros(n, dtype=np.float64)
+
+        open_long_arr = bool_arr('open_long')
+        close_long_arr = bool_arr('close_long')
+        open_short_arr = bool_arr('open_short')
+        close_short_arr = bool_arr('close_short')
+
+        # Apply execution timing to avoid look-ahead bias:
+        # If signals are computed using bar close, realistic execution is next bar open.
+        if next_bar_open:
+            open_long_arr = np.insert(open_long_arr[:-1], 0, False)
+            close_long_arr = np.insert(close_long_arr[:-1], 0, False)
+            open_short_arr = np.insert(open_short_arr[:-1], 0, False)
+            close_short_arr = np.insert(close_short_arr[:-1], 0, False)
+
+        # 根据交易方向过滤信号
+        if trade_direction == 'long':
+            open_short_arr = np.zeros(n, dtype=bool)
+            close_short_arr = np.zeros(n, dtype=bool)
+        elif trade_direction == 'short':
+            open_long_arr = np.zeros(n, dtype=bool)
+            close_long_arr = np.zeros(n, dtype=bool)
+
+        # 仓位管理（加仓信号）
+        has_position_management = 'add_long' in signals and 'add_short' in signals
+        if has_position_management:
+            add_long_arr = bool_arr('add_long')
+            add_short_arr = bool_arr('add_short')
+            if trade_direction == 'long':
+                add_short_arr = np.zeros(n, dtype=bool)
+            elif trade_direction == 'short':
+                add_long_arr = np.zeros(n, dtype=bool)
+        else:
+            add_long_arr = add_short_arr = np.zeros(n, dtype=bool)
+        position_size_arr = price_arr('position_size')
+
+        # 指标提供的精确开仓/平仓/加仓价格（0 表示未提供）
+        open_long_price_arr = price_arr('open_long_price')
+        open_short_price_arr = price_arr('open_short_price')
+        close_long_price_arr = price_arr('close_long_price')
+        close_short_price_arr = price_arr('close_short_price')
+        add_long_price_arr = price_arr('add_long_price')
+        add_short_price_arr = price_arr('add_short_price')
+
+        # 主信号K线上不执行任何加减仓
+        main_signal_arr = open_long_arr | open_short_arr | close_long_arr | close_short_arr
+
+        # Python 原生标量的逐元素访问远快于 numpy 标量
+        opens = np.asarray(open_arr, dtype=np.float64).tolist()
+        highs = np.asarray(high_arr, dtype=np.float64).tolist()
+        lows = np.asarray(low_arr, dtype=np.float64).tolist()
+        closes = np.asarray(close_arr, dtype=np.float64).tolist()
+        open_long_l = open_long_arr.tolist()
+        close_long_l = close_long_arr.tolist()
+        open_short_l = open_short_arr.tolist()
+        close_short_l = close_short_arr.tolist()
+        main_signal_l = main_signal_arr.tolist()
+        add_long_l = add_long_arr.tolist()
+        add_short_l = add_short_arr.tolist()
+        position_size_l = position_size_arr.tolist()
+        open_long_price_l = open_long_price_arr.tolist()
+        open_short_price_l = open_short_price_arr.tolist()
+        close_long_price_l = close_long_price_arr.tolist()
+        close_short_price_l = close_short_price_arr.tolist()
+        add_long_price_l = add_long_price_arr.tolist()
+        add_short_price_l = add_short_price_arr.tolist()
+
+        # 与旧引擎一致：价格/数量/盈亏按 numpy 规则取整
+        r = np.round
+        progress_step = max(1, n // 100)
+
+        for i in range(n):
+            if progress_callback is not None and i % progress_step == 0:
+                progress_callback('simulate', i, n, len(trades))
+
+            if is_liquidated:
+                continue  # equity 已预置为 0
+
+            # 若已无持仓且余额过低，视为赔光并停止后续交易
+            if position == 0 and capital < min_capital_to_trade:
+                is_liquidated = True
+                capital = 0.0
+                trades.append({
+                    'time': i,
+                    'type': 'liquidation',
+                    'price': round(float(closes[i] or 0), 4),
+                    'amount': 0,
+                    'profit': round(-initial_capital, 2),
+                    'balance': 0
+                })
+                continue
+
+            high = highs[i]
+            low = lows[i]
+            close = closes[i]
+            open_ = opens[i]
+
+            # --- Risk controls: SL / TP / trailing exit (highest priority) ---
+            if position != 0 and position_type is not None:
+                if highest_since_entry is None:
+                    highest_since_entry = entry_price
+                if lowest_since_entry is None:
+                    lowest_since_entry = entry_price
+                highest_since_entry = max(highest_since_entry, high)
+                lowest_since_entry = min(lowest_since_entry, low)
+
+                # 同一根K线内多个触发点按确定性优先级处理：止损 > 移动止盈(回撤) > 固定止盈
+                if position_type == 'long' and position > 0:
+                    trade_type = None
+                    if stop_loss_pct_eff > 0:
+                        sl_price = entry_price * (1 - stop_loss_pct_eff)
+                        if low <= sl_price:
+                            trade_type, trigger_price = 'close_long_stop', sl_price
+                    if trade_type is None and trailing_on:
+                        trail_active = True
+                        if trailing_activation_pct_eff > 0:
+                            trail_active = highest_since_entry >= entry_price * (1 + trailing_activation_pct_eff)
+                        if trail_active:
+                            tr_price = highest_since_entry * (1 - trailing_pct_eff)
+                            if low <= tr_price:
+                                trade_type, trigger_price = 'close_long_trailing', tr_price
+                    # Fixed take-profit exit is disabled when trailing is enabled.
+                    if trade_type is None and (not trailing_enabled) and take_profit_pct_eff > 0:
+                        tp_price = entry_price * (1 + take_profit_pct_eff)
+                        if high >= tp_price:
+                            trade_type, trigger_price = 'close_long_profit', tp_price
+
+                    if trade_type is not None:
+                        exec_price_close = trigger_price * (1 - slippage)
+                        commission_fee_close = position * exec_price_close * commission
+                        profit = (exec_price_close - entry_price) * position - commission_fee_close
+                        capital += profit
+                        total_commission_paid += commission_fee_close
+
+                        trades.append({
+                            'time': i,
+                            'type': trade_type,
+                            'price': r(exec_price_close, 4),
+                            'amount': r(position, 4),
+                            'profit': r(profit, 2),
+                            'balance': r(capital, 2)
+                        })
+
+                        position = 0
+                        position_type = None
+                        liquidation_price = 0
+                        highest_since_entry = None
+                        lowest_since_entry = None
+                        trend_add_times = dca_add_times = trend_reduce_times = adverse_reduce_times = 0
+                        last_trend_add_anchor = last_dca_add_anchor = last_trend_reduce_anchor = last_adverse_reduce_anchor = None
+
+                        equity[i] = capital
+                        continue
+
+                if position_type == 'short' and position < 0:
+                    shares = abs(position)
+                    trade_type = None
+                    if stop_loss_pct_eff > 0:
+                        sl_price = entry_price * (1 + stop_loss_pct_eff)
+                        if high >= sl_price:
+                            trade_type, trigger_price = 'close_short_stop', sl_price
+                    if trade_type is None and trailing_on:
+                        trail_active = True
+                        if trailing_activation_pct_eff > 0:
+                            trail_active = lowest_since_entry <= entry_price * (1 - trailing_activation_pct_eff)
+                        if trail_active:
+                            tr_price = lowest_since_entry * (1 + trailing_pct_eff)
+                            if high >= tr_price:
+                                trade_type, trigger_price = 'close_short_trailing', tr_price
+                    if trade_type is None and (not trailing_enabled) and take_profit_pct_eff > 0:
+                        tp_price = entry_price * (1 - take_profit_pct_eff)
+                        if low <= tp_price:
+                            trade_type, trigger_price = 'close_short_profit', tp_price
+
+                    if trade_type is not None:
+                        exec_price_close = trigger_price * (1 + slippage)
+                        commission_fee_close = shares * exec_price_close * commission
+                        profit = (entry_price - exec_price_close) * shares - commission_fee_close
+
+                        if capital + profit <= 0:
+                            capital = 0.0
+                            is_liquidated = True
+                            trades.append({
+                                'time': i,
+                                'type': 'liquidation',
+                                'price': r(exec_price_close, 4),
+                                'amount': r(shares, 4),
+                                'profit': round(-initial_capital, 2),
+                                'balance': 0
+                            })
+                            position = 0
+                            position_type = None
+                            liquidation_price = 0
+                            continue
+
+                        capital += profit
+                        total_commission_paid += commission_fee_close
+
+                        trades.append({
+                            'time': i,
+                            'type': trade_type,
+                            'price': r(exec_price_close, 4),
+                            'amount': r(shares, 4),
+                            'profit': r(profit, 2),
+                            'balance': r(capital, 2)
+                        })
+
+                        position = 0
+                        position_type = None
+                        liquidation_price = 0
+                        highest_since_entry = None
+                        lowest_since_entry = None
+                        trend_add_times = dca_add_times = trend_reduce_times = adverse_reduce_times = 0
+                        last_trend_add_anchor = last_dca_add_anchor = last_trend_reduce_anchor = last_adverse_reduce_anchor = None
+
+                        equity[i] = capital
+                        continue
+
+            # 处理平仓信号（signal close，非强制止盈止损）
+            if position > 0 and close_long_l[i]:
+                if next_bar_open:
+                    target_price = open_
+                else:
+                    target_price = close_long_price_l[i] if close_long_price_l[i] > 0 else close
+                exec_price = target_price * (1 - slippage)
+                commission_fee = position * exec_price * commission
+                profit = (exec_price - entry_price) * position - commission_fee
+                capital += profit
+                total_commission_paid += commission_fee
+
+                trades.append({
+                    'time': i,
+                    'type': 'close_long',
+                    'price': r(exec_price, 4),
+                    'amount': r(position, 4),
+                    'profit': r(profit, 2),
+                    'balance': r(capital, 2)
+                })
+
+                position = 0
+                position_type = None
+                liquidation_price = 0
+                highest_since_entry = None
+                lowest_since_entry = None
+                trend_add_times = dca_add_times = trend_reduce_times = adverse_reduce_times = 0
+                last_trend_add_anchor = last_dca_add_anchor = last_trend_reduce_anchor = last_adverse_reduce_anchor = None
+
+                # 平仓后余额过低则停止交易（避免同K线反手开仓）
+                if capital < min_capital_to_trade:
+                    is_liquidated = True
+                    capital = 0.0
+                    trades.append({
+                        'time': i,
+                        'type': 'liquidation',
+                        'price': r(exec_price, 4),
+                        'amount': 0,
+                        'profit': round(-initial_capital, 2),
+                        'balance': 0
+                    })
+
+            elif position < 0 and close_short_l[i]:
+                if next_bar_open:
+                    target_price = open_
+                else:
+                    target_price = close_short_price_l[i] if close_short_price_l[i] > 0 else close
+                exec_price = target_price * (1 + slippage)
+                shares = abs(position)
+                commission_fee = shares * exec_price * commission
+                profit = (entry_price - exec_price) * shares - commission_fee
+
+                if capital + profit <= 0:
+                    logger.warning(f"平空时资金不足爆仓")
+                    capital = 0.0
+                    is_liquidated = True
+                    trades.append({
+                        'time': i,
+                        'type': 'liquidation',
+                        'price': r(exec_price, 4),
+                        'amount': r(shares, 4),
+                        'profit': 0,
+                        'balance': 0
+                    })
+                    position = 0
+                    position_type = None
+                    continue
+
+                capital += profit
+                total_commission_paid += commission_fee
+
+                trades.append({
+                    'time': i,
+                    'type': 'close_short',
+                    'price': r(exec_price, 4),
+                    'amount': r(shares, 4),
+                    'profit': r(profit, 2),
+                    'balance': r(capital, 2)
+                })
+
+                position = 0
+                position_type = None
+                liquidation_price = 0
+                highest_since_entry = None
+                lowest_since_entry = None
+                trend_add_times = dca_add_times = trend_reduce_times = adverse_reduce_times = 0
+                last_trend_add_anchor = last_dca_add_anchor = last_trend_reduce_anchor = last_adverse_reduce_anchor = None
+
+                if capital < min_capital_to_trade:
+                    is_liquidated = True
+                    capital = 0.0
+                    trades.append({
+                        'time': i,
+                        'type': 'liquidation',
+                        'price': r(exec_price, 4),
+                        'amount': 0,
+                        'profit': round(-initial_capital, 2),
+                        'balance': 0
+                    })
+
+            main_signal_on_bar = main_signal_l[i]
+
+            # --- Parameterized scaling rules (no strategy code needed) ---
+            if (not main_signal_on_bar) and position != 0 and position_type is not None and capital >= min_capital_to_trade:
+                if position_type == 'long' and position > 0:
+                    # Trend scale-in (trigger on higher price)
+                    if trend_add_on and (trend_add_max_times == 0 or trend_add_times < trend_add_max_times):
+                        anchor = last_trend_add_anchor if last_trend_add_anchor is not None else entry_price
+                        trigger = anchor * (1 + trend_add_step_pct_eff)
+                        if high >= trigger:
+                            exec_price_add = trigger * (1 + slippage)
+                            shares_add = (capital * trend_add_size_pct * leverage) / exec_price_add
+                            commission_fee = shares_add * exec_price_add * commission
+                            total_cost_after = position * entry_price + shares_add * exec_price_add
+                            position += shares_add
+                            entry_price = total_cost_after / position
+                            capital -= commission_fee
+                            total_commission_paid += commission_fee
+                            liquidation_price = entry_price * (1 - 1.0 / leverage)
+                            trend_add_times += 1
+                            last_trend_add_anchor = trigger
+                            trades.append({
+                                'time': i,
+                                'type': 'add_long',
+                                'price': r(exec_price_add, 4),
+                                'amount': r(shares_add, 4),
+                                'profit': 0,
+                                'balance': r(capital, 2)
+                            })
+
+                    # Mean-reversion DCA (trigger on lower price)
+                    if dca_add_on and (dca_add_max_times == 0 or dca_add_times < dca_add_max_times):
+                        anchor = last_dca_add_anchor if last_dca_add_anchor is not None else entry_price
+                        trigger = anchor * (1 - dca_add_step_pct_eff)
+                        if low <= trigger:
+                            exec_price_add = trigger * (1 + slippage)
+                            shares_add = (capital * dca_add_size_pct * leverage) / exec_price_add
+                            commission_fee = shares_add * exec_price_add * commission
+                            total_cost_after = position * entry_price + shares_add * exec_price_add
+                            position += shares_add
+                            entry_price = total_cost_after / position
+                            capital -= commission_fee
+                            total_commission_paid += commission_fee
+                            liquidation_price = entry_price * (1 - 1.0 / leverage)
+                            dca_add_times += 1
+                            last_dca_add_anchor = trigger
+                            trades.append({
+                                'time': i,
+                                'type': 'add_long',
+                                'price': r(exec_price_add, 4),
+                                'amount': r(shares_add, 4),
+                                'profit': 0,
+                                'balance': r(capital, 2)
+                            })
+
+                    # Trend reduce (trigger on higher price)
+                    if trend_reduce_on and (trend_reduce_max_times == 0 or trend_reduce_times < trend_reduce_max_times):
+                        anchor = last_trend_reduce_anchor if last_trend_reduce_anchor is not None else entry_price
+                        trigger = anchor * (1 + trend_reduce_step_pct_eff)
+                        if high >= trigger:
+                            reduce_shares = position * max(trend_reduce_size_pct, 0.0)
+                            if reduce_shares > 0:
+                                exec_price_reduce = trigger * (1 - slippage)
+                                commission_fee = reduce_shares * exec_price_reduce * commission
+                                profit = (exec_price_reduce - entry_price) * reduce_shares - commission_fee
+                                capital += profit
+                                total_commission_paid += commission_fee
+                                position -= reduce_shares
+                                if position <= 1e-12:
+                                    position = 0
+                                    position_type = None
+                                    liquidation_price = 0
+                                else:
+                                    liquidation_price = entry_price * (1 - 1.0 / leverage)
+                                trend_reduce_times += 1
+                                last_trend_reduce_anchor = trigger
+                                trades.append({
+                                    'time': i,
+                                    'type': 'reduce_long',
+                                    'price': r(exec_price_reduce, 4),
+                                    'amount': r(reduce_shares, 4),
+                                    'profit': r(profit, 2),
+                                    'balance': r(capital, 2)
+                                })
+
+                    # Adverse reduce (trigger on lower price)
+                    if position_type == 'long' and position > 0 and adverse_reduce_on and (adverse_reduce_max_times == 0 or adverse_reduce_times < adverse_reduce_max_times):
+                        anchor = last_adverse_reduce_anchor if last_adverse_reduce_anchor is not None else entry_price
+                        trigger = anchor * (1 - adverse_reduce_step_pct_eff)
+                        if low <= trigger:
+                            reduce_shares = position * max(adverse_reduce_size_pct, 0.0)
+                            if reduce_shares > 0:
+                                exec_price_reduce = trigger * (1 - slippage)
+                                commission_fee = reduce_shares * exec_price_reduce * commission
+                                profit = (exec_price_reduce - entry_price) * reduce_shares - commission_fee
+                                capital += profit
+                                total_commission_paid += commission_fee
+                                position -= reduce_shares
+                                if position <= 1e-12:
+                                    position = 0
+                                    position_type = None
+                                    liquidation_price = 0
+                                else:
+                                    liquidation_price = entry_price * (1 - 1.0 / leverage)
+                                adverse_reduce_times += 1
+                                last_adverse_reduce_anchor = trigger
+                                trades.append({
+                                    'time': i,
+                                    'type': 'reduce_long',
+                                    'price': r(exec_price_reduce, 4),
+                                    'amount': r(reduce_shares, 4),
+                                    'profit': r(profit, 2),
+                                    'balance': r(capital, 2)
+                                })
+
+                if position_type == 'short' and position < 0:
+                    shares_total = abs(position)
+
+                    # Trend scale-in (trigger on lower price)
+                    if trend_add_on and (trend_add_max_times == 0 or trend_add_times < trend_add_max_times):
+                        anchor = last_trend_add_anchor if last_trend_add_anchor is not None else entry_price
+                        trigger = anchor * (1 - trend_add_step_pct_eff)
+                        if low <= trigger:
+                            exec_price_add = trigger * (1 - slippage)  # 卖出加空，滑点不利
+                            shares_add = (capital * trend_add_size_pct * leverage) / exec_price_add
+                            commission_fee = shares_add * exec_price_add * commission
+                            total_cost_after = shares_total * entry_price + shares_add * exec_price_add
+                            position -= shares_add
+                            shares_total = abs(position)
+                            entry_price = total_cost_after / shares_total
+                            capital -= commission_fee
+                            total_commission_paid += commission_fee
+                            liquidation_price = entry_price * (1 + 1.0 / leverage)
+                            trend_add_times += 1
+                            last_trend_add_anchor = trigger
+                            trades.append({
+                                'time': i,
+                                'type': 'add_short',
+                                'price': r(exec_price_add, 4),
+                                'amount': r(shares_add, 4),
+                                'profit': 0,
+                                'balance': r(capital, 2)
+                            })
+
+                    # Mean-reversion DCA (trigger on higher price)
+                    if dca_add_on and (dca_add_max_times == 0 or dca_add_times < dca_add_max_times):
+                        anchor = last_dca_add_anchor if last_dca_add_anchor is not None else entry_price
+                        trigger = anchor * (1 + dca_add_step_pct_eff)
+                        if high >= trigger:
+                            exec_price_add = trigger * (1 - slippage)
+                            shares_add = (capital * dca_add_size_pct * leverage) / exec_price_add
+                            commission_fee = shares_add * exec_price_add * commission
+                            total_cost_after = shares_total * entry_price + shares_add * exec_price_add
+                            position -= shares_add
+                            shares_total = abs(position)
+                            entry_price = total_cost_after / shares_total
+                            capital -= commission_fee
+                            total_commission_paid += commission_fee
+                            liquidation_price = entry_price * (1 + 1.0 / leverage)
+                            dca_add_times += 1
+                            last_dca_add_anchor = trigger
+                            trades.append({
+                                'time': i,
+                                'type': 'add_short',
+                                'price': r(exec_price_add, 4),
+                                'amount': r(shares_add, 4),
+                                'profit': 0,
+                                'balance': r(capital, 2)
+                            })
+
+                    # Trend reduce (trigger on lower price)
+                    if trend_reduce_on and (trend_reduce_max_times == 0 or trend_reduce_times < trend_reduce_max_times):
+                        anchor = last_trend_reduce_anchor if last_trend_reduce_anchor is not None else entry_price
+                        trigger = anchor * (1 - trend_reduce_step_pct_eff)
+                        if low <= trigger:
+                            reduce_shares = shares_total * max(trend_reduce_size_pct, 0.0)
+                            if reduce_shares > 0:
+                                exec_price_reduce = trigger * (1 + slippage)  # 回补更贵
+                                commission_fee = reduce_shares * exec_price_reduce * commission
+                                profit = (entry_price - exec_price_reduce) * reduce_shares - commission_fee
+                                capital += profit
+                                total_commission_paid += commission_fee
+                                position += reduce_shares
+                                shares_total = abs(position)
+                                if shares_total <= 1e-12:
+                                    position = 0
+                                    position_type = None
+                                    liquidation_price = 0
+                                else:
+                                    liquidation_price = entry_price * (1 + 1.0 / leverage)
+                                trend_reduce_times += 1
+                                last_trend_reduce_anchor = trigger
+                                trades.append({
+                                    'time': i,
+                                    'type': 'reduce_short',
+                                    'price': r(exec_price_reduce, 4),
+                                    'amount': r(reduce_shares, 4),
+                                    'profit': r(profit, 2),
+                                    'balance': r(capital, 2)
+                                })
+
+                    # Adverse reduce (trigger on higher price)
+                    if position_type == 'short' and position < 0 and adverse_reduce_on and (adverse_reduce_max_times == 0 or adverse_reduce_times < adverse_reduce_max_times):
+                        anchor = last_adverse_reduce_anchor if last_adverse_reduce_anchor is not None else entry_price
+                        trigger = anchor * (1 + adverse_reduce_step_pct_eff)
+                        if high >= trigger:
+                            reduce_shares = shares_total * max(adverse_reduce_size_pct, 0.0)
+                            if reduce_shares > 0:
+                                exec_price_reduce = trigger * (1 + slippage)
+                                commission_fee = reduce_shares * exec_price_reduce * commission
+                                profit = (entry_price - exec_price_reduce) * reduce_shares - commission_fee
+                                capital += profit
+                                total_commission_paid += commission_fee
+                                position += reduce_shares
+                                shares_total = abs(position)
+                                if shares_total <= 1e-12:
+                                    position = 0
+                                    position_type = None
+                                    liquidation_price = 0
+                                else:
+                                    liquidation_price = entry_price * (1 + 1.0 / leverage)
+                                adverse_reduce_times += 1
+                                last_adverse_reduce_anchor = trigger
+                                trades.append({
+                                    'time': i,
+                                    'type': 'reduce_short',
+                                    'price': r(exec_price_reduce, 4),
+                                    'amount': r(reduce_shares, 4),
+                                    'profit': r(profit, 2),
+                                    'balance': r(capital, 2)
+                                })
+
+            # 处理加仓信号（仓位管理模式）
+            if has_position_management and (not main_signal_on_bar):
+                if position > 0 and add_long_l[i] and capital >= min_capital_to_trade:
+                    target_price = add_long_price_l[i] if add_long_price_l[i] > 0 else close
+                    exec_price = target_price * (1 + slippage)
+                    position_pct = position_size_l[i] if position_size_l[i] > 0 else 0.1
+                    shares = (capital * position_pct * leverage) / exec_price
+                    commission_fee = shares * exec_price * commission
+                    total_cost_after = position * entry_price + shares * exec_price
+                    position += shares
+                    entry_price = total_cost_after / position
+                    capital -= commission_fee
+                    total_commission_paid += commission_fee
+                    liquidation_price = entry_price * (1 - 1.0 / leverage)
+                    trades.append({
+                        'time': i,
+                        'type': 'add_long',
+                        'price': r(exec_price, 4),
+                        'amount': r(shares, 4),
+                        'profit': 0,
+                        'balance': r(capital, 2)
+                    })
 
-            # Validation: if chart signals are provided, df['buy']/df['sell'] must exist for backtest normalization.
-            # This keeps indicator scripts simple and consistent (chart=buy/sell, execution=normalized in backend).
-            output_obj = exec_env.get('output')
-            has_output_signals = isinstance(output_obj, dict) and isinstance(output_obj.get('signals'), list) and len(output_obj.get('signals')) > 0
-            if has_output_signals and not all(col in executed_df.columns for col in ['buy', 'sell']):
-                raise ValueError(
-                    "Invalid indicator script: output['signals'] is provided, but df['buy'] and df['sell'] are missing. "
-                    "Please set df['buy'] and df['sell'] as boolean columns (len == len(df))."
-                )
-            
-            # Extract signals from executed df
-            if all(col in executed_df.columns for col in ['open_long', 'close_long', 'open_short', 'close_short']):
-                
-                signals = {
-                    'open_long': executed_df['open_long'].fillna(False).astype(bool),
-                    'close_long': executed_df['close_long'].fillna(False).astype(bool),
-                    'open_short': executed_df['open_short'].fillna(False).astype(bool),
-                    'close_short': executed_df['close_short'].fillna(False).astype(bool)
-                }
-                
-                # Convention: backtest uses 4-way signals only.
-                # Position sizing, TP/SL, trailing, etc must be handled by strategy_config / strategy logic.
-            elif all(col in executed_df.columns for col in ['buy', 'sell']):
-                # Simple buy/sell signals (recommended for indicator authors)
-                signals = {
-                    'buy': executed_df['buy'].fillna(False).astype(bool),
-                    'sell': executed_df['sell'].fillna(False).astype(bool)
-                }
-            
-            else:
-                raise ValueError(
-                    "Indicator must define either 4-way columns "
-                    "(df['open_long'], df['close_long'], df['open_short'], df['close_short']) "
-                    "or simple columns (df['buy'], df['sell'])."
-                )
-            
-        except Exception as e:
-            logger.error(f"指标代码执行错误: {e}")
-            logger.error(traceback.format_exc())
-        
-        return signals
-    
-    def _get_indicator_functions(self) -> Dict:
-        """获取技术指标函数"""
-        def SMA(series, period):
-            return series.rolling(window=period).mean()
-        
-        def EMA(series, period):
-            return series.ewm(span=period, adjust=False).mean()
-        
-        def RSI(series, period=14):
-            delta = series.diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-            rs = gain / loss
-            return 100 - (100 / (1 + rs))
-        
-        def MACD(series, fast=12, slow=26, signal=9):
-            exp1 = series.ewm(span=fast, adjust=False).mean()
-            exp2 = series.ewm(span=slow, adjust=False).mean()
-            macd = exp1 - exp2
-            macd_signal = macd.ewm(span=signal, adjust=False).mean()
-            macd_hist = macd - macd_signal
-            return macd, macd_signal, macd_hist
-        
-        def BOLL(series, period=20, std_dev=2):
-            middle = series.rolling(window=period).mean()
-            std = series.rolling(window=period).std()
-            upper = middle + std_dev * std
-            lower = middle - std_dev * std
-            return upper, middle, lower
-        
-        def ATR(high, low, close, period=14):
-            tr1 = high - low
-            tr2 = abs(high - close.shift())
-            tr3 = abs(low - close.shift())
-            tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-            return tr.rolling(window=period).mean()
-        
-        def CROSSOVER(series1, series2):
-            return (series1 > series2) & (series1.shift(1) <= series2.shift(1))
-        
-        def CROSSUNDER(series1, series2):
-            return (series1 < series2) & (series1.shift(1) >= series2.shift(1))
-        
-        return {
-            'SMA': SMA,
-            'EMA': EMA,
-            'RSI': RSI,
-            'MACD': MACD,
-            'BOLL': BOLL,
-            'ATR': ATR,
-            'CROSSOVER': CROSSOVER,
-            'CROSSUNDER': CROSSUNDER,
-        }
-    
-    def _simulate_trading(
-        self,
-        df: pd.DataFrame,
-        signals,
-        initial_capital: float,
-        commission: float,
-        slippage: float,
-        leverage: int = 1,
-        trade_direction: str = 'long',
-        strategy_config: Optional[Dict[str, Any]] = None
-    ) -> tuple:
-        """
-        模拟交易
-        
-        Args:
-            signals: 信号，可以是 pd.Series (旧格式) 或 dict (新格式四种信号)
-            trade_direction: 交易方向
-                - 'long': 只做多 (buy->sell)
-                - 'short': 只做空 (sell->buy, 收益反向)
-                - 'both': 双向 (buy->sell做多 + sell->buy做空)
-        """
-        # Normalize supported signal formats into 4-way signals.
-        if not isinstance(signals, dict):
-            raise ValueError("signals must be a dict (either 4-way or buy/sell).")
+                elif position < 0 and add_short_l[i] and capital >= min_capital_to_trade:
+                    target_price = add_short_price_l[i] if add_short_price_l[i] > 0 else close
+                    exec_price = target_price * (1 - slippage)
+                    position_pct = position_size_l[i] if position_size_l[i] > 0 else 0.1
+                    shares = (capital * position_pct * leverage) / exec_price
+                    commission_fee = shares * exec_price * commission
+                    total_cost_after = abs(position) * entry_price + shares * exec_price
+                    position -= shares  # 空头是负数
+                    entry_price = total_cost_after / abs(position)
+                    capital -= commission_fee
+                    total_commission_paid += commission_fee
+                    liquidation_price = entry_price * (1 + 1.0 / leverage)
+                    trades.append({
+                        'time': i,
+                        'type': 'add_short',
+                        'price': r(exec_price, 4),
+                        'amount': r(shares, 4),
+                        'profit': 0,
+                        'balance': r(capital, 2)
+                    })
 
-        if all(k in signals for k in ['open_long', 'close_long', 'open_short', 'close_short']):
-            norm = signals
-        elif all(k in signals for k in ['buy', 'sell']):
-            buy = signals['buy'].fillna(False).astype(bool)
-            sell = signals['sell'].fillna(False).astype(bool)
-
-            td = (trade_direction or 'both')
-            td = str(td).lower()
-            if td not in ['long', 'short', 'both']:
-                td = 'both'
-
-            # Mapping rules:
-            # - long: buy=open_long, sell=close_long
-            # - short: sell=open_short, buy=close_short
-            # - both: buy=open_long+close_short, sell=open_short+close_long
-            if td == 'long':
-                norm = {
-                    'open_long': buy,
-                    'close_long': sell,
-                    'open_short': pd.Series([False] * len(df), index=df.index),
-                    'close_short': pd.Series([False] * len(df), index=df.index),
-                }
-            elif td == 'short':
-                norm = {
-                    'open_long': pd.Series([False] * len(df), index=df.index),
-                    'close_long': pd.Series([False] * len(df), index=df.index),
-                    'open_short': sell,
-                    'close_short': buy,
-                }
+            # 处理开仓信号
+            if open_long_l[i] and position == 0 and capital >= min_capital_to_trade:
+                if next_bar_open:
+                    base_price = open_
+                else:
+                    base_price = open_long_price_l[i] if open_long_price_l[i] > 0 else close
+                exec_price = base_price * (1 + slippage)
+
+                # 优先采用回测弹窗的 entryPct；其次采用指标提供的 position_size；否则全仓
+                position_pct = None
+                if entry_pct_cfg and entry_pct_cfg > 0:
+                    position_pct = entry_pct_cfg
+                elif has_position_management and position_size_l[i] > 0:
+                    position_pct = position_size_l[i]
+                if position_pct is not None and 0 < position_pct < 1:
+                    shares = (capital * position_pct * leverage) / exec_price
+                else:
+                    shares = (capital * leverage) / exec_price
+
+                commission_fee = shares * exec_price * commission
+
+                position = shares
+                entry_price = exec_price
+                position_type = 'long'
+                capital -= commission_fee
+                total_commission_paid += commission_fee
+                liquidation_price = entry_price * (1 - 1.0 / leverage)
+                highest_since_entry = entry_price
+                lowest_since_entry = entry_price
+                last_trend_add_anchor = entry_price
+                last_dca_add_anchor = entry_price
+                last_trend_reduce_anchor = entry_price
+                last_adverse_reduce_anchor = entry_price
+
+                trades.append({
+                    'time': i,
+                    'type': 'open_long',
+                    'price': r(exec_price, 4),
+                    'amount': r(shares, 4),
+                    'profit': 0,
+                    'balance': r(capital, 2)
+                })
+
+                # Strict intrabar stop-loss / liquidation check right after entry (closer to live trading).
+                sl_price = entry_price * (1 - stop_loss_pct_eff) if stop_loss_pct_eff > 0 else None
+                hit_sl = (sl_price is not None) and (low <= sl_price)
+                hit_liq = liquidation_price > 0 and (low <= liquidation_price)
+                if position > 0 and (hit_sl or hit_liq):
+                    if hit_liq and (not hit_sl or sl_price <= liquidation_price):
+                        is_liquidated = True
+                        capital = 0.0
+                        trades.append({
+                            'time': i,
+                            'type': 'liquidation',
+                            'price': r(liquidation_price, 4),
+                            'amount': r(position, 4),
+                            'profit': round(-initial_capital, 2),
+                            'balance': 0
+                        })
+                    else:
+                        exec_price_close = sl_price * (1 - slippage)
+                        commission_fee_close = position * exec_price_close * commission
+                        profit = (exec_price_close - entry_price) * position - commission_fee_close
+                        capital += profit
+                        total_commission_paid += commission_fee_close
+                        if capital <= 0:
+                            is_liquidated = True
+                            capital = 0.0
+                        trades.append({
+                            'time': i,
+                            'type': 'close_long_stop',
+                            'price': r(exec_price_close, 4),
+                            'amount': r(position, 4),
+                            'profit': r(profit, 2),
+                            'balance': r(capital, 2)
+                        })
+
+                    position = 0
+                    position_type = None
+                    liquidation_price = 0
+                    highest_since_entry = None
+                    lowest_since_entry = None
+                    equity[i] = capital
+                    continue
+
+            elif open_short_l[i] and position == 0 and capital >= min_capital_to_trade:
+                if next_bar_open:
+                    base_price = open_
+                else:
+                    base_price = open_short_price_l[i] if open_short_price_l[i] > 0 else close
+                exec_price = base_price * (1 - slippage)
+
+                position_pct = None
+                if entry_pct_cfg and entry_pct_cfg > 0:
+                    position_pct = entry_pct_cfg
+                elif has_position_management and position_size_l[i] > 0:
+                    position_pct = position_size_l[i]
+                if position_pct is not None and 0 < position_pct < 1:
+                    shares = (capital * position_pct * leverage) / exec_price
+                else:
+                    shares = (capital * leverage) / exec_price
+
+                commission_fee = shares * exec_price * commission
+
+                position = -shares
+                entry_price = exec_price
+                position_type = 'short'
+                capital -= commission_fee
+                total_commission_paid += commission_fee
+                liquidation_price = entry_price * (1 + 1.0 / leverage)
+                highest_since_entry = entry_price
+                lowest_since_entry = entry_price
+                last_trend_add_anchor = entry_price
+                last_dca_add_anchor = entry_price
+                last_trend_reduce_anchor = entry_price
+                last_adverse_reduce_anchor = entry_price
+
+                trades.append({
+                    'time': i,
+                    'type': 'open_short',
+                    'price': r(exec_price, 4),
+                    'amount': r(shares, 4),
+                    'profit': 0,
+                    'balance': r(capital, 2)
+                })
+
+                # Strict intrabar stop-loss / liquidation check right after entry (closer to live trading).
+                sl_price = entry_price * (1 + stop_loss_pct_eff) if stop_loss_pct_eff > 0 else None
+                hit_sl = (sl_price is not None) and (high >= sl_price)
+                hit_liq = liquidation_price > 0 and (high >= liquidation_price)
+                if position < 0 and (hit_sl or hit_liq):
+                    if hit_liq and (not hit_sl or sl_price >= liquidation_price):
+                        is_liquidated = True
+                        capital = 0.0
+                        trades.append({
+                            'time': i,
+                            'type': 'liquidation',
+                            'price': r(liquidation_price, 4),
+                            'amount': r(abs(position), 4),
+                            'profit': round(-initial_capital, 2),
+                            'balance': 0
+                        })
+                    else:
+                        exec_price_close = sl_price * (1 + slippage)
+                        shares_close = abs(position)
+                        commission_fee_close = shares_close * exec_price_close * commission
+                        profit = (entry_price - exec_price_close) * shares_close - commission_fee_close
+                        capital += profit
+                        total_commission_paid += commission_fee_close
+                        if capital <= 0:
+                            is_liquidated = True
+                            capital = 0.0
+                        trades.append({
+                            'time': i,
+                            'type': 'close_short_stop',
+                            'price': r(exec_price_close, 4),
+                            'amount': r(shares_close, 4),
+                            'profit': r(profit, 2),
+                            'balance': r(capital, 2)
+                        })
+
+                    position = 0
+                    position_type = None
+                    liquidation_price = 0
+                    highest_since_entry = None
+                    lowest_since_entry = None
+                    equity[i] = capital
+                    continue
+
+            # 检测持仓期间是否触及爆仓线（兜底保护；若同K线有更严格的止损信号则止损优先）
+            if position != 0 and not is_liquidated:
+                if position_type == 'long' and low <= liquidation_price:
+                    has_stop_loss = close_long_l[i] and close_long_price_l[i] > 0
+                    stop_loss_price = close_long_price_l[i] if has_stop_loss else 0
+
+                    if has_stop_loss and stop_loss_price > liquidation_price:
+                        exec_price_close = stop_loss_price * (1 - slippage)
+                        commission_fee_close = position * exec_price_close * commission
+                        profit = (exec_price_close - entry_price) * position - commission_fee_close
+                        capital += profit
+                        total_commission_paid += commission_fee_close
+                        trades.append({
+                            'time': i,
+                            'type': 'close_long_stop',
+                            'price': r(exec_price_close, 4),
+                            'amount': r(position, 4),
+                            'profit': r(profit, 2),
+                            'balance': r(capital, 2)
+                        })
+                    else:
+                        logger.warning(f"做多爆仓！开仓价={entry_price:.2f}, 最低价={low:.2f}, "
+                                     f"爆仓线={liquidation_price:.2f}, 止损价={stop_loss_price:.2f}")
+                        is_liquidated = True
+                        capital = 0.0
+                        trades.append({
+                            'time': i,
+                            'type': 'liquidation',
+                            'price': r(liquidation_price, 4),
+                            'amount': r(abs(position), 4),
+                            'profit': round(-initial_capital, 2),
+                            'balance': 0
+                        })
+
+                    position = 0
+                    position_type = None
+                    equity[i] = capital
+                    unrounded_idx.append(i)
+                    continue
+
+                elif position_type == 'short' and high >= liquidation_price:
+                    has_stop_loss = close_short_l[i] and close_short_price_l[i] > 0
+                    stop_loss_price = close_short_price_l[i] if has_stop_loss else 0
+
+                    logger.warning(f"[K线{i}] 做空触及爆仓线！开仓={entry_price:.2f}, 最高={high:.2f}, 爆仓线={liquidation_price:.2f}, "
+                              f"止损信号={close_short_l[i]}, 止损价={stop_loss_price:.4f}")
+
+                    if has_stop_loss and stop_loss_price < liquidation_price:
+                        exec_price_close = stop_loss_price * (1 + slippage)
+                        shares_close = abs(position)
+                        commission_fee_close = shares_close * exec_price_close * commission
+                        profit = (entry_price - exec_price_close) * shares_close - commission_fee_close
+                        capital += profit
+                        total_commission_paid += commission_fee_close
+                        trades.append({
+                            'time': i,
+                            'type': 'close_short_stop',
+                            'price': r(exec_price_close, 4),
+                            'amount': r(shares_close, 4),
+                            'profit': r(profit, 2),
+                            'balance': r(capital, 2)
+                        })
+                    else:
+                        logger.warning(f"做空爆仓！开仓价={entry_price:.2f}, 最高价={high:.2f}, "
+                                     f"爆仓线={liquidation_price:.2f}, 止损价={stop_loss_price:.2f}")
+                        is_liquidated = True
+                        capital = 0.0
+                        trades.append({
+                            'time': i,
+                            'type': 'liquidation',
+                            'price': r(liquidation_price, 4),
+                            'amount': r(abs(position), 4),
+                            'profit': round(-initial_capital, 2),
+                            'balance': 0
+                        })
+
+                    position = 0
+                    position_type = None
+                    equity[i] = capital
+                    unrounded_idx.append(i)
+                    continue
+
+            # 记录权益（使用收盘价计算未实现盈亏）
+            if position_type == 'long':
+                total_value = capital + (close - entry_price) * position
+            elif position_type == 'short':
+                total_value = capital + (entry_price - close) * abs(position)
             else:
-                norm = {
-                    'open_long': buy,
-                    'close_long': sell,
-                    'open_short': sell,
-                    'close_short': buy,
-                }
+                total_value = capital
+            if total_value < 0:
+                total_value = 0.0
+            equity[i] = total_value
+
+        # 回测结束时强制平仓
+        if position != 0 and n > 0:
+            final_close = closes[-1]
+
+            if position > 0:  # 平多
+                exec_price = final_close * (1 - slippage)
+                commission_fee = position * exec_price * commission
+                profit = (exec_price - entry_price) * position - commission_fee
+                capital += profit
+                total_commission_paid += commission_fee
+                trades.append({
+                    'time': n - 1,
+                    'type': 'close_long',
+                    'price': r(exec_price, 4),
+                    'amount': r(position, 4),
+                    'profit': r(profit, 2),
+                    'balance': r(capital, 2)
+                })
+            else:  # 平空
+                exec_price = final_close * (1 + slippage)
+                shares = abs(position)
+                commission_fee = shares * exec_price * commission
+                profit = (entry_price - exec_price) * shares - commission_fee
+
+                if capital + profit <= 0:
+                    logger.warning(f"回测结束爆仓！")
+                    capital = 0.0
+                    is_liquidated = True
+                    trades.append({
+                        'time': n - 1,
+                        'type': 'liquidation',
+                        'price': r(exec_price, 4),
+                        'amount': r(shares, 4),
+                        'profit': 0,
+                        'balance': 0
+                    })
+                else:
+                    capital += profit
+                    total_commission_paid += commission_fee
+                    trades.append({
+                        'time': n - 1,
+                        'type': 'close_short',
+                        'price': r(exec_price, 4),
+                        'amount': r(shares, 4),
+                        'profit': r(profit, 2),
+                        'balance': r(capital, 2)
+                    })
+
+            equity[n - 1] = capital
+            if unrounded_idx and unrounded_idx[-1] == n - 1:
+                unrounded_idx.pop()
+
+        # 统一取整（与旧引擎逐点 round(value, 2) 结果一致）
+        if unrounded_idx:
+            raw = equity[unrounded_idx]
+            equity = np.round(equity, 2)
+            equity[unrounded_idx] = raw
         else:
-            raise ValueError("signals dict must contain either 4-way keys or buy/sell keys.")
+            equity = np.round(equity, 2)
+
+        return equity, trades, total_commission_paid
+
+    def _format_trade_times(self, index: pd.DatetimeIndex, trades: List[Dict[str, Any]]) -> None:
+        """将交易记录中暂存的K线下标替换为格式化时间（原地修改）"""
+        if not trades:
+            return
+        times = index[[t['time'] for t in trades]].strftime('%Y-%m-%d %H:%M')
+        for trade, time_str in zip(trades, times):
+            trade['time'] = time_str
+
+    def _format_equity_curve(self, index: pd.DatetimeIndex, equity: np.ndarray, max_points: int = 500) -> List[Dict[str, Any]]:
+        """按 _format_result 的抽样规则抽样权益数组，仅对保留的点格式化时间"""
+        step = 1
+        if len(equity) > max_points:
+            step = len(equity) // max_points
+        times = index[::step].strftime('%Y-%m-%d %H:%M')
+        values = equity[::step].tolist()
+        return [{'time': t, 'value': v} for t, v in zip(times, values)]
 
-        return self._simulate_trading_new_format(df, norm, initial_capital, commission, slippage, leverage, trade_direction, strategy_config)
-    
     def _simulate_trading_new_format(
         self,
         df: pd.DataFrame,
@@ -2684,7 +4051,7 @@ import pandas as pd
     
     def _calculate_metrics(
         self,
-        equity_curve: List,
+        equity_values,
         trades: List,
         initial_capital: float,
         timeframe: str,
@@ -2692,11 +4059,18 @@ import pandas as pd
         end_date: datetime,
         total_commission: float = 0
     ) -> Dict:
-        """计算回测指标"""
-        if not equity_curve:
+        """
+        计算回测指标
+
+        Args:
+            equity_values: 权益序列（float64 数组或数值列表）
+        """
+        values = np.asarray(equity_values, dtype=np.float64)
+        if values.size == 0:
             return {}
         
-        final_value = equity_curve[-1]['value']
+        final_value = values[-1]
+        total_commission = np.float64(total_commission)
         total_return = (final_value - initial_capital) / initial_capital * 100
         
         # 计算年化收益：使用简单年化而不是复利年化
@@ -2711,7 +4085,6 @@ import pandas as pd
             annual_return = 0
         
         # 计算最大回撤
-        values = [e['value'] for e in equity_curve]
         max_drawdown = self._calculate_max_drawdown(values)
         
         # 计算夏普比率
@@ -2745,24 +4118,21 @@ import pandas as pd
             'totalCommission': round(total_commission, 2)
         }
     
-    def _calculate_max_drawdown(self, values: List[float]) -> float:
-        """计算最大回撤"""
-        if not values:
+    def _calculate_max_drawdown(self, values) -> float:
+        """计算最大回撤（向量化：运行峰值 np.maximum.accumulate）"""
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
             return 0
         
-        peak = values[0]
-        max_dd = 0
-        
-        for value in values:
-            if value > peak:
-                peak = value
-            dd = (peak - value) / peak * 100
-            if dd > max_dd:
-                max_dd = dd
+        peak = np.maximum.accumulate(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dd = (peak - values) / peak * 100
+        dd = dd[~np.isnan(dd)]
+        max_dd = dd.max() if dd.size else 0
         
-        return -max_dd
+        return -max_dd if max_dd > 0 else 0
     
-    def _calculate_sharpe(self, values: List[float], timeframe: str = '1D', risk_free_rate: float = 0.02) -> float:
+    def _calculate_sharpe(self, values, timeframe: str = '1D', risk_free_rate: float = 0.02) -> float:
         """
         计算夏普比率
         
@@ -2771,11 +4141,12 @@ import pandas as pd
             timeframe: 时间周期
             risk_free_rate: 无风险收益率（年化）
         """
+        values = np.asarray(values, dtype=np.float64)
         if len(values) < 2:
             return 0
         
         # 过滤掉0值（爆仓后的数据），避免除以0
-        valid_values = [v for v in values if v > 0]
+        valid_values = values[values > 0]
         if len(valid_values) < 2:
             return 0
         
@@ -0,0 +1,159 @@
+"""
+Content-addressed backtest result cache.
+
+Key = sha256 over everything that determines a backtest result: indicator code, market, symbol,
+timeframe, date range, commission/slippage/leverage/direction, the normalized strategy_config
+and the kline data version (see BacktestService._kline_data_version).
+
+Two tiers:
+- In-process LRU of serialized results, bounded by entry count and total bytes.
+- `qd_backtest_runs.cache_key`: successful runs persisted by the routes / job queue, so a
+  restarted process (or another gunicorn worker) still hits.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.utils.db import get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Bump when the simulation engine / result format changes so stale results are not served.
+RESULT_CACHE_VERSION = 1
+
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    """Stable sha256 over a JSON-serializable payload (sorted keys, compact separators)."""
+    raw = json.dumps(
+        {'v': RESULT_CACHE_VERSION, **payload},
+        sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class BacktestResultCache:
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.enabled = os.getenv('BACKTEST_CACHE_ENABLED', 'true').lower() == 'true'
+        try:
+            self.max_entries = max(1, int(max_entries or os.getenv('BACKTEST_CACHE_MAX_ENTRIES', '128')))
+        except Exception:
+            self.max_entries = 128
+        try:
+            self.max_bytes = max(1, int(max_bytes or float(os.getenv('BACKTEST_CACHE_MAX_MB', '64')) * 1024 * 1024))
+        except Exception:
+            self.max_bytes = 64 * 1024 * 1024
+
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._memory_hits = 0
+        self._db_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of the cached result, or None on miss."""
+        with self._lock:
+            raw = self._entries.get(key)
+            if raw is not None:
+                self._entries.move_to_end(key)
+                self._memory_hits += 1
+        if raw is not None:
+            return json.loads(raw)
+
+        raw = self._load_from_db(key)
+        if raw:
+            try:
+                result = json.loads(raw)
+            except Exception:
+                result = None
+            if isinstance(result, dict) and result:
+                with self._lock:
+                    self._db_hits += 1
+                self._store(key, raw)
+                return result
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        try:
+            raw = json.dumps(result, ensure_ascii=False)
+        except Exception:
+            return
+        self._store(key, raw)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._memory_hits + self._db_hits
+            lookups = hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxEntries': self.max_entries,
+                'maxBytes': self.max_bytes,
+                'memoryHits': self._memory_hits,
+                'dbHits': self._db_hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hitRatio': round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _store(self, key: str, raw: str) -> None:
+        size = len(raw)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = raw
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._evictions += 1
+
+    def _load_from_db(self, key: str) -> Optional[str]:
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(
+                    """
+                    SELECT result_json FROM qd_backtest_runs
+                    WHERE cache_key = ? AND status = 'success' AND result_json != ''
+                    ORDER BY id DESC LIMIT 1
+                    """,
+                    (key,)
+                )
+                row = cur.fetchone()
+                cur.close()
+            return (row or {}).get('result_json') or None
+        except Exception as e:
+            logger.debug(f"Backtest cache db lookup failed: {e}")
+            return None
+
+
+_result_cache: Optional[BacktestResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_backtest_result_cache() -> BacktestResultCache:
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = BacktestResultCache()
+    return _result_cache
@@ -0,0 +1,511 @@
+"""
+Backtest job queue.
+
+Long backtests (1m/5m over months) do not fit in a gunicorn sync request (timeout=120s), so
+they are submitted as jobs instead:
+- submit() persists a `qd_backtest_runs` row (status=queued) and returns its id as the job id.
+- A bounded pool of daemon worker threads executes jobs from a bounded queue
+  (BACKTEST_JOB_WORKERS / BACKTEST_JOB_QUEUE_SIZE); a full queue rejects new submissions.
+- Progress (stage, bars processed, trades so far) is pushed to subscriber queues for SSE.
+- Jobs can be cancelled while queued or running (checked at every progress tick, including
+  right before and after the indicator stage).
+- Parameter sweeps (params['kind'] == JOB_KIND_SWEEP) go through the same queue; their progress
+  counts parameter combinations instead of bars, and at most BACKTEST_SWEEP_CONCURRENCY sweeps run
+  their process pools at once (see BacktestService.run_sweep).
+
+Job state lives in the process that accepted the submission; other processes (e.g. multiple
+gunicorn workers) still see status/result through the `qd_backtest_runs` row. Each row records
+its owner (host:pid); reconcile_interrupted_jobs() runs at startup and fails queued/running rows
+whose owner process is gone, so a restart does not leave jobs stuck forever.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.services.backtest import BacktestService
+from app.utils.db import get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCESS = 'success'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+TERMINAL_STATUSES = (JOB_SUCCESS, JOB_FAILED, JOB_CANCELLED)
+
+JOB_KIND_BACKTEST = 'backtest'
+JOB_KIND_SWEEP = 'sweep'
+
+INTERRUPTED_ERROR = 'Interrupted: the server restarted before the job finished'
+
+
+class BacktestCancelled(Exception):
+    """Raised from the progress callback to abort a cancelled job."""
+
+
+class BacktestQueueFull(Exception):
+    """Raised by submit() when the job queue is at capacity."""
+
+
+class BacktestJob:
+    def __init__(self, job_id: int, user_id: int, params: Dict[str, Any]):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.params = params
+        self.kind = params.get('kind') or JOB_KIND_BACKTEST
+        self.status = JOB_QUEUED
+        self.stage = ''
+        self.bars_done = 0
+        self.bars_total = 0
+        self.trades = 0
+        self.error = ''
+        self.result: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+        self.subscribers: List[queue.Queue] = []
+
+    def snapshot(self, include_result: bool = False) -> Dict[str, Any]:
+        data = {
+            'jobId': self.job_id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'barsProcessed': self.bars_done,
+            'barsTotal': self.bars_total,
+            'progress': round(self.bars_done / self.bars_total * 100, 1) if self.bars_total else 0,
+            'trades': self.trades,
+            'error': self.error,
+            'createdAt': int(self.created_at),
+            'startedAt': int(self.started_at) if self.started_at else None,
+            'finishedAt': int(self.finished_at) if self.finished_at else None,
+        }
+        if include_result:
+            data['result'] = self.result
+        return data
+
+
+class BacktestJobManager:
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None):
+        try:
+            self.max_workers = max(1, int(max_workers or os.getenv('BACKTEST_JOB_WORKERS', '2')))
+        except Exception:
+            self.max_workers = 2
+        try:
+            self.max_queue = max(1, int(max_queue or os.getenv('BACKTEST_JOB_QUEUE_SIZE', '20')))
+        except Exception:
+            self.max_queue = 20
+        # Finished jobs are kept in memory for this long so late SSE/status calls still see them.
+        try:
+            self.retention_sec = int(os.getenv('BACKTEST_JOB_RETENTION_SEC', '3600'))
+        except Exception:
+            self.retention_sec = 3600
+
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_queue)
+        self._jobs: Dict[int, BacktestJob] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._service = BacktestService()
+
+    def start(self) -> None:
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.max_workers:
+                th = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"BacktestJobWorker-{len(self._threads)}",
+                    daemon=True
+                )
+                th.start()
+                self._threads.append(th)
+
+    # ---- public API ----
+
+    def submit(self, params: Dict[str, Any]) -> BacktestJob:
+        """
+        Queue a backtest. `params` is the dict produced by the route's request parser.
+
+        Raises:
+            BacktestQueueFull: when BACKTEST_JOB_QUEUE_SIZE jobs are already waiting.
+        """
+        self.start()
+        if self._queue.full():
+            raise BacktestQueueFull(f'Backtest queue is full ({self.max_queue} jobs waiting), please retry later')
+
+        run_id = _insert_run(params, JOB_QUEUED)
+        job = BacktestJob(run_id, int(params.get('user_id') or 1), params)
+        with self._lock:
+            self._purge_finished()
+            self._jobs[run_id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(run_id, None)
+            _update_run(run_id, JOB_CANCELLED, error='Backtest queue is full')
+            raise BacktestQueueFull(f'Backtest queue is full ({self.max_queue} jobs waiting), please retry later')
+        logger.info(f"Backtest {job.kind} job {run_id} queued ({params.get('symbol')} {params.get('timeframe')})")
+        return job
+
+    def get_job(self, job_id: int) -> Optional[BacktestJob]:
+        with self._lock:
+            return self._jobs.get(int(job_id))
+
+    def get_status(self, job_id: int, include_result: bool = False) -> Optional[Dict[str, Any]]:
+        """Status from memory, falling back to the persisted run (other process / after restart)."""
+        job = self.get_job(job_id)
+        if job is not None:
+            return job.snapshot(include_result=include_result)
+        return _load_run_status(int(job_id), include_result=include_result)
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Request cancellation. Queued jobs are dropped when a worker picks them up; running jobs
+        stop at the next progress tick. Returns False if the job is unknown or already finished.
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            return False
+        with self._lock:
+            if job.status in TERMINAL_STATUSES:
+                return False
+            # Set under the lock: a worker picking the job up right now either sees the flag or has
+            # already moved it to running (and then stops at the next progress tick).
+            job.cancel_event.set()
+            queued = job.status == JOB_QUEUED
+        if queued:
+            self._finish(job, JOB_CANCELLED, error='Cancelled by user')
+        return True
+
+    def subscribe(self, job_id: int) -> Optional[queue.Queue]:
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+        q: queue.Queue = queue.Queue()
+        with self._lock:
+            job.subscribers.append(q)
+        return q
+
+    def unsubscribe(self, job_id: int, q: queue.Queue) -> None:
+        job = self.get_job(job_id)
+        if job is None:
+            return
+        with self._lock:
+            try:
+                job.subscribers.remove(q)
+            except ValueError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [j.status for j in self._jobs.values()]
+        return {
+            'workers': self.max_workers,
+            'queueSize': self.max_queue,
+            'queued': statuses.count(JOB_QUEUED),
+            'running': statuses.count(JOB_RUNNING),
+        }
+
+    # ---- internals ----
+
+    def _worker_loop(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                self._run_job(job)
+            except Exception as e:
+                logger.error(f"Backtest job {job.job_id} crashed: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def _run_job(self, job: BacktestJob) -> None:
+        with self._lock:
+            if job.cancel_event.is_set() or job.status in TERMINAL_STATUSES:
+                return
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+        _update_run(job.job_id, JOB_RUNNING)
+        self._publish(job, 'status')
+
+        def on_progress(stage: str, bars_done: int, bars_total: int, trades_count: int) -> None:
+            if job.cancel_event.is_set():
+                raise BacktestCancelled()
+            job.stage = stage
+            job.bars_done = bars_done
+            job.bars_total = bars_total
+            job.trades = trades_count
+            self._publish(job, 'progress')
+
+        p = job.params
+        # Key the result by the data version seen before the run, not after it (a candle may close mid-run).
+        # Sweep results are not single-backtest results and must not be found under a backtest cache key.
+        cache_key = self._result_cache_key(p) if job.kind == JOB_KIND_BACKTEST else ''
+        try:
+            if job.cancel_event.is_set():
+                raise BacktestCancelled()
+            if job.kind == JOB_KIND_SWEEP:
+                result = self._service.run_sweep(
+                    indicator_code=p['indicator_code'],
+                    market=p['market'],
+                    symbol=p['symbol'],
+                    timeframe=p['timeframe'],
+                    start_date=p['start_date'],
+                    end_date=p['end_date'],
+                    param_grid=p['param_grid'],
+                    initial_capital=p['initial_capital'],
+                    commission=p['commission'],
+                    slippage=p['slippage'],
+                    leverage=p['leverage'],
+                    trade_direction=p['trade_direction'],
+                    strategy_config=p['strategy_config'],
+                    sort_by=p.get('sort_by') or 'totalReturn',
+                    top_n=p.get('top_n') or 50,
+                    progress_callback=on_progress
+                )
+            else:
+                result = self._service.run(
+                    indicator_code=p['indicator_code'],
+                    market=p['market'],
+                    symbol=p['symbol'],
+                    timeframe=p['timeframe'],
+                    start_date=p['start_date'],
+                    end_date=p['end_date'],
+                    initial_capital=p['initial_capital'],
+                    commission=p['commission'],
+                    slippage=p['slippage'],
+                    leverage=p['leverage'],
+                    trade_direction=p['trade_direction'],
+                    strategy_config=p['strategy_config'],
+                    progress_callback=on_progress,
+                    use_cache=p.get('use_cache', True),
+                    cache_key=cache_key or None
+                )
+        except BacktestCancelled:
+            self._finish(job, JOB_CANCELLED, error='Cancelled by user')
+            return
+        except Exception as e:
+            logger.warning(f"Backtest job {job.job_id} failed: {e}")
+            self._finish(job, JOB_FAILED, error=str(e))
+            return
+
+        if job.cancel_event.is_set():
+            self._finish(job, JOB_CANCELLED, error='Cancelled by user')
+            return
+
+        job.result = result
+        job.bars_done = job.bars_total
+        if job.kind == JOB_KIND_BACKTEST:
+            job.trades = len((result or {}).get('trades') or [])
+        self._finish(job, JOB_SUCCESS, result=result, cache_key=cache_key)
+
+    def _result_cache_key(self, p: Dict[str, Any]) -> str:
+        try:
+            return self._service.result_cache_key(
+                p['indicator_code'], p['market'], p['symbol'], p['timeframe'], p['start_date'], p['end_date'],
+                p['initial_capital'], p['commission'], p['slippage'], p['leverage'], p['trade_direction'],
+                p['strategy_config']
+            )
+        except Exception:
+            return ''
+
+    def _finish(
+        self,
+        job: BacktestJob,
+        status: str,
+        error: str = '',
+        result: Optional[Dict[str, Any]] = None,
+        cache_key: str = ''
+    ) -> None:
+        with self._lock:
+            if job.status in TERMINAL_STATUSES:
+                return
+            job.status = status
+            job.error = error
+            job.finished_at = time.time()
+        _update_run(job.job_id, status, error=error, result=result, cache_key=cache_key)
+        self._publish(job, 'done')
+        logger.info(f"Backtest job {job.job_id} {status}")
+
+    def _publish(self, job: BacktestJob, event: str) -> None:
+        with self._lock:
+            subscribers = list(job.subscribers)
+        if not subscribers:
+            return
+        payload = (event, job.snapshot())
+        for q in subscribers:
+            try:
+                q.put_nowait(payload)
+            except Exception:
+                pass
+
+    def _purge_finished(self) -> None:
+        """Drop finished jobs older than retention_sec (caller holds the lock)."""
+        cutoff = time.time() - self.retention_sec
+        stale = [jid for jid, j in self._jobs.items()
+                 if j.status in TERMINAL_STATUSES and (j.finished_at or 0) < cutoff]
+        for jid in stale:
+            self._jobs.pop(jid, None)
+
+
+def _owner_token(pid: Optional[int] = None) -> str:
+    return f"{socket.gethostname()}:{pid if pid is not None else os.getpid()}"
+
+
+def _owner_alive(owner: str) -> bool:
+    """Whether the process recorded in job_owner is still running (only checkable on this host)."""
+    host, _, pid_str = (owner or '').rpartition(':')
+    if host != socket.gethostname():
+        return False
+    try:
+        pid = int(pid_str)
+    except Exception:
+        return False
+    # This process just started and owns no jobs yet; a matching pid is a reused one (e.g. pid 1 in Docker).
+    if pid <= 0 or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except Exception:
+        return False
+    return True
+
+
+def reconcile_interrupted_jobs() -> int:
+    """
+    Mark queued/running runs whose owner process is gone as failed (call once at startup).
+    Jobs only live in the memory of the process that accepted them, so nothing else would ever
+    finish these rows. Returns the number of rows updated.
+    """
+    try:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute(
+                "SELECT id, job_owner FROM qd_backtest_runs WHERE status IN (?, ?)",
+                (JOB_QUEUED, JOB_RUNNING)
+            )
+            stale = [int(r['id']) for r in (cur.fetchall() or []) if not _owner_alive(r.get('job_owner') or '')]
+            for run_id in stale:
+                cur.execute(
+                    "UPDATE qd_backtest_runs SET status = ?, error_message = ? WHERE id = ? AND status IN (?, ?)",
+                    (JOB_FAILED, INTERRUPTED_ERROR, run_id, JOB_QUEUED, JOB_RUNNING)
+                )
+            db.commit()
+            cur.close()
+    except Exception:
+        logger.warning("Failed to reconcile interrupted backtest jobs", exc_info=True)
+        return 0
+    if stale:
+        logger.info(f"Marked {len(stale)} interrupted backtest job(s) as failed: {stale}")
+    return len(stale)
+
+
+def _insert_run(params: Dict[str, Any], status: str) -> int:
+    indicator_id = params.get('indicator_id')
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute(
+            """
+            INSERT INTO qd_backtest_runs
+            (user_id, indicator_id, market, symbol, timeframe, start_date, end_date,
+             initial_capital, commission, slippage, leverage, trade_direction,
+             strategy_config, status, error_message, result_json, job_owner, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                int(params.get('user_id') or 1),
+                int(indicator_id) if indicator_id is not None else None,
+                params['market'],
+                params['symbol'],
+                params['timeframe'],
+                params['start_date_str'],
+                params['end_date_str'],
+                params['initial_capital'],
+                params['commission'],
+                params['slippage'],
+                params['leverage'],
+                params['trade_direction'],
+                json.dumps(params.get('strategy_config') or {}, ensure_ascii=False),
+                status,
+                '',
+                '',
+                _owner_token(),
+                int(time.time())
+            )
+        )
+        run_id = cur.lastrowid
+        db.commit()
+        cur.close()
+    return int(run_id)
+
+
+def _update_run(
+    run_id: int,
+    status: str,
+    error: str = '',
+    result: Optional[Dict[str, Any]] = None,
+    cache_key: str = ''
+) -> None:
+    try:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            if result is not None:
+                cur.execute(
+                    "UPDATE qd_backtest_runs SET status = ?, error_message = ?, result_json = ?, cache_key = ? WHERE id = ?",
+                    (status, error, json.dumps(result, ensure_ascii=False), cache_key, run_id)
+                )
+            else:
+                cur.execute(
+                    "UPDATE qd_backtest_runs SET status = ?, error_message = ? WHERE id = ?",
+                    (status, error, run_id)
+                )
+            db.commit()
+            cur.close()
+    except Exception:
+        logger.warning(f"Failed to update backtest run {run_id}", exc_info=True)
+
+
+def _load_run_status(run_id: int, include_result: bool = False) -> Optional[Dict[str, Any]]:
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute(
+            "SELECT id, status, error_message, result_json, created_at FROM qd_backtest_runs WHERE id = ?",
+            (run_id,)
+        )
+        row = cur.fetchone()
+        cur.close()
+    if not row:
+        return None
+    data = {
+        'jobId': row.get('id'),
+        'status': row.get('status') or '',
+        'stage': '',
+        'barsProcessed': 0,
+        'barsTotal': 0,
+        'progress': 100 if row.get('status') == JOB_SUCCESS else 0,
+        'trades': 0,
+        'error': row.get('error_message') or '',
+        'createdAt': row.get('created_at'),
+        'startedAt': None,
+        'finishedAt': None,
+    }
+    if include_result:
+        try:
+            data['result'] = json.loads(row.get('result_json') or 'null')
+        except Exception:
+            data['result'] = None
+    return data
@@ -0,0 +1,279 @@
+"""
+Single-writer, write-behind queue for high-frequency SQLite writes.
+
+Per-tick position price updates, trade records, browser notifications and HAMA monitor history used to open
+their own connection and commit (one fsync each), with every writer contending for the SQLite write lock.
+Callers now hand write intents to one writer thread which applies them in enqueue order and commits in
+batches every DB_WRITE_FLUSH_MS:
+
+- insert(sql, params): appended as-is.
+- upsert(key, sql, params): a later upsert with the same key replaces the pending one (last write wins) and
+  moves to the back of the queue, so it still lands after anything enqueued in between.
+- wait=True / flush(): order-critical writes block until their batch is committed (and re-raise a failure).
+
+If a batch fails it is rolled back and replayed one intent per transaction so a bad row does not drop the
+others. DB_WRITE_QUEUE_ENABLED=false executes every intent inline (previous behaviour).
+"""
+
+from __future__ import annotations
+
+import atexit
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+from app.utils.db import SQLiteConnection, get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class _Intent:
+    __slots__ = ("sql", "params", "db_path", "done", "error")
+
+    def __init__(self, sql: str, params: Sequence[Any], db_path: Optional[str], wait: bool):
+        self.sql = sql
+        self.params = tuple(params or ())
+        self.db_path = db_path
+        self.done = threading.Event() if wait else None
+        self.error: Optional[BaseException] = None
+
+
+class DbWriteQueue:
+    def __init__(
+        self,
+        flush_ms: Optional[float] = None,
+        batch_max: Optional[int] = None,
+        queue_max: Optional[int] = None,
+        enabled: Optional[bool] = None,
+    ):
+        try:
+            self.flush_sec = float(flush_ms if flush_ms is not None else os.getenv("DB_WRITE_FLUSH_MS", "50")) / 1000.0
+        except Exception:
+            self.flush_sec = 0.05
+        try:
+            self.batch_max = max(1, int(batch_max if batch_max is not None else os.getenv("DB_WRITE_BATCH_MAX", "500")))
+        except Exception:
+            self.batch_max = 500
+        try:
+            self.queue_max = max(1, int(queue_max if queue_max is not None else os.getenv("DB_WRITE_QUEUE_MAX", "20000")))
+        except Exception:
+            self.queue_max = 20000
+        if enabled is None:
+            enabled = os.getenv("DB_WRITE_QUEUE_ENABLED", "true").lower() == "true"
+        self.enabled = bool(enabled)
+
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[Hashable, _Intent]" = OrderedDict()
+        self._seq = itertools.count()
+        self._urgent = False
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._conns: Dict[str, SQLiteConnection] = {}  # writer thread only: connections for non-default db files
+
+        self._enqueued = 0
+        self._coalesced = 0
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+        self._max_batch = 0
+        self._last_flush_ms = 0.0
+
+    # ---- producer API ----
+
+    def insert(self, sql: str, params: Sequence[Any] = (), *, wait: bool = False, db_path: Optional[str] = None) -> None:
+        self._submit(None, sql, params, wait=wait, db_path=db_path)
+
+    def upsert(self, key: Hashable, sql: str, params: Sequence[Any] = (), *, wait: bool = False, db_path: Optional[str] = None) -> None:
+        self._submit(key, sql, params, wait=wait, db_path=db_path)
+
+    def flush(self, timeout: Optional[float] = 30.0) -> bool:
+        """Block until everything enqueued so far is committed; returns False on timeout."""
+        if not self._running():
+            return True
+        marker = _Intent("", (), None, wait=True)
+        with self._cond:
+            if not self._pending:
+                return True
+            # The marker is a no-op intent at the back of the queue: once it is done, so is everything before it.
+            self._pending[("__flush__", next(self._seq))] = marker
+            self._urgent = True
+            self._cond.notify_all()
+        return marker.done.wait(timeout)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        t = self._thread
+        if t is not None and t.is_alive():
+            t.join(timeout)
+        for c in self._conns.values():
+            try:
+                c.close()
+            except Exception:
+                pass
+        self._conns.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "pending": len(self._pending),
+                "enqueued": self._enqueued,
+                "coalesced": self._coalesced,
+                "written": self._written,
+                "failed": self._failed,
+                "batches": self._batches,
+                "maxBatch": self._max_batch,
+                "lastFlushMs": round(self._last_flush_ms, 2),
+                "flushIntervalMs": round(self.flush_sec * 1000.0, 1),
+            }
+
+    # ---- internals ----
+
+    def _running(self) -> bool:
+        return self.enabled and not self._stopping
+
+    def _submit(self, key: Optional[Hashable], sql: str, params: Sequence[Any], *, wait: bool, db_path: Optional[str]) -> None:
+        intent = _Intent(sql, params, db_path, wait)
+        if not self._running():
+            self._apply([intent])
+            if intent.error is not None:
+                raise intent.error
+            return
+
+        with self._cond:
+            self._ensure_thread()
+            while len(self._pending) >= self.queue_max and not self._stopping:
+                # Backpressure: let the writer catch up instead of growing without bound.
+                self._urgent = True
+                self._cond.notify_all()
+                self._cond.wait(1.0)
+            self._enqueued += 1
+            slot: Hashable = ("__seq__", next(self._seq))
+            if key is not None and not wait:
+                # Only fire-and-forget intents coalesce; a waited-on write is never dropped or merged.
+                key_slot = ("__key__", db_path, key)
+                if self._pending.pop(key_slot, None) is not None:
+                    self._coalesced += 1
+                slot = key_slot
+            was_empty = not self._pending
+            self._pending[slot] = intent
+            if wait:
+                self._urgent = True
+            if wait or was_empty:
+                self._cond.notify_all()
+
+        if wait:
+            intent.done.wait()
+            if intent.error is not None:
+                raise intent.error
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="DbWriteQueue", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if not self._pending and self._stopping:
+                    return
+                if not self._urgent and not self._stopping:
+                    # Batching window: collect what arrives in the next flush interval.
+                    deadline = time.time() + self.flush_sec
+                    while not self._urgent and not self._stopping and len(self._pending) < self.batch_max:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                batch: List[_Intent] = []
+                while self._pending and len(batch) < self.batch_max:
+                    batch.append(self._pending.popitem(last=False)[1])
+                if not self._pending:
+                    self._urgent = False
+                self._cond.notify_all()
+
+            t0 = time.time()
+            self._apply(batch)
+            elapsed_ms = (time.time() - t0) * 1000.0
+            with self._cond:
+                self._batches += 1
+                self._max_batch = max(self._max_batch, len(batch))
+                self._last_flush_ms = elapsed_ms
+            for it in batch:
+                if it.done is not None:
+                    it.done.set()
+
+    def _apply(self, batch: List[_Intent]) -> None:
+        groups: Dict[Optional[str], List[_Intent]] = {}
+        for it in batch:
+            if it.sql:
+                groups.setdefault(it.db_path, []).append(it)
+        for db_path, intents in groups.items():
+            try:
+                self._write_group(db_path, intents)
+            except Exception as e:
+                logger.warning(f"db write batch of {len(intents)} failed, replaying one by one: {e}")
+                for it in intents:
+                    try:
+                        self._write_group(db_path, [it])
+                    except Exception as e1:
+                        it.error = e1
+                        with self._cond:
+                            self._failed += 1
+                        logger.error(f"db write failed: {e1}; sql={it.sql.strip()[:120]}")
+
+    def _write_group(self, db_path: Optional[str], intents: List[_Intent]) -> None:
+        if db_path:
+            conn = self._conns.get(db_path)
+            if conn is None or conn.closed:
+                conn = SQLiteConnection(db_path)
+                self._conns[db_path] = conn
+            try:
+                self._execute_all(conn, intents)
+            except Exception:
+                conn.rollback()
+                raise
+        else:
+            with get_db_connection() as db:
+                self._execute_all(db, intents)
+        with self._cond:
+            self._written += len(intents)
+
+    @staticmethod
+    def _execute_all(conn: Any, intents: List[_Intent]) -> None:
+        cur = conn.cursor()
+        try:
+            # Consecutive intents with the same statement go through one executemany call.
+            for sql, group in itertools.groupby(intents, key=lambda it: it.sql):
+                rows = [it.params for it in group]
+                if len(rows) == 1:
+                    cur.execute(sql, rows[0])
+                else:
+                    cur.executemany(sql, rows)
+            conn.commit()
+        finally:
+            cur.close()
+
+
+_write_queue: Optional[DbWriteQueue] = None
+_write_queue_pid: Optional[int] = None
+_write_queue_lock = threading.Lock()
+
+
+def get_db_write_queue() -> DbWriteQueue:
+    global _write_queue, _write_queue_pid
+    if _write_queue is None or _write_queue_pid != os.getpid():
+        with _write_queue_lock:
+            if _write_queue is None or _write_queue_pid != os.getpid():
+                _write_queue = DbWriteQueue()
+                _write_queue_pid = os.getpid()
+                atexit.register(_write_queue.stop)
+    return _write_queue
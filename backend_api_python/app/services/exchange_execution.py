@@ -11,7 +11,7 @@ Notes:
 from __future__ import annotations
 
 import json
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from app.utils.db import get_db_connection
 from app.utils.logger import get_logger
@@ -70,6 +70,32 @@ def load_strategy_configs(strategy_id: int) -> Dict[str, Any]:
         row = cur.fetchone() or {}
         cur.close()
 
+    return _strategy_config_from_row(int(strategy_id), row)
+
+
+def load_strategy_configs_bulk(strategy_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Batch variant of load_strategy_configs: one query for many strategies, keyed by strategy id."""
+    ids = sorted({int(x) for x in (strategy_ids or []) if int(x or 0) > 0})
+    if not ids:
+        return {}
+    placeholders = ",".join(["%s"] * len(ids))
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute(
+            f"""
+            SELECT id, exchange_config, trading_config, market_type, leverage, execution_mode
+            FROM qd_strategies_trading
+            WHERE id IN ({placeholders})
+            """,
+            tuple(ids),
+        )
+        rows = cur.fetchall() or []
+        cur.close()
+
+    return {int(r.get("id")): _strategy_config_from_row(int(r.get("id")), r) for r in rows}
+
+
+def _strategy_config_from_row(strategy_id: int, row: Dict[str, Any]) -> Dict[str, Any]:
     exchange_config = _safe_json_loads(row.get("exchange_config"), {})
     trading_config = _safe_json_loads(row.get("trading_config"), {})
 
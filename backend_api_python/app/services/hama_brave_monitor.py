@@ -21,6 +21,7 @@ from typing import Dict, Any, Optional, List
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from app.utils.logger import get_logger
+from app.services.db_write_queue import get_db_write_queue
 
 logger = get_logger(__name__)
 
@@ -426,27 +427,16 @@ class HamaBraveMonitor:
             except Exception as e:
                 logger.warning(f"读取截图文件失败: {e}")
 
-        # 保存到 SQLite (每次创建新连接)
+        # 保存到 SQLite（交给写入队列批量提交；同一 symbol+timeframe 的缓存行只保留最新一次）
         if self.use_sqlite:
             try:
                 # 数据库路径
                 db_path = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'quantdinger.db')
                 db_path = os.path.abspath(db_path)
 
-                # 创建新连接
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-
                 current_time = datetime.now()
                 timeframe = hama_data.get('timeframe', '15m')
-
-                # 1. 更新缓存表 (每条记录包含 symbol + timeframe)
-                cursor.execute('''
-                    INSERT OR REPLACE INTO hama_monitor_cache
-                    (symbol, timeframe, hama_trend, hama_color, hama_value, price, ocr_text, screenshot_path,
-                     candle_ma_status, bollinger_status, last_cross_info, monitored_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
+                row = (
                     symbol,
                     timeframe,
                     hama_data.get('trend'),
@@ -459,32 +449,26 @@ class HamaBraveMonitor:
                     hama_data.get('bollinger_status', ''),
                     hama_data.get('last_cross_info', ''),
                     current_time
-                ))
+                )
+                write_queue = get_db_write_queue()
+
+                # 1. 更新缓存表 (每条记录包含 symbol + timeframe)
+                write_queue.upsert(('hama_monitor_cache', symbol, timeframe), '''
+                    INSERT OR REPLACE INTO hama_monitor_cache
+                    (symbol, timeframe, hama_trend, hama_color, hama_value, price, ocr_text, screenshot_path,
+                     candle_ma_status, bollinger_status, last_cross_info, monitored_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', row, db_path=db_path)
 
                 # 2. 插入历史表 (每次监控都插入新记录)
-                cursor.execute('''
+                write_queue.insert('''
                     INSERT INTO hama_monitor_history
                     (symbol, timeframe, hama_trend, hama_color, hama_value, price, ocr_text, screenshot_path,
                      candle_ma_status, bollinger_status, last_cross_info, monitored_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    symbol,
-                    timeframe,
-                    hama_data.get('trend'),
-                    hama_data.get('color'),
-                    hama_data.get('hama_value'),
-                    hama_data.get('price'),
-                    hama_data.get('ocr_text', ''),
-                    hama_data.get('screenshot_path', ''),
-                    hama_data.get('candle_ma_status', ''),
-                    hama_data.get('bollinger_status', ''),
-                    hama_data.get('last_cross_info', ''),
-                    current_time
-                ))
+                ''', row, db_path=db_path)
 
-                conn.commit()
-                conn.close()
-                logger.debug(f"{symbol} {timeframe} HAMA 数据已保存到 SQLite (缓存表 + 历史表)")
+                logger.debug(f"{symbol} {timeframe} HAMA 数据已提交写入队列 (缓存表 + 历史表)")
                 success = True
             except Exception as e:
                 logger.error(f"保存到 SQLite 失败 {symbol}: {e}")
@@ -1314,6 +1298,9 @@ class HamaBraveMonitor:
             db_path = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'quantdinger.db')
             db_path = os.path.abspath(db_path)
 
+            # 依赖刚刚写入的历史记录：先等写入队列落库
+            get_db_write_queue().flush()
+
             conn = sqlite3.connect(db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
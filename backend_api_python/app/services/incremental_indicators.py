@@ -0,0 +1,368 @@
+"""
+内置技术指标函数 + 实时 tick 的增量（尾部）计算
+
+- get_indicator_functions(): 指标脚本可直接调用的 SMA/EMA/RSI/MACD/BOLL/ATR/CROSSOVER/CROSSUNDER/HAMA
+  （回测与实盘共用同一套定义）。
+- TailIndicators: 同名函数的增量版本，每个运行中的策略持有一个实例。
+  实时 tick 只更新最后一根K线，输入序列除最后一个值外与上次调用完全相同时，只重算最后一个值
+  （O(period)），其余直接复用上次结果；前缀不同（新K线、窗口滑动、输入含 NaN 等）时按原函数整段重算。
+  结果与整段重算一致，执行器另外按 INDICATOR_PARITY_CHECK_TICKS 定期做整段重算比对。
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def get_indicator_functions() -> Dict[str, Callable]:
+    """获取技术指标函数"""
+    def SMA(series, period):
+        return series.rolling(window=period).mean()
+
+    def EMA(series, period):
+        return series.ewm(span=period, adjust=False).mean()
+
+    def RSI(series, period=14):
+        delta = series.diff()
+        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+        rs = gain / loss
+        return 100 - (100 / (1 + rs))
+
+    def MACD(series, fast=12, slow=26, signal=9):
+        exp1 = series.ewm(span=fast, adjust=False).mean()
+        exp2 = series.ewm(span=slow, adjust=False).mean()
+        macd = exp1 - exp2
+        macd_signal = macd.ewm(span=signal, adjust=False).mean()
+        macd_hist = macd - macd_signal
+        return macd, macd_signal, macd_hist
+
+    def BOLL(series, period=20, std_dev=2):
+        middle = series.rolling(window=period).mean()
+        std = series.rolling(window=period).std()
+        upper = middle + std_dev * std
+        lower = middle - std_dev * std
+        return upper, middle, lower
+
+    def ATR(high, low, close, period=14):
+        tr1 = high - low
+        tr2 = abs(high - close.shift())
+        tr3 = abs(low - close.shift())
+        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+        return tr.rolling(window=period).mean()
+
+    def CROSSOVER(series1, series2):
+        return (series1 > series2) & (series1.shift(1) <= series2.shift(1))
+
+    def CROSSUNDER(series1, series2):
+        return (series1 < series2) & (series1.shift(1) >= series2.shift(1))
+
+    def HAMA(df):
+        """HAMA 指标（返回带 hama_* / bb_* 列的新 DataFrame，不修改传入的 df）"""
+        from app.services.hama_calculator import hama_calculator
+        return hama_calculator.calculate_hama(df[['open', 'high', 'low', 'close']].copy())
+
+    return {
+        'SMA': SMA,
+        'EMA': EMA,
+        'RSI': RSI,
+        'MACD': MACD,
+        'BOLL': BOLL,
+        'ATR': ATR,
+        'CROSSOVER': CROSSOVER,
+        'CROSSUNDER': CROSSUNDER,
+        'HAMA': HAMA,
+    }
+
+
+# ---- tail helpers (value at the last index only) ----
+
+def _values(series) -> np.ndarray:
+    return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _same_prefix(new: np.ndarray, old: np.ndarray) -> bool:
+    """new 与 old 等长，且除最后一个值外完全相同（NaN 视为相等）"""
+    if len(new) != len(old) or len(new) < 2:
+        return False
+    return bool(np.array_equal(new[:-1], old[:-1], equal_nan=True))
+
+
+def _tail_mean(x: np.ndarray, period: int) -> float:
+    if len(x) < period:
+        return np.nan
+    return float(np.mean(x[-period:]))
+
+
+def _tail_std(x: np.ndarray, period: int) -> float:
+    if len(x) < period or period < 2:
+        return np.nan
+    return float(np.std(x[-period:], ddof=1))
+
+
+def _tail_ema(x: np.ndarray, prev_out: np.ndarray, period: int) -> Optional[float]:
+    """EMA(adjust=False) 的最后一个值；前值缺失时返回 None（需整段重算）"""
+    # 前一个输入缺失时 pandas 会按间隔调整权重，不能用单步递推
+    if len(prev_out) < 2 or len(x) < 2 or np.isnan(x[-1]) or np.isnan(x[-2]) or np.isnan(prev_out[-2]):
+        return None
+    alpha = 2.0 / (period + 1.0)
+    return float(alpha * x[-1] + (1.0 - alpha) * prev_out[-2])
+
+
+def _tail_wma(x: np.ndarray, period: int) -> float:
+    if len(x) < period:
+        return np.nan
+    window = x[-period:]
+    if np.isnan(window).any():
+        return np.nan
+    weights = np.arange(1, period + 1)
+    return float(np.dot(window, weights) / weights.sum())
+
+
+class _Memo:
+    __slots__ = ('inputs', 'outputs')
+
+    def __init__(self, inputs: List[np.ndarray], outputs: List[np.ndarray]):
+        self.inputs = inputs
+        self.outputs = outputs
+
+
+class TailIndicators:
+    """
+    增量版内置指标（每个策略一个实例，非线程安全；调度器保证同一策略同一时间只有一个 tick 在执行）。
+
+    缓存键为 (函数名, 输入序列名, 参数)；是否可以只算尾部由输入值的前缀比对决定，
+    因此即使缓存键冲突也只会退化为整段重算，不会返回错误结果。
+    """
+
+    def __init__(self):
+        self._plain = get_indicator_functions()
+        self._memo: Dict[Tuple, _Memo] = {}
+        self.tail_updates = 0
+        self.full_updates = 0
+
+    def functions(self) -> Dict[str, Callable]:
+        return {
+            'SMA': self.SMA,
+            'EMA': self.EMA,
+            'RSI': self.RSI,
+            'MACD': self.MACD,
+            'BOLL': self.BOLL,
+            'ATR': self.ATR,
+            'CROSSOVER': self._plain['CROSSOVER'],
+            'CROSSUNDER': self._plain['CROSSUNDER'],
+            'HAMA': self.HAMA,
+        }
+
+    def reset(self) -> None:
+        self._memo.clear()
+
+    # ---- memo plumbing ----
+
+    def _cached(self, key: Tuple, inputs: List[np.ndarray]) -> Optional[_Memo]:
+        memo = self._memo.get(key)
+        if memo is None or len(memo.inputs) != len(inputs):
+            return None
+        if all(_same_prefix(new, old) for new, old in zip(inputs, memo.inputs)):
+            return memo
+        return None
+
+    def _store(self, key: Tuple, inputs: List[np.ndarray], outputs: List[np.ndarray], tail: bool) -> None:
+        self._memo[key] = _Memo([x.copy() for x in inputs], outputs)
+        if tail:
+            self.tail_updates += 1
+        else:
+            self.full_updates += 1
+
+    @staticmethod
+    def _series(values: np.ndarray, like: pd.Series, name: Any = ...) -> pd.Series:
+        # 返回副本，调用方修改结果不会污染缓存
+        return pd.Series(values.copy(), index=like.index, name=like.name if name is ... else name)
+
+    # ---- indicators ----
+
+    def SMA(self, series, period):
+        if not isinstance(series, pd.Series):
+            return self._plain['SMA'](series, period)
+        x = _values(series)
+        key = ('SMA', series.name, period)
+        memo = self._cached(key, [x])
+        if memo is None:
+            out = _values(self._plain['SMA'](series, period))
+            self._store(key, [x], [out], tail=False)
+        else:
+            out = memo.outputs[0].copy()
+            out[-1] = _tail_mean(x, period)
+            self._store(key, [x], [out], tail=True)
+        return self._series(out, series)
+
+    def EMA(self, series, period):
+        if not isinstance(series, pd.Series):
+            return self._plain['EMA'](series, period)
+        x = _values(series)
+        key = ('EMA', series.name, period)
+        memo = self._cached(key, [x])
+        last = _tail_ema(x, memo.outputs[0], period) if memo is not None else None
+        if last is None:
+            out = _values(self._plain['EMA'](series, period))
+            self._store(key, [x], [out], tail=False)
+        else:
+            out = memo.outputs[0].copy()
+            out[-1] = last
+            self._store(key, [x], [out], tail=True)
+        return self._series(out, series)
+
+    def RSI(self, series, period=14):
+        if not isinstance(series, pd.Series):
+            return self._plain['RSI'](series, period)
+        x = _values(series)
+        key = ('RSI', series.name, period)
+        memo = self._cached(key, [x])
+        if memo is None or len(x) < period + 1 or np.isnan(x[-period - 1:]).any():
+            out = _values(self._plain['RSI'](series, period))
+            self._store(key, [x], [out], tail=False)
+        else:
+            delta = np.diff(x[-period - 1:])
+            gain = np.where(delta > 0, delta, 0.0).mean()
+            loss = np.where(delta < 0, -delta, 0.0).mean()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rs = np.float64(gain) / np.float64(loss)
+                value = 100 - (100 / (1 + rs))
+            out = memo.outputs[0].copy()
+            out[-1] = value
+            self._store(key, [x], [out], tail=True)
+        return self._series(out, series)
+
+    def MACD(self, series, fast=12, slow=26, signal=9):
+        if not isinstance(series, pd.Series):
+            return self._plain['MACD'](series, fast, slow, signal)
+        x = _values(series)
+        key = ('MACD', series.name, fast, slow, signal)
+        memo = self._cached(key, [x])
+        exp1 = exp2 = sig = None
+        if memo is not None:
+            exp1 = _tail_ema(x, memo.outputs[0], fast)
+            exp2 = _tail_ema(x, memo.outputs[1], slow)
+        if exp1 is not None and exp2 is not None:
+            macd_tail = exp1 - exp2
+            macd_arr = memo.outputs[2].copy()
+            macd_arr[-1] = macd_tail
+            sig = _tail_ema(macd_arr, memo.outputs[3], signal)
+        if sig is None:
+            e1 = series.ewm(span=fast, adjust=False).mean()
+            e2 = series.ewm(span=slow, adjust=False).mean()
+            macd, macd_signal, macd_hist = self._plain['MACD'](series, fast, slow, signal)
+            outputs = [_values(e1), _values(e2), _values(macd), _values(macd_signal), _values(macd_hist)]
+            self._store(key, [x], outputs, tail=False)
+        else:
+            outputs = [o.copy() for o in memo.outputs]
+            outputs[0][-1] = exp1
+            outputs[1][-1] = exp2
+            outputs[2][-1] = macd_tail
+            outputs[3][-1] = sig
+            outputs[4][-1] = macd_tail - sig
+            self._store(key, [x], outputs, tail=True)
+        return tuple(self._series(o, series) for o in outputs[2:])
+
+    def BOLL(self, series, period=20, std_dev=2):
+        if not isinstance(series, pd.Series):
+            return self._plain['BOLL'](series, period, std_dev)
+        x = _values(series)
+        key = ('BOLL', series.name, period, std_dev)
+        memo = self._cached(key, [x])
+        if memo is None:
+            upper, middle, lower = self._plain['BOLL'](series, period, std_dev)
+            outputs = [_values(upper), _values(middle), _values(lower)]
+            self._store(key, [x], outputs, tail=False)
+        else:
+            mid = _tail_mean(x, period)
+            std = _tail_std(x, period)
+            outputs = [o.copy() for o in memo.outputs]
+            outputs[0][-1] = mid + std_dev * std
+            outputs[1][-1] = mid
+            outputs[2][-1] = mid - std_dev * std
+            self._store(key, [x], outputs, tail=True)
+        return tuple(self._series(o, series) for o in outputs)
+
+    def ATR(self, high, low, close, period=14):
+        if not all(isinstance(s, pd.Series) for s in (high, low, close)):
+            return self._plain['ATR'](high, low, close, period)
+        h, l, c = _values(high), _values(low), _values(close)
+        key = ('ATR', high.name, low.name, close.name, period)
+        memo = self._cached(key, [h, l, c])
+        if memo is None or np.isnan(c[-2]):
+            tr = _values(pd.concat([high - low, abs(high - close.shift()), abs(low - close.shift())], axis=1).max(axis=1))
+            out = _values(self._plain['ATR'](high, low, close, period))
+            self._store(key, [h, l, c], [out, tr], tail=False)
+        else:
+            tr = memo.outputs[1].copy()
+            tr[-1] = np.nanmax([h[-1] - l[-1], abs(h[-1] - c[-2]), abs(l[-1] - c[-2])])
+            out = memo.outputs[0].copy()
+            out[-1] = _tail_mean(tr, period)
+            self._store(key, [h, l, c], [out, tr], tail=True)
+        return self._series(out, close, name=None)
+
+    def HAMA(self, df):
+        from app.services.hama_calculator import hama_calculator as calc
+
+        o, h, l, c = (_values(df[col]) for col in ('open', 'high', 'low', 'close'))
+        key = ('HAMA',)
+        memo = self._cached(key, [o, h, l, c])
+        if memo is None or len(df) < max(calc.ma_length, calc.close_length):
+            result = self._plain['HAMA'](df)
+            self._store(key, [o, h, l, c], [result], tail=False)
+            return result.copy()
+
+        prev: pd.DataFrame = memo.outputs[0]
+        src_open = prev['source_open'].to_numpy(dtype=np.float64)
+        src_high = prev['source_high'].to_numpy(dtype=np.float64).copy()
+        src_low = prev['source_low'].to_numpy(dtype=np.float64).copy()
+        src_close = prev['source_close'].to_numpy(dtype=np.float64).copy()
+        src_high[-1] = max(h[-1], c[-1])
+        src_low[-1] = min(l[-1], c[-1])
+        src_close[-1] = (o[-1] + h[-1] + l[-1] + c[-1]) / 4
+
+        hama_open = _tail_ema(src_open, prev['hama_open'].to_numpy(dtype=np.float64), calc.open_length)
+        hama_high = _tail_ema(src_high, prev['hama_high'].to_numpy(dtype=np.float64), calc.high_length)
+        hama_low = _tail_ema(src_low, prev['hama_low'].to_numpy(dtype=np.float64), calc.low_length)
+        if hama_open is None or hama_high is None or hama_low is None:
+            result = self._plain['HAMA'](df)
+            self._store(key, [o, h, l, c], [result], tail=False)
+            return result.copy()
+
+        result = prev.copy()
+        i = len(result) - 1
+        hama_close = _tail_wma(src_close, calc.close_length)
+        hama_ma = _tail_wma(c, calc.ma_length)
+        prev_close = result['hama_close'].iat[i - 1]
+        prev_ma = result['hama_ma'].iat[i - 1]
+        bb_basis = _tail_mean(c, calc.bb_length)
+        bb_dev = _tail_std(c, calc.bb_length)
+        bb_upper = bb_basis + bb_dev * calc.bb_mult
+        bb_lower = bb_basis - bb_dev * calc.bb_mult
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bb_width = np.float64(bb_upper - bb_lower) / np.float64(bb_basis)
+
+        tail = {
+            'open': o[-1], 'high': h[-1], 'low': l[-1], 'close': c[-1],
+            'source_high': src_high[-1], 'source_low': src_low[-1], 'source_close': src_close[-1],
+            'hama_open': hama_open, 'hama_high': hama_high, 'hama_low': hama_low,
+            'hama_close': hama_close, 'hama_ma': hama_ma,
+            # calculate_hama 计算颜色时 hama_open_prev 列尚未生成，比较的是 hama_open 自身，整段计算结果恒为 'red'；尾部保持一致
+            'hama_color': 'red',
+            'hama_cross_up': bool(hama_close > hama_ma and prev_close <= prev_ma),
+            'hama_cross_down': bool(hama_close < hama_ma and prev_close >= prev_ma),
+            'bb_basis': bb_basis, 'bb_dev': bb_dev, 'bb_upper': bb_upper, 'bb_lower': bb_lower,
+            'bb_width': bb_width,
+            'bb_squeeze': bool(bb_width < 0.1),
+            'bb_expansion': bool(bb_width > 0.15),
+            'hama_rising': bool(hama_ma > prev_ma),
+            'hama_falling': bool(hama_ma < prev_ma),
+        }
+        for col, value in tail.items():
+            result.iat[i, result.columns.get_loc(col)] = value
+        self._store(key, [o, h, l, c], [result], tail=True)
+        return result.copy()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'tailUpdates': self.tail_updates, 'fullUpdates': self.full_updates, 'cached': len(self._memo)}
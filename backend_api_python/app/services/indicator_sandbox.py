@@ -0,0 +1,467 @@
+"""
+指标脚本沙箱：预热的子进程池
+
+signal.alarm 只在主线程生效，执行器线程 / Flask 工作线程里的 safe_exec 超时形同虚设，
+死循环的指标脚本会一直占满一个核。这里把用户代码放到独立的子进程里执行：
+
+- 进程池启动时预先 spawn 若干 worker，worker 启动即导入 numpy / pandas / 内置指标函数，
+  之后每次调用只传代码和参数，不再付出进程启动与导入的开销；
+- OHLCV 等数值列（含时间索引）通过共享内存传入，不经过 pickle；
+- 父进程等待结果时强制墙钟超时，并按 /proc/<pid>/statm 监控 worker 的 RSS，
+  超时或超内存直接 kill 该 worker 并补充新进程；
+- worker 执行 INDICATOR_SANDBOX_MAX_RUNS 次或 RSS 接近上限后回收重建，避免内存碎片累积。
+
+配置：
+- INDICATOR_SANDBOX_ENABLED: 是否启用（默认 true；关闭时各调用方回退到进程内执行）
+- INDICATOR_SANDBOX_WORKERS: worker 进程数（默认 2）
+- INDICATOR_SANDBOX_MAX_RSS_MB: 单个 worker 的 RSS 上限（默认 1024）
+- INDICATOR_SANDBOX_MAX_RUNS: 单个 worker 执行多少次后回收（默认 200）
+"""
+import os
+import signal
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from app.utils.code_cache import get_code_cache, get_safe_builtins
+from app.utils.logger import get_logger
+from app.utils.mp_worker import get_worker_context
+from app.utils.shared_arrays import attach_shared_arrays, pack_shared_arrays
+
+logger = get_logger(__name__)
+
+# 指标脚本默认允许导入的模块（与执行器一致）
+DEFAULT_ALLOWED_MODULES = ('numpy', 'pandas', 'math', 'json', 'time')
+# 回传给调用方的执行环境变量类型（函数、模块、DataFrame 等不回传）
+_ENV_SCALAR_TYPES = (bool, int, float, str, type(None), np.generic)
+
+_STARTUP_TIMEOUT_SEC = 60.0
+_POLL_SEC = 0.02
+# RSS 超过上限的该比例时，执行结束后回收 worker
+_RECYCLE_RSS_RATIO = 0.75
+_INDEX_KEY = '__index__'
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+class SandboxError(RuntimeError):
+    """沙箱执行失败（worker 异常退出、无法启动等）"""
+    pass
+
+
+class SandboxTimeoutError(SandboxError):
+    """代码执行超时（worker 已被终止）"""
+    pass
+
+
+class SandboxMemoryError(SandboxError):
+    """代码执行内存超限（worker 已被终止）"""
+    pass
+
+
+class SandboxCodeError(SandboxError):
+    """用户代码抛出的异常"""
+
+    def __init__(self, error_type: str, message: str, details: str = '', lineno: Optional[int] = None):
+        super().__init__(message)
+        self.error_type = error_type
+        self.message = message
+        self.details = details
+        self.lineno = lineno
+
+
+class SandboxResult:
+    """沙箱执行结果：执行后的 df、output 变量、以及执行环境中的标量变量"""
+
+    def __init__(self, df: Optional[pd.DataFrame], output: Any, env: Dict[str, Any]):
+        self.df = df
+        self.output = output
+        self.env = env
+
+
+# ==================== worker（子进程） ====================
+
+def _task_dataframe(task: Dict[str, Any]) -> pd.DataFrame:
+    shm, views = attach_shared_arrays(task['shm'], task['layout'])
+    try:
+        # 复制出可写数组后立即释放共享内存（用户代码可能原地修改 df）
+        data = {key: np.array(view) for key, view in views.items()}
+    finally:
+        shm.close()
+
+    if _INDEX_KEY in data:
+        index = pd.DatetimeIndex(data.pop(_INDEX_KEY).view('datetime64[ns]'), name=task.get('index_name'))
+        if task.get('index_tz') is not None:
+            index = index.tz_localize('UTC').tz_convert(task['index_tz'])
+    else:
+        index = task['index']
+    data.update(task.get('extra') or {})
+    return pd.DataFrame({col: data[col] for col in task['columns']}, index=index)
+
+
+def _run_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        df = _task_dataframe(task)
+        env: Dict[str, Any] = {}
+        allowed_modules = task.get('allowed_modules')
+        if allowed_modules is not None:
+            env['__builtins__'] = get_safe_builtins(allowed_modules)
+        env['np'] = np
+        env['pd'] = pd
+        if task.get('expose_series'):
+            for col in ('open', 'high', 'low', 'close', 'volume'):
+                if col in df.columns:
+                    env[col] = df[col].astype('float64')
+            env['signals'] = pd.Series(0, index=df.index, dtype='float64')
+        if task.get('indicator_functions'):
+            from app.services.incremental_indicators import get_indicator_functions
+            env.update(get_indicator_functions())
+        env.update(task.get('variables') or {})
+        env['df'] = df
+
+        # worker 进程内同样按代码哈希缓存编译结果
+        exec(get_code_cache().get(task['code']).code_obj, env)
+    except BaseException as e:
+        return {
+            'ok': False,
+            'error_type': type(e).__name__,
+            'message': e.msg if isinstance(e, SyntaxError) else str(e),
+            'details': traceback.format_exc(),
+            'lineno': getattr(e, 'lineno', None) if isinstance(e, SyntaxError) else None,
+        }
+
+    out_df = env.get('df')
+    return {
+        'ok': True,
+        'df': out_df if isinstance(out_df, pd.DataFrame) else None,
+        'output': env.get('output'),
+        'env': {k: v for k, v in env.items() if not k.startswith('_') and isinstance(v, _ENV_SCALAR_TYPES)},
+    }
+
+
+def _worker_main(conn) -> None:
+    # 终端 Ctrl+C 由父进程处理，worker 随父进程退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 预热：导入内置指标（连带 numpy / pandas）
+    from app.services.incremental_indicators import get_indicator_functions
+    get_indicator_functions()
+    conn.send(('ready', os.getpid()))
+
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        reply = _run_task(task)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # output / df 中含有无法序列化的对象
+            conn.send({
+                'ok': False,
+                'error_type': type(e).__name__,
+                'message': f"执行结果无法序列化: {e}",
+                'details': '',
+                'lineno': None,
+            })
+
+
+# ==================== 进程池（父进程） ====================
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child_conn,), name='indicator-sandbox', daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.ready = False
+        self.runs = 0
+
+    def ensure_ready(self, timeout: float) -> None:
+        if self.ready:
+            return
+        if not self.conn.poll(timeout):
+            raise SandboxError(f"沙箱进程启动超时（{timeout}秒）")
+        try:
+            self.conn.recv()
+        except (EOFError, OSError):
+            raise SandboxError(f"沙箱进程启动失败 (exitcode={self.proc.exitcode})")
+        self.ready = True
+
+    def rss_bytes(self) -> Optional[int]:
+        try:
+            with open(f'/proc/{self.proc.pid}/statm') as f:
+                return int(f.read().split()[1]) * _PAGE_SIZE
+        except Exception:
+            return None
+
+    def stop(self, kill: bool = False) -> None:
+        try:
+            if not kill and self.proc.is_alive():
+                self.conn.send(None)
+                self.proc.join(timeout=1.0)
+            if self.proc.is_alive():
+                self.proc.kill()
+                self.proc.join(timeout=1.0)
+        except Exception:
+            pass
+        finally:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+
+
+class IndicatorSandbox:
+    """指标脚本执行进程池"""
+
+    def __init__(self, workers: Optional[int] = None, max_rss_mb: Optional[int] = None, max_runs: Optional[int] = None):
+        self.enabled = os.getenv('INDICATOR_SANDBOX_ENABLED', 'true').lower() == 'true'
+        try:
+            self.size = max(1, int(workers or os.getenv('INDICATOR_SANDBOX_WORKERS', '2')))
+        except Exception:
+            self.size = 2
+        try:
+            self.max_rss_bytes = max(64, int(max_rss_mb or os.getenv('INDICATOR_SANDBOX_MAX_RSS_MB', '1024'))) * 1024 * 1024
+        except Exception:
+            self.max_rss_bytes = 1024 * 1024 * 1024
+        try:
+            self.max_runs = max(1, int(max_runs or os.getenv('INDICATOR_SANDBOX_MAX_RUNS', '200')))
+        except Exception:
+            self.max_runs = 200
+
+        # spawn：避免在多线程的 Web/执行器进程中 fork；worker 不重新导入入口脚本（见 mp_worker）
+        self._ctx = get_worker_context()
+        self._cond = threading.Condition()
+        self._workers: set = set()
+        self._idle: List[_Worker] = []
+        self._closed = False
+
+        self._runs = 0
+        self._code_errors = 0
+        self._timeouts = 0
+        self._memory_kills = 0
+        self._crashes = 0
+        self._recycled = 0
+        self._spawned = 0
+
+    # ---- lifecycle ----
+
+    def start(self) -> None:
+        """预先启动全部 worker（导入在子进程中异步完成）"""
+        if not self.enabled:
+            return
+        with self._cond:
+            while not self._closed and len(self._workers) < self.size:
+                self._idle.append(self._spawn_locked())
+            self._cond.notify_all()
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+            self._idle.clear()
+            self._cond.notify_all()
+        for w in workers:
+            w.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'enabled': self.enabled,
+                'workers': len(self._workers),
+                'idle': len(self._idle),
+                'size': self.size,
+                'maxRssMb': self.max_rss_bytes // (1024 * 1024),
+                'maxRuns': self.max_runs,
+                'runs': self._runs,
+                'codeErrors': self._code_errors,
+                'timeouts': self._timeouts,
+                'memoryKills': self._memory_kills,
+                'crashes': self._crashes,
+                'recycled': self._recycled,
+                'spawned': self._spawned,
+            }
+
+    # ---- execution ----
+
+    def run(
+        self,
+        code: str,
+        df: pd.DataFrame,
+        variables: Optional[Dict[str, Any]] = None,
+        timeout: float = 30.0,
+        allowed_modules: Optional[Sequence[str]] = DEFAULT_ALLOWED_MODULES,
+        expose_series: bool = True,
+        indicator_functions: bool = True,
+    ) -> SandboxResult:
+        """
+        在 worker 进程中执行指标代码。
+
+        Args:
+            code: 用户代码
+            df: K线 DataFrame（脚本中的 df）
+            variables: 额外注入执行环境的变量（需可 pickle）
+            timeout: 墙钟超时（秒），超时后 worker 被 kill
+            allowed_modules: 允许 import 的模块；None 表示不限制 builtins（verifyCode 的原有行为）
+            expose_series: 是否注入 open/high/low/close/volume/signals
+            indicator_functions: 是否注入内置指标函数（SMA/EMA/...）
+
+        Raises:
+            SandboxCodeError: 用户代码抛出异常
+            SandboxTimeoutError / SandboxMemoryError: 超时 / 超内存
+            SandboxError: worker 异常退出或无法启动
+        """
+        deadline = time.time() + timeout
+        worker = self._acquire(deadline)
+        retire = False
+        shm = None
+        try:
+            worker.ensure_ready(_STARTUP_TIMEOUT_SEC)
+            task, shm = self._build_task(code, df, variables, allowed_modules, expose_series, indicator_functions)
+            worker.conn.send(task)
+            reply = self._wait(worker, time.time() + timeout, timeout)
+        except BaseException:
+            retire = True
+            raise
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            if not retire:
+                worker.runs += 1
+                rss = worker.rss_bytes()
+                if worker.runs >= self.max_runs or (rss and rss > self.max_rss_bytes * _RECYCLE_RSS_RATIO):
+                    retire = True
+                    self._count('_recycled')
+            self._release(worker, retire)
+
+        self._count('_runs')
+        if not reply.get('ok'):
+            self._count('_code_errors')
+            raise SandboxCodeError(
+                reply.get('error_type') or 'Error',
+                reply.get('message') or '',
+                reply.get('details') or '',
+                reply.get('lineno'),
+            )
+        return SandboxResult(reply.get('df'), reply.get('output'), reply.get('env') or {})
+
+    # ---- internals ----
+
+    def _build_task(self, code, df, variables, allowed_modules, expose_series, indicator_functions):
+        arrays: Dict[str, np.ndarray] = {}
+        extra: Dict[str, Any] = {}
+        for col in df.columns:
+            values = df[col].to_numpy()
+            if values.dtype.kind in 'biuf':
+                arrays[col] = values
+            else:
+                extra[col] = values
+
+        task: Dict[str, Any] = {
+            'code': code,
+            'columns': list(df.columns),
+            'extra': extra,
+            'variables': dict(variables or {}),
+            'allowed_modules': list(allowed_modules) if allowed_modules is not None else None,
+            'expose_series': expose_series,
+            'indicator_functions': indicator_functions,
+        }
+        index = df.index
+        if isinstance(index, pd.DatetimeIndex):
+            task['index_tz'] = index.tz
+            task['index_name'] = index.name
+            utc = index.tz_convert('UTC').tz_localize(None) if index.tz is not None else index
+            arrays[_INDEX_KEY] = utc.to_numpy(dtype='datetime64[ns]').view('int64')
+        else:
+            task['index'] = index
+
+        shm, layout = pack_shared_arrays(arrays)
+        task['shm'] = shm.name
+        task['layout'] = layout
+        return task, shm
+
+    def _wait(self, worker: _Worker, deadline: float, timeout: float) -> Dict[str, Any]:
+        while True:
+            if worker.conn.poll(_POLL_SEC):
+                try:
+                    return worker.conn.recv()
+                except (EOFError, OSError):
+                    self._count('_crashes')
+                    raise SandboxError(f"沙箱进程异常退出 (exitcode={worker.proc.exitcode})")
+            if not worker.proc.is_alive():
+                self._count('_crashes')
+                raise SandboxError(f"沙箱进程异常退出 (exitcode={worker.proc.exitcode})")
+            if time.time() >= deadline:
+                worker.stop(kill=True)
+                self._count('_timeouts')
+                logger.warning(f"Indicator sandbox timeout after {timeout}s; worker {worker.proc.pid} killed")
+                raise SandboxTimeoutError(f"代码执行超时（超过{timeout}秒）")
+            rss = worker.rss_bytes()
+            if rss is not None and rss > self.max_rss_bytes:
+                worker.stop(kill=True)
+                self._count('_memory_kills')
+                limit_mb = self.max_rss_bytes // (1024 * 1024)
+                logger.warning(f"Indicator sandbox RSS {rss // (1024 * 1024)}MB > {limit_mb}MB; worker {worker.proc.pid} killed")
+                raise SandboxMemoryError(f"代码执行内存超限（超过{limit_mb}MB）")
+
+    def _acquire(self, deadline: float) -> _Worker:
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise SandboxError("指标沙箱已关闭")
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._workers) < self.size:
+                    return self._spawn_locked()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise SandboxTimeoutError("等待空闲沙箱进程超时")
+                self._cond.wait(remaining)
+
+    def _release(self, worker: _Worker, retire: bool) -> None:
+        with self._cond:
+            if retire or self._closed:
+                self._workers.discard(worker)
+            else:
+                self._idle.append(worker)
+            self._cond.notify()
+        if retire:
+            worker.stop()
+            # 补充新进程，保持进程池预热
+            self.start()
+
+    def _spawn_locked(self) -> _Worker:
+        worker = _Worker(self._ctx)
+        self._workers.add(worker)
+        self._spawned += 1
+        return worker
+
+    def _count(self, name: str) -> None:
+        with self._cond:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+_sandbox: Optional[IndicatorSandbox] = None
+_sandbox_lock = threading.Lock()
+
+
+def get_indicator_sandbox() -> IndicatorSandbox:
+    global _sandbox
+    if _sandbox is None:
+        with _sandbox_lock:
+            if _sandbox is None:
+                _sandbox = IndicatorSandbox()
+                _sandbox.start()
+    return _sandbox
@@ -3,13 +3,18 @@ K线数据服务
 """
 from typing import Dict, List, Any, Optional
 
-from app.data_sources import DataSourceFactory
+from app.data_sources import DataSourceFactory, KlineBatch
 from app.utils.cache import CacheManager
 from app.utils.logger import get_logger
+from app.utils.singleflight import SingleFlight
+from app.services.kline_cache import get_kline_window_cache
 from app.config import CacheConfig
 
 logger = get_logger(__name__)
 
+# 进程内合并相同的并发K线请求（收盘时刻多个策略/多个页面同时刷新同一品种）
+_kline_flight = SingleFlight('kline')
+
 
 class KlineService:
     """K线数据服务"""
@@ -17,6 +22,7 @@ class KlineService:
     def __init__(self):
         self.cache = CacheManager()
         self.cache_ttl = CacheConfig.KLINE_CACHE_TTL
+        self.window_cache = get_kline_window_cache()
     
     def get_kline(
         self,
@@ -24,8 +30,9 @@ class KlineService:
         symbol: str,
         timeframe: str,
         limit: int = 300,
-        before_time: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
+        before_time: Optional[int] = None,
+        refresh: bool = False
+    ) -> KlineBatch:
         """
         获取K线数据
         
@@ -35,19 +42,54 @@ class KlineService:
             timeframe: 时间周期
             limit: 数据条数
             before_time: 获取此时间之前的数据
+            refresh: 忽略未过期的最新数据缓存（K线收盘后取刚收盘的K线）
             
         Returns:
-            K线数据列表
+            KlineBatch（按时间升序）
         """
-        # 构建缓存键（历史数据不缓存）
-        if not before_time:
-            cache_key = f"kline:{market}:{symbol}:{timeframe}:{limit}"
-            cached = self.cache.get(cache_key)
-            if cached:
-                # logger.info(f"命中缓存: {cache_key}")
-                return cached
+        ttl = self.cache_ttl.get(timeframe, 300)
+        if self.window_cache.enabled:
+            if refresh and not before_time:
+                self.window_cache.expire(market, symbol, timeframe)
+            # 区间缓存：任意 limit / before_time 从缓存的连续K线中切片，只向上游补齐缺失的边
+            def fetch(n: int, before: Optional[int]) -> KlineBatch:
+                return DataSourceFactory.get_kline(
+                    market=market,
+                    symbol=symbol,
+                    timeframe=timeframe,
+                    limit=n,
+                    before_time=before
+                )
+
+            def load() -> KlineBatch:
+                return self.window_cache.get(market, symbol, timeframe, limit, before_time, fetch, ttl)
+        else:
+            # 构建缓存键（历史数据不缓存）
+            if not before_time and not refresh:
+                cache_key = f"kline:{market}:{symbol}:{timeframe}:{limit}"
+                cached = self.cache.get(cache_key)
+                if cached:
+                    # logger.info(f"命中缓存: {cache_key}")
+                    # 缓存中为列式结构；兼容旧版本写入的 list-of-dict
+                    return KlineBatch.from_columns(cached) if isinstance(cached, dict) else KlineBatch.coerce(cached)
+
+            def load() -> KlineBatch:
+                return self._fetch_and_cache(market, symbol, timeframe, limit, before_time)
         
-        # 获取数据
+        # 相同参数的并发请求只执行一次，其余调用等待同一结果（异常同样传递给所有等待者）
+        flight_key = (market, symbol, timeframe, limit, before_time, refresh)
+        klines, shared = _kline_flight.do(flight_key, load)
+        # 等待者拿到独立副本，避免调用方原地修改共享数组
+        return klines.copy() if shared else klines
+
+    def _fetch_and_cache(
+        self,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        limit: int,
+        before_time: Optional[int]
+    ) -> KlineBatch:
         klines = DataSourceFactory.get_kline(
             market=market,
             symbol=symbol,
@@ -58,11 +100,25 @@ class KlineService:
         
         # 设置缓存（仅最新数据）
         if klines and not before_time:
+            cache_key = f"kline:{market}:{symbol}:{timeframe}:{limit}"
             ttl = self.cache_ttl.get(timeframe, 300)
-            self.cache.set(cache_key, klines, ttl)
+            self.cache.set(cache_key, klines.to_columns(), ttl)
             # logger.info(f"缓存设置: {cache_key}, TTL: {ttl}s")
         
         return klines
+
+    def seed_latest(self, market: str, symbol: str, timeframe: str, klines: KlineBatch) -> None:
+        """用调用方已持有的最新K线填充区间缓存（未启用区间缓存时忽略）"""
+        if self.window_cache.enabled:
+            self.window_cache.seed(market, symbol, timeframe, klines)
+
+    @staticmethod
+    def get_singleflight_stats() -> Dict[str, Any]:
+        """请求合并统计（calls=实际执行次数，coalesced=合并等待的调用数）"""
+        return _kline_flight.stats()
+
+    def get_window_cache_stats(self) -> Dict[str, Any]:
+        return self.window_cache.stats()
     
     def get_latest_price(self, market: str, symbol: str) -> Optional[Dict[str, Any]]:
         """获取最新价格"""
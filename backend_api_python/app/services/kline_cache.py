@@ -0,0 +1,319 @@
+"""
+区间索引的K线内存缓存（window cache）
+
+每个 (market, symbol, timeframe) 只保存一段连续的K线（KlineBatch），任意 limit / before_time
+请求都从这段连续区间中切片返回，只向上游补齐缺失的边：
+- 尾部：最新数据过期（超过 KLINE_CACHE_TTL）时，只拉取距上次最新K线以来的几根并合并；
+- 头部：区间内K线不足 limit 根、或 before_time 早于区间起点时，只拉取更早的缺少部分；
+- 历史分页（before_time）落在已覆盖区间内时直接命中，不再回源。
+
+按总内存（每根K线 48 字节）做 LRU 淘汰，单个区间最多保留 KLINE_WINDOW_CACHE_MAX_BARS 根。
+
+配置：
+- KLINE_WINDOW_CACHE_ENABLED: 是否启用（默认 true；关闭时回退到 CacheManager 按 limit 缓存）
+- KLINE_WINDOW_CACHE_MAX_MB: 内存上限（默认 64）
+- KLINE_WINDOW_CACHE_MAX_BARS: 单个区间最多保留的K线根数（默认 20000）
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.data_sources import KlineBatch
+from app.data_sources.base import TIMEFRAME_SECONDS
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# fetch(limit, before_time) -> KlineBatch（按时间升序）
+FetchFn = Callable[[int, Optional[int]], KlineBatch]
+
+_BYTES_PER_BAR = 8 * 6
+# 单次补齐头部时最多向上游请求的轮数（部分数据源单次返回条数有上限）
+_MAX_HEAD_ROUNDS = 3
+
+
+class _Window:
+    __slots__ = ('batch', 'settled_end', 'refreshed_at', 'head_complete', 'accounted_bytes')
+
+    def __init__(self, batch: KlineBatch, settled_end: int, refreshed_at: Optional[float]):
+        self.batch = batch
+        # 已确认完整覆盖的右边界（不含）：该时间之前的K线都已在 batch 中且已收盘
+        self.settled_end = settled_end
+        # 最近一次拉取最新K线的时间；None 表示区间来自历史请求，不包含最新K线
+        self.refreshed_at = refreshed_at
+        self.head_complete = False
+        # 最近一次计入缓存总量的字节数（batch 会被原地替换，淘汰时按此扣减）
+        self.accounted_bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.batch) * _BYTES_PER_BAR
+
+
+class KlineWindowCache:
+    """K线区间缓存（进程内）"""
+
+    def __init__(self, max_bytes: Optional[int] = None, max_bars: Optional[int] = None):
+        self.enabled = os.getenv('KLINE_WINDOW_CACHE_ENABLED', 'true').lower() == 'true'
+        try:
+            self.max_bytes = max(1, int(max_bytes or float(os.getenv('KLINE_WINDOW_CACHE_MAX_MB', '64')) * 1024 * 1024))
+        except Exception:
+            self.max_bytes = 64 * 1024 * 1024
+        try:
+            self.max_bars = max(1, int(max_bars or os.getenv('KLINE_WINDOW_CACHE_MAX_BARS', '20000')))
+        except Exception:
+            self.max_bars = 20000
+
+        self._windows: "OrderedDict[Tuple[str, str, str], _Window]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self._hits = 0
+        self._partial = 0
+        self._misses = 0
+        self._bypass = 0
+        self._evictions = 0
+
+    # ---- public API ----
+
+    def get(
+        self,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        limit: int,
+        before_time: Optional[int],
+        fetch: FetchFn,
+        ttl: int
+    ) -> KlineBatch:
+        """
+        返回 limit 根 before_time 之前的K线（before_time 为空表示最新），结果为独立副本。
+        """
+        tf_seconds = TIMEFRAME_SECONDS.get(timeframe)
+        if not tf_seconds or not limit or limit <= 0 or limit > self.max_bars:
+            self._count('_bypass')
+            return fetch(limit, before_time)
+
+        key = (market, symbol, timeframe)
+        with self._key_lock(key):
+            with self._lock:
+                window = self._windows.get(key)
+                if window is not None:
+                    self._windows.move_to_end(key)
+
+            if before_time:
+                result = self._get_history(key, window, int(before_time), limit, tf_seconds, fetch)
+            else:
+                result = self._get_latest(key, window, limit, tf_seconds, fetch, ttl)
+        return result.copy()
+
+    def seed(self, market: str, symbol: str, timeframe: str, batch: KlineBatch) -> None:
+        """
+        用外部已有的连续最新K线（如重启时从快照恢复并补齐尾部的K线）填充缓存，
+        已缓存的区间更长时保留原区间。
+        """
+        if not self.enabled or not batch or not TIMEFRAME_SECONDS.get(timeframe):
+            return
+        key = (market, symbol, timeframe)
+        with self._key_lock(key):
+            with self._lock:
+                window = self._windows.get(key)
+            if window is not None and len(window.batch) >= len(batch):
+                return
+            self._save(key, _Window(batch.copy(), int(batch.time[-1]), time.time()))
+
+    def expire(self, market: str, symbol: str, timeframe: str) -> None:
+        """标记最新数据过期（K线收盘后调用）：下次请求只拉取尾部几根，不丢弃已缓存的区间"""
+        with self._lock:
+            window = self._windows.get((market, symbol, timeframe))
+            if window is not None:
+                window.refreshed_at = None
+
+    def invalidate(self, market: str, symbol: str, timeframe: str) -> None:
+        with self._lock:
+            window = self._windows.pop((market, symbol, timeframe), None)
+            if window is not None:
+                self._bytes -= window.accounted_bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._windows.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._partial + self._misses
+            return {
+                'enabled': self.enabled,
+                'windows': len(self._windows),
+                'bars': self._bytes // _BYTES_PER_BAR,
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self._hits,
+                'partial': self._partial,
+                'misses': self._misses,
+                'bypass': self._bypass,
+                'evictions': self._evictions,
+                'hitRatio': round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # ---- request paths ----
+
+    def _get_latest(
+        self,
+        key: Tuple[str, str, str],
+        window: Optional[_Window],
+        limit: int,
+        tf_seconds: int,
+        fetch: FetchFn,
+        ttl: int
+    ) -> KlineBatch:
+        now = time.time()
+        if window is None:
+            batch = fetch(limit, None)
+            self._count('_misses')
+            if batch:
+                window = _Window(batch, int(batch.time[-1]), now)
+                self._save(key, window)
+            return batch
+
+        fresh = window.refreshed_at is not None and now - window.refreshed_at < ttl
+        if fresh and (len(window.batch) >= limit or window.head_complete):
+            self._count('_hits')
+            return window.batch[-limit:]
+
+        self._count('_partial')
+        if not fresh:
+            # 只拉取上次最新K线（可能未收盘）以来的部分
+            gap = int((now - int(window.batch.time[-1])) // tf_seconds) + 2
+            if gap >= limit:
+                batch = fetch(limit, None)
+                if not batch:
+                    return batch
+                window = _Window(batch, int(batch.time[-1]), now)
+                self._save(key, window)
+                return batch
+
+            tail = fetch(gap, None)
+            if not tail:
+                return tail
+            window = self._merge_tail(window, tail)
+            window.settled_end = int(window.batch.time[-1])
+            window.refreshed_at = now
+
+        self._extend_head(window, limit - len(window.batch), fetch)
+        self._save(key, window)
+        return window.batch[-limit:]
+
+    def _get_history(
+        self,
+        key: Tuple[str, str, str],
+        window: Optional[_Window],
+        before_time: int,
+        limit: int,
+        tf_seconds: int,
+        fetch: FetchFn
+    ) -> KlineBatch:
+        if window is None:
+            batch = fetch(limit, before_time)
+            self._count('_misses')
+            if batch:
+                window = _Window(batch, before_time, None)
+                self._save(key, window)
+            return batch
+
+        if before_time > window.settled_end:
+            # 请求的右边界超出已覆盖区间：整段拉取，能与已有区间衔接时合并
+            batch = fetch(limit, before_time)
+            self._count('_misses')
+            if batch and int(batch.time[0]) <= window.settled_end:
+                window.batch = KlineBatch.concat([window.batch.before(int(batch.time[0])), batch])
+                window.settled_end = before_time
+                window.refreshed_at = None
+                self._save(key, window)
+            return batch
+
+        start = int(window.batch.time[0])
+        if before_time <= start:
+            # 早于区间起点：估算中间缺少的根数，向前补齐（跨度过大时直接回源，不进缓存）
+            if window.head_complete:
+                self._count('_hits')
+                return KlineBatch.empty()
+            need = (start - before_time) // tf_seconds + limit
+            if len(window.batch) + need > self.max_bars:
+                self._count('_bypass')
+                return fetch(limit, before_time)
+        else:
+            need = limit - len(window.batch.before(before_time))
+
+        if need <= 0 or window.head_complete:
+            self._count('_hits')
+        else:
+            self._count('_partial')
+            self._extend_head(window, need, fetch)
+            self._save(key, window)
+        return window.batch.before(before_time)[-limit:]
+
+    # ---- helpers ----
+
+    def _merge_tail(self, window: _Window, tail: KlineBatch) -> _Window:
+        first = int(tail.time[0])
+        if first <= int(window.batch.time[-1]):
+            window.batch = KlineBatch.concat([window.batch.before(first), tail])
+            return window
+        # 新数据与已有区间之间可能有缺口，不能保证连续：以新数据重新开始
+        return _Window(tail, int(tail.time[-1]), None)
+
+    def _extend_head(self, window: _Window, need: int, fetch: FetchFn) -> None:
+        rounds = 0
+        while need > 0 and not window.head_complete and rounds < _MAX_HEAD_ROUNDS:
+            start = int(window.batch.time[0])
+            older = fetch(need, start).before(start)
+            if not older:
+                window.head_complete = True
+                break
+            window.batch = KlineBatch.concat([older, window.batch])
+            need -= len(older)
+            rounds += 1
+
+    def _save(self, key: Tuple[str, str, str], window: _Window) -> None:
+        if len(window.batch) > self.max_bars:
+            window.batch = window.batch[-self.max_bars:]
+            window.head_complete = False
+        with self._lock:
+            old = self._windows.pop(key, None)
+            if old is not None:
+                self._bytes -= old.accounted_bytes
+            window.accounted_bytes = window.nbytes
+            self._windows[key] = window
+            self._bytes += window.accounted_bytes
+            while self._bytes > self.max_bytes and len(self._windows) > 1:
+                _, evicted = self._windows.popitem(last=False)
+                self._bytes -= evicted.accounted_bytes
+                self._evictions += 1
+
+    def _key_lock(self, key: Tuple[str, str, str]) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+_window_cache: Optional[KlineWindowCache] = None
+_window_cache_lock = threading.Lock()
+
+
+def get_kline_window_cache() -> KlineWindowCache:
+    global _window_cache
+    if _window_cache is None:
+        with _window_cache_lock:
+            if _window_cache is None:
+                _window_cache = KlineWindowCache()
+    return _window_cache
@@ -4,16 +4,21 @@ Base REST client helpers for direct exchange connections.
 Notes:
 - Keep this minimal and dependency-light (requests only).
 - All secrets must be excluded from logs.
+- Each client owns a keep-alive requests.Session; clients are long-lived and shared between threads
+  (see client_pool.get_client), so per-instance state must stay thread-safe.
 """
 
 from __future__ import annotations
 
 import json
+import os
+import threading
 import time
 from dataclasses import dataclass
 from typing import Any, Dict, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 
 @dataclass
@@ -30,9 +35,76 @@ class LiveTradingError(Exception):
 
 
 class BaseRestClient:
+    # Key into rate_limit.VENUE_LIMITS; empty disables client-side throttling.
+    rate_limit_venue: str = ""
+
     def __init__(self, base_url: str, timeout_sec: float = 15.0):
         self.base_url = (base_url or "").rstrip("/")
         self.timeout_sec = float(timeout_sec)
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+        self._last_nonce_ms = 0
+        self.last_used_at = time.time()
+
+    def _get_session(self) -> requests.Session:
+        """Keep-alive session (connection pool) reused across calls to avoid a TCP+TLS handshake per request."""
+        s = self._session
+        if s is None:
+            with self._session_lock:
+                s = self._session
+                if s is None:
+                    try:
+                        pool_size = int(os.getenv("LIVE_HTTP_POOL_SIZE", "8"))
+                    except Exception:
+                        pool_size = 8
+                    s = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(1, pool_size))
+                    s.mount("https://", adapter)
+                    s.mount("http://", adapter)
+                    self._session = s
+        return s
+
+    def close(self) -> None:
+        with self._session_lock:
+            s, self._session = self._session, None
+        if s is not None:
+            try:
+                s.close()
+            except Exception:
+                pass
+
+    def _throttle(self, method: str, path: str) -> float:
+        """
+        Wait for the venue's rate limit before sending. Signed requests call this before computing their
+        timestamp / nonce so a queued request is not rejected as stale.
+        """
+        if not self.rate_limit_venue:
+            return 0.0
+        from app.services.live_trading.rate_limit import account_fingerprint, get_rate_limiter
+        return get_rate_limiter().acquire(
+            self.rate_limit_venue, method, self._path_only(path), account_fingerprint(getattr(self, "api_key", "") or "")
+        )
+
+    def _observe_rate_limit(self, method: str, path: str, status: int, headers: Any) -> None:
+        if not self.rate_limit_venue:
+            return
+        from app.services.live_trading.rate_limit import account_fingerprint, get_rate_limiter
+        get_rate_limiter().observe(
+            self.rate_limit_venue, method, self._path_only(path),
+            account_fingerprint(getattr(self, "api_key", "") or ""), status, headers,
+        )
+
+    @staticmethod
+    def _path_only(path: str) -> str:
+        p = str(path or "").split("?", 1)[0]
+        return p if p.startswith("/") else "/" + p
+
+    def _nonce_ms(self) -> str:
+        """Strictly increasing ms nonce (a shared client may sign two requests within the same millisecond)."""
+        with self._session_lock:
+            n = max(self._now_ms(), self._last_nonce_ms + 1)
+            self._last_nonce_ms = n
+        return str(n)
 
     def _url(self, path: str) -> str:
         p = str(path or "")
@@ -49,17 +121,31 @@ class BaseRestClient:
         json_body: Optional[Dict[str, Any]] = None,
         headers: Optional[Dict[str, str]] = None,
         data: Optional[Any] = None,
+        throttled: bool = False,
     ) -> Tuple[int, Dict[str, Any], str]:
+        """
+        throttled=True: the caller already waited via _throttle() (signed requests). Unsigned requests are
+        throttled here and retried once after a 429 (the exchange did not process them).
+        """
         url = self._url(path)
-        resp = requests.request(
-            method=str(method or "GET").upper(),
-            url=url,
-            params=params or None,
-            json=json_body if json_body is not None else None,
-            data=data,
-            headers=headers or None,
-            timeout=self.timeout_sec,
-        )
+        m = str(method or "GET").upper()
+        attempts = 1 if throttled else 2
+        for attempt in range(attempts):
+            if not throttled:
+                self._throttle(m, path)
+            self.last_used_at = time.time()
+            resp = self._get_session().request(
+                method=m,
+                url=url,
+                params=params or None,
+                json=json_body if json_body is not None else None,
+                data=data,
+                headers=headers or None,
+                timeout=self.timeout_sec,
+            )
+            self._observe_rate_limit(m, path, int(resp.status_code), resp.headers)
+            if int(resp.status_code) != 429 or attempt + 1 >= attempts:
+                break
         text = resp.text or ""
         parsed: Dict[str, Any] = {}
         try:
@@ -19,6 +19,8 @@ from app.services.live_trading.symbols import to_binance_futures_symbol
 
 
 class BinanceFuturesClient(BaseRestClient):
+    rate_limit_venue = "binance_futures"
+
     def __init__(self, *, api_key: str, secret_key: str, base_url: str = "https://fapi.binance.com", timeout_sec: float = 15.0):
         super().__init__(base_url=base_url, timeout_sec=timeout_sec)
         self.api_key = (api_key or "").strip()
@@ -76,12 +78,13 @@ class BinanceFuturesClient(BaseRestClient):
         return {"X-MBX-APIKEY": self.api_key}
 
     def _signed_request(self, method: str, path: str, *, params: Dict[str, Any]) -> Dict[str, Any]:
+        self._throttle(method, path)
         p = dict(params or {})
         # Use server-accepted timestamp in ms.
         p["timestamp"] = int(time.time() * 1000)
         qs = urlencode(p, doseq=True)
         p["signature"] = self._sign(qs)
-        code, data, text = self._request(method, path, params=p, headers=self._signed_headers())
+        code, data, text = self._request(method, path, params=p, headers=self._signed_headers(), throttled=True)
         if code >= 400:
             raise LiveTradingError(f"Binance HTTP {code}: {text[:500]}")
         if isinstance(data, dict) and data.get("code") and int(data.get("code")) < 0:
@@ -420,7 +423,10 @@ class BinanceFuturesClient(BaseRestClient):
         poll_interval_sec: float = 0.5,
     ) -> Dict[str, Any]:
         """
-        Poll order detail to obtain (best-effort) executed quantity and average price.
+        Wait for the order's executed quantity and average price (best-effort).
+
+        Uses the account's user-data stream when one is live (see user_stream), otherwise / afterwards
+        polls order detail.
 
         Returns:
         {
@@ -433,6 +439,20 @@ class BinanceFuturesClient(BaseRestClient):
         end_ts = time.time() + float(max_wait_sec or 0.0)
         last: Dict[str, Any] = {}
 
+        try:
+            from app.services.live_trading.user_stream import wait_for_order_event
+
+            st = wait_for_order_event(
+                self, order_id=str(order_id or ""), client_order_id=str(client_order_id or ""),
+                ready=lambda s: bool(s.get("final")) or (s.get("filled", 0) > 0 and s.get("avg_price", 0) > 0),
+                max_wait_sec=float(max_wait_sec or 0.0),
+            )
+        except Exception:
+            st = None
+        if st is not None:
+            return {"filled": float(st.get("filled") or 0.0), "avg_price": float(st.get("avg_price") or 0.0),
+                    "status": str(st.get("status") or ""), "order": st.get("raw") or {}, "source": "stream"}
+
         while True:
             try:
                 last = self.get_order(symbol=symbol, order_id=str(order_id or ""), client_order_id=str(client_order_id or ""))
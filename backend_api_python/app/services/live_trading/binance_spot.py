@@ -16,6 +16,8 @@ from app.services.live_trading.symbols import to_binance_futures_symbol
 
 
 class BinanceSpotClient(BaseRestClient):
+    rate_limit_venue = "binance_spot"
+
     def __init__(self, *, api_key: str, secret_key: str, base_url: str = "https://api.binance.com", timeout_sec: float = 15.0):
         super().__init__(base_url=base_url, timeout_sec=timeout_sec)
         self.api_key = (api_key or "").strip()
@@ -66,11 +68,12 @@ class BinanceSpotClient(BaseRestClient):
         return {"X-MBX-APIKEY": self.api_key}
 
     def _signed_request(self, method: str, path: str, *, params: Dict[str, Any]) -> Dict[str, Any]:
+        self._throttle(method, path)
         p = dict(params or {})
         p["timestamp"] = int(time.time() * 1000)
         qs = urlencode(p, doseq=True)
         p["signature"] = self._sign(qs)
-        code, data, text = self._request(method, path, params=p, headers=self._signed_headers())
+        code, data, text = self._request(method, path, params=p, headers=self._signed_headers(), throttled=True)
         if code >= 400:
             raise LiveTradingError(f"BinanceSpot HTTP {code}: {text[:500]}")
         if isinstance(data, dict) and data.get("code") and int(data.get("code")) < 0:
@@ -24,6 +24,8 @@ from app.services.live_trading.symbols import to_bitfinex_perp_symbol
 
 
 class BitfinexClient(BaseRestClient):
+    rate_limit_venue = "bitfinex"
+
     def __init__(self, *, api_key: str, secret_key: str, base_url: str = "https://api.bitfinex.com", timeout_sec: float = 15.0):
         super().__init__(base_url=base_url, timeout_sec=timeout_sec)
         self.api_key = (api_key or "").strip()
@@ -33,7 +35,7 @@ class BitfinexClient(BaseRestClient):
 
     def _nonce(self) -> str:
         # Use ms; Bitfinex accepts monotonic increasing nonces.
-        return str(int(time.time() * 1000))
+        return self._nonce_ms()
 
     def _sign(self, path: str, nonce: str, body_str: str) -> str:
         payload = f"/api/v2{path}{nonce}{body_str}"
@@ -43,11 +45,12 @@ class BitfinexClient(BaseRestClient):
         return {"bfx-apikey": self.api_key, "bfx-nonce": nonce, "bfx-signature": sign, "content-type": "application/json"}
 
     def _signed_request(self, method: str, path: str, *, json_body: Optional[Dict[str, Any]] = None) -> Any:
+        self._throttle(method, path)
         m = str(method or "POST").upper()
         nonce = self._nonce()
         body_str = self._json_dumps(json_body) if json_body is not None else ""
         sign = self._sign(path, nonce, body_str)
-        code, data, text = self._request(m, path, params=None, data=body_str if body_str else None, headers=self._headers(nonce, sign))
+        code, data, text = self._request(m, path, params=None, data=body_str if body_str else None, headers=self._headers(nonce, sign), throttled=True)
         if code >= 400:
             raise LiveTradingError(f"Bitfinex HTTP {code}: {text[:500]}")
         return data
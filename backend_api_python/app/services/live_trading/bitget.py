@@ -20,6 +20,8 @@ from app.services.live_trading.symbols import to_bitget_um_symbol
 
 
 class BitgetMixClient(BaseRestClient):
+    rate_limit_venue = "bitget"
+
     def __init__(
         self,
         *,
@@ -128,6 +130,7 @@ class BitgetMixClient(BaseRestClient):
         - Use `data=<serialized_json>` to ensure the signed body matches the sent body.
         - For GET params, include query string into the signed request path.
         """
+        self._throttle(method, path)
         ts_ms = str(int(time.time() * 1000))
         body_str = self._json_dumps(json_body) if json_body is not None else ""
 
@@ -144,6 +147,7 @@ class BitgetMixClient(BaseRestClient):
             params=params,
             data=body_str if body_str else None,
             headers=self._headers(ts_ms, sign),
+            throttled=True,
         )
         if code >= 400:
             raise LiveTradingError(f"Bitget HTTP {code}: {text[:500]}")
@@ -23,6 +23,8 @@ from app.services.live_trading.symbols import to_bitget_um_symbol
 
 
 class BitgetSpotClient(BaseRestClient):
+    rate_limit_venue = "bitget"
+
     def __init__(
         self,
         *,
@@ -106,6 +108,7 @@ class BitgetSpotClient(BaseRestClient):
         """
         Bitget signature must match the exact body string sent over the wire.
         """
+        self._throttle(method, path)
         ts_ms = str(int(time.time() * 1000))
         body_str = self._json_dumps(json_body) if json_body is not None else ""
 
@@ -122,6 +125,7 @@ class BitgetSpotClient(BaseRestClient):
             params=params,
             data=body_str if body_str else None,
             headers=self._headers(ts_ms, sign),
+            throttled=True,
         )
         if code >= 400:
             raise LiveTradingError(f"BitgetSpot HTTP {code}: {text[:500]}")
@@ -22,6 +22,8 @@ from app.services.live_trading.symbols import to_bybit_symbol
 
 
 class BybitClient(BaseRestClient):
+    rate_limit_venue = "bybit"
+
     def __init__(
         self,
         *,
@@ -106,6 +108,7 @@ class BybitClient(BaseRestClient):
         params: Optional[Dict[str, Any]] = None,
         json_body: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
+        self._throttle(method, path)
         m = str(method or "GET").upper()
         ts_ms = str(int(time.time() * 1000))
 
@@ -125,6 +128,7 @@ class BybitClient(BaseRestClient):
             params=params if (m == "GET" and params) else (params or None),
             data=body_str if body_str else None,
             headers=self._headers(ts_ms, sign),
+            throttled=True,
         )
         if code >= 400:
             raise LiveTradingError(f"Bybit HTTP {code}: {text[:500]}")
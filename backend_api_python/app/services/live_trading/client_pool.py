@@ -0,0 +1,165 @@
+"""
+Registry of long-lived exchange clients.
+
+create_client() builds a fresh client every time, so each order (and every position in the worker's sync
+loop) paid a new TCP+TLS handshake and lost the per-instance caches (Binance symbol filters / dual-side
+mode, OKX instruments / leverage, ...). get_client() reuses one client per
+(exchange_id, market_type, credential fingerprint):
+- the fingerprint is a sha256 over the credentials and endpoint settings; secrets are never kept as keys;
+- clients idle for LIVE_CLIENT_IDLE_SEC (default 600) are evicted and their sessions closed;
+- at most LIVE_CLIENT_POOL_MAX clients are kept (least recently used evicted first).
+
+Changed credentials produce a new fingerprint and therefore a new client; the old one idles out.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.live_trading.base import BaseRestClient, LiveTradingError
+from app.services.live_trading.factory import _get, create_client, normalize_market_type
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Fields (with aliases) that change how create_client builds a client.
+_FINGERPRINT_FIELDS = (
+    ("api_key", "apiKey"),
+    ("secret_key", "secret"),
+    ("passphrase", "password"),
+    ("base_url", "baseUrl"),
+    ("futures_base_url", "futuresBaseUrl"),
+    ("channel_api_code", "channelApiCode"),
+    ("recv_window_ms", "recvWindow"),
+)
+
+PoolKey = Tuple[str, str, str]
+
+
+def client_key(exchange_config: Dict[str, Any], market_type: str = "swap") -> PoolKey:
+    if not isinstance(exchange_config, dict):
+        raise LiveTradingError("Invalid exchange_config")
+    exchange_id = _get(exchange_config, "exchange_id", "exchangeId").lower()
+    mt = normalize_market_type(exchange_config, market_type)
+    h = hashlib.sha256()
+    for keys in _FINGERPRINT_FIELDS:
+        h.update(_get(exchange_config, *keys).encode("utf-8"))
+        h.update(b"\0")
+    return exchange_id, mt, h.hexdigest()
+
+
+class ClientPool:
+    def __init__(self, idle_sec: Optional[float] = None, max_clients: Optional[int] = None):
+        try:
+            self.idle_sec = float(idle_sec if idle_sec is not None else os.getenv("LIVE_CLIENT_IDLE_SEC", "600"))
+        except Exception:
+            self.idle_sec = 600.0
+        try:
+            self.max_clients = int(max_clients if max_clients is not None else os.getenv("LIVE_CLIENT_POOL_MAX", "256"))
+        except Exception:
+            self.max_clients = 256
+        self._lock = threading.Lock()
+        self._clients: Dict[PoolKey, BaseRestClient] = {}
+        self._hits = 0
+        self._created = 0
+        self._evicted = 0
+        self._last_sweep_ts = time.time()
+
+    def get(self, exchange_config: Dict[str, Any], *, market_type: str = "swap") -> BaseRestClient:
+        key = client_key(exchange_config, market_type)
+        now = time.time()
+        evicted = []
+        with self._lock:
+            if now - self._last_sweep_ts >= 60.0:
+                evicted = self._evict_locked(now)
+            client = self._clients.get(key)
+            if client is not None:
+                self._hits += 1
+                client.last_used_at = now
+        for c in evicted:
+            c.close()
+        if client is not None:
+            return client
+
+        # Build outside the lock (constructors may validate / decode secrets).
+        client = create_client(exchange_config, market_type=market_type)
+        evicted = []
+        with self._lock:
+            existing = self._clients.get(key)
+            if existing is not None:
+                # Lost a race with another thread; keep the registered one.
+                self._hits += 1
+                existing.last_used_at = time.time()
+                evicted.append(client)
+                client = existing
+            else:
+                self._created += 1
+                self._clients[key] = client
+                evicted.extend(self._evict_locked(time.time()))
+        for c in evicted:
+            c.close()
+        return client
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            evicted = self._evict_locked(time.time())
+        for c in evicted:
+            c.close()
+        return len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for c in clients:
+            c.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_exchange: Dict[str, int] = {}
+            for (exchange_id, mt, _fp) in self._clients:
+                k = f"{exchange_id}:{mt}"
+                by_exchange[k] = by_exchange.get(k, 0) + 1
+            return {
+                "clients": len(self._clients),
+                "hits": self._hits,
+                "created": self._created,
+                "evicted": self._evicted,
+                "byExchange": by_exchange,
+            }
+
+    def _evict_locked(self, now: float) -> list:
+        self._last_sweep_ts = now
+        out = []
+        if self.idle_sec > 0:
+            for k, c in list(self._clients.items()):
+                if now - float(c.last_used_at or 0) > self.idle_sec:
+                    out.append(self._clients.pop(k))
+        if self.max_clients > 0 and len(self._clients) > self.max_clients:
+            lru = sorted(self._clients.items(), key=lambda kv: float(kv[1].last_used_at or 0))
+            for k, c in lru[: len(self._clients) - self.max_clients]:
+                out.append(self._clients.pop(k))
+        self._evicted += len(out)
+        return out
+
+
+_client_pool: Optional[ClientPool] = None
+_client_pool_lock = threading.Lock()
+
+
+def get_client_pool() -> ClientPool:
+    global _client_pool
+    if _client_pool is None:
+        with _client_pool_lock:
+            if _client_pool is None:
+                _client_pool = ClientPool()
+    return _client_pool
+
+
+def get_client(exchange_config: Dict[str, Any], *, market_type: str = "swap") -> BaseRestClient:
+    """Pooled counterpart of create_client(); the returned client is shared, do not close() it."""
+    return get_client_pool().get(exchange_config, market_type=market_type)
@@ -21,6 +21,8 @@ from app.services.live_trading.symbols import to_coinbase_product_id
 
 
 class CoinbaseExchangeClient(BaseRestClient):
+    rate_limit_venue = "coinbase_exchange"
+
     def __init__(
         self,
         *,
@@ -56,6 +58,7 @@ class CoinbaseExchangeClient(BaseRestClient):
         }
 
     def _signed_request(self, method: str, path: str, *, params: Optional[Dict[str, Any]] = None, json_body: Optional[Dict[str, Any]] = None) -> Any:
+        self._throttle(method, path)
         m = str(method or "GET").upper()
         ts = str(int(time.time()))
         body_str = self._json_dumps(json_body) if json_body is not None else ""
@@ -75,7 +78,7 @@ class CoinbaseExchangeClient(BaseRestClient):
                 signed_path = f"{path}?{'&'.join(items)}"
         prehash = f"{ts}{m}{signed_path}{body_str}"
         sign = self._sign(prehash)
-        code, data, text = self._request(m, path, params=params, data=body_str if body_str else None, headers=self._headers(ts, sign))
+        code, data, text = self._request(m, path, params=params, data=body_str if body_str else None, headers=self._headers(ts, sign), throttled=True)
         if code >= 400:
             raise LiveTradingError(f"CoinbaseExchange HTTP {code}: {text[:500]}")
         return data
@@ -1,5 +1,8 @@
 """
 Factory for direct exchange clients.
+
+create_client() always builds a new client; long-running callers should use
+client_pool.get_client() to reuse clients (and their keep-alive sessions / metadata caches).
 """
 
 from __future__ import annotations
@@ -32,6 +35,13 @@ def _get(cfg: Dict[str, Any], *keys: str) -> str:
     return ""
 
 
+def normalize_market_type(exchange_config: Dict[str, Any], market_type: str = "swap") -> str:
+    mt = (market_type or exchange_config.get("market_type") or exchange_config.get("defaultType") or "swap").strip().lower()
+    if mt in ("futures", "future", "perp", "perpetual"):
+        mt = "swap"
+    return mt
+
+
 def create_client(exchange_config: Dict[str, Any], *, market_type: str = "swap") -> BaseRestClient:
     if not isinstance(exchange_config, dict):
         raise LiveTradingError("Invalid exchange_config")
@@ -40,9 +50,7 @@ def create_client(exchange_config: Dict[str, Any], *, market_type: str = "swap")
     secret_key = _get(exchange_config, "secret_key", "secret")
     passphrase = _get(exchange_config, "passphrase", "password")
 
-    mt = (market_type or exchange_config.get("market_type") or exchange_config.get("defaultType") or "swap").strip().lower()
-    if mt in ("futures", "future", "perp", "perpetual"):
-        mt = "swap"
+    mt = normalize_market_type(exchange_config, market_type)
 
     if exchange_id == "binance":
         if mt == "spot":
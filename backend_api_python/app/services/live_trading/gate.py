@@ -40,6 +40,7 @@ class _GateBase(BaseRestClient):
         return {"KEY": self.api_key, "Timestamp": ts, "SIGN": sign, "Content-Type": "application/json"}
 
     def _signed_request(self, method: str, path: str, *, params: Optional[Dict[str, Any]] = None, json_body: Optional[Dict[str, Any]] = None) -> Any:
+        self._throttle(method, path)
         m = str(method or "GET").upper()
         ts = str(int(time.time()))
         body_str = self._json_dumps(json_body) if json_body is not None else ""
@@ -48,7 +49,7 @@ class _GateBase(BaseRestClient):
             norm = {str(k): "" if v is None else str(v) for k, v in dict(params).items()}
             qs = urlencode(sorted(norm.items()), doseq=True)
         sign = self._sign(method=m, url=path, query_string=qs, body_str=body_str, ts=ts)
-        code, data, text = self._request(m, path, params=params, data=body_str if body_str else None, headers=self._headers(ts, sign))
+        code, data, text = self._request(m, path, params=params, data=body_str if body_str else None, headers=self._headers(ts, sign), throttled=True)
         if code >= 400:
             raise LiveTradingError(f"Gate HTTP {code}: {text[:500]}")
         return data
@@ -61,6 +62,8 @@ class _GateBase(BaseRestClient):
 
 
 class GateSpotClient(_GateBase):
+    rate_limit_venue = "gate_spot"
+
     def ping(self) -> bool:
         try:
             _ = self._public_request("GET", "/api/v4/spot/time")
@@ -154,6 +157,8 @@ class GateSpotClient(_GateBase):
 
 
 class GateUsdtFuturesClient(_GateBase):
+    rate_limit_venue = "gate_futures"
+
     def __init__(self, *, api_key: str, secret_key: str, base_url: str = "https://api.gateio.ws", timeout_sec: float = 15.0):
         super().__init__(api_key=api_key, secret_key=secret_key, base_url=base_url, timeout_sec=timeout_sec)
         # Best-effort cache for contract metadata to convert base qty -> contracts.
@@ -24,6 +24,8 @@ from app.services.live_trading.symbols import to_kraken_pair
 
 
 class KrakenClient(BaseRestClient):
+    rate_limit_venue = "kraken"
+
     def __init__(self, *, api_key: str, secret_key: str, base_url: str = "https://api.kraken.com", timeout_sec: float = 15.0):
         super().__init__(base_url=base_url, timeout_sec=timeout_sec)
         self.api_key = (api_key or "").strip()
@@ -54,16 +56,17 @@ class KrakenClient(BaseRestClient):
         return base64.b64encode(mac).decode("utf-8")
 
     def _signed_request(self, method: str, path: str, *, data: Dict[str, Any]) -> Dict[str, Any]:
+        self._throttle(method, path)
         m = str(method or "POST").upper()
         if m != "POST":
             raise LiveTradingError("Kraken private endpoints in this client use POST")
-        nonce = str(int(time.time() * 1000))
+        nonce = self._nonce_ms()
         body = dict(data or {})
         body["nonce"] = nonce
         postdata = urlencode(body, doseq=True)
         sign = self._sign(urlpath=path, nonce=nonce, postdata=postdata)
         headers = {"API-Key": self.api_key, "API-Sign": sign, "Content-Type": "application/x-www-form-urlencoded"}
-        code, resp, text = self._request("POST", path, params=None, json_body=None, data=postdata, headers=headers)
+        code, resp, text = self._request("POST", path, params=None, json_body=None, data=postdata, headers=headers, throttled=True)
         if code >= 400:
             raise LiveTradingError(f"Kraken HTTP {code}: {text[:500]}")
         if isinstance(resp, dict):
@@ -29,6 +29,8 @@ from app.services.live_trading.symbols import to_kraken_futures_symbol
 
 
 class KrakenFuturesClient(BaseRestClient):
+    rate_limit_venue = "kraken_futures"
+
     def __init__(self, *, api_key: str, secret_key: str, base_url: str = "https://futures.kraken.com", timeout_sec: float = 15.0):
         super().__init__(base_url=base_url, timeout_sec=timeout_sec)
         self.api_key = (api_key or "").strip()
@@ -44,15 +46,16 @@ class KrakenFuturesClient(BaseRestClient):
         return {"APIKey": self.api_key, "Nonce": nonce, "Authent": authent, "Content-Type": "application/x-www-form-urlencoded"}
 
     def _signed_request(self, method: str, path: str, *, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        self._throttle(method, path)
         m = str(method or "POST").upper()
         # Kraken Futures private endpoints often use POST.
-        nonce = str(int(time.time() * 1000))
+        nonce = self._nonce_ms()
         body = dict(data or {})
         postdata = urlencode(body, doseq=True) if body else ""
         # Sign with endpoint path (not including domain)
         prehash = f"{nonce}{postdata}{path}"
         authent = self._b64_hmac_sha256(prehash)
-        code, resp, text = self._request(m, path, params=None, json_body=None, data=postdata if postdata else None, headers=self._headers(nonce, authent))
+        code, resp, text = self._request(m, path, params=None, json_body=None, data=postdata if postdata else None, headers=self._headers(nonce, authent), throttled=True)
         if code >= 400:
             raise LiveTradingError(f"KrakenFutures HTTP {code}: {text[:500]}")
         if isinstance(resp, dict):
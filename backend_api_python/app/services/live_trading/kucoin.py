@@ -22,6 +22,8 @@ from app.services.live_trading.symbols import to_kucoin_symbol
 
 
 class KucoinSpotClient(BaseRestClient):
+    rate_limit_venue = "kucoin_spot"
+
     def __init__(
         self,
         *,
@@ -55,6 +57,7 @@ class KucoinSpotClient(BaseRestClient):
         }
 
     def _signed_request(self, method: str, path: str, *, params: Optional[Dict[str, Any]] = None, json_body: Optional[Dict[str, Any]] = None) -> Any:
+        self._throttle(method, path)
         m = str(method or "GET").upper()
         ts_ms = str(int(time.time() * 1000))
         body_str = self._json_dumps(json_body) if json_body is not None else ""
@@ -65,7 +68,7 @@ class KucoinSpotClient(BaseRestClient):
         signed_path = f"{path}?{qs}" if qs else path
         prehash = f"{ts_ms}{m}{signed_path}{body_str}"
         sign = self._b64_hmac_sha256(self.secret_key, prehash)
-        code, data, text = self._request(m, path, params=params, data=body_str if body_str else None, headers=self._headers(ts_ms, sign))
+        code, data, text = self._request(m, path, params=params, data=body_str if body_str else None, headers=self._headers(ts_ms, sign), throttled=True)
         if code >= 400:
             raise LiveTradingError(f"KuCoin HTTP {code}: {text[:500]}")
         return data
@@ -225,6 +228,7 @@ class KucoinFuturesClient(BaseRestClient):
       but endpoints and symbol formats differ.
     - Futures order size is typically in contracts; we convert from "base qty" best-effort.
     """
+    rate_limit_venue = "kucoin_futures"
 
     def __init__(
         self,
@@ -262,6 +266,7 @@ class KucoinFuturesClient(BaseRestClient):
         }
 
     def _signed_request(self, method: str, path: str, *, params: Optional[Dict[str, Any]] = None, json_body: Optional[Dict[str, Any]] = None) -> Any:
+        self._throttle(method, path)
         m = str(method or "GET").upper()
         ts_ms = str(int(time.time() * 1000))
         body_str = self._json_dumps(json_body) if json_body is not None else ""
@@ -272,7 +277,7 @@ class KucoinFuturesClient(BaseRestClient):
         signed_path = f"{path}?{qs}" if qs else path
         prehash = f"{ts_ms}{m}{signed_path}{body_str}"
         sign = self._b64_hmac_sha256(self.secret_key, prehash)
-        code, data, text = self._request(m, path, params=params, data=body_str if body_str else None, headers=self._headers(ts_ms, sign))
+        code, data, text = self._request(m, path, params=params, data=body_str if body_str else None, headers=self._headers(ts_ms, sign), throttled=True)
         if code >= 400:
             raise LiveTradingError(f"KuCoinFutures HTTP {code}: {text[:500]}")
         return data
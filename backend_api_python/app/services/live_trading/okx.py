@@ -20,6 +20,8 @@ from app.services.live_trading.symbols import to_okx_swap_inst_id, to_okx_spot_i
 
 
 class OkxClient(BaseRestClient):
+    rate_limit_venue = "okx"
+
     def __init__(
         self,
         *,
@@ -194,6 +196,7 @@ class OkxClient(BaseRestClient):
 
         For GET requests with params, the query string must be part of request_path in the prehash.
         """
+        self._throttle(method, path)
         ts = self._iso_ts()
         body_str = self._json_dumps(json_body) if json_body is not None else ""
 
@@ -212,6 +215,7 @@ class OkxClient(BaseRestClient):
             params=params,
             data=body_str if body_str else None,
             headers=self._headers(ts, sign),
+            throttled=True,
         )
         if code >= 400:
             raise LiveTradingError(f"OKX HTTP {code}: {text[:500]}")
@@ -519,7 +523,8 @@ class OkxClient(BaseRestClient):
         poll_interval_sec: float = 0.5,
     ) -> Dict[str, Any]:
         """
-        Poll order detail / fills to obtain (best-effort) executed size and average price.
+        Wait for the order's executed size and average price (best-effort): user stream first, then poll
+        order detail / fills.
 
         Returns:
         {
@@ -550,6 +555,34 @@ class OkxClient(BaseRestClient):
         last_order: Dict[str, Any] = {}
         last_fills: Dict[str, Any] = {}
 
+        # Prefer the account's "orders" channel (see user_stream): it carries cumulative fill size, avgPx and
+        # fee, so no need to poll order detail + fills. Falls back to polling below.
+        try:
+            from app.services.live_trading.user_stream import wait_for_order_event
+
+            st = wait_for_order_event(
+                self, order_id=str(ord_id or ""), client_order_id=str(cl_ord_id or ""),
+                ready=lambda s: bool(s.get("final")) or (s.get("filled", 0) > 0 and s.get("avg_price", 0) > 0),
+                max_wait_sec=float(max_wait_sec or 0.0),
+            )
+        except Exception:
+            st = None
+        if st is not None:
+            filled_dec = self._to_dec(str(st.get("filled") or "0"))
+            if mt != "spot":
+                filled_dec = filled_dec * ct_val
+            return {
+                "filled": float(filled_dec),
+                "avg_price": float(st.get("avg_price") or 0.0),
+                "fee": float(st.get("fee") or 0.0),
+                "fee_ccy": str(st.get("fee_ccy") or ""),
+                "state": str(st.get("status") or ""),
+                "order": st.get("raw") or {},
+                "fills": {},
+                "filled_unit": "base",
+                "source": "stream",
+            }
+
         while True:
             try:
                 last_order = self.get_order(inst_id=inst_id, ord_id=str(ord_id or ""), cl_ord_id=str(cl_ord_id or ""))
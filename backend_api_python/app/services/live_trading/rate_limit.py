@@ -0,0 +1,353 @@
+"""
+Client-side rate limiting for direct exchange clients.
+
+Every venue publishes request limits (Binance: request weight per IP + order count per account, OKX: per
+endpoint per UID, KuCoin: weighted resource pools, Kraken: decaying call counter, ...). Without throttling a
+burst of orders/position syncs gets 429s and, on Binance, a 418 IP ban that stalls every strategy.
+
+- VENUE_LIMITS lists the documented limits as LimitRules; one token bucket per
+  (venue, rule, scope), where scope is the process (≈ egress IP) or the API key.
+- Requests wait (queue) for tokens instead of failing; the limits are scaled by LIVE_RATE_LIMIT_SAFETY
+  (default 0.8) to leave headroom for clock skew and other processes on the same IP.
+- Usage headers (X-MBX-USED-WEIGHT-1M, X-Bapi-Limit-Status, gw-ratelimit-remaining, ...) correct the
+  local estimate; 429/418 + Retry-After pause the bucket.
+- stats() exposes wait-time metrics per bucket.
+
+Limits are as documented at the time of writing and intentionally conservative.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Mapping, Optional, Tuple
+
+from app.services.live_trading.base import LiveTradingError
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SCOPE_IP = "ip"
+SCOPE_ACCOUNT = "account"
+
+_SAMPLE_SIZE = 500
+
+
+@dataclass(frozen=True)
+class LimitRule:
+    name: str
+    capacity: float                       # tokens per window
+    window_sec: float
+    scope: str = SCOPE_IP
+    methods: Tuple[str, ...] = ()         # empty: any method
+    path_prefixes: Tuple[str, ...] = ()   # empty: any path
+    # Cost per request: "METHOD /path" or "/path" (exact) -> tokens; default 1.
+    weights: Mapping[str, float] = field(default_factory=dict)
+    # Response headers reporting usage: header -> "used" (consumed in window) or "remaining".
+    headers: Mapping[str, str] = field(default_factory=dict)
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods and method not in self.methods:
+            return False
+        return not self.path_prefixes or any(path.startswith(p) for p in self.path_prefixes)
+
+    def cost(self, method: str, path: str) -> float:
+        w = self.weights.get(f"{method} {path}")
+        if w is None:
+            w = self.weights.get(path, 1.0)
+        return float(w)
+
+
+VENUE_LIMITS: Dict[str, Tuple[LimitRule, ...]] = {
+    "binance_futures": (
+        LimitRule("weight", 2400, 60, SCOPE_IP,
+                  weights={"/fapi/v2/account": 5, "/fapi/v2/positionRisk": 5, "/fapi/v1/userTrades": 5,
+                           "/fapi/v1/exchangeInfo": 1, "GET /fapi/v1/order": 1, "/fapi/v1/positionSide/dual": 30},
+                  headers={"x-mbx-used-weight-1m": "used"}),
+        LimitRule("orders", 300, 10, SCOPE_ACCOUNT, methods=("POST",), path_prefixes=("/fapi/v1/order",),
+                  headers={"x-mbx-order-count-10s": "used"}),
+    ),
+    "binance_spot": (
+        LimitRule("weight", 6000, 60, SCOPE_IP,
+                  weights={"/api/v3/account": 20, "/api/v3/exchangeInfo": 20, "/api/v3/myTrades": 20,
+                           "GET /api/v3/order": 4},
+                  headers={"x-mbx-used-weight-1m": "used"}),
+        LimitRule("orders", 100, 10, SCOPE_ACCOUNT, methods=("POST",), path_prefixes=("/api/v3/order",),
+                  headers={"x-mbx-order-count-10s": "used"}),
+    ),
+    "okx": (
+        LimitRule("public", 20, 2, SCOPE_IP, path_prefixes=("/api/v5/public/",)),
+        LimitRule("place_order", 60, 2, SCOPE_ACCOUNT, methods=("POST",), path_prefixes=("/api/v5/trade/order",)),
+        LimitRule("cancel_order", 60, 2, SCOPE_ACCOUNT, methods=("POST",), path_prefixes=("/api/v5/trade/cancel-order",)),
+        LimitRule("query_order", 60, 2, SCOPE_ACCOUNT, methods=("GET",), path_prefixes=("/api/v5/trade/order",)),
+        LimitRule("fills", 60, 2, SCOPE_ACCOUNT, path_prefixes=("/api/v5/trade/fills",)),
+        LimitRule("account", 10, 2, SCOPE_ACCOUNT, path_prefixes=("/api/v5/account/",)),
+    ),
+    "bitget": (
+        LimitRule("public", 20, 1, SCOPE_IP, path_prefixes=("/api/v2/public/", "/api/v2/mix/market/", "/api/v2/spot/public/")),
+        LimitRule("orders", 10, 1, SCOPE_ACCOUNT, methods=("POST",),
+                  path_prefixes=("/api/v2/mix/order/place-order", "/api/v2/spot/trade/place-order",
+                                 "/api/v2/mix/order/cancel-order", "/api/v2/spot/trade/cancel-order")),
+        LimitRule("private", 10, 1, SCOPE_ACCOUNT, methods=("GET",),
+                  path_prefixes=("/api/v2/mix/account/", "/api/v2/mix/position/", "/api/v2/spot/account/")),
+    ),
+    "bybit": (
+        LimitRule("ip", 600, 5, SCOPE_IP),
+        LimitRule("orders", 10, 1, SCOPE_ACCOUNT, methods=("POST",),
+                  path_prefixes=("/v5/order/create", "/v5/order/cancel"),
+                  headers={"x-bapi-limit-status": "remaining"}),
+        LimitRule("private", 50, 1, SCOPE_ACCOUNT, path_prefixes=("/v5/position/", "/v5/account/", "/v5/order/realtime")),
+    ),
+    "kucoin_spot": (
+        LimitRule("spot", 4000, 30, SCOPE_ACCOUNT,
+                  weights={"POST /api/v1/orders": 1, "/api/v1/accounts": 5, "/api/v1/fills": 10},
+                  headers={"gw-ratelimit-remaining": "remaining"}),
+    ),
+    "kucoin_futures": (
+        LimitRule("futures", 2000, 30, SCOPE_ACCOUNT,
+                  weights={"POST /api/v1/orders": 2, "/api/v1/positions": 2, "/api/v1/account-overview": 5,
+                           "/api/v1/fills": 5, "/api/v1/contracts/active": 3},
+                  headers={"gw-ratelimit-remaining": "remaining"}),
+    ),
+    "gate_spot": (
+        LimitRule("ip", 200, 10, SCOPE_IP),
+        LimitRule("orders", 10, 1, SCOPE_ACCOUNT, methods=("POST", "DELETE"), path_prefixes=("/api/v4/spot/orders",),
+                  headers={"x-gate-ratelimit-requests-remain": "remaining"}),
+    ),
+    "gate_futures": (
+        LimitRule("ip", 200, 10, SCOPE_IP),
+        LimitRule("orders", 100, 1, SCOPE_ACCOUNT, methods=("POST", "DELETE"),
+                  path_prefixes=("/api/v4/futures/usdt/orders",),
+                  headers={"x-gate-ratelimit-requests-remain": "remaining"}),
+    ),
+    # Kraken spot: private call counter max 15, decays 0.33/s (starter tier); AddOrder/CancelOrder use the
+    # separate per-pair trading limit and do not count here.
+    "kraken": (
+        LimitRule("public", 1, 1, SCOPE_IP, path_prefixes=("/0/public/",)),
+        LimitRule("private", 15, 45, SCOPE_ACCOUNT, path_prefixes=("/0/private/Balance", "/0/private/QueryOrders")),
+        LimitRule("trading", 60, 60, SCOPE_ACCOUNT, path_prefixes=("/0/private/AddOrder", "/0/private/CancelOrder")),
+    ),
+    "kraken_futures": (
+        LimitRule("derivatives", 500, 10, SCOPE_ACCOUNT,
+                  weights={"/derivatives/api/v3/sendorder": 10, "/derivatives/api/v3/cancelorder": 10,
+                           "/derivatives/api/v3/accounts": 2, "/derivatives/api/v3/openpositions": 2},
+                  path_prefixes=("/derivatives/api/v3/",)),
+    ),
+    "bitfinex": (
+        LimitRule("public", 30, 60, SCOPE_IP, path_prefixes=("/v2/platform/", "/v2/ticker", "/v2/conf")),
+        LimitRule("auth", 90, 60, SCOPE_ACCOUNT, path_prefixes=("/v2/auth/",)),
+    ),
+    "coinbase_exchange": (
+        LimitRule("public", 10, 1, SCOPE_IP, path_prefixes=("/time", "/products")),
+        LimitRule("private", 15, 1, SCOPE_ACCOUNT, path_prefixes=("/orders", "/accounts", "/fills")),
+    ),
+}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return round(values[idx], 1)
+
+
+class TokenBucket:
+    """Reservation-style token bucket: callers reserve tokens (possibly going negative) and sleep their share."""
+
+    def __init__(self, capacity: float, window_sec: float):
+        self.capacity = max(1.0, float(capacity))
+        self.rate = self.capacity / max(1e-6, float(window_sec))
+        self._tokens = self.capacity
+        self._ts = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.delayed = 0
+        self.throttled = 0
+        self.wait_ms_total = 0.0
+        self._wait_ms: Deque[float] = deque(maxlen=_SAMPLE_SIZE)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def reserve(self, cost: float) -> float:
+        """Take `cost` tokens; returns the seconds the caller must wait before sending."""
+        cost = min(float(cost), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= cost
+            wait = max(0.0, -self._tokens / self.rate, self._paused_until - now)
+            self.acquired += 1
+            return wait
+
+    def refund(self, cost: float) -> None:
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + min(float(cost), self.capacity))
+
+    def record_wait(self, wait_sec: float) -> None:
+        with self._lock:
+            if wait_sec > 0:
+                self.delayed += 1
+                self.wait_ms_total += wait_sec * 1000.0
+            self._wait_ms.append(wait_sec * 1000.0)
+
+    def observe_used(self, used: float) -> None:
+        """Server says `used` is consumed in the current window: never believe we have more left."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, self.capacity - float(used))
+
+    def observe_remaining(self, remaining: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, float(remaining))
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, now + max(0.0, float(seconds)))
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            waits = list(self._wait_ms)
+            return {
+                "capacity": round(self.capacity, 1),
+                "tokens": round(self._tokens, 1),
+                "acquired": self.acquired,
+                "delayed": self.delayed,
+                "throttled": self.throttled,
+                "waitMsTotal": round(self.wait_ms_total, 1),
+                "waitMs": {"p50": _percentile(waits, 50), "p99": _percentile(waits, 99),
+                           "max": round(max(waits), 1) if waits else 0.0},
+                "pausedSec": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            }
+
+
+BucketKey = Tuple[str, str, str]
+
+
+class RateLimiter:
+    def __init__(self):
+        self.enabled = os.getenv("LIVE_RATE_LIMIT_ENABLED", "true").lower() == "true"
+        self.safety = min(1.0, max(0.1, _env_float("LIVE_RATE_LIMIT_SAFETY", 0.8)))
+        self.max_wait_sec = _env_float("LIVE_RATE_LIMIT_MAX_WAIT_SEC", 30.0)
+        self._lock = threading.Lock()
+        self._buckets: Dict[BucketKey, TokenBucket] = {}
+
+    def _bucket(self, venue: str, rule: LimitRule, account: str) -> TokenBucket:
+        key = (venue, rule.name, account if rule.scope == SCOPE_ACCOUNT else "")
+        b = self._buckets.get(key)
+        if b is None:
+            with self._lock:
+                b = self._buckets.get(key)
+                if b is None:
+                    b = TokenBucket(rule.capacity * self.safety, rule.window_sec)
+                    self._buckets[key] = b
+        return b
+
+    def _matched(self, venue: str, method: str, path: str, account: str) -> List[Tuple[LimitRule, TokenBucket]]:
+        rules = VENUE_LIMITS.get(venue) or ()
+        return [(r, self._bucket(venue, r, account)) for r in rules if r.matches(method, path)]
+
+    def acquire(self, venue: str, method: str, path: str, account: str = "") -> float:
+        """Block until every bucket the request counts against has room; returns the seconds waited."""
+        if not self.enabled or not venue:
+            return 0.0
+        m = str(method or "GET").upper()
+        matched = self._matched(venue, m, path, account)
+        if not matched:
+            return 0.0
+        reserved = [(b, r.cost(m, path)) for r, b in matched]
+        wait = 0.0
+        for b, cost in reserved:
+            wait = max(wait, b.reserve(cost))
+        if self.max_wait_sec > 0 and wait > self.max_wait_sec:
+            for b, cost in reserved:
+                b.refund(cost)
+            raise LiveTradingError(f"Rate limit queue too long for {venue} {m} {path}: {wait:.1f}s")
+        if wait > 0:
+            time.sleep(wait)
+        for b, _ in reserved:
+            b.record_wait(wait)
+        return wait
+
+    def observe(self, venue: str, method: str, path: str, account: str, status: int,
+                headers: Optional[Mapping[str, str]]) -> None:
+        """Correct the local estimate from usage headers; pause on 429 / 418."""
+        if not self.enabled or not venue:
+            return
+        matched = self._matched(venue, str(method or "GET").upper(), path, account)
+        if not matched:
+            return
+        hdrs = {str(k).lower(): v for k, v in (headers or {}).items()}
+        for rule, bucket in matched:
+            for name, kind in rule.headers.items():
+                raw = hdrs.get(name)
+                if raw in (None, ""):
+                    continue
+                try:
+                    val = float(str(raw).split(",")[0])
+                except Exception:
+                    continue
+                # Keep the same (1 - safety) headroom against the server's numbers.
+                if kind == "used":
+                    bucket.observe_used(val)
+                else:
+                    bucket.observe_remaining(val - (1.0 - self.safety) * rule.capacity)
+        if status in (418, 429):
+            retry_after = 0.0
+            try:
+                retry_after = float(hdrs.get("retry-after") or 0)
+            except Exception:
+                retry_after = 0.0
+            if retry_after <= 0:
+                retry_after = 60.0 if status == 418 else 1.0
+            logger.warning(f"{venue} HTTP {status} on {method} {path}: pausing for {retry_after:.0f}s")
+            for _rule, bucket in matched:
+                bucket.pause(retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            items = list(self._buckets.items())
+        out: Dict[str, Any] = {}
+        for (venue, rule, account), b in items:
+            k = f"{venue}:{rule}" + (f":{account}" if account else "")
+            out[k] = b.stats()
+        return {"enabled": self.enabled, "safety": self.safety, "buckets": out}
+
+
+def account_fingerprint(api_key: str) -> str:
+    if not api_key:
+        return ""
+    return hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter()
+    return _rate_limiter
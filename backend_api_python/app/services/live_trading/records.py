@@ -11,6 +11,9 @@ from __future__ import annotations
 import time
 from typing import Any, Dict, Optional, Tuple
 
+from app.services.db_write_queue import get_db_write_queue
+from app.services.position_cache import invalidate_positions
+from app.services.trade_aggregates import record_trade_aggregates
 from app.utils.db import get_db_connection
 
 
@@ -27,33 +30,33 @@ def record_trade(
 ) -> None:
     now = int(time.time())
     value = float(amount or 0.0) * float(price or 0.0)
-    with get_db_connection() as db:
-        cur = db.cursor()
-        cur.execute(
-            """
-            INSERT INTO qd_strategy_trades
-            (strategy_id, symbol, type, price, amount, value, commission, commission_ccy, profit, created_at)
-            VALUES
-            (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                int(strategy_id),
-                str(symbol),
-                str(trade_type),
-                float(price or 0.0),
-                float(amount or 0.0),
-                float(value),
-                float(commission or 0.0),
-                str(commission_ccy or ""),
-                profit,
-                now,
-            ),
-        )
-        db.commit()
-        cur.close()
+    # Trade rows are append-only history: hand them to the batched writer.
+    get_db_write_queue().insert(
+        """
+        INSERT INTO qd_strategy_trades
+        (strategy_id, symbol, type, price, amount, value, commission, commission_ccy, profit, created_at)
+        VALUES
+        (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """,
+        (
+            int(strategy_id),
+            str(symbol),
+            str(trade_type),
+            float(price or 0.0),
+            float(amount or 0.0),
+            float(value),
+            float(commission or 0.0),
+            str(commission_ccy or ""),
+            profit,
+            now,
+        ),
+    )
+    record_trade_aggregates(int(strategy_id), profit, now)
 
 
 def _fetch_position(strategy_id: int, symbol: str, side: str) -> Dict[str, Any]:
+    # Read-your-writes: queued price/extreme updates for this position must land before we read it.
+    get_db_write_queue().flush()
     with get_db_connection() as db:
         cur = db.cursor()
         cur.execute(
@@ -66,14 +69,14 @@ def _fetch_position(strategy_id: int, symbol: str, side: str) -> Dict[str, Any]:
 
 
 def _delete_position(strategy_id: int, symbol: str, side: str) -> None:
-    with get_db_connection() as db:
-        cur = db.cursor()
-        cur.execute(
-            "DELETE FROM qd_strategy_positions WHERE strategy_id = %s AND symbol = %s AND side = %s",
-            (int(strategy_id), str(symbol), str(side)),
-        )
-        db.commit()
-        cur.close()
+    # Position rows also receive queued executor updates (prices / extremes): write through the same
+    # queue and wait, so the delete is ordered after them instead of racing a direct commit.
+    get_db_write_queue().insert(
+        "DELETE FROM qd_strategy_positions WHERE strategy_id = %s AND symbol = %s AND side = %s",
+        (int(strategy_id), str(symbol), str(side)),
+        wait=True,
+    )
+    invalidate_positions(strategy_id)
 
 
 def upsert_position(
@@ -88,26 +91,25 @@ def upsert_position(
     lowest_price: float = 0.0,
 ) -> None:
     now = int(time.time())
-    with get_db_connection() as db:
-        cur = db.cursor()
-        cur.execute(
-            """
-            INSERT INTO qd_strategy_positions
-            (strategy_id, symbol, side, size, entry_price, current_price, highest_price, lowest_price, updated_at)
-            VALUES
-            (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT(strategy_id, symbol, side) DO UPDATE SET
-                size = excluded.size,
-                entry_price = excluded.entry_price,
-                current_price = excluded.current_price,
-                highest_price = CASE WHEN excluded.highest_price > 0 THEN excluded.highest_price ELSE highest_price END,
-                lowest_price = CASE WHEN excluded.lowest_price > 0 THEN excluded.lowest_price ELSE lowest_price END,
-                updated_at = excluded.updated_at
-            """,
-            (int(strategy_id), str(symbol), str(side), float(size or 0.0), float(entry_price or 0.0), float(current_price or 0.0), float(highest_price or 0.0), float(lowest_price or 0.0), now),
-        )
-        db.commit()
-        cur.close()
+    # Ordered with the executor's queued position updates (see _delete_position).
+    get_db_write_queue().insert(
+        """
+        INSERT INTO qd_strategy_positions
+        (strategy_id, symbol, side, size, entry_price, current_price, highest_price, lowest_price, updated_at)
+        VALUES
+        (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT(strategy_id, symbol, side) DO UPDATE SET
+            size = excluded.size,
+            entry_price = excluded.entry_price,
+            current_price = excluded.current_price,
+            highest_price = CASE WHEN excluded.highest_price > 0 THEN excluded.highest_price ELSE highest_price END,
+            lowest_price = CASE WHEN excluded.lowest_price > 0 THEN excluded.lowest_price ELSE lowest_price END,
+            updated_at = excluded.updated_at
+        """,
+        (int(strategy_id), str(symbol), str(side), float(size or 0.0), float(entry_price or 0.0), float(current_price or 0.0), float(highest_price or 0.0), float(lowest_price or 0.0), now),
+        wait=True,
+    )
+    invalidate_positions(strategy_id)
 
 
 def apply_fill_to_local_position(
@@ -0,0 +1,467 @@
+"""
+Private user-data streams (order / fill updates over websocket).
+
+wait_for_fill used to poll get_order every 0.5s: several REST calls per fill (each one counted against the
+rate limits) and up to half a second of extra latency. With a user stream running for the account, order
+updates are pushed into an in-memory OrderStateTable and wait_for_fill blocks on it; REST polling remains
+the fallback whenever the stream is disabled, not connected yet, or drops during the wait.
+
+Supported:
+- Binance USDT-M futures: listenKey (POST/PUT /fapi/v1/listenKey), ORDER_TRADE_UPDATE events.
+- OKX: private channel login + "orders" channel (instType ANY).
+
+One stream per (venue, API key, ws url), each on its own daemon thread running an asyncio loop
+(same pattern as realtime_price). Reconnects with exponential backoff.
+
+Config:
+- LIVE_USER_STREAM_ENABLED: start streams for live accounts (default false)
+- LIVE_USER_STREAM_BINANCE_FUTURES_WS_URL / LIVE_USER_STREAM_OKX_WS_URL: override endpoints (testnet / mock)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import websockets
+
+from app.services.live_trading.rate_limit import account_fingerprint
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+BINANCE_FUTURES_WS_URL = "wss://fstream.binance.com/ws"
+OKX_PRIVATE_WS_URL = "wss://ws.okx.com:8443/ws/v5/private"
+
+_STATE_TTL_SEC = 900.0
+_UNSEEN_GRACE_SEC = 2.0
+
+OrderState = Dict[str, Any]
+
+
+class OrderStateTable:
+    """
+    Latest known state per exchange order id (client order ids are mapped to it).
+
+    State fields: order_id, client_order_id, symbol, status, filled, avg_price, fee, fee_ccy, final, raw, updated_at.
+    """
+
+    def __init__(self, ttl_sec: float = _STATE_TTL_SEC):
+        self.ttl_sec = float(ttl_sec)
+        self._cond = threading.Condition()
+        self._by_id: Dict[str, OrderState] = {}
+        self._cid_to_id: Dict[str, str] = {}
+        self._last_prune = time.time()
+        self.updates = 0
+
+    def get(self, order_id: str = "", client_order_id: str = "") -> Optional[OrderState]:
+        with self._cond:
+            return self._get_locked(str(order_id or ""), str(client_order_id or ""))
+
+    def update(self, state: OrderState) -> None:
+        oid = str(state.get("order_id") or "")
+        cid = str(state.get("client_order_id") or "")
+        if not oid and not cid:
+            return
+        key = oid or f"cid:{cid}"
+        now = time.time()
+        with self._cond:
+            st = dict(state, updated_at=now)
+            self._by_id[key] = st
+            if cid:
+                prev = self._cid_to_id.get(cid)
+                if prev and prev != key and prev.startswith("cid:"):
+                    self._by_id.pop(prev, None)
+                self._cid_to_id[cid] = key
+            self.updates += 1
+            if now - self._last_prune > 60.0:
+                self._prune_locked(now)
+            self._cond.notify_all()
+
+    def wait_for(self, order_id: str, client_order_id: str, ready: Callable[[OrderState], bool],
+                 timeout: float) -> Optional[OrderState]:
+        """Block until the order's state satisfies `ready` or timeout; returns the last state seen (or None)."""
+        oid = str(order_id or "")
+        cid = str(client_order_id or "")
+        deadline = time.time() + max(0.0, float(timeout))
+        with self._cond:
+            while True:
+                st = self._get_locked(oid, cid)
+                if st is not None and ready(st):
+                    return st
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return st
+                self._cond.wait(remaining)
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._by_id)
+
+    def _get_locked(self, oid: str, cid: str) -> Optional[OrderState]:
+        st = self._by_id.get(oid) if oid else None
+        if st is None and cid:
+            key = self._cid_to_id.get(cid)
+            st = self._by_id.get(key) if key else None
+        return dict(st) if st is not None else None
+
+    def _prune_locked(self, now: float) -> None:
+        self._last_prune = now
+        for k, st in list(self._by_id.items()):
+            if now - float(st.get("updated_at") or 0) > self.ttl_sec:
+                self._by_id.pop(k, None)
+        live = set(self._by_id)
+        for c, k in list(self._cid_to_id.items()):
+            if k not in live:
+                self._cid_to_id.pop(c, None)
+
+
+class UserDataStream:
+    venue = ""
+
+    def __init__(self, client: Any, ws_url: str):
+        self.client = client
+        self.ws_url = ws_url
+        self.table = OrderStateTable()
+        self._stop = threading.Event()
+        self._live = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ws: Any = None
+        self.connects = 0
+        self.messages = 0
+        self.last_error = ""
+        self.live_since = 0.0
+
+    # ---- lifecycle ----
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"UserStream-{self.venue}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        loop, ws = self._loop, self._ws
+        if loop is not None and ws is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(ws.close(), loop)
+            except Exception:
+                pass
+
+    def is_live(self) -> bool:
+        return self._live.is_set()
+
+    def wait_live(self, timeout: float) -> bool:
+        return self._live.wait(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "venue": self.venue,
+            "live": self.is_live(),
+            "connects": self.connects,
+            "messages": self.messages,
+            "orders": len(self.table),
+            "lastError": self.last_error,
+        }
+
+    def _run(self) -> None:
+        try:
+            asyncio.run(self._main())
+        except Exception as e:
+            logger.warning(f"{self.venue} user stream thread exited: {e}")
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        backoff = 1.0
+        while not self._stop.is_set():
+            keepalive = None
+            try:
+                url = await self._prepare()
+                async with websockets.connect(url, ping_interval=20, open_timeout=10) as ws:
+                    self._ws = ws
+                    await self._on_open(ws)
+                    self.connects += 1
+                    self.live_since = time.time()
+                    self._live.set()
+                    backoff = 1.0
+                    keepalive = asyncio.ensure_future(self._keepalive(ws))
+                    async for raw in ws:
+                        self.messages += 1
+                        try:
+                            msg = json.loads(raw)
+                        except Exception:
+                            continue  # e.g. OKX "pong"
+                        if self._handle(msg) is False:
+                            break
+            except Exception as e:
+                self.last_error = str(e)[:200]
+                logger.warning(f"{self.venue} user stream error: {e}")
+            finally:
+                self._live.clear()
+                self._ws = None
+                if keepalive is not None:
+                    keepalive.cancel()
+            if self._stop.is_set():
+                break
+            end = time.time() + backoff
+            while time.time() < end and not self._stop.is_set():
+                await asyncio.sleep(0.2)
+            backoff = min(backoff * 2, 30.0)
+
+    async def _rest(self, fn: Callable[[], Any]) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(None, fn)
+
+    # ---- venue hooks ----
+
+    async def _prepare(self) -> str:
+        """Returns the url to connect to."""
+        return self.ws_url
+
+    async def _on_open(self, ws: Any) -> None:
+        pass
+
+    async def _keepalive(self, ws: Any) -> None:
+        pass
+
+    def _handle(self, msg: Any) -> Optional[bool]:
+        """Process one message; return False to reconnect."""
+        raise NotImplementedError
+
+
+class BinanceFuturesUserStream(UserDataStream):
+    venue = "binance_futures"
+    KEEPALIVE_SEC = 30 * 60
+
+    def __init__(self, client: Any, ws_url: str):
+        super().__init__(client, ws_url)
+        self._listen_key = ""
+
+    async def _prepare(self) -> str:
+        def create() -> str:
+            code, data, text = self.client._request("POST", "/fapi/v1/listenKey", headers=self.client._signed_headers())
+            key = str((data or {}).get("listenKey") or "") if isinstance(data, dict) else ""
+            if code >= 400 or not key:
+                raise RuntimeError(f"listenKey create failed: HTTP {code}: {text[:200]}")
+            return key
+
+        self._listen_key = await self._rest(create)
+        return f"{self.ws_url.rstrip('/')}/{self._listen_key}"
+
+    async def _keepalive(self, ws: Any) -> None:
+        def extend() -> int:
+            code, _, _ = self.client._request("PUT", "/fapi/v1/listenKey", headers=self.client._signed_headers())
+            return code
+
+        while True:
+            await asyncio.sleep(self.KEEPALIVE_SEC)
+            try:
+                if await self._rest(extend) >= 400:
+                    await ws.close()
+                    return
+            except Exception:
+                await ws.close()
+                return
+
+    def _handle(self, msg: Any) -> Optional[bool]:
+        if not isinstance(msg, dict):
+            return None
+        ev = msg.get("e")
+        if ev == "listenKeyExpired":
+            return False
+        if ev != "ORDER_TRADE_UPDATE":
+            return None
+        o = msg.get("o") or {}
+        oid = str(o.get("i") or "")
+        cid = str(o.get("c") or "")
+        prev = self.table.get(oid, cid) or {}
+        fee = float(prev.get("fee") or 0.0)
+        fee_ccy = str(prev.get("fee_ccy") or "")
+        if str(o.get("x") or "") == "TRADE":
+            try:
+                fee += abs(float(o.get("n") or 0.0))
+                fee_ccy = str(o.get("N") or fee_ccy)
+            except Exception:
+                pass
+        status = str(o.get("X") or "")
+        self.table.update({
+            "order_id": oid,
+            "client_order_id": cid,
+            "symbol": str(o.get("s") or ""),
+            "status": status,
+            "filled": _f(o.get("z")),
+            "avg_price": _f(o.get("ap")),
+            "fee": fee,
+            "fee_ccy": fee_ccy,
+            "final": status in ("FILLED", "CANCELED", "EXPIRED", "REJECTED"),
+            "raw": o,
+        })
+        return None
+
+
+class OkxUserStream(UserDataStream):
+    venue = "okx"
+    PING_SEC = 20
+
+    async def _on_open(self, ws: Any) -> None:
+        ts = str(int(time.time()))
+        sign = self.client._sign(ts, "GET", "/users/self/verify", "")
+        await ws.send(json.dumps({"op": "login", "args": [{
+            "apiKey": self.client.api_key, "passphrase": self.client.passphrase, "timestamp": ts, "sign": sign,
+        }]}))
+        await self._expect(ws, "login")
+        await ws.send(json.dumps({"op": "subscribe", "args": [{"channel": "orders", "instType": "ANY"}]}))
+        await self._expect(ws, "subscribe")
+
+    @staticmethod
+    async def _expect(ws: Any, event: str) -> None:
+        while True:
+            raw = await asyncio.wait_for(ws.recv(), timeout=10)
+            try:
+                msg = json.loads(raw)
+            except Exception:
+                continue
+            if msg.get("event") == "error":
+                raise RuntimeError(f"OKX ws {event} failed: {msg.get('code')} {msg.get('msg')}")
+            if msg.get("event") == event:
+                return
+
+    async def _keepalive(self, ws: Any) -> None:
+        # OKX closes idle connections after 30s; it expects a text "ping".
+        while True:
+            await asyncio.sleep(self.PING_SEC)
+            await ws.send("ping")
+
+    def _handle(self, msg: Any) -> Optional[bool]:
+        if not isinstance(msg, dict) or (msg.get("arg") or {}).get("channel") != "orders":
+            return None
+        for o in msg.get("data") or []:
+            state = str(o.get("state") or "")
+            try:
+                fee = abs(float(o.get("fee") or 0.0))
+            except Exception:
+                fee = 0.0
+            self.table.update({
+                "order_id": str(o.get("ordId") or ""),
+                "client_order_id": str(o.get("clOrdId") or ""),
+                "symbol": str(o.get("instId") or ""),
+                "status": state,
+                # Contracts for SWAP (same unit as REST accFillSz); callers convert with ctVal.
+                "filled": _f(o.get("accFillSz")),
+                "avg_price": _f(o.get("avgPx")),
+                "fee": fee,
+                "fee_ccy": str(o.get("feeCcy") or ""),
+                "final": state in ("filled", "canceled", "mmp_canceled"),
+                "raw": o,
+            })
+        return None
+
+
+def _f(v: Any) -> float:
+    try:
+        return float(v or 0.0)
+    except Exception:
+        return 0.0
+
+
+# ---- registry ----
+
+_streams: Dict[tuple, UserDataStream] = {}
+_streams_lock = threading.Lock()
+
+
+def user_streams_enabled() -> bool:
+    return os.getenv("LIVE_USER_STREAM_ENABLED", "false").lower() == "true"
+
+
+def _stream_spec(client: Any):
+    # Imported lazily: the client modules import base, not this module.
+    from app.services.live_trading.binance import BinanceFuturesClient
+    from app.services.live_trading.okx import OkxClient
+
+    if isinstance(client, BinanceFuturesClient):
+        url = (os.getenv("LIVE_USER_STREAM_BINANCE_FUTURES_WS_URL") or "").strip() or BINANCE_FUTURES_WS_URL
+        return BinanceFuturesUserStream, url
+    if isinstance(client, OkxClient):
+        url = (os.getenv("LIVE_USER_STREAM_OKX_WS_URL") or "").strip() or OKX_PRIVATE_WS_URL
+        return OkxUserStream, url
+    return None, ""
+
+
+def get_user_stream(client: Any) -> Optional[UserDataStream]:
+    """The running stream for this client's account, if any."""
+    cls, url = _stream_spec(client)
+    if cls is None:
+        return None
+    key = (cls.venue, account_fingerprint(getattr(client, "api_key", "") or ""), url)
+    with _streams_lock:
+        return _streams.get(key)
+
+
+def ensure_user_stream(client: Any) -> Optional[UserDataStream]:
+    """Start (once) the user stream for this client's account when enabled; non-blocking."""
+    if not user_streams_enabled():
+        return None
+    cls, url = _stream_spec(client)
+    if cls is None:
+        return None
+    key = (cls.venue, account_fingerprint(getattr(client, "api_key", "") or ""), url)
+    with _streams_lock:
+        stream = _streams.get(key)
+        if stream is None:
+            stream = cls(client, url)
+            _streams[key] = stream
+    stream.start()
+    return stream
+
+
+def stop_user_streams() -> None:
+    with _streams_lock:
+        streams = list(_streams.values())
+        _streams.clear()
+    for s in streams:
+        s.stop()
+
+
+def user_stream_stats() -> Dict[str, Any]:
+    with _streams_lock:
+        items = list(_streams.items())
+    return {
+        "enabled": user_streams_enabled(),
+        "streams": {f"{k[0]}:{k[1]}": s.stats() for k, s in items},
+    }
+
+
+def wait_for_order_event(client: Any, *, order_id: str = "", client_order_id: str = "",
+                         ready: Callable[[OrderState], bool], max_wait_sec: float) -> Optional[OrderState]:
+    """
+    Block on the account's user stream until the order satisfies `ready`.
+
+    Returns None when there is no live stream, or it drops / times out before the order is ready; the caller
+    then falls back to REST polling. Every order placed while the stream is live gets at least a NEW/live
+    event within milliseconds, so an order the stream has not seen after _UNSEEN_GRACE_SEC (placed before
+    the stream connected) also falls back to REST.
+    """
+    stream = get_user_stream(client) or ensure_user_stream(client)
+    if stream is None or not stream.is_live():
+        return None
+    started = time.time()
+    deadline = started + max(0.0, float(max_wait_sec or 0.0))
+    seen = False
+    while True:
+        remaining = deadline - time.time()
+        st = stream.table.wait_for(order_id, client_order_id, ready, timeout=max(0.0, min(0.5, remaining)))
+        if st is not None:
+            if ready(st):
+                return st
+            seen = True
+        if remaining <= 0 or not stream.is_live():
+            return None
+        if not seen and time.time() - started >= _UNSEEN_GRACE_SEC:
+            return None
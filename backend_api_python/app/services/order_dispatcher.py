@@ -0,0 +1,146 @@
+"""
+Order dispatcher: bounded worker pool + per-lane FIFO queues.
+
+PendingOrderWorker used to process its batch serially on one thread, so a maker order waiting for a fill
+(plus its market fallback) delayed every other strategy's order. Orders are now routed into lanes
+(one per exchange account; signal-only orders get one lane per strategy):
+- orders within a lane run strictly one at a time, in submission order (ordering is preserved per
+  account and therefore per strategy);
+- different lanes run in parallel on a shared pool of PENDING_ORDER_WORKERS threads;
+- a lane task handles one order and then re-queues itself, so a busy lane cannot starve the others.
+
+stats() exposes queued / in-flight counts and queue-wait percentiles.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SAMPLE_SIZE = 1000
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(pct / 100.0 * (len(values) - 1)))))
+    return round(values[idx], 1)
+
+
+class OrderDispatcher:
+    def __init__(self, handler: Callable[[Dict[str, Any]], None], workers: int = 8, name: str = "order-dispatch"):
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        # lane -> FIFO of (order, enqueued_at)
+        self._lanes: Dict[Hashable, Deque[Tuple[Dict[str, Any], float]]] = {}
+        # lanes that currently have a task scheduled or running
+        self._active: set = set()
+        self._queued_ids: set = set()
+        self._inflight = 0
+        self._dispatched = 0
+        self._errors = 0
+        # queue wait (enqueue -> handler start) and order age (created_at -> handler start), ms
+        self._wait_ms: Deque[float] = deque(maxlen=_SAMPLE_SIZE)
+        self._age_ms: Deque[float] = deque(maxlen=_SAMPLE_SIZE)
+
+    def submit(self, lane: Hashable, order: Dict[str, Any]) -> bool:
+        """Queue an order on its lane; returns False when the same order id is already queued."""
+        oid = order.get("id")
+        with self._lock:
+            if oid is not None and oid in self._queued_ids:
+                return False
+            if oid is not None:
+                self._queued_ids.add(oid)
+            self._lanes.setdefault(lane, deque()).append((order, time.time()))
+            if lane in self._active:
+                return True
+            self._active.add(lane)
+        self._schedule(lane)
+        return True
+
+    def queued_ids(self) -> List[Any]:
+        with self._lock:
+            return list(self._queued_ids)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = list(self._wait_ms)
+            ages = list(self._age_ms)
+            return {
+                "workers": self.workers,
+                "lanes": len(self._lanes),
+                "activeLanes": len(self._active),
+                "queued": len(self._queued_ids) - self._inflight,
+                "inflight": self._inflight,
+                "dispatched": self._dispatched,
+                "errors": self._errors,
+                "queueWaitMs": {"p50": _percentile(waits, 50), "p99": _percentile(waits, 99),
+                                "max": round(max(waits), 1) if waits else 0.0},
+                "orderAgeMs": {"p50": _percentile(ages, 50), "p99": _percentile(ages, 99),
+                               "max": round(max(ages), 1) if ages else 0.0},
+                "busiestLanes": sorted(
+                    ((str(k), len(q)) for k, q in self._lanes.items() if q), key=lambda x: -x[1]
+                )[:10],
+            }
+
+    # ---- internals ----
+
+    def _schedule(self, lane: Hashable) -> None:
+        try:
+            self._pool.submit(self._run_one, lane)
+        except RuntimeError:
+            # pool shut down
+            with self._lock:
+                self._active.discard(lane)
+
+    def _run_one(self, lane: Hashable) -> None:
+        with self._lock:
+            q = self._lanes.get(lane)
+            if not q:
+                self._active.discard(lane)
+                self._lanes.pop(lane, None)
+                return
+            order, enqueued_at = q.popleft()
+            self._inflight += 1
+            now = time.time()
+            self._wait_ms.append((now - enqueued_at) * 1000.0)
+            try:
+                created = float(order.get("created_at") or 0)
+                if created > 0:
+                    self._age_ms.append(max(0.0, now - created) * 1000.0)
+            except Exception:
+                pass
+
+        ok = True
+        try:
+            self.handler(order)
+        except Exception as e:
+            ok = False
+            logger.warning(f"order dispatch error: lane={lane}, id={order.get('id')}, err={e}")
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                self._dispatched += 1
+                if not ok:
+                    self._errors += 1
+                self._queued_ids.discard(order.get("id"))
+                more = bool(self._lanes.get(lane))
+                if not more:
+                    self._active.discard(lane)
+                    self._lanes.pop(lane, None)
+            if more:
+                # Re-queue behind other lanes' tasks instead of draining this lane in a loop.
+                self._schedule(lane)
@@ -0,0 +1,125 @@
+"""
+Pending-order wakeup channel.
+
+TradingExecutor._enqueue_pending_order calls notify_pending_order() right after inserting a row, so
+PendingOrderWorker starts dispatching immediately instead of waiting for its next DB poll (the poll stays
+as a slow safety net, PENDING_ORDER_POLL_SEC).
+
+- Same process: a threading.Event shared by the producer and the worker.
+- Separate processes: set PENDING_ORDER_WAKEUP_PORT; the worker listens on 127.0.0.1:<port> (UDP) and
+  producers in processes without a listening worker send a one-datagram nudge there. A lost datagram
+  only costs latency: the safety-net poll still picks the order up.
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import threading
+from typing import Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _wakeup_port() -> int:
+    try:
+        return int(os.getenv("PENDING_ORDER_WAKEUP_PORT", "0") or 0)
+    except Exception:
+        return 0
+
+
+class PendingOrderWakeup:
+    def __init__(self, port: Optional[int] = None):
+        self.port = _wakeup_port() if port is None else int(port)
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._listening = False
+        self._sock: Optional[socket.socket] = None
+        self._notifications = 0
+        self._remote = 0
+
+    def notify(self, order_id: Optional[int] = None) -> None:
+        """Wake the worker (in-process when it runs here, otherwise via the local UDP port)."""
+        with self._lock:
+            self._notifications += 1
+            listening = self._listening
+        self._event.set()
+        if listening or self.port <= 0:
+            return
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                s.sendto(f"pending_order:{int(order_id or 0)}".encode("ascii"), ("127.0.0.1", self.port))
+        except Exception as e:
+            logger.debug(f"pending order wakeup send failed: {e}")
+
+    def wait(self, timeout: float) -> bool:
+        """Block until notified or timeout; returns True when woken by a notification."""
+        fired = self._event.wait(timeout)
+        self._event.clear()
+        return fired
+
+    def start_listener(self) -> None:
+        """Called by the worker: accept in-process notifications and, if configured, local UDP nudges."""
+        with self._lock:
+            if self._listening:
+                return
+            self._listening = True
+        if self.port <= 0:
+            return
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(("127.0.0.1", self.port))
+        except Exception as e:
+            logger.warning(f"pending order wakeup listener unavailable on 127.0.0.1:{self.port}: {e}")
+            return
+        self._sock = sock
+        threading.Thread(target=self._listen, args=(sock,), name="PendingOrderWakeup", daemon=True).start()
+
+    def stop_listener(self) -> None:
+        with self._lock:
+            self._listening = False
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except Exception:
+                pass
+        self._event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"port": self.port, "listening": self._listening,
+                    "notifications": self._notifications, "remote": self._remote}
+
+    def _listen(self, sock: socket.socket) -> None:
+        while True:
+            try:
+                sock.recvfrom(256)
+            except Exception:
+                return  # socket closed
+            with self._lock:
+                self._remote += 1
+            self._event.set()
+
+
+_wakeup: Optional[PendingOrderWakeup] = None
+_wakeup_lock = threading.Lock()
+
+
+def get_pending_order_wakeup() -> PendingOrderWakeup:
+    global _wakeup
+    if _wakeup is None:
+        with _wakeup_lock:
+            if _wakeup is None:
+                _wakeup = PendingOrderWakeup()
+    return _wakeup
+
+
+def notify_pending_order(order_id: Optional[int] = None) -> None:
+    """Called after a row is inserted into pending_orders."""
+    try:
+        get_pending_order_wakeup().notify(order_id)
+    except Exception as e:
+        logger.debug(f"pending order wakeup failed: {e}")
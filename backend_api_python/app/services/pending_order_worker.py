@@ -1,24 +1,37 @@
 """
 Pending order worker.
 
-This worker polls `pending_orders` periodically and dispatches orders based on `execution_mode`:
+This worker consumes `pending_orders` and dispatches orders based on `execution_mode`:
 - signal: send notifications (no real trading).
 - live: not implemented (paper mode only).
+
+Dispatch is concurrent (see OrderDispatcher): orders are routed into one lane per exchange account
+(signal-only orders: one lane per strategy). Orders in a lane run one at a time in queue order, different
+lanes run in parallel on PENDING_ORDER_WORKERS threads, so a slow maker order only delays its own account.
+
+Wakeup is event-driven (see order_wakeup): the executor notifies the worker right after enqueueing, the DB
+poll (PENDING_ORDER_POLL_SEC) is only a safety net, and the stale-processing requeue runs on its own timer
+(PENDING_ORDER_STALE_SWEEP_SEC).
 """
 
 from __future__ import annotations
 
+import hashlib
 import json
 import os
 import threading
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from app.services.signal_notifier import SignalNotifier
-from app.services.exchange_execution import load_strategy_configs, resolve_exchange_config, safe_exchange_config_for_log
+from app.services.exchange_execution import load_strategy_configs, load_strategy_configs_bulk, resolve_exchange_config, safe_exchange_config_for_log
 from app.services.live_trading.execution import place_order_from_signal
-from app.services.live_trading.factory import create_client
+from app.services.live_trading.client_pool import client_key, get_client
+from app.services.live_trading.user_stream import ensure_user_stream, stop_user_streams, user_stream_stats
 from app.services.live_trading.records import apply_fill_to_local_position, record_trade
+from app.services.position_cache import invalidate_positions
+from app.services.order_dispatcher import OrderDispatcher
+from app.services.order_wakeup import get_pending_order_wakeup
 from app.services.live_trading.base import LiveTradingError
 from app.services.live_trading.binance import BinanceFuturesClient
 from app.services.live_trading.binance_spot import BinanceSpotClient
@@ -43,8 +56,14 @@ logger = get_logger(__name__)
 
 
 class PendingOrderWorker:
-    def __init__(self, poll_interval_sec: float = 1.0, batch_size: int = 50):
-        self.poll_interval_sec = float(poll_interval_sec)
+    def __init__(self, poll_interval_sec: Optional[float] = None, batch_size: int = 50):
+        # Safety-net DB poll; new orders normally arrive through the wakeup channel.
+        if poll_interval_sec is None:
+            try:
+                poll_interval_sec = float(os.getenv("PENDING_ORDER_POLL_SEC", "5"))
+            except Exception:
+                poll_interval_sec = 5.0
+        self.poll_interval_sec = max(0.1, float(poll_interval_sec))
         self.batch_size = int(batch_size)
         self._stop_event = threading.Event()
         self._thread: Optional[threading.Thread] = None
@@ -56,17 +75,40 @@ class PendingOrderWorker:
             self._stale_processing_sec = int(os.getenv("PENDING_ORDER_STALE_SEC", "90"))
         except Exception:
             self._stale_processing_sec = 90
+        try:
+            self._stale_sweep_interval_sec = float(os.getenv("PENDING_ORDER_STALE_SWEEP_SEC", "30"))
+        except Exception:
+            self._stale_sweep_interval_sec = 30.0
+        self._last_stale_sweep_ts = 0.0
+        self._wakeup = get_pending_order_wakeup()
+        self._wakeups = 0
+        self._polls = 0
 
         # Position sync self-check (best-effort): keep local positions aligned with exchange.
         self._position_sync_enabled = os.getenv("POSITION_SYNC_ENABLED", "true").lower() == "true"
         self._position_sync_interval_sec = float(os.getenv("POSITION_SYNC_INTERVAL_SEC", "10"))
         self._last_position_sync_ts = 0.0
 
+        # Concurrent dispatch: bounded pool, one FIFO lane per exchange account.
+        try:
+            workers = int(os.getenv("PENDING_ORDER_WORKERS", "8"))
+        except Exception:
+            workers = 8
+        self._dispatcher: Optional[OrderDispatcher] = None
+        self._dispatch_workers = max(1, workers)
+        # strategy_id -> (expires_at, lane)
+        self._lane_cache: Dict[int, Tuple[float, str]] = {}
+        self._lane_cache_ttl_sec = 30.0
+
     def start(self) -> bool:
         with self._lock:
             if self._thread and self._thread.is_alive():
                 return True
             self._stop_event.clear()
+            if self._dispatcher is None:
+                self._dispatcher = OrderDispatcher(self._process_order, workers=self._dispatch_workers,
+                                                   name="pending-order")
+            self._wakeup.start_listener()
             self._thread = threading.Thread(target=self._run_loop, name="PendingOrderWorker", daemon=True)
             self._thread.start()
             logger.info("PendingOrderWorker started")
@@ -76,39 +118,101 @@ class PendingOrderWorker:
         with self._lock:
             self._stop_event.set()
             th = self._thread
+            dispatcher, self._dispatcher = self._dispatcher, None
+        self._wakeup.stop_listener()
+        stop_user_streams()
         if th and th.is_alive():
             th.join(timeout=timeout_sec)
+        if dispatcher is not None:
+            dispatcher.shutdown()
         logger.info("PendingOrderWorker stopped")
 
+    def stats(self) -> Dict[str, Any]:
+        dispatcher = self._dispatcher
+        out = dispatcher.stats() if dispatcher is not None else {"workers": self._dispatch_workers, "running": False}
+        out["userStreams"] = user_stream_stats()
+        out["wakeup"] = dict(self._wakeup.stats(), wakeups=self._wakeups, polls=self._polls,
+                             pollIntervalSec=self.poll_interval_sec)
+        return out
+
     def _run_loop(self) -> None:
         while not self._stop_event.is_set():
             try:
                 self._tick()
             except Exception as e:
                 logger.warning(f"PendingOrderWorker tick error: {e}")
-            time.sleep(self.poll_interval_sec)
+            if self._stop_event.is_set():
+                break
+            if self._wakeup.wait(self._next_wait_sec()):
+                self._wakeups += 1
+            else:
+                self._polls += 1
+
+    def _next_wait_sec(self) -> float:
+        """Sleep until the next safety-net poll or timer (stale sweep / position sync), whichever is first."""
+        now = time.time()
+        wait = self.poll_interval_sec
+        if self._stale_processing_sec > 0 and self._stale_sweep_interval_sec > 0:
+            wait = min(wait, self._last_stale_sweep_ts + self._stale_sweep_interval_sec - now)
+        if self._position_sync_enabled and self._position_sync_interval_sec > 0:
+            wait = min(wait, self._last_position_sync_ts + self._position_sync_interval_sec - now)
+        return max(0.05, wait)
 
     def _tick(self) -> None:
-        orders = self._fetch_pending_orders(limit=self.batch_size)
-        if not orders:
-            self._maybe_sync_positions()
+        dispatcher = self._dispatcher
+        if dispatcher is None:
             return
-
+        self._maybe_requeue_stale()
+        # Orders stay 'pending' while they wait in a lane; skip those already queued.
+        queued = dispatcher.queued_ids()
+        orders = []
+        if len(queued) < self.batch_size * 10:
+            orders = self._fetch_pending_orders(limit=self.batch_size, exclude_ids=queued)
         for o in orders:
-            oid = o.get("id")
-            if not oid:
-                continue
+            if o.get("id"):
+                dispatcher.submit(self._lane_of(o), o)
 
-            # Mark processing (best-effort)
-            if not self._mark_processing(order_id=int(oid)):
-                continue
+        self._maybe_sync_positions()
 
-            try:
-                self._dispatch_one(o)
-            except Exception as e:
-                self._mark_failed(order_id=int(oid), error=str(e))
+    def _process_order(self, o: Dict[str, Any]) -> None:
+        """Runs on a dispatcher lane: claim the order, then dispatch it."""
+        oid = int(o.get("id"))
+        # Mark processing (best-effort)
+        if not self._mark_processing(order_id=oid):
+            return
+        try:
+            self._dispatch_one(o)
+        except Exception as e:
+            self._mark_failed(order_id=oid, error=str(e))
 
-        self._maybe_sync_positions()
+    def _lane_of(self, order_row: Dict[str, Any]) -> str:
+        """Dispatch lane: the strategy's exchange account for live orders, the strategy itself otherwise."""
+        try:
+            strategy_id = int(order_row.get("strategy_id") or 0)
+        except Exception:
+            strategy_id = 0
+        if strategy_id <= 0:
+            return f"order:{order_row.get('id')}"
+        now = time.time()
+        cached = self._lane_cache.get(strategy_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        lane = f"strategy:{strategy_id}"
+        try:
+            cfg = load_strategy_configs(strategy_id)
+            mode = (order_row.get("execution_mode") or "signal").strip().lower()
+            if mode == "live" or (cfg.get("execution_mode") or "").strip().lower() == "live":
+                exchange_config = resolve_exchange_config(cfg.get("exchange_config") or {})
+                exchange_id = str(exchange_config.get("exchange_id") or "").strip().lower()
+                api_key = str(exchange_config.get("api_key") or exchange_config.get("apiKey") or "")
+                if exchange_id and api_key:
+                    digest = hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:12]
+                    lane = f"account:{exchange_id}:{digest}"
+        except Exception as e:
+            logger.debug(f"lane resolve failed: strategy_id={strategy_id}, err={e}")
+        self._lane_cache[strategy_id] = (now + self._lane_cache_ttl_sec, lane)
+        return lane
 
     def _maybe_sync_positions(self) -> None:
         if not self._position_sync_enabled:
@@ -131,6 +235,10 @@ class PendingOrderWorker:
         - If exchange position size differs, update local size (optional best-effort).
 
         This prevents "ghost positions" when positions are closed externally on the exchange.
+
+        Strategies are grouped by exchange account (credentials + market type), so each account's position
+        list is fetched once per sync; all local rows are diffed in memory and the deletes / updates are
+        applied in a single transaction. Cost scales with accounts, not positions.
         """
         # 1) Load local positions
         with get_db_connection() as db:
@@ -142,7 +250,6 @@ class PendingOrderWorker:
         if not rows:
             return
 
-        # Group by strategy_id for efficient exchange queries.
         sid_to_rows: Dict[int, List[Dict[str, Any]]] = {}
         for r in rows:
             sid = int(r.get("strategy_id") or 0)
@@ -150,281 +257,331 @@ class PendingOrderWorker:
                 continue
             sid_to_rows.setdefault(sid, []).append(r)
 
-        # 2) Reconcile per strategy
-        for sid, plist in sid_to_rows.items():
+        # 2) Group live strategies by exchange account
+        configs = load_strategy_configs_bulk(list(sid_to_rows.keys()))
+        resolved_cache: Dict[str, Dict[str, Any]] = {}
+        accounts: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        for sid in sid_to_rows:
+            sc = configs.get(sid) or {}
+            if (sc.get("execution_mode") or "").strip().lower() != "live":
+                continue
             try:
-                sc = load_strategy_configs(int(sid))
-                if (sc.get("execution_mode") or "").strip().lower() != "live":
-                    continue
-                exchange_config = resolve_exchange_config(sc.get("exchange_config") or {})
-                safe_cfg = safe_exchange_config_for_log(exchange_config)
+                raw_cfg = sc.get("exchange_config") or {}
+                cache_key = json.dumps(raw_cfg, sort_keys=True, default=str)
+                exchange_config = resolved_cache.get(cache_key)
+                if exchange_config is None:
+                    exchange_config = resolve_exchange_config(raw_cfg)
+                    resolved_cache[cache_key] = exchange_config
                 market_type = (sc.get("market_type") or exchange_config.get("market_type") or "swap")
                 market_type = str(market_type or "swap").strip().lower()
                 if market_type in ("futures", "future", "perp", "perpetual"):
                     market_type = "swap"
+                product_type = str(exchange_config.get("product_type") or exchange_config.get("productType") or "")
+                key = client_key(exchange_config, market_type) + (product_type,)
+            except Exception as e:
+                logger.info(f"position sync: strategy_id={sid} config failed: {e}")
+                continue
+            acct = accounts.setdefault(key, {"exchange_config": exchange_config, "market_type": market_type, "sids": []})
+            acct["sids"].append(sid)
+
+        # 3) One position snapshot per account; diff every strategy of the account in memory
+        to_delete_ids: List[int] = []
+        to_update: List[Dict[str, Any]] = []
+        deleted_by_sid: Dict[int, int] = {}
+        for key, acct in accounts.items():
+            exchange_config = acct["exchange_config"]
+            market_type = acct["market_type"]
+            try:
+                client = get_client(exchange_config, market_type=market_type)
+                exch_size = self._fetch_exchange_positions(client, market_type, exchange_config)
+            except Exception as e:
+                logger.info(f"position sync: account {key[0]}:{key[1]} (strategies {acct['sids']}) failed: {e}")
+                continue
+            if exch_size is None:
+                # Spot reconciliation is optional; skip for now (keeps self-check low-risk).
+                logger.debug(f"position sync: skip unsupported market/client: sids={acct['sids']}, cfg={safe_exchange_config_for_log(exchange_config)}, market_type={market_type}, client={type(client)}")
+                continue
+            for sid in acct["sids"]:
+                dels, ups = self._diff_positions(sid_to_rows[sid], exch_size)
+                to_delete_ids.extend(dels)
+                to_update.extend(ups)
+                if dels:
+                    deleted_by_sid[sid] = len(dels)
+
+        if not to_delete_ids and not to_update:
+            return
 
-                client = create_client(exchange_config, market_type=market_type)
+        # 4) Apply in a single transaction
+        with get_db_connection() as db:
+            cur = db.cursor()
+            for rid in to_delete_ids:
+                cur.execute("DELETE FROM qd_strategy_positions WHERE id = %s", (int(rid),))
+            now_ts = int(time.time())
+            for u in to_update:
+                cur.execute("UPDATE qd_strategy_positions SET size = %s, updated_at = %s WHERE id = %s", (float(u["size"]), now_ts, int(u["id"])))
+            db.commit()
+            cur.close()
+        for sid in {int(u["strategy_id"]) for u in to_update} | set(deleted_by_sid):
+            invalidate_positions(sid)
+        for sid, n in deleted_by_sid.items():
+            logger.info(f"position sync: removed {n} ghost positions for strategy_id={sid}")
+
+    @staticmethod
+    def _diff_positions(plist: List[Dict[str, Any]], exch_size: Dict[str, Dict[str, float]]) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """Compare one strategy's local rows with the account snapshot: (ids to delete, size updates)."""
+        to_delete_ids: List[int] = []
+        to_update: List[Dict[str, Any]] = []
+        eps = 1e-12
+
+        for r in plist:
+            rid = int(r.get("id") or 0)
+            sym = str(r.get("symbol") or "").strip()
+            side = str(r.get("side") or "").strip().lower()
+            if not rid or not sym or side not in ("long", "short"):
+                continue
+            try:
+                local_size = float(r.get("size") or 0.0)
+            except Exception:
+                local_size = 0.0
 
-                # Build an "exchange snapshot" per symbol+side
-                exch_size: Dict[str, Dict[str, float]] = {}  # {symbol: {long: size, short: size}}
+            exch = exch_size.get(sym) or {}
+            exch_qty = float(exch.get(side) or 0.0)
 
-                if isinstance(client, BinanceFuturesClient) and market_type == "swap":
-                    all_pos = client.get_positions() or []
-                    if isinstance(all_pos, list):
-                        for p in all_pos:
-                            sym = str(p.get("symbol") or "").strip().upper()
-                            try:
-                                amt = float(p.get("positionAmt") or 0.0)
-                            except Exception:
-                                amt = 0.0
-                            if not sym or abs(amt) <= 0:
-                                continue
-                            # Map to our symbol format: BTCUSDT -> BTC/USDT (best-effort)
-                            hb_sym = sym
-                            if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
-                                hb_sym = f"{hb_sym[:-4]}/USDT"
-                            side = "long" if amt > 0 else "short"
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
-
-                elif isinstance(client, OkxClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    data = (resp.get("data") or []) if isinstance(resp, dict) else []
-                    if isinstance(data, list):
-                        for p in data:
-                            inst_id = str(p.get("instId") or "")
-                            pos_side = str(p.get("posSide") or "").lower()
-                            try:
-                                pos = float(p.get("pos") or 0.0)
-                            except Exception:
-                                pos = 0.0
-                            if not inst_id or abs(pos) <= 0:
-                                continue
-                            # instId: BTC-USDT-SWAP -> BTC/USDT
-                            hb_sym = inst_id.replace("-SWAP", "").replace("-", "/")
-                            side = "long" if pos_side == "long" else ("short" if pos_side == "short" else ("long" if pos > 0 else "short"))
-                            # IMPORTANT: OKX swap positions `pos` is in contracts (张数), but our system uses base-asset quantity.
-                            # Convert contracts -> base using ctVal when available.
-                            qty_base = abs(float(pos))
-                            try:
-                                inst = client.get_instrument(inst_type="SWAP", inst_id=inst_id) or {}
-                                ct_val = float(inst.get("ctVal") or 0.0)
-                                if ct_val > 0:
-                                    qty_base = qty_base * ct_val
-                            except Exception:
-                                pass
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
-
-                elif isinstance(client, BitgetMixClient) and market_type == "swap":
-                    product_type = str(exchange_config.get("product_type") or exchange_config.get("productType") or "USDT-FUTURES")
-                    resp = client.get_positions(product_type=product_type)
-                    data = resp.get("data") if isinstance(resp, dict) else None
-                    if isinstance(data, list):
-                        for p in data:
-                            sym = str(p.get("symbol") or "")
-                            hold_side = str(p.get("holdSide") or "").lower()
-                            try:
-                                total = float(p.get("total") or 0.0)
-                            except Exception:
-                                total = 0.0
-                            if not sym or abs(total) <= 0:
-                                continue
-                            # Symbol is like BTCUSDT -> BTC/USDT best-effort
-                            hb_sym = sym.upper()
-                            if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
-                                hb_sym = f"{hb_sym[:-4]}/USDT"
-                            side = "long" if hold_side == "long" else "short"
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(total))
-
-                elif isinstance(client, BybitClient) and market_type == "swap":
-                    # Bybit linear positions
-                    resp = client.get_positions()
-                    lst = (((resp.get("result") or {}).get("list")) if isinstance(resp, dict) else None) or []
-                    if isinstance(lst, list):
-                        for p in lst:
-                            if not isinstance(p, dict):
-                                continue
-                            sym = str(p.get("symbol") or "").strip().upper()
-                            side0 = str(p.get("side") or "").strip().lower()  # Buy/Sell
-                            try:
-                                sz = float(p.get("size") or 0.0)
-                            except Exception:
-                                sz = 0.0
-                            if not sym or abs(sz) <= 0:
-                                continue
-                            hb_sym = sym
-                            if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
-                                hb_sym = f"{hb_sym[:-4]}/USDT"
-                            side = "long" if side0 == "buy" else ("short" if side0 == "sell" else ("long" if sz > 0 else "short"))
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
-
-                elif isinstance(client, GateUsdtFuturesClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    items = resp if isinstance(resp, list) else []
-                    if isinstance(items, list):
-                        for p in items:
-                            if not isinstance(p, dict):
-                                continue
-                            contract = str(p.get("contract") or "").strip()
-                            try:
-                                sz_ct = float(p.get("size") or 0.0)  # contracts, signed
-                            except Exception:
-                                sz_ct = 0.0
-                            if not contract or abs(sz_ct) <= 0:
-                                continue
-                            hb_sym = contract.replace("_", "/")
-                            side = "long" if sz_ct > 0 else "short"
-                            # Convert contracts -> base using quanto_multiplier.
-                            qty_base = abs(sz_ct)
-                            try:
-                                meta = client.get_contract(contract=contract) or {}
-                                qm = float(meta.get("quanto_multiplier") or meta.get("contract_size") or 0.0)
-                                if qm > 0:
-                                    qty_base = qty_base * qm
-                            except Exception:
-                                pass
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
-
-                elif isinstance(client, KucoinFuturesClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    data = (resp.get("data") if isinstance(resp, dict) else None) or []
-                    if isinstance(data, list):
-                        for p in data:
-                            if not isinstance(p, dict):
-                                continue
-                            sym = str(p.get("symbol") or "").strip()
-                            try:
-                                qty_ct = float(p.get("currentQty") or p.get("quantity") or 0.0)
-                            except Exception:
-                                qty_ct = 0.0
-                            if not sym or abs(qty_ct) <= 0:
-                                continue
-                            side = "long" if qty_ct > 0 else "short"
-                            # Convert contracts -> base using multiplier.
-                            qty_base = abs(qty_ct)
-                            try:
-                                meta = client.get_contract(symbol=sym) or {}
-                                mult = float(meta.get("multiplier") or meta.get("lotSize") or 0.0)
-                                if mult > 0:
-                                    qty_base = qty_base * mult
-                            except Exception:
-                                pass
-                            exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
-
-                elif isinstance(client, KrakenFuturesClient) and market_type == "swap":
-                    resp = client.get_open_positions()
-                    positions = (resp.get("openPositions") if isinstance(resp, dict) else None) or (resp.get("open_positions") if isinstance(resp, dict) else None) or []
-                    if isinstance(positions, list):
-                        for p in positions:
-                            if not isinstance(p, dict):
-                                continue
-                            sym = str(p.get("symbol") or p.get("instrument") or "").strip()
-                            try:
-                                sz = float(p.get("size") or p.get("positionSize") or 0.0)
-                            except Exception:
-                                sz = 0.0
-                            if not sym or abs(sz) <= 0:
-                                continue
-                            side = "long" if sz > 0 else "short"
-                            exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
-
-                elif isinstance(client, BitfinexDerivativesClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    items = resp if isinstance(resp, list) else []
-                    if isinstance(items, list):
-                        for p in items:
-                            # Bitfinex positions are arrays; best-effort parse:
-                            # [symbol, status, amount, base_price, ...]
-                            try:
-                                if isinstance(p, list) and len(p) >= 3:
-                                    sym = str(p[0] or "")
-                                    amt = float(p[2] or 0.0)
-                                    if not sym or abs(amt) <= 0:
-                                        continue
-                                    side = "long" if amt > 0 else "short"
-                                    exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
-                            except Exception:
-                                continue
+            if exch_qty <= eps:
+                # Exchange is flat -> delete local position (self-heal).
+                to_delete_ids.append(rid)
+            else:
+                # Update local size if it diverged materially (best-effort).
+                if local_size <= 0 or abs(exch_qty - local_size) / max(1.0, local_size) > 0.01:
+                    to_update.append({"id": rid, "strategy_id": int(r.get("strategy_id") or 0), "size": exch_qty})
+        return to_delete_ids, to_update
 
-                else:
-                    # Spot reconciliation is optional; skip for now (keeps self-check low-risk).
-                    logger.debug(f"position sync: skip unsupported market/client: sid={sid}, cfg={safe_cfg}, market_type={market_type}, client={type(client)}")
-                    continue
-
-                # 3) Apply reconciliation to local rows.
-                to_delete_ids: List[int] = []
-                to_update: List[Dict[str, Any]] = []
-                eps = 1e-12
-
-                for r in plist:
-                    rid = int(r.get("id") or 0)
-                    sym = str(r.get("symbol") or "").strip()
-                    side = str(r.get("side") or "").strip().lower()
-                    if not rid or not sym or side not in ("long", "short"):
+    def _fetch_exchange_positions(self, client: Any, market_type: str, exchange_config: Dict[str, Any]) -> Optional[Dict[str, Dict[str, float]]]:
+        """One position-list call for the account: {symbol: {long: size, short: size}}; None if unsupported."""
+        exch_size: Dict[str, Dict[str, float]] = {}  # {symbol: {long: size, short: size}}
+
+        if isinstance(client, BinanceFuturesClient) and market_type == "swap":
+            all_pos = client.get_positions() or []
+            if isinstance(all_pos, list):
+                for p in all_pos:
+                    sym = str(p.get("symbol") or "").strip().upper()
+                    try:
+                        amt = float(p.get("positionAmt") or 0.0)
+                    except Exception:
+                        amt = 0.0
+                    if not sym or abs(amt) <= 0:
                         continue
+                    # Map to our symbol format: BTCUSDT -> BTC/USDT (best-effort)
+                    hb_sym = sym
+                    if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
+                        hb_sym = f"{hb_sym[:-4]}/USDT"
+                    side = "long" if amt > 0 else "short"
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
+
+        elif isinstance(client, OkxClient) and market_type == "swap":
+            resp = client.get_positions()
+            data = (resp.get("data") or []) if isinstance(resp, dict) else []
+            if isinstance(data, list):
+                for p in data:
+                    inst_id = str(p.get("instId") or "")
+                    pos_side = str(p.get("posSide") or "").lower()
                     try:
-                        local_size = float(r.get("size") or 0.0)
+                        pos = float(p.get("pos") or 0.0)
                     except Exception:
-                        local_size = 0.0
-
-                    exch = exch_size.get(sym) or {}
-                    exch_qty = float(exch.get(side) or 0.0)
+                        pos = 0.0
+                    if not inst_id or abs(pos) <= 0:
+                        continue
+                    # instId: BTC-USDT-SWAP -> BTC/USDT
+                    hb_sym = inst_id.replace("-SWAP", "").replace("-", "/")
+                    side = "long" if pos_side == "long" else ("short" if pos_side == "short" else ("long" if pos > 0 else "short"))
+                    # IMPORTANT: OKX swap positions `pos` is in contracts (张数), but our system uses base-asset quantity.
+                    # Convert contracts -> base using ctVal when available.
+                    qty_base = abs(float(pos))
+                    try:
+                        inst = client.get_instrument(inst_type="SWAP", inst_id=inst_id) or {}
+                        ct_val = float(inst.get("ctVal") or 0.0)
+                        if ct_val > 0:
+                            qty_base = qty_base * ct_val
+                    except Exception:
+                        pass
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
+
+        elif isinstance(client, BitgetMixClient) and market_type == "swap":
+            product_type = str(exchange_config.get("product_type") or exchange_config.get("productType") or "USDT-FUTURES")
+            resp = client.get_positions(product_type=product_type)
+            data = resp.get("data") if isinstance(resp, dict) else None
+            if isinstance(data, list):
+                for p in data:
+                    sym = str(p.get("symbol") or "")
+                    hold_side = str(p.get("holdSide") or "").lower()
+                    try:
+                        total = float(p.get("total") or 0.0)
+                    except Exception:
+                        total = 0.0
+                    if not sym or abs(total) <= 0:
+                        continue
+                    # Symbol is like BTCUSDT -> BTC/USDT best-effort
+                    hb_sym = sym.upper()
+                    if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
+                        hb_sym = f"{hb_sym[:-4]}/USDT"
+                    side = "long" if hold_side == "long" else "short"
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(total))
+
+        elif isinstance(client, BybitClient) and market_type == "swap":
+            # Bybit linear positions
+            resp = client.get_positions()
+            lst = (((resp.get("result") or {}).get("list")) if isinstance(resp, dict) else None) or []
+            if isinstance(lst, list):
+                for p in lst:
+                    if not isinstance(p, dict):
+                        continue
+                    sym = str(p.get("symbol") or "").strip().upper()
+                    side0 = str(p.get("side") or "").strip().lower()  # Buy/Sell
+                    try:
+                        sz = float(p.get("size") or 0.0)
+                    except Exception:
+                        sz = 0.0
+                    if not sym or abs(sz) <= 0:
+                        continue
+                    hb_sym = sym
+                    if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
+                        hb_sym = f"{hb_sym[:-4]}/USDT"
+                    side = "long" if side0 == "buy" else ("short" if side0 == "sell" else ("long" if sz > 0 else "short"))
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
+
+        elif isinstance(client, GateUsdtFuturesClient) and market_type == "swap":
+            resp = client.get_positions()
+            items = resp if isinstance(resp, list) else []
+            if isinstance(items, list):
+                for p in items:
+                    if not isinstance(p, dict):
+                        continue
+                    contract = str(p.get("contract") or "").strip()
+                    try:
+                        sz_ct = float(p.get("size") or 0.0)  # contracts, signed
+                    except Exception:
+                        sz_ct = 0.0
+                    if not contract or abs(sz_ct) <= 0:
+                        continue
+                    hb_sym = contract.replace("_", "/")
+                    side = "long" if sz_ct > 0 else "short"
+                    # Convert contracts -> base using quanto_multiplier.
+                    qty_base = abs(sz_ct)
+                    try:
+                        meta = client.get_contract(contract=contract) or {}
+                        qm = float(meta.get("quanto_multiplier") or meta.get("contract_size") or 0.0)
+                        if qm > 0:
+                            qty_base = qty_base * qm
+                    except Exception:
+                        pass
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
+
+        elif isinstance(client, KucoinFuturesClient) and market_type == "swap":
+            resp = client.get_positions()
+            data = (resp.get("data") if isinstance(resp, dict) else None) or []
+            if isinstance(data, list):
+                for p in data:
+                    if not isinstance(p, dict):
+                        continue
+                    sym = str(p.get("symbol") or "").strip()
+                    try:
+                        qty_ct = float(p.get("currentQty") or p.get("quantity") or 0.0)
+                    except Exception:
+                        qty_ct = 0.0
+                    if not sym or abs(qty_ct) <= 0:
+                        continue
+                    side = "long" if qty_ct > 0 else "short"
+                    # Convert contracts -> base using multiplier.
+                    qty_base = abs(qty_ct)
+                    try:
+                        meta = client.get_contract(symbol=sym) or {}
+                        mult = float(meta.get("multiplier") or meta.get("lotSize") or 0.0)
+                        if mult > 0:
+                            qty_base = qty_base * mult
+                    except Exception:
+                        pass
+                    exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
+
+        elif isinstance(client, KrakenFuturesClient) and market_type == "swap":
+            resp = client.get_open_positions()
+            positions = (resp.get("openPositions") if isinstance(resp, dict) else None) or (resp.get("open_positions") if isinstance(resp, dict) else None) or []
+            if isinstance(positions, list):
+                for p in positions:
+                    if not isinstance(p, dict):
+                        continue
+                    sym = str(p.get("symbol") or p.get("instrument") or "").strip()
+                    try:
+                        sz = float(p.get("size") or p.get("positionSize") or 0.0)
+                    except Exception:
+                        sz = 0.0
+                    if not sym or abs(sz) <= 0:
+                        continue
+                    side = "long" if sz > 0 else "short"
+                    exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
+
+        elif isinstance(client, BitfinexDerivativesClient) and market_type == "swap":
+            resp = client.get_positions()
+            items = resp if isinstance(resp, list) else []
+            if isinstance(items, list):
+                for p in items:
+                    # Bitfinex positions are arrays; best-effort parse:
+                    # [symbol, status, amount, base_price, ...]
+                    try:
+                        if isinstance(p, list) and len(p) >= 3:
+                            sym = str(p[0] or "")
+                            amt = float(p[2] or 0.0)
+                            if not sym or abs(amt) <= 0:
+                                continue
+                            side = "long" if amt > 0 else "short"
+                            exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
+                    except Exception:
+                        continue
 
-                    if exch_qty <= eps:
-                        # Exchange is flat -> delete local position (self-heal).
-                        to_delete_ids.append(rid)
-                    else:
-                        # Update local size if it diverged materially (best-effort).
-                        if local_size <= 0 or abs(exch_qty - local_size) / max(1.0, local_size) > 0.01:
-                            to_update.append({"id": rid, "size": exch_qty})
-
-                if not to_delete_ids and not to_update:
-                    continue
-
-                with get_db_connection() as db:
-                    cur = db.cursor()
-                    for rid in to_delete_ids:
-                        cur.execute("DELETE FROM qd_strategy_positions WHERE id = %s", (int(rid),))
-                    now_ts = int(time.time())
-                    for u in to_update:
-                        cur.execute("UPDATE qd_strategy_positions SET size = %s, updated_at = %s WHERE id = %s", (float(u["size"]), now_ts, int(u["id"])))
-                    db.commit()
-                    cur.close()
-
-                if to_delete_ids:
-                    logger.info(f"position sync: removed {len(to_delete_ids)} ghost positions for strategy_id={sid}")
-            except Exception as e:
-                logger.info(f"position sync: strategy_id={sid} failed: {e}")
+        else:
+            return None
+        return exch_size
 
-    def _fetch_pending_orders(self, limit: int = 50) -> List[Dict[str, Any]]:
+    def _maybe_requeue_stale(self) -> None:
+        """Best-effort: requeue stale "processing" rows (e.g. worker crashed after claiming), on its own timer."""
         try:
-            # Best-effort: requeue stale "processing" rows to avoid deadlocks after crashes.
-            try:
-                stale_sec = int(self._stale_processing_sec or 0)
-            except Exception:
-                stale_sec = 0
-            if stale_sec > 0:
-                now = int(time.time())
-                cutoff = now - stale_sec
-                with get_db_connection() as db:
-                    cur = db.cursor()
-                    cur.execute(
-                        """
-                        UPDATE pending_orders
-                        SET status = 'pending',
-                            updated_at = %s,
-                            dispatch_note = CASE
-                                WHEN dispatch_note IS NULL OR dispatch_note = '' THEN 'requeued_stale_processing'
-                                ELSE dispatch_note
-                            END
-                        WHERE status = 'processing'
-                          AND (updated_at IS NULL OR updated_at < %s)
-                          AND (attempts < max_attempts)
-                        """,
-                        (now, cutoff),
-                    )
-                    db.commit()
-                    cur.close()
+            stale_sec = int(self._stale_processing_sec or 0)
+        except Exception:
+            stale_sec = 0
+        now = time.time()
+        if stale_sec <= 0 or now - self._last_stale_sweep_ts < self._stale_sweep_interval_sec:
+            return
+        self._last_stale_sweep_ts = now
+        try:
+            now = int(now)
+            cutoff = now - stale_sec
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(
+                    """
+                    UPDATE pending_orders
+                    SET status = 'pending',
+                        updated_at = %s,
+                        dispatch_note = CASE
+                            WHEN dispatch_note IS NULL OR dispatch_note = '' THEN 'requeued_stale_processing'
+                            ELSE dispatch_note
+                        END
+                    WHERE status = 'processing'
+                      AND (updated_at IS NULL OR updated_at < %s)
+                      AND (attempts < max_attempts)
+                    """,
+                    (now, cutoff),
+                )
+                db.commit()
+                cur.close()
+        except Exception as e:
+            logger.warning(f"requeue_stale_processing failed: {e}")
 
+    def _fetch_pending_orders(self, limit: int = 50, exclude_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        try:
+            # Excluded ids are filtered here rather than bound into a NOT IN list, which could exceed
+            # SQLite's bound-variable limit on a large backlog. Over-fetching by len(exclude) still
+            # yields `limit` rows whenever that many eligible orders exist.
+            exclude = {int(i) for i in (exclude_ids or [])}
             with get_db_connection() as db:
                 cur = db.cursor()
                 cur.execute(
@@ -436,11 +593,11 @@ class PendingOrderWorker:
                     ORDER BY priority DESC, id ASC
                     LIMIT %s
                     """,
-                    (int(limit),),
+                    (int(limit) + len(exclude),),
                 )
                 rows = cur.fetchall() or []
                 cur.close()
-            return rows
+            return [r for r in rows if int(r.get("id") or 0) not in exclude][:int(limit)]
         except Exception as e:
             logger.warning(f"fetch_pending_orders failed: {e}")
             return []
@@ -686,12 +843,17 @@ class PendingOrderWorker:
 
         client = None
         try:
-            client = create_client(exchange_config, market_type=market_type)
+            client = get_client(exchange_config, market_type=market_type)
         except Exception as e:
             self._mark_failed(order_id=order_id, error=f"create_client_failed:{e}")
             _console_print(f"[worker] create_client_failed: strategy_id={strategy_id} pending_id={order_id} err={e}")
             _notify_live_best_effort(status="failed", error=f"create_client_failed:{e}")
             return
+        # Order/fill updates over websocket (when enabled) so wait_for_fill does not have to poll.
+        try:
+            ensure_user_stream(client)
+        except Exception as e:
+            logger.info(f"user stream unavailable: {e}")
 
         def _make_client_oid(phase: str = "") -> str:
             """
@@ -0,0 +1,130 @@
+"""
+策略持仓的内存缓存（qd_strategy_positions 的镜像）
+
+执行器每个 tick 要读持仓做信号状态机和服务端止盈止损，原先每次都查库。这里按 strategy_id
+缓存持仓行：
+- 执行器自己的写入（_update_position / _close_position）同步更新缓存；
+- 成交回写（live_trading.records）与交易所持仓同步（PendingOrderWorker）写库后调用 invalidate，
+  下次读取时重新加载；
+- POSITION_CACHE_TTL_SEC（默认 60）兜底，外部直接改库最多延迟一个 TTL 生效。
+
+加载在锁外进行：每个 strategy_id 有一个代数（generation），invalidate / upsert / remove 都会递增它，
+加载期间代数变了说明读到的可能是旧数据，这次结果只返回给调用方、不写入缓存。
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+Loader = Callable[[int], List[Dict[str, Any]]]
+
+
+class PositionCache:
+    def __init__(self, ttl_sec: Optional[float] = None):
+        try:
+            self.ttl_sec = float(ttl_sec if ttl_sec is not None else os.getenv('POSITION_CACHE_TTL_SEC', '60'))
+        except Exception:
+            self.ttl_sec = 60.0
+        self._lock = threading.Lock()
+        # strategy_id -> (loaded_at, rows)
+        self._rows: Dict[int, tuple] = {}
+        # strategy_id -> generation；_epoch 在 invalidate() 全部失效时递增
+        self._gens: Dict[int, int] = {}
+        self._epoch = 0
+        self._hits = 0
+        self._loads = 0
+        self._invalidations = 0
+        self._stale_loads = 0
+
+    def get(self, strategy_id: int, loader: Loader) -> List[Dict[str, Any]]:
+        """返回策略全部持仓行的副本；未缓存或过期时用 loader 从库中加载"""
+        sid = int(strategy_id)
+        now = time.time()
+        with self._lock:
+            item = self._rows.get(sid)
+            if item is not None and (self.ttl_sec <= 0 or now - item[0] < self.ttl_sec):
+                self._hits += 1
+                return [dict(r) for r in item[1]]
+            gen = self._generation_locked(sid)
+
+        rows = loader(sid)
+        with self._lock:
+            self._loads += 1
+            if self._generation_locked(sid) == gen:
+                self._rows[sid] = (now, [dict(r) for r in rows])
+            else:
+                # 加载期间有写入 / 失效：不缓存可能过期的结果，下次读取重新加载
+                self._stale_loads += 1
+        return [dict(r) for r in rows]
+
+    def upsert(self, strategy_id: int, symbol: str, side: str, fields: Dict[str, Any]) -> None:
+        """执行器写库后同步缓存；缓存中没有该行（新开仓）时整体失效，下次读取重新加载（拿到行 id）"""
+        sid = int(strategy_id)
+        with self._lock:
+            self._bump_locked(sid)
+            item = self._rows.get(sid)
+            if item is None:
+                return
+            for row in item[1]:
+                if row.get('symbol') == symbol and row.get('side') == side:
+                    row.update(fields)
+                    return
+            self._rows.pop(sid, None)
+
+    def remove(self, strategy_id: int, symbol: str, side: str) -> None:
+        sid = int(strategy_id)
+        with self._lock:
+            self._bump_locked(sid)
+            item = self._rows.get(sid)
+            if item is None:
+                return
+            rows = [r for r in item[1] if not (r.get('symbol') == symbol and r.get('side') == side)]
+            self._rows[sid] = (item[0], rows)
+
+    def invalidate(self, strategy_id: Optional[int] = None) -> None:
+        with self._lock:
+            self._invalidations += 1
+            if strategy_id is None:
+                self._epoch += 1
+                self._rows.clear()
+            else:
+                self._bump_locked(int(strategy_id))
+                self._rows.pop(int(strategy_id), None)
+
+    def _generation_locked(self, sid: int) -> tuple:
+        return (self._epoch, self._gens.get(sid, 0))
+
+    def _bump_locked(self, sid: int) -> None:
+        self._gens[sid] = self._gens.get(sid, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'strategies': len(self._rows),
+                'hits': self._hits,
+                'loads': self._loads,
+                'invalidations': self._invalidations,
+                'staleLoads': self._stale_loads,
+            }
+
+
+_position_cache: Optional[PositionCache] = None
+_position_cache_lock = threading.Lock()
+
+
+def get_position_cache() -> PositionCache:
+    global _position_cache
+    if _position_cache is None:
+        with _position_cache_lock:
+            if _position_cache is None:
+                _position_cache = PositionCache()
+    return _position_cache
+
+
+def invalidate_positions(strategy_id: Optional[int] = None) -> None:
+    """qd_strategy_positions 被执行器以外的代码修改后调用"""
+    get_position_cache().invalidate(strategy_id)
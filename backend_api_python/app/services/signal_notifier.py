@@ -30,7 +30,7 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 
-from app.utils.db import get_db_connection
+from app.services.db_write_queue import get_db_write_queue
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -450,27 +450,23 @@ class SignalNotifier:
     ) -> Tuple[bool, str]:
         try:
             now = int(time.time())
-            with get_db_connection() as db:
-                cur = db.cursor()
-                cur.execute(
-                    """
-                    INSERT INTO qd_strategy_notifications
-                    (strategy_id, symbol, signal_type, channels, title, message, payload_json, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        int(strategy_id),
-                        str(symbol or ""),
-                        str(signal_type or ""),
-                        ",".join([str(c) for c in (channels or [])]),
-                        str(title or ""),
-                        str(message or ""),
-                        json.dumps(payload or {}, ensure_ascii=False),
-                        int(now),
-                    ),
-                )
-                db.commit()
-                cur.close()
+            get_db_write_queue().insert(
+                """
+                INSERT INTO qd_strategy_notifications
+                (strategy_id, symbol, signal_type, channels, title, message, payload_json, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    int(strategy_id),
+                    str(symbol or ""),
+                    str(signal_type or ""),
+                    ",".join([str(c) for c in (channels or [])]),
+                    str(title or ""),
+                    str(message or ""),
+                    json.dumps(payload or {}, ensure_ascii=False),
+                    int(now),
+                ),
+            )
             return True, ""
         except Exception as e:
             logger.warning(f"browser notify persist failed: {e}")
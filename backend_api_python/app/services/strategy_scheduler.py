@@ -0,0 +1,547 @@
+"""
+Event-driven strategy scheduler.
+
+Replaces the thread-per-strategy loop of TradingExecutor with:
+- a timer wheel (one slot per second, one revolution per STRATEGY_TICK_INTERVAL_SEC): every symbol is
+  hashed onto a slot, so all strategies trading the same symbol tick together and their load is
+  spread across the interval;
+- a separate warm-up pool (STRATEGY_WARMUP_CONCURRENCY) for strategy initialization, so restoring many
+  strategies at startup is staggered instead of stampeding the exchange;
+- a small worker pool (STRATEGY_SCHEDULER_WORKERS) that runs the per-slot work:
+  1. one batched status query for the strategies due in the slot (stopped ones are dropped),
+  2. one price fetch per (symbol, market_type),
+  3. one K-line fetch per (symbol, timeframe) group when any member's candle is due,
+  4. one evaluation task per strategy (TradingExecutor._strategy_tick).
+
+K-line refreshes are aligned to candle boundaries: a candle-close barrier thread wakes at every
+timeframe boundary plus a settle delay (CANDLE_CLOSE_SETTLE_SEC), fetches the closed candle once per
+(symbol, timeframe) and publishes it to every subscribed strategy right away. Slot ticks only fetch
+K-lines themselves for strategies the barrier could not serve (busy, or the fetch failed).
+
+Strategies whose trigger / stop / take-profit levels were crossed by the slot's price (looked up in
+TradingExecutor.trigger_index) are evaluated first; strategies in error back-off still get a
+trigger-only evaluation so risk exits are not delayed. on_price() lets any other price source
+(e.g. a websocket ticker) fire crossed levels between slots.
+
+A strategy whose previous evaluation is still running skips the tick instead of queueing up.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from app.services.incremental_indicators import TailIndicators
+from app.utils.db import get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Back-off after an evaluation error (same pause as the legacy per-thread loop).
+_ERROR_BACKOFF_SEC = 5.0
+_STATUS_CHUNK = 500
+
+
+class StrategyRuntime:
+    """In-memory state of one running strategy (built by TradingExecutor._init_strategy_runtime)."""
+
+    def __init__(
+        self,
+        strategy_id: int,
+        strategy_name: str,
+        symbol: str,
+        timeframe: str,
+        timeframe_seconds: int,
+        market_type: str,
+        leverage: float,
+        trade_direction: str,
+        initial_capital: float,
+        indicator_code: str,
+        trading_config: Dict[str, Any],
+        ai_model_config: Dict[str, Any],
+        execution_mode: str,
+        notification_config: Dict[str, Any],
+        df: Any,
+        pending_signals: List[Dict[str, Any]],
+        last_kline_time: int = 0,
+    ):
+        self.strategy_id = strategy_id
+        self.strategy_name = strategy_name
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.timeframe_seconds = timeframe_seconds
+        self.market_type = market_type
+        self.leverage = leverage
+        self.trade_direction = trade_direction
+        self.initial_capital = initial_capital
+        self.indicator_code = indicator_code
+        self.trading_config = trading_config
+        self.ai_model_config = ai_model_config
+        self.execution_mode = execution_mode
+        self.notification_config = notification_config
+        self.df = df
+        self.pending_signals = pending_signals
+        self.last_kline_time = last_kline_time
+        self.last_kline_update_time = time.time()
+        # K-lines are refreshed once per candle, kline_settle_sec after the candle boundary
+        self.kline_settle_sec = 0.0
+        # 信号模式下无需真实交易所连接
+        self.exchange = None
+
+        # Incremental indicator state (see TradingExecutor._evaluate_realtime)
+        self.indicators = TailIndicators()
+        self.indicator_env: Optional[Dict[str, Any]] = None
+        self.incremental = True
+        self.ticks_since_parity = 0
+
+        # Price levels last published to TradingExecutor.trigger_index (see _sync_trigger_levels)
+        self.trigger_key: Optional[tuple] = None
+
+        # State snapshots for fast restart (see TradingExecutor._maybe_snapshot)
+        self.snapshot_at = 0.0
+        self.snapshot_key: Optional[str] = None
+
+        # Scheduler bookkeeping
+        self.busy = False
+        self.backoff_until = 0.0
+
+    def candle_epoch(self, t: float) -> int:
+        return int((t - self.kline_settle_sec) // self.timeframe_seconds)
+
+    def kline_due(self, now: float) -> bool:
+        """A candle has closed (and settled) since the last K-line refresh."""
+        return self.candle_epoch(now) > self.candle_epoch(self.last_kline_update_time)
+
+
+class StrategyScheduler:
+    def __init__(self, executor: Any, workers: int = 8, tick_interval_sec: int = 10, candle_settle_sec: float = 2.0,
+                 init_workers: int = 4):
+        self.executor = executor
+        self.workers = max(1, int(workers))
+        self.init_workers = max(1, int(init_workers))
+        self.slots = max(1, int(tick_interval_sec))
+        self.candle_settle_sec = max(0.0, float(candle_settle_sec))
+
+        self._lock = threading.Lock()
+        self._runtimes: Dict[int, StrategyRuntime] = {}
+        # wheel[slot][symbol] -> {strategy_id, ...}
+        self._wheel: List[Dict[str, set]] = [dict() for _ in range(self.slots)]
+        self._pending_init: set = set()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # Strategy warm-up (K-line fetch + first indicator run) runs on its own small pool, so a mass
+        # restore is staggered and never starves the tick workers.
+        self._init_pool: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._barrier_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        # (symbol, timeframe) -> open time of the last candle published by the barrier
+        self._closed_candles: Dict[tuple, int] = {}
+
+        self._ticks = 0
+        self._evaluations = 0
+        self._price_fetches = 0
+        self._kline_fetches = 0
+        self._candle_closes = 0
+        self._skipped_busy = 0
+        self._trigger_hits = 0
+        self._errors = 0
+        self._max_lag_ms = 0.0
+
+    # ---- lifecycle ----
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="strategy-sched")
+            self._init_pool = ThreadPoolExecutor(max_workers=self.init_workers, thread_name_prefix="strategy-init")
+            self._thread = threading.Thread(target=self._run_wheel, name="StrategyScheduler", daemon=True)
+            self._thread.start()
+            self._barrier_thread = threading.Thread(target=self._run_barrier, name="CandleCloseBarrier", daemon=True)
+            self._barrier_thread.start()
+            logger.info(f"StrategyScheduler started: workers={self.workers}, slots={self.slots}")
+
+    def stop(self, timeout_sec: float = 5.0) -> None:
+        self._stop_event.set()
+        for th in (self._thread, self._barrier_thread):
+            if th and th.is_alive():
+                th.join(timeout=timeout_sec)
+        for pool in (self._pool, self._init_pool):
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+    # ---- registration ----
+
+    def add(self, strategy_id: int) -> None:
+        """Initialize the strategy on the worker pool, then put it on the wheel."""
+        self.start()
+        with self._lock:
+            if strategy_id in self._runtimes or strategy_id in self._pending_init:
+                return
+            self._pending_init.add(strategy_id)
+        self._submit_to(self._init_pool, self._init_strategy, strategy_id)
+
+    def remove(self, strategy_id: int) -> bool:
+        with self._lock:
+            self._pending_init.discard(strategy_id)
+            rt = self._runtimes.pop(strategy_id, None)
+            if rt is None:
+                return False
+            bucket = self._wheel[self._slot_of(rt.symbol)]
+            ids = bucket.get(rt.symbol)
+            if ids is not None:
+                ids.discard(strategy_id)
+                if not ids:
+                    del bucket[rt.symbol]
+            return True
+
+    def is_scheduled(self, strategy_id: int) -> bool:
+        with self._lock:
+            return strategy_id in self._runtimes or strategy_id in self._pending_init
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            groups = {(rt.symbol, rt.timeframe) for rt in self._runtimes.values()}
+            return {
+                'strategies': len(self._runtimes),
+                'initializing': len(self._pending_init),
+                'symbols': len({rt.symbol for rt in self._runtimes.values()}),
+                'groups': len(groups),
+                'workers': self.workers,
+                'initWorkers': self.init_workers,
+                'slots': self.slots,
+                'ticks': self._ticks,
+                'evaluations': self._evaluations,
+                'priceFetches': self._price_fetches,
+                'klineFetches': self._kline_fetches,
+                'candleCloses': self._candle_closes,
+                'skippedBusy': self._skipped_busy,
+                'triggerHits': self._trigger_hits,
+                'errors': self._errors,
+                'maxLagMs': round(self._max_lag_ms, 1),
+            }
+
+    def on_price(self, symbol: str, price: float, market_type: Optional[str] = None) -> int:
+        """
+        Trigger-only evaluation of the strategies whose levels on `symbol` are crossed by `price`.
+        With `market_type`, strategies trading the symbol on another market are left alone.
+        """
+        hits = self.executor.trigger_index.crossed(symbol, float(price))
+        if not hits:
+            return 0
+        now = time.time()
+        due = []
+        with self._lock:
+            for sid in hits:
+                rt = self._runtimes.get(sid)
+                if rt is None or (market_type and rt.market_type != market_type):
+                    continue
+                if rt.busy:
+                    self._skipped_busy += 1
+                    continue
+                rt.busy = True
+                due.append(rt)
+            self._trigger_hits += len(due)
+        for rt in due:
+            self._hand_off(set(), rt, float(price), now, None, True)
+        return len(due)
+
+    # ---- internals ----
+
+    def _slot_of(self, symbol: str) -> int:
+        return zlib.crc32((symbol or '').encode('utf-8')) % self.slots
+
+    def _submit(self, fn, *args) -> bool:
+        return self._submit_to(self._pool, fn, *args)
+
+    def _submit_to(self, pool: Optional[ThreadPoolExecutor], fn, *args) -> bool:
+        """Returns False when the task was not queued (no pool / pool shut down)."""
+        if pool is None:
+            return False
+        try:
+            pool.submit(fn, *args)
+            return True
+        except RuntimeError:
+            # pool shut down
+            return False
+
+    def _init_strategy(self, strategy_id: int) -> None:
+        rt = None
+        try:
+            rt = self.executor._init_strategy_runtime(strategy_id)
+        except Exception as e:
+            logger.error(f"Strategy {strategy_id} crashed: {str(e)}")
+            logger.error(traceback.format_exc())
+            self.executor._console_print(f"[strategy:{strategy_id}] fatal error: {e}")
+
+        with self._lock:
+            wanted = strategy_id in self._pending_init
+            self._pending_init.discard(strategy_id)
+            if rt is not None and wanted:
+                rt.kline_settle_sec = self.candle_settle_sec
+                self._runtimes[strategy_id] = rt
+                self._wheel[self._slot_of(rt.symbol)].setdefault(rt.symbol, set()).add(strategy_id)
+                return
+        self.executor._on_strategy_exit(strategy_id)
+
+    def _run_wheel(self) -> None:
+        cursor = 0
+        next_at = time.time()
+        while not self._stop_event.is_set():
+            delay = next_at - time.time()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            now = time.time()
+            lag_ms = max(0.0, (now - next_at) * 1000.0)
+            # Overrun (e.g. host suspended): do not replay missed slots in a burst.
+            next_at = max(next_at + 1.0, now)
+
+            with self._lock:
+                self._ticks += 1
+                self._max_lag_ms = max(self._max_lag_ms, lag_ms)
+                due = {sym: set(ids) for sym, ids in self._wheel[cursor].items() if ids}
+            cursor = (cursor + 1) % self.slots
+            if due:
+                self._submit(self._dispatch_slot, due, now)
+
+    def _run_barrier(self) -> None:
+        """Wakes at the next candle boundary (+ settle delay) of any subscribed timeframe."""
+        settle = self.candle_settle_sec
+        last_fired = 0
+        while not self._stop_event.is_set():
+            with self._lock:
+                timeframes = {rt.timeframe_seconds for rt in self._runtimes.values() if rt.timeframe_seconds > 0}
+            now = time.time()
+            base = max(now - settle, last_fired)
+            boundary = min((int(base // tf) + 1) * tf for tf in timeframes) if timeframes else 0
+            delay = boundary + settle - now if boundary else 1.0
+            # Re-plan at least every second so newly added timeframes are not missed.
+            if delay > 1.0 or not boundary:
+                self._stop_event.wait(min(delay, 1.0))
+                continue
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            last_fired = boundary
+
+            with self._lock:
+                groups: Dict[tuple, List[int]] = {}
+                for rt in self._runtimes.values():
+                    if rt.timeframe_seconds > 0 and boundary % rt.timeframe_seconds == 0:
+                        groups.setdefault((rt.symbol, rt.timeframe), []).append(rt.strategy_id)
+            for (symbol, timeframe), sids in groups.items():
+                self._submit(self._close_candle, symbol, timeframe, boundary, sids)
+
+    def _close_candle(self, symbol: str, timeframe: str, boundary: int, strategy_ids: List[int]) -> None:
+        """Runs on the pool: one K-line fetch for the closed candle, then one evaluation per subscriber."""
+        ready: List[StrategyRuntime] = []
+        handed: set = set()
+        try:
+            klines = None
+            for attempt in range(2):
+                with self._lock:
+                    self._kline_fetches += 1
+                klines = self.executor._fetch_latest_kline(symbol, timeframe, limit=500, refresh=True)
+                # The upstream has not opened the next candle yet: retry once after another settle delay.
+                if (klines and int(klines.time[-1]) >= boundary) or attempt:
+                    break
+                if self._stop_event.wait(max(self.candle_settle_sec, 1.0)):
+                    return
+            if not klines or len(klines) < 2:
+                logger.warning(f"Candle close {symbol} {timeframe} @ {boundary}: K-line fetch failed")
+                return
+
+            now = time.time()
+            with self._lock:
+                self._candle_closes += 1
+                self._closed_candles[(symbol, timeframe)] = boundary
+                for sid in strategy_ids:
+                    rt = self._runtimes.get(sid)
+                    if rt is None or rt.busy or rt.backoff_until > now or not rt.kline_due(now):
+                        continue
+                    rt.busy = True
+                    ready.append(rt)
+            if not ready:
+                return
+
+            markets: Dict[str, List[StrategyRuntime]] = {}
+            for rt in ready:
+                markets.setdefault(rt.market_type, []).append(rt)
+            for market_type, members in markets.items():
+                with self._lock:
+                    self._price_fetches += 1
+                current_price = self.executor._fetch_current_price(None, symbol, market_type=market_type)
+                if current_price is None:
+                    logger.warning(f"Candle close {symbol} {timeframe} ({market_type}): failed to fetch current price")
+                    self._release(members)
+                    continue
+                for rt in members:
+                    self._hand_off(handed, rt, current_price, now, klines)
+        except Exception as e:
+            logger.error(f"StrategyScheduler candle close error for {symbol} {timeframe}: {e}")
+            logger.error(traceback.format_exc())
+            self._release([rt for rt in ready if rt.strategy_id not in handed])
+
+    def _dispatch_slot(self, due: Dict[str, set], now: float) -> None:
+        """Runs on the pool: status check for the slot, then one task per symbol."""
+        try:
+            ids = [sid for sids in due.values() for sid in sids]
+            running = self._running_ids(ids)
+            for sid in ids:
+                if sid not in running:
+                    if self.remove(sid):
+                        logger.info(f"Strategy {sid} stopped")
+                        self.executor._on_strategy_exit(sid)
+            for symbol, sids in due.items():
+                sids = [sid for sid in sids if sid in running]
+                if sids:
+                    self._submit(self._tick_symbol, symbol, sids, now)
+        except Exception as e:
+            logger.error(f"StrategyScheduler dispatch error: {e}")
+            logger.error(traceback.format_exc())
+
+    def _tick_symbol(self, symbol: str, strategy_ids: List[int], now: float) -> None:
+        with self._lock:
+            runtimes = [self._runtimes[sid] for sid in strategy_ids if sid in self._runtimes]
+            ready = []
+            backoff = []
+            for rt in runtimes:
+                if rt.busy:
+                    self._skipped_busy += 1
+                    continue
+                rt.busy = True
+                (ready if rt.backoff_until <= now else backoff).append(rt)
+        if not ready and not backoff:
+            return
+
+        claimed = ready + backoff
+        handed: set = set()
+        try:
+            # Spot and swap strategies on one symbol are priced (and their triggers checked) separately.
+            markets: Dict[str, List[StrategyRuntime]] = {}
+            for rt in claimed:
+                markets.setdefault(rt.market_type, []).append(rt)
+            # K-lines are shared across market types: one fetch per (symbol, timeframe) per tick.
+            klines_by_tf: Dict[str, Any] = {}
+            for market_type, members in markets.items():
+                self._tick_market(
+                    symbol, market_type,
+                    [rt for rt in ready if rt in members], [rt for rt in backoff if rt in members],
+                    now, handed, klines_by_tf,
+                )
+        except Exception as e:
+            logger.error(f"StrategyScheduler tick error for {symbol}: {e}")
+            logger.error(traceback.format_exc())
+            self._release([rt for rt in claimed if rt.strategy_id not in handed])
+
+    def _tick_market(self, symbol: str, market_type: str, ready: List[StrategyRuntime],
+                     backoff: List[StrategyRuntime], now: float, handed: set, klines_by_tf: Dict[str, Any]) -> None:
+        """Steps 1-4 of a slot tick for the claimed runtimes of one (symbol, market_type)."""
+        # 1. One price per (symbol, market_type) per tick
+        with self._lock:
+            self._price_fetches += 1
+        current_price = self.executor._fetch_current_price(None, symbol, market_type=market_type)
+        if current_price is None:
+            logger.warning(f"Strategies {[rt.strategy_id for rt in ready + backoff]} failed to fetch current price for {symbol} ({market_type})")
+            self._release(ready + backoff)
+            return
+
+        # 2. Crossed trigger levels first: no K-line wait for strategies whose candle is not due
+        hits = self.executor.trigger_index.crossed(symbol, float(current_price))
+        if hits:
+            # The index is keyed by symbol: only this market's runtimes count against this price.
+            members = {rt.strategy_id for rt in ready + backoff}
+            hits = {sid: levels for sid, levels in hits.items() if sid in members}
+            with self._lock:
+                self._trigger_hits += len(hits)
+        for rt in backoff:
+            if rt.strategy_id in hits:
+                self._hand_off(handed, rt, current_price, now, None, True)
+            else:
+                rt.busy = False
+        rest = []
+        for rt in ready:
+            if rt.strategy_id in hits and not rt.kline_due(now):
+                self._hand_off(handed, rt, current_price, now, None)
+            else:
+                rest.append(rt)
+        ready = rest
+
+        # 3. One K-line fetch per (symbol, timeframe) when any member's candle is due
+        groups: Dict[str, List[StrategyRuntime]] = {}
+        for rt in ready:
+            groups.setdefault(rt.timeframe, []).append(rt)
+        for timeframe, members in groups.items():
+            klines = klines_by_tf.get(timeframe)
+            due = [rt for rt in members if rt.kline_due(now)]
+            if due and klines is None:
+                # Served from the K-line cache when the barrier already fetched this candle.
+                boundary = due[0].candle_epoch(now) * due[0].timeframe_seconds
+                with self._lock:
+                    refresh = self._closed_candles.get((symbol, timeframe), -1) < boundary
+                    self._kline_fetches += 1
+                klines = self.executor._fetch_latest_kline(symbol, timeframe, limit=500, refresh=refresh)
+                klines_by_tf[timeframe] = klines
+            # 4. Evaluation tasks
+            for rt in members:
+                self._hand_off(handed, rt, current_price, now, klines if due else None)
+
+    def _evaluate(self, rt: StrategyRuntime, current_price: float, now: float, klines: Any,
+                  triggers_only: bool = False) -> None:
+        try:
+            self.executor._strategy_tick(rt, current_price, now, klines=klines, triggers_only=triggers_only)
+            with self._lock:
+                self._evaluations += 1
+        except Exception as e:
+            logger.error(f"Strategy {rt.strategy_id} loop error: {str(e)}")
+            logger.error(traceback.format_exc())
+            self.executor._console_print(f"[strategy:{rt.strategy_id}] loop error: {e}")
+            with self._lock:
+                self._errors += 1
+            rt.backoff_until = time.time() + _ERROR_BACKOFF_SEC
+        finally:
+            rt.busy = False
+
+    def _hand_off(self, handed: set, rt: StrategyRuntime, *args) -> None:
+        """
+        Queue an evaluation for a runtime claimed with busy=True. Once queued, _evaluate's finally
+        owns the busy flag: error paths must only release runtimes not recorded in `handed`, or a
+        still-queued evaluation could run twice at once.
+        """
+        if self._submit(self._evaluate, rt, *args):
+            handed.add(rt.strategy_id)
+        else:
+            rt.busy = False
+
+    def _release(self, runtimes: List[StrategyRuntime]) -> None:
+        for rt in runtimes:
+            rt.busy = False
+
+    def _running_ids(self, strategy_ids: List[int]) -> set:
+        """Batched `status = 'running'` check for the strategies due in one slot."""
+        if not strategy_ids:
+            return set()
+        running = set()
+        try:
+            ids = [int(sid) for sid in strategy_ids]
+            with get_db_connection() as db:
+                cur = db.cursor()
+                # Chunked to stay under SQLite's bound-variable limit.
+                for i in range(0, len(ids), _STATUS_CHUNK):
+                    chunk = ids[i:i + _STATUS_CHUNK]
+                    placeholders = ",".join(["?"] * len(chunk))
+                    cur.execute(
+                        f"SELECT id FROM qd_strategies_trading WHERE status = 'running' AND id IN ({placeholders})",
+                        tuple(chunk),
+                    )
+                    running.update(int(r.get('id')) for r in (cur.fetchall() or []))
+                cur.close()
+            return running
+        except Exception as e:
+            # Keep ticking on a transient DB error rather than stopping every strategy in the slot.
+            logger.warning(f"StrategyScheduler status check failed: {e}")
+            return set(strategy_ids)
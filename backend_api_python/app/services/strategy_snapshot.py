@@ -0,0 +1,133 @@
+"""
+策略运行时状态快照（快速重启）
+
+重启 / 重新部署时，每个运行中的策略原本都要重新拉取 500 根K线并全量执行一次指标才能开始工作，
+策略一多就会集中请求交易所，并留下数分钟的空窗期。执行器定期把每个策略的：
+- 最近的K线（rt.df 的 OHLCV 列）
+- pending_signals、last_kline_time、last_kline_update_time
+- 信号去重表（同一根K线不重复下单）
+写入本地快照文件，启动时先从快照恢复，只向上游拉取快照之后的几根K线做校验。
+
+每个策略一个 .npz 文件（K线为 numpy 数组，其余字段为 JSON），以 allow_pickle=False 读取；
+写入先写临时文件再 os.replace，进程中途退出不会留下半个文件。
+
+配置：
+- STRATEGY_SNAPSHOT_ENABLED: 是否启用（默认 true）
+- STRATEGY_SNAPSHOT_DIR: 快照目录（默认与 SQLite 数据库同目录下的 strategy_snapshots/）
+- STRATEGY_SNAPSHOT_INTERVAL_SEC: 每个策略的快照间隔（默认 60 秒）
+- STRATEGY_SNAPSHOT_MAX_AGE_SEC: 超过该时长的快照不再使用（默认 21600 = 6 小时）
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.data_sources import KlineBatch
+from app.data_sources.kline_batch import KLINE_COLUMNS
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _default_dir() -> str:
+    db_file = (os.getenv('SQLITE_DATABASE_FILE') or '').strip() or os.path.join(_BASE_DIR, 'data', 'quantdinger.db')
+    return os.path.join(os.path.dirname(os.path.abspath(db_file)), 'strategy_snapshots')
+
+
+class StrategySnapshotStore:
+    def __init__(self, directory: Optional[str] = None):
+        self.enabled = os.getenv('STRATEGY_SNAPSHOT_ENABLED', 'true').lower() == 'true'
+        self.directory = directory or (os.getenv('STRATEGY_SNAPSHOT_DIR') or '').strip() or _default_dir()
+        try:
+            self.interval_sec = float(os.getenv('STRATEGY_SNAPSHOT_INTERVAL_SEC', '60'))
+        except Exception:
+            self.interval_sec = 60.0
+        try:
+            self.max_age_sec = float(os.getenv('STRATEGY_SNAPSHOT_MAX_AGE_SEC', '21600'))
+        except Exception:
+            self.max_age_sec = 21600.0
+        if self.interval_sec <= 0:
+            self.enabled = False
+        self._lock = threading.Lock()
+        self._saves = 0
+        self._loads = 0
+        self._rejected = 0
+
+    def path(self, strategy_id: int) -> str:
+        return os.path.join(self.directory, f"strategy_{int(strategy_id)}.npz")
+
+    def save(self, strategy_id: int, klines: KlineBatch, meta: Dict[str, Any]) -> bool:
+        """写入快照（meta 需可 JSON 序列化）"""
+        if not self.enabled:
+            return False
+        path = self.path(strategy_id)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            payload = dict(meta, version=SNAPSHOT_VERSION, strategy_id=int(strategy_id), saved_at=time.time())
+            arrays = {col: getattr(klines, col) for col in KLINE_COLUMNS}
+            with open(tmp, 'wb') as f:
+                np.savez_compressed(f, meta=np.array(json.dumps(payload, default=str)), **arrays)
+            os.replace(tmp, path)
+            with self._lock:
+                self._saves += 1
+            return True
+        except Exception as e:
+            logger.warning(f"Strategy {strategy_id} snapshot save failed: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False
+
+    def load(self, strategy_id: int) -> Optional[Dict[str, Any]]:
+        """读取快照：返回 meta 字典（另含 'klines': KlineBatch）；不存在、损坏或过期时返回 None"""
+        if not self.enabled:
+            return None
+        path = self.path(strategy_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                klines = KlineBatch(*[data[col] for col in KLINE_COLUMNS])
+        except Exception as e:
+            logger.warning(f"Strategy {strategy_id} snapshot unreadable, ignored: {e}")
+            self._reject()
+            return None
+        age = time.time() - float(meta.get('saved_at') or 0)
+        if meta.get('version') != SNAPSHOT_VERSION or int(meta.get('strategy_id') or 0) != int(strategy_id) \
+                or age > self.max_age_sec or len(klines) < 2:
+            self._reject()
+            return None
+        meta['klines'] = klines
+        with self._lock:
+            self._loads += 1
+        return meta
+
+    def delete(self, strategy_id: int) -> None:
+        try:
+            os.remove(self.path(strategy_id))
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'directory': self.directory,
+                'saves': self._saves,
+                'loads': self._loads,
+                'rejected': self._rejected,
+            }
+
+    def _reject(self) -> None:
+        with self._lock:
+            self._rejected += 1
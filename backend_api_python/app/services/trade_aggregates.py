@@ -0,0 +1,117 @@
+"""
+Incrementally maintained dashboard aggregates.
+
+Every recorded trade also updates (through the same write queue, right behind the trade insert):
+- qd_pnl_daily: realized pnl / win-loss counts per local day, per strategy and for all strategies (strategy_id 0);
+- qd_pnl_hourly: trade count and pnl per hour of day (all strategies);
+- qd_pnl_strategy: running totals plus drawdown state (cumulative pnl, peak, max drawdown) per strategy and overall.
+
+The updates are additive upserts evaluated by SQLite, so they are safe across processes. The tables are created
+and backfilled by schema migration 3; rebuild_aggregates() (scripts/rebuild_dashboard_aggregates.py) recomputes
+them from qd_strategy_trades, e.g. after editing trades by hand or changing the server time zone.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.db_write_queue import get_db_write_queue
+from app.utils.db import get_db_connection
+from app.utils.db_migrations import DASHBOARD_AGGREGATE_REBUILD
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_DAILY_SQL = """
+    INSERT INTO qd_pnl_daily (strategy_id, day, trades, wins, losses, gross_profit, gross_loss, pnl)
+    VALUES (%s, %s, 1, %s, %s, %s, %s, %s)
+    ON CONFLICT(strategy_id, day) DO UPDATE SET
+        trades = trades + 1,
+        wins = wins + excluded.wins,
+        losses = losses + excluded.losses,
+        gross_profit = gross_profit + excluded.gross_profit,
+        gross_loss = gross_loss + excluded.gross_loss,
+        pnl = pnl + excluded.pnl
+"""
+
+_HOURLY_SQL = """
+    INSERT INTO qd_pnl_hourly (hour, trades, pnl) VALUES (%s, 1, %s)
+    ON CONFLICT(hour) DO UPDATE SET trades = trades + 1, pnl = pnl + excluded.pnl
+"""
+
+# SET expressions see the row before the update, so "pnl + excluded.pnl" is the new cumulative pnl.
+_STRATEGY_SQL = """
+    INSERT INTO qd_pnl_strategy (strategy_id, trades, wins, losses, gross_profit, gross_loss, pnl,
+                                 max_win, max_loss, equity_peak, max_drawdown, updated_at)
+    VALUES (%s, 1, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT(strategy_id) DO UPDATE SET
+        trades = trades + 1,
+        wins = wins + excluded.wins,
+        losses = losses + excluded.losses,
+        gross_profit = gross_profit + excluded.gross_profit,
+        gross_loss = gross_loss + excluded.gross_loss,
+        pnl = pnl + excluded.pnl,
+        max_win = MAX(max_win, excluded.max_win),
+        max_loss = MIN(max_loss, excluded.max_loss),
+        equity_peak = MAX(equity_peak, pnl + excluded.pnl),
+        max_drawdown = MAX(max_drawdown, MAX(equity_peak, pnl + excluded.pnl) - (pnl + excluded.pnl)),
+        updated_at = excluded.updated_at
+"""
+
+
+def aggregate_statements(strategy_id: int, profit: Optional[float], created_at: int) -> List[Tuple[str, tuple]]:
+    """Upserts that fold one trade into the aggregate tables (same bucketing as DASHBOARD_AGGREGATE_REBUILD)."""
+    try:
+        p = float(profit or 0.0)
+    except Exception:
+        p = 0.0
+    sid = int(strategy_id or 0)
+    ts = int(created_at or 0)
+    win, loss = int(p > 0), int(p < 0)
+    gross_profit, gross_loss = (p if p > 0 else 0.0), (-p if p < 0 else 0.0)
+    scopes = [sid, 0] if sid > 0 else [0]
+
+    out: List[Tuple[str, tuple]] = []
+    if ts > 0:
+        lt = time.localtime(ts)
+        day = time.strftime("%Y-%m-%d", lt)
+        for scope in scopes:
+            out.append((_DAILY_SQL, (scope, day, win, loss, gross_profit, gross_loss, p)))
+        out.append((_HOURLY_SQL, (int(lt.tm_hour), p)))
+    now = int(time.time())
+    for scope in scopes:
+        # First trade of a scope: peak/drawdown start from 0 like the rebuild.
+        out.append((_STRATEGY_SQL, (scope, win, loss, gross_profit, gross_loss, p, p, p, max(0.0, p), max(0.0, -p), now)))
+    return out
+
+
+def record_trade_aggregates(strategy_id: int, profit: Optional[float], created_at: int) -> None:
+    """Queue the aggregate updates for a trade; call right after queueing the trade insert."""
+    try:
+        q = get_db_write_queue()
+        for sql, params in aggregate_statements(strategy_id, profit, created_at):
+            q.insert(sql, params)
+    except Exception as e:
+        logger.warning(f"dashboard aggregates update failed (run scripts/rebuild_dashboard_aggregates.py): {e}")
+
+
+def rebuild_aggregates() -> Dict[str, Any]:
+    """Recompute all aggregate tables from qd_strategy_trades in one write transaction."""
+    started = time.time()
+    get_db_write_queue().flush()
+    with get_db_connection() as db:
+        cur = db.cursor()
+        # Take the write lock up front so no trade lands between the reads and the commit.
+        cur.execute("BEGIN IMMEDIATE")
+        for sql in DASHBOARD_AGGREGATE_REBUILD:
+            cur.execute(sql)
+        db.commit()
+        counts = {}
+        for table in ("qd_pnl_daily", "qd_pnl_hourly", "qd_pnl_strategy"):
+            cur.execute(f"SELECT COUNT(*) AS n FROM {table}")
+            counts[table] = int((cur.fetchone() or {}).get("n") or 0)
+        cur.execute("SELECT trades FROM qd_pnl_strategy WHERE strategy_id = 0")
+        row = cur.fetchone() or {}
+        cur.close()
+    return {"trades": int(row.get("trades") or 0), "rows": counts, "seconds": round(time.time() - started, 3)}
@@ -9,7 +9,7 @@ try:
     import resource  # Linux/Unix only
 except Exception:
     resource = None
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Union
 from datetime import datetime
 import json
 from decimal import Decimal, ROUND_DOWN, ROUND_UP
@@ -19,8 +19,22 @@ import ccxt
 
 from app.utils.logger import get_logger
 from app.utils.db import get_db_connection
-from app.data_sources import DataSourceFactory
+from app.data_sources import DataSourceFactory, KlineBatch
 from app.services.kline import KlineService
+from app.services.strategy_scheduler import StrategyRuntime, StrategyScheduler
+from app.services.incremental_indicators import TailIndicators, get_indicator_functions
+from app.services.indicator_sandbox import DEFAULT_ALLOWED_MODULES as INDICATOR_ALLOWED_MODULES, get_indicator_sandbox
+from app.utils.code_cache import code_key, get_code_cache, get_safe_builtins
+from app.utils.thread_deadline import DeadlineExceeded, call_with_deadline
+from app.services.strategy_snapshot import StrategySnapshotStore
+from app.services.position_cache import get_position_cache
+from app.services.order_wakeup import notify_pending_order
+from app.services.db_write_queue import get_db_write_queue
+from app.services.trade_aggregates import record_trade_aggregates
+from app.services.trigger_index import (
+    DOWN, UP, KIND_REARM, KIND_SIGNAL, KIND_STOP_LOSS, KIND_TAKE_PROFIT, KIND_TRAILING_STOP,
+    TriggerIndex, TriggerLevel,
+)
 
 logger = get_logger(__name__)
 
@@ -30,7 +44,7 @@ class TradingExecutor:
     
     def __init__(self):
         # 不再使用全局连接，改为每次使用时从连接池获取
-        self.running_strategies = {}  # {strategy_id: thread}
+        self.running_strategies = {}  # {strategy_id: thread}（调度器模式下为 None）
         self.lock = threading.Lock()
         # Local-only lightweight in-memory price cache (symbol -> (price, expiry_ts)).
         # This replaces the old Redis-based PriceCache for local deployments.
@@ -47,6 +61,50 @@ class TradingExecutor:
         
         # 单实例线程上限，避免无限制创建线程导致 can't start new thread/OOM
         self.max_threads = int(os.getenv('STRATEGY_MAX_THREADS', '64'))
+
+        # 调度器模式（默认）：少量工作线程 + 时间轮统一驱动所有策略，按 symbol 合并取价；
+        # 关闭时回退为每个策略一个线程（受 STRATEGY_MAX_THREADS 限制）
+        # K线在每根K线收盘后 CANDLE_CLOSE_SETTLE_SEC 秒刷新（等待交易所完成收盘K线）
+        try:
+            self.candle_settle_sec = max(0.0, float(os.getenv('CANDLE_CLOSE_SETTLE_SEC', '2')))
+        except Exception:
+            self.candle_settle_sec = 2.0
+        # 策略初始化（拉取K线 + 首次计算指标）的并发上限：启动时批量恢复策略不会集中请求交易所
+        try:
+            self.warmup_concurrency = max(1, int(os.getenv('STRATEGY_WARMUP_CONCURRENCY', '4')))
+        except Exception:
+            self.warmup_concurrency = 4
+        self._warmup_sem = threading.BoundedSemaphore(self.warmup_concurrency)
+        # 策略状态快照：重启时从快照恢复，只补齐快照之后的K线
+        self.snapshots = StrategySnapshotStore()
+        self.scheduler: Optional[StrategyScheduler] = None
+        if os.getenv('STRATEGY_SCHEDULER_ENABLED', 'true').lower() == 'true':
+            try:
+                workers = int(os.getenv('STRATEGY_SCHEDULER_WORKERS', '8'))
+            except Exception:
+                workers = 8
+            self.scheduler = StrategyScheduler(
+                self, workers=workers, tick_interval_sec=self._tick_interval_sec(),
+                candle_settle_sec=self.candle_settle_sec, init_workers=self.warmup_concurrency,
+            )
+
+        # 增量指标计算：非K线更新 tick 只重算最后一根K线，定期与全量结果比对（0 关闭比对）
+        self.indicator_incremental = os.getenv('INDICATOR_INCREMENTAL_ENABLED', 'true').lower() == 'true'
+        try:
+            self.indicator_parity_check_ticks = int(os.getenv('INDICATOR_PARITY_CHECK_TICKS', '60'))
+        except Exception:
+            self.indicator_parity_check_ticks = 60
+        # 指标脚本执行超时：全量执行在沙箱进程池中强制（超时 kill worker），
+        # 本进程内的增量计算（TailIndicators / on_tick）由看门狗中断（见 thread_deadline）
+        try:
+            self.indicator_timeout_sec = float(os.getenv('INDICATOR_EXEC_TIMEOUT_SEC', '30'))
+        except Exception:
+            self.indicator_timeout_sec = 30.0
+
+        # 所有运行中策略的触发价位（待触发信号 + 服务端止盈止损），按 symbol 排序存放；
+        # 持仓读自内存缓存，成交 / 同步写库时失效
+        self.trigger_index = TriggerIndex()
+        self.position_cache = get_position_cache()
         
         # 确保数据库字段存在
         self._ensure_db_columns()
@@ -384,6 +442,17 @@ class TradingExecutor:
         """
         try:
             with self.lock:
+                if self.scheduler is not None:
+                    if strategy_id in self.running_strategies:
+                        logger.warning(f"Strategy {strategy_id} is already running")
+                        return False
+                    # 初始化（加载配置、拉取K线、首次计算指标）在调度器工作线程中进行
+                    self.running_strategies[strategy_id] = None
+                    self.scheduler.add(strategy_id)
+                    logger.info(f"Strategy {strategy_id} started")
+                    self._console_print(f"[strategy:{strategy_id}] started")
+                    return True
+
                 # 清理已退出的线程，防止计数膨胀
                 stale_ids = [sid for sid, th in self.running_strategies.items() if not th.is_alive()]
                 for sid in stale_ids:
@@ -450,8 +519,12 @@ class TradingExecutor:
                     db.commit()
                     cursor.close()
                 
-                # 从运行列表中移除（线程会在下次循环检查状态时退出）
+                # 从运行列表中移除（线程会在下次循环检查状态时退出；调度器模式下直接移出时间轮）
                 del self.running_strategies[strategy_id]
+                if self.scheduler is not None:
+                    self.scheduler.remove(strategy_id)
+                self.trigger_index.remove(strategy_id)
+                self.snapshots.delete(strategy_id)
                 
                 logger.info(f"Strategy {strategy_id} stopped")
                 self._console_print(f"[strategy:{strategy_id}] stopped (requested)")
@@ -464,7 +537,9 @@ class TradingExecutor:
     
     def _run_strategy_loop(self, strategy_id: int):
         """
-        策略运行循环
+        策略运行循环（线程模式，STRATEGY_SCHEDULER_ENABLED=false 时使用）
+
+        调度器模式下由 StrategyScheduler 统一驱动 _init_strategy_runtime / _strategy_tick。
         
         Args:
             strategy_id: 策略ID
@@ -473,205 +548,13 @@ class TradingExecutor:
         self._console_print(f"[strategy:{strategy_id}] loop initializing")
         
         try:
-            # 加载策略配置
-            strategy = self._load_strategy(strategy_id)
-            if not strategy:
-                logger.error(f"Strategy {strategy_id} not found")
-                return
-            
-            if strategy['strategy_type'] != 'IndicatorStrategy':
-                logger.error(f"Strategy {strategy_id} has unsupported strategy_type for realtime execution: {strategy['strategy_type']}")
-                return
-            
-            # 初始化策略状态
-            trading_config = strategy['trading_config']
-            indicator_config = strategy['indicator_config']
-            ai_model_config = strategy.get('ai_model_config') or {}
-            execution_mode = (strategy.get('execution_mode') or 'signal').strip().lower()
-            if execution_mode not in ['signal', 'live']:
-                execution_mode = 'signal'
-            notification_config = strategy.get('notification_config') or {}
-            strategy_name = strategy.get('strategy_name') or f"strategy_{int(strategy_id)}"
-            symbol = trading_config.get('symbol', '')
-            timeframe = trading_config.get('timeframe', '1H')
-            
-            # 安全获取 leverage 和 trade_direction
-            try:
-                leverage_val = trading_config.get('leverage', 1)
-                if isinstance(leverage_val, (list, tuple)):
-                    leverage_val = leverage_val[0] if leverage_val else 1
-                leverage = float(leverage_val)
-            except:
-                logger.warning(f"Strategy {strategy_id} invalid leverage format, reset to 1: {trading_config.get('leverage')}")
-                leverage = 1.0
-            
-            # 获取市场类型，默认为合约
-            # 根据杠杆自动判断：杠杆=1为现货，杠杆>1为合约
-            market_type = trading_config.get('market_type', 'swap')
-            if market_type not in ['swap', 'spot']:
-                logger.error(f"Strategy {strategy_id} invalid market_type={market_type} (only swap/spot supported); refusing to start")
-                return
-            
-            # 根据杠杆自动调整市场类型
-            if leverage == 1.0:
-                market_type = 'spot'  # 现货固定1倍杠杆
-                logger.info(f"Strategy {strategy_id} leverage=1; auto-switch market_type to spot")
-            else:
-                # 合约市场：统一使用 swap（永续），避免 futures/delivery 混淆导致持仓/下单查错市场
-                market_type = 'swap'
-                logger.info(f"Strategy {strategy_id} derivatives trading; normalize market_type to: {market_type}")
-            
-            # 根据市场类型限制杠杆
-            if market_type == 'spot':
-                leverage = 1.0  # 现货固定1倍杠杆
-            elif leverage < 1:
-                leverage = 1.0
-            elif leverage > 125:
-                leverage = 125.0
-                logger.warning(f"Strategy {strategy_id} leverage > 125; capped to 125")
-            
-            # 获取交易方向，现货只能做多
-            trade_direction = trading_config.get('trade_direction', 'long')
-            if market_type == 'spot':
-                trade_direction = 'long'  # 现货只能做多
-                logger.info(f"Strategy {strategy_id} spot trading; force trade_direction=long")
-
-            # 初始化交易所连接（信号模式下无需真实连接）
-            exchange = None
-            
-            # 安全获取 initial_capital
-            try:
-                initial_capital_val = strategy.get('initial_capital', 1000)
-                if isinstance(initial_capital_val, (list, tuple)):
-                    initial_capital_val = initial_capital_val[0] if initial_capital_val else 1000
-                initial_capital = float(initial_capital_val)
-            except:
-                logger.warning(f"Strategy {strategy_id} invalid initial_capital format, reset to 1000: {strategy.get('initial_capital')}")
-                initial_capital = 1000.0
-            
-            # 净值会在首次更新持仓时自动计算和更新
-            
-            # 获取指标代码
-            indicator_id = indicator_config.get('indicator_id')
-            indicator_code = indicator_config.get('indicator_code', '')
-            
-            # 如果代码为空，尝试从数据库获取
-            if not indicator_code and indicator_id:
-                indicator_code = self._get_indicator_code_from_db(indicator_id)
-            
-            if not indicator_code:
-                logger.error(f"Strategy {strategy_id} indicator_code is empty")
-                return
-            
-            # 确保 indicator_code 是字符串（处理 JSON 转义问题）
-            if not isinstance(indicator_code, str):
-                indicator_code = str(indicator_code)
-            
-            # 处理可能的 JSON 转义问题
-            if '\\n' in indicator_code and '\n' not in indicator_code:
-                try:
-                    import json
-                    decoded = json.loads(f'"{indicator_code}"')
-                    if isinstance(decoded, str):
-                        indicator_code = decoded
-                        logger.info(f"Strategy {strategy_id} decoded escaped indicator_code")
-                except Exception as e:
-                    logger.warning(f"Strategy {strategy_id} JSON decode failed; falling back to manual unescape: {str(e)}")
-                    indicator_code = (
-                        indicator_code
-                        .replace('\\n', '\n')
-                        .replace('\\t', '\t')
-                        .replace('\\r', '\r')
-                        .replace('\\"', '"')
-                        .replace("\\'", "'")
-                        .replace('\\\\', '\\')
-                    )
-            
-            # ============================================
-            # 初始化阶段：获取历史K线并计算指标
-            # ============================================
-            # logger.info(f"策略 {strategy_id} 初始化：获取历史K线数据...")
-            klines = self._fetch_latest_kline(symbol, timeframe, limit=500)
-            if not klines or len(klines) < 2:
-                logger.error(f"Strategy {strategy_id} failed to fetch K-lines")
-                return
-            
-            # 转换为DataFrame
-            df = self._klines_to_dataframe(klines)
-            if len(df) == 0:
-                logger.error(f"Strategy {strategy_id} K-lines are empty after normalization")
-                return
-
-            # ============================================
-            # 启动时：完全依赖本地数据库的持仓状态（虚拟持仓）
-            # ============================================
-            # 信号模式下，不再同步交易所持仓
-            pass
-
-            # 获取当前持仓最高价（从本地数据库读取）
-            current_pos_list = self._get_current_positions(strategy_id, symbol)
-            initial_highest = 0.0
-            initial_position = 0  # 0=无持仓, 1=多头, -1=空头
-            initial_avg_entry_price = 0.0
-            initial_position_count = 0
-            initial_last_add_price = 0.0
-            
-            if current_pos_list:
-                pos = current_pos_list[0]  # 取第一个持仓（单向持仓模式）
-                initial_highest = float(pos.get('highest_price', 0) or 0)
-                pos_side = pos.get('side', 'long')
-                initial_position = 1 if pos_side == 'long' else -1
-                initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
-                initial_position_count = 1  # 简化处理，假设是单笔持仓
-                initial_last_add_price = initial_avg_entry_price
-
-            # 关键诊断日志：确认指标是否拿到了持仓状态
-            logger.info(
-                f"策略 {strategy_id} 指标注入持仓状态: count={len(current_pos_list)}, "
-                f"position={initial_position}, entry_price={initial_avg_entry_price}, highest={initial_highest}"
-            )
-
-            # 执行指标代码，获取信号和触发价格
-            indicator_result = self._execute_indicator_with_prices(
-                indicator_code, df, trading_config, 
-                initial_highest_price=initial_highest,
-                initial_position=initial_position,
-                initial_avg_entry_price=initial_avg_entry_price,
-                initial_position_count=initial_position_count,
-                initial_last_add_price=initial_last_add_price
-            )
-            if indicator_result is None:
-                logger.error(f"Strategy {strategy_id} indicator execution failed")
+            with self._warmup_sem:
+                rt = self._init_strategy_runtime(strategy_id)
+            if rt is None:
                 return
-            
-            # 提取信号和触发价格
-            pending_signals = indicator_result.get('pending_signals', [])  # 待触发的信号列表
-            last_kline_time = indicator_result.get('last_kline_time', 0)  # 最后一根K线的时间
-            
-            logger.info(f"Strategy {strategy_id} initialized; pending_signals={len(pending_signals)}")
-            if pending_signals:
-                logger.info(f"Initial signals: {pending_signals}")
-            
-            # ============================================
-            # Main loop: unified tick cadence (default: 10s)
-            # ============================================
-            # One tick = fetch current price once + evaluate triggers once + (if needed) refresh K-lines / recalc indicator.
-            # Note: `pending_orders` scanning stays at 1s (see PendingOrderWorker) to reduce live dispatch latency.
-            try:
-                # Global-only (no per-strategy override)
-                tick_interval_sec = int(os.getenv('STRATEGY_TICK_INTERVAL_SEC', '10'))
-            except Exception:
-                tick_interval_sec = 10
-            if tick_interval_sec < 1:
-                tick_interval_sec = 1
 
             last_tick_time = 0.0
-            last_kline_update_time = time.time()
-            
-            # 计算K线周期（秒）
-            from app.data_sources.base import TIMEFRAME_SECONDS
-            timeframe_seconds = TIMEFRAME_SECONDS.get(timeframe, 3600)
-            kline_update_interval = timeframe_seconds  # 每个K线周期更新一次
+            tick_interval_sec = self._tick_interval_sec()
             
             while True:
                 try:
@@ -690,290 +573,13 @@ class TradingExecutor:
                             continue
                     last_tick_time = current_time
 
-                    # ============================================
-                    # 0. 虚拟持仓模式，无需同步交易所
-                    # ============================================
-                    # pass
-                    
-                    # ============================================
-                    # 1. Fetch current price once per tick
-                    # ============================================
-                    current_price = self._fetch_current_price(exchange, symbol, market_type=market_type)
+                    # Fetch current price once per tick
+                    current_price = self._fetch_current_price(rt.exchange, rt.symbol, market_type=rt.market_type)
                     if current_price is None:
                         logger.warning(f"Strategy {strategy_id} failed to fetch current price")
                         continue
 
-                    # ============================================
-                    # 2. 检查是否需要更新K线（每个K线周期更新一次，从API拉取）
-                    # ============================================
-                    if current_time - last_kline_update_time >= kline_update_interval:
-                        klines = self._fetch_latest_kline(symbol, timeframe, limit=500)
-                        if klines and len(klines) >= 2:
-                            df = self._klines_to_dataframe(klines)
-                            if len(df) > 0:
-                                current_pos_list = self._get_current_positions(strategy_id, symbol)
-                                initial_highest = 0.0
-                                initial_position = 0
-                                initial_avg_entry_price = 0.0
-                                initial_position_count = 0
-                                initial_last_add_price = 0.0
-
-                                if current_pos_list:
-                                    pos = current_pos_list[0]
-                                    initial_highest = float(pos.get('highest_price', 0) or 0)
-                                    pos_side = pos.get('side', 'long')
-                                    initial_position = 1 if pos_side == 'long' else -1
-                                    initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
-                                    initial_position_count = 1
-                                    initial_last_add_price = initial_avg_entry_price
-
-                                indicator_result = self._execute_indicator_with_prices(
-                                    indicator_code, df, trading_config,
-                                    initial_highest_price=initial_highest,
-                                    initial_position=initial_position,
-                                    initial_avg_entry_price=initial_avg_entry_price,
-                                    initial_position_count=initial_position_count,
-                                    initial_last_add_price=initial_last_add_price
-                                )
-                                if indicator_result:
-                                    pending_signals = indicator_result.get('pending_signals', [])
-                                    last_kline_time = indicator_result.get('last_kline_time', 0)
-                                    new_hp = indicator_result.get('new_highest_price', 0)
-
-                                    last_kline_update_time = current_time
-
-                                    # 更新 highest_price（使用最新 close 作为 current_price 的近似）
-                                    if new_hp > 0 and current_pos_list:
-                                        current_close = float(df['close'].iloc[-1])
-                                        for p in current_pos_list:
-                                            self._update_position(
-                                                strategy_id, p['symbol'], p['side'],
-                                                float(p['size']), float(p['entry_price']),
-                                                current_close,
-                                                highest_price=new_hp
-                                            )
-                    else:
-                        # ============================================
-                        # 3. 非K线更新tick：用当前价更新最后一根K线并重算指标（统一tick节奏）
-                        # ============================================
-                        if 'df' in locals() and df is not None and len(df) > 0:
-                            try:
-                                realtime_df = df.copy()
-                                realtime_df = self._update_dataframe_with_current_price(realtime_df, current_price, timeframe)
-
-                                current_pos_list = self._get_current_positions(strategy_id, symbol)
-                                initial_highest = 0.0
-                                initial_position = 0
-                                initial_avg_entry_price = 0.0
-                                initial_position_count = 0
-                                initial_last_add_price = 0.0
-
-                                if current_pos_list:
-                                    pos = current_pos_list[0]
-                                    initial_highest = float(pos.get('highest_price', 0) or 0)
-                                    pos_side = pos.get('side', 'long')
-                                    initial_position = 1 if pos_side == 'long' else -1
-                                    initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
-                                    initial_position_count = 1
-                                    initial_last_add_price = initial_avg_entry_price
-
-                                indicator_result = self._execute_indicator_with_prices(
-                                    indicator_code, realtime_df, trading_config,
-                                    initial_highest_price=initial_highest,
-                                    initial_position=initial_position,
-                                    initial_avg_entry_price=initial_avg_entry_price,
-                                    initial_position_count=initial_position_count,
-                                    initial_last_add_price=initial_last_add_price
-                                )
-                                if indicator_result:
-                                    pending_signals = indicator_result.get('pending_signals', [])
-                                    new_hp = indicator_result.get('new_highest_price', 0)
-
-                                    if new_hp > 0 and current_pos_list:
-                                        for p in current_pos_list:
-                                            self._update_position(
-                                                strategy_id, p['symbol'], p['side'],
-                                                float(p['size']), float(p['entry_price']),
-                                                current_price,
-                                                highest_price=new_hp
-                                            )
-                            except Exception as e:
-                                logger.warning(f"Strategy {strategy_id} realtime indicator recompute failed: {str(e)}")
-                    
-                    # ============================================
-                    # 4. Evaluate triggers once per tick
-                    # ============================================
-                    # 优化点4: 信号有效期清理 (Signal Expiration)
-                    current_ts = int(time.time())
-                    if pending_signals:
-                        expiration_threshold = timeframe_seconds * 2
-                        valid_signals = []
-                        for s in pending_signals:
-                            signal_time = s.get('timestamp', 0)
-                            if signal_time == 0 or (current_ts - signal_time) < expiration_threshold:
-                                valid_signals.append(s)
-                            else:
-                                logger.warning(f"Signal expired and removed: {s}")
-                        if len(valid_signals) != len(pending_signals):
-                            pending_signals = valid_signals
-
-                    # Unified cadence log: at most once per tick.
-                    if pending_signals:
-                        logger.info(f"[monitoring] strategy={strategy_id} price={current_price}, pending_signals={len(pending_signals)}")
-
-                    # 检查是否有待触发的信号
-                    triggered_signals = []
-                    signals_to_remove = []
-                        
-                    for signal_info in pending_signals:
-                        signal_type = signal_info.get('type')  # 'open_long', 'close_long', 'open_short', 'close_short'
-                        trigger_price = signal_info.get('trigger_price', 0)
-                        
-                        # 检查价格是否触发
-                        triggered = False
-
-                        # 【关键修复】平仓/止损止盈信号默认“立即触发”
-                        exit_trigger_mode = trading_config.get('exit_trigger_mode', 'immediate')  # 'immediate' or 'price'
-                        if signal_type in ['close_long', 'close_short'] and exit_trigger_mode == 'immediate':
-                            triggered = True
-                        
-                        # 【可选】开仓/加仓信号是否“立即触发”
-                        entry_trigger_mode = trading_config.get('entry_trigger_mode', 'price')  # 'price' or 'immediate'
-                        if signal_type in ['open_long', 'open_short', 'add_long', 'add_short'] and entry_trigger_mode == 'immediate':
-                            triggered = True
-
-                        if trigger_price > 0:
-                            if signal_type in ['open_long', 'close_short', 'add_long']:
-                                if current_price >= trigger_price:
-                                    triggered = True
-                            elif signal_type in ['open_short', 'close_long', 'add_short']:
-                                if current_price <= trigger_price:
-                                    triggered = True
-                        else:
-                            triggered = True
-                        
-                        if triggered:
-                            triggered_signals.append(signal_info)
-                            signals_to_remove.append(signal_info)
-
-                    # ============================================
-                    # 4.1 Server-side exits (config-driven): SL / TP / trailing
-                    # ============================================
-                    # Note: stop-loss is only applied when stop_loss_pct > 0. No default fallback.
-                    risk_tp = self._server_side_take_profit_or_trailing_signal(
-                        strategy_id=strategy_id,
-                        symbol=symbol,
-                        current_price=float(current_price),
-                        market_type=market_type,
-                        leverage=float(leverage),
-                        trading_config=trading_config,
-                        timeframe_seconds=int(timeframe_seconds or 60),
-                    )
-                    if risk_tp:
-                        triggered_signals.append(risk_tp)
-
-                    risk_sl = self._server_side_stop_loss_signal(
-                        strategy_id=strategy_id,
-                        symbol=symbol,
-                        current_price=float(current_price),
-                        market_type=market_type,
-                        leverage=float(leverage),
-                        trading_config=trading_config,
-                        timeframe_seconds=int(timeframe_seconds or 60),
-                    )
-                    if risk_sl:
-                        triggered_signals.append(risk_sl)
-                        
-                    # 从待触发列表中移除已触发的信号
-                    for signal_info in signals_to_remove:
-                        if signal_info in pending_signals:
-                            pending_signals.remove(signal_info)
-                        
-                    # 执行触发的信号
-                    if triggered_signals:
-                        logger.info(f"Strategy {strategy_id} triggered signals: {triggered_signals}")
-
-                        current_positions = self._get_current_positions(strategy_id, symbol)
-                        state = self._position_state(current_positions)
-
-                        # Strict state machine + priority:
-                        # - Only allow signals matching current state (flat/long/short).
-                        # - Always prefer close_* over open_*/add_*.
-                        # - Execute at most ONE signal per tick to avoid duplicated/re-entrant orders.
-                        candidates = [s for s in triggered_signals if self._is_signal_allowed(state, s.get('type'))]
-
-                        # If both directions are present while flat, choose by trade_direction (deterministic).
-                        if state == "flat" and candidates:
-                            td = (trade_direction or "both").strip().lower()
-                            if td == "long":
-                                candidates = [s for s in candidates if s.get("type") == "open_long"]
-                            elif td == "short":
-                                candidates = [s for s in candidates if s.get("type") == "open_short"]
-
-                        candidates = sorted(
-                            candidates,
-                            key=lambda s: (
-                                self._signal_priority(s.get("type")),
-                                int(s.get("timestamp") or 0),
-                                str(s.get("type") or ""),
-                            ),
-                        )
-
-                        selected = None
-                        now_i = int(time.time())
-                        for s in candidates:
-                            stype = s.get("type")
-                            sts = int(s.get("timestamp") or 0)
-                            if self._should_skip_signal_once_per_candle(
-                                strategy_id=strategy_id,
-                                symbol=symbol,
-                                signal_type=str(stype or ""),
-                                signal_ts=sts,
-                                timeframe_seconds=int(timeframe_seconds or 60),
-                                now_ts=now_i,
-                            ):
-                                continue
-                            selected = s
-                            break
-
-                        if selected:
-                            signal_type = selected.get('type')
-                            position_size = selected.get('position_size', 0)
-                            trigger_price = selected.get('trigger_price', current_price)
-                            execute_price = trigger_price if trigger_price > 0 else current_price
-                            signal_ts = int(selected.get("timestamp") or 0)
-
-                            ok = self._execute_signal(
-                                strategy_id=strategy_id,
-                                strategy_name=strategy_name,
-                                exchange=exchange,
-                                symbol=symbol,
-                                current_price=execute_price,
-                                signal_type=signal_type,
-                                position_size=position_size,
-                                signal_ts=signal_ts,
-                                current_positions=current_positions,
-                                trade_direction=trade_direction,
-                                leverage=leverage,
-                                initial_capital=initial_capital,
-                                market_type=market_type,
-                                execution_mode=execution_mode,
-                                notification_config=notification_config,
-                                trading_config=trading_config,
-                                ai_model_config=ai_model_config,
-                            )
-                            if ok:
-                                logger.info(f"Strategy {strategy_id} signal executed: {signal_type} @ {execute_price}")
-                            else:
-                                logger.warning(f"Strategy {strategy_id} signal rejected/failed: {signal_type}")
-
-                    # Update positions once per tick.
-                    self._update_positions(strategy_id, symbol, current_price)
-
-                    # Heartbeat for UI observability (once per tick).
-                    self._console_print(
-                        f"[strategy:{strategy_id}] tick price={float(current_price or 0.0):.8f} pending_signals={len(pending_signals or [])}"
-                    )
+                    self._strategy_tick(rt, current_price, current_time)
                     
                 except Exception as e:
                     logger.error(f"Strategy {strategy_id} loop error: {str(e)}")
@@ -986,12 +592,693 @@ class TradingExecutor:
             logger.error(traceback.format_exc())
             self._console_print(f"[strategy:{strategy_id}] fatal error: {e}")
         finally:
-            # 清理
-            with self.lock:
-                if strategy_id in self.running_strategies:
-                    del self.running_strategies[strategy_id]
-            self._console_print(f"[strategy:{strategy_id}] loop exited")
-            logger.info(f"Strategy {strategy_id} loop exited")
+            self._on_strategy_exit(strategy_id)
+
+    def _on_strategy_exit(self, strategy_id: int) -> None:
+        """策略退出后的清理（线程模式与调度器模式共用）"""
+        with self.lock:
+            if strategy_id in self.running_strategies:
+                del self.running_strategies[strategy_id]
+        self.trigger_index.remove(strategy_id)
+        self.snapshots.delete(strategy_id)
+        self._console_print(f"[strategy:{strategy_id}] loop exited")
+        logger.info(f"Strategy {strategy_id} loop exited")
+
+    def get_scheduler_stats(self) -> Optional[Dict[str, Any]]:
+        return self.scheduler.stats() if self.scheduler is not None else None
+
+    def _tick_interval_sec(self) -> int:
+        """Main loop: unified tick cadence (default: 10s)"""
+        # One tick = fetch current price once + evaluate triggers once + (if needed) refresh K-lines / recalc indicator.
+        # Note: `pending_orders` scanning stays at 1s (see PendingOrderWorker) to reduce live dispatch latency.
+        try:
+            # Global-only (no per-strategy override)
+            tick_interval_sec = int(os.getenv('STRATEGY_TICK_INTERVAL_SEC', '10'))
+        except Exception:
+            tick_interval_sec = 10
+        return max(1, tick_interval_sec)
+
+    def _init_strategy_runtime(self, strategy_id: int) -> Optional[StrategyRuntime]:
+        """
+        加载策略配置、拉取历史K线并首次计算指标。
+
+        Returns:
+            StrategyRuntime；配置无效或初始化失败时返回 None（原因已记录日志）
+        """
+        # 加载策略配置
+        strategy = self._load_strategy(strategy_id)
+        if not strategy:
+            logger.error(f"Strategy {strategy_id} not found")
+            return None
+        
+        if strategy['strategy_type'] != 'IndicatorStrategy':
+            logger.error(f"Strategy {strategy_id} has unsupported strategy_type for realtime execution: {strategy['strategy_type']}")
+            return None
+        
+        # 初始化策略状态
+        trading_config = strategy['trading_config']
+        indicator_config = strategy['indicator_config']
+        ai_model_config = strategy.get('ai_model_config') or {}
+        execution_mode = (strategy.get('execution_mode') or 'signal').strip().lower()
+        if execution_mode not in ['signal', 'live']:
+            execution_mode = 'signal'
+        notification_config = strategy.get('notification_config') or {}
+        strategy_name = strategy.get('strategy_name') or f"strategy_{int(strategy_id)}"
+        symbol = trading_config.get('symbol', '')
+        timeframe = trading_config.get('timeframe', '1H')
+        
+        # 安全获取 leverage 和 trade_direction
+        try:
+            leverage_val = trading_config.get('leverage', 1)
+            if isinstance(leverage_val, (list, tuple)):
+                leverage_val = leverage_val[0] if leverage_val else 1
+            leverage = float(leverage_val)
+        except:
+            logger.warning(f"Strategy {strategy_id} invalid leverage format, reset to 1: {trading_config.get('leverage')}")
+            leverage = 1.0
+        
+        # 获取市场类型，默认为合约
+        # 根据杠杆自动判断：杠杆=1为现货，杠杆>1为合约
+        market_type = trading_config.get('market_type', 'swap')
+        if market_type not in ['swap', 'spot']:
+            logger.error(f"Strategy {strategy_id} invalid market_type={market_type} (only swap/spot supported); refusing to start")
+            return None
+        
+        # 根据杠杆自动调整市场类型
+        if leverage == 1.0:
+            market_type = 'spot'  # 现货固定1倍杠杆
+            logger.info(f"Strategy {strategy_id} leverage=1; auto-switch market_type to spot")
+        else:
+            # 合约市场：统一使用 swap（永续），避免 futures/delivery 混淆导致持仓/下单查错市场
+            market_type = 'swap'
+            logger.info(f"Strategy {strategy_id} derivatives trading; normalize market_type to: {market_type}")
+        
+        # 根据市场类型限制杠杆
+        if market_type == 'spot':
+            leverage = 1.0  # 现货固定1倍杠杆
+        elif leverage < 1:
+            leverage = 1.0
+        elif leverage > 125:
+            leverage = 125.0
+            logger.warning(f"Strategy {strategy_id} leverage > 125; capped to 125")
+        
+        # 获取交易方向，现货只能做多
+        trade_direction = trading_config.get('trade_direction', 'long')
+        if market_type == 'spot':
+            trade_direction = 'long'  # 现货只能做多
+            logger.info(f"Strategy {strategy_id} spot trading; force trade_direction=long")
+
+        # 安全获取 initial_capital
+        try:
+            initial_capital_val = strategy.get('initial_capital', 1000)
+            if isinstance(initial_capital_val, (list, tuple)):
+                initial_capital_val = initial_capital_val[0] if initial_capital_val else 1000
+            initial_capital = float(initial_capital_val)
+        except:
+            logger.warning(f"Strategy {strategy_id} invalid initial_capital format, reset to 1000: {strategy.get('initial_capital')}")
+            initial_capital = 1000.0
+        
+        # 净值会在首次更新持仓时自动计算和更新
+        
+        # 获取指标代码
+        indicator_id = indicator_config.get('indicator_id')
+        indicator_code = indicator_config.get('indicator_code', '')
+        
+        # 如果代码为空，尝试从数据库获取
+        if not indicator_code and indicator_id:
+            indicator_code = self._get_indicator_code_from_db(indicator_id)
+        
+        if not indicator_code:
+            logger.error(f"Strategy {strategy_id} indicator_code is empty")
+            return None
+        
+        # 确保 indicator_code 是字符串（处理 JSON 转义问题）
+        if not isinstance(indicator_code, str):
+            indicator_code = str(indicator_code)
+        
+        # 处理可能的 JSON 转义问题
+        if '\\n' in indicator_code and '\n' not in indicator_code:
+            try:
+                decoded = json.loads(f'"{indicator_code}"')
+                if isinstance(decoded, str):
+                    indicator_code = decoded
+                    logger.info(f"Strategy {strategy_id} decoded escaped indicator_code")
+            except Exception as e:
+                logger.warning(f"Strategy {strategy_id} JSON decode failed; falling back to manual unescape: {str(e)}")
+                indicator_code = (
+                    indicator_code
+                    .replace('\\n', '\n')
+                    .replace('\\t', '\t')
+                    .replace('\\r', '\r')
+                    .replace('\\"', '"')
+                    .replace("\\'", "'")
+                    .replace('\\\\', '\\')
+                )
+        
+        # ============================================
+        # 初始化阶段：获取历史K线并计算指标
+        # ============================================
+        # 优先从快照恢复（只向上游补齐快照之后的几根K线），快照缺失/过期/校验失败时全量拉取
+        state_key = self._snapshot_state_key(indicator_code, trading_config)
+        snapshot = self.snapshots.load(strategy_id)
+        klines = self._restore_klines_from_snapshot(strategy_id, snapshot, symbol, timeframe) if snapshot else None
+        if klines is None:
+            snapshot = None
+            klines = self._fetch_latest_kline(symbol, timeframe, limit=500)
+        if not klines or len(klines) < 2:
+            logger.error(f"Strategy {strategy_id} failed to fetch K-lines")
+            return None
+        
+        # 转换为DataFrame
+        df = self._klines_to_dataframe(klines)
+        if len(df) == 0:
+            logger.error(f"Strategy {strategy_id} K-lines are empty after normalization")
+            return None
+
+        # 启动时：完全依赖本地数据库的持仓状态（虚拟持仓），信号模式下不再同步交易所持仓
+        current_pos_list, position_inputs = self._indicator_position_inputs(strategy_id, symbol)
+        position_key = self._snapshot_position_key(current_pos_list)
+
+        if snapshot is not None:
+            with self._signal_dedup_lock:
+                now = time.time()
+                bucket = self._signal_dedup.setdefault(int(strategy_id), {})
+                for k, exp in (snapshot.get('dedup') or {}).items():
+                    if float(exp) > now:
+                        bucket.setdefault(str(k), float(exp))
+            # 快照之后没有新K线收盘、且代码/配置/持仓未变化：直接沿用快照中的信号，跳过首次指标计算
+            if (
+                snapshot.get('state_key') == state_key
+                and snapshot.get('position_key') == position_key
+                and int(snapshot['klines'].time[-1]) == int(klines.time[-1])
+            ):
+                rt = self._build_runtime(
+                    strategy_id, strategy_name, symbol, timeframe, market_type, leverage, trade_direction,
+                    initial_capital, indicator_code, trading_config, ai_model_config, execution_mode,
+                    notification_config, df, list(snapshot.get('pending_signals') or []),
+                    int(snapshot.get('last_kline_time') or 0), None,
+                )
+                rt.last_kline_update_time = float(snapshot.get('last_kline_update_time') or time.time())
+                rt.snapshot_key = state_key
+                self._sync_trigger_levels(rt, current_pos_list)
+                logger.info(f"Strategy {strategy_id} restored from snapshot; pending_signals={len(rt.pending_signals)}")
+                return rt
+
+        # 关键诊断日志：确认指标是否拿到了持仓状态
+        logger.info(
+            f"策略 {strategy_id} 指标注入持仓状态: count={len(current_pos_list)}, "
+            f"position={position_inputs['initial_position']}, "
+            f"entry_price={position_inputs['initial_avg_entry_price']}, "
+            f"highest={position_inputs['initial_highest_price']}"
+        )
+
+        # 执行指标代码，获取信号和触发价格（首次全量执行走沙箱，确认脚本能在超时/内存上限内完成）
+        indicator_result = self._execute_indicator_with_prices(indicator_code, df, trading_config, **position_inputs)
+        if indicator_result is None:
+            logger.error(f"Strategy {strategy_id} indicator execution failed")
+            return None
+        indicator_env = indicator_result.pop('exec_env', None)
+        
+        # 提取信号和触发价格
+        pending_signals = indicator_result.get('pending_signals', [])  # 待触发的信号列表
+        
+        logger.info(f"Strategy {strategy_id} initialized; pending_signals={len(pending_signals)}")
+        if pending_signals:
+            logger.info(f"Initial signals: {pending_signals}")
+
+        rt = self._build_runtime(
+            strategy_id, strategy_name, symbol, timeframe, market_type, leverage, trade_direction,
+            initial_capital, indicator_code, trading_config, ai_model_config, execution_mode,
+            notification_config, df, pending_signals,
+            indicator_result.get('last_kline_time', 0),  # 最后一根K线的时间
+            indicator_env,
+        )
+        rt.snapshot_key = state_key
+        self._sync_trigger_levels(rt, current_pos_list)
+        return rt
+
+    def _build_runtime(
+        self, strategy_id, strategy_name, symbol, timeframe, market_type, leverage, trade_direction,
+        initial_capital, indicator_code, trading_config, ai_model_config, execution_mode,
+        notification_config, df, pending_signals, last_kline_time, indicator_env,
+    ) -> StrategyRuntime:
+        # 计算K线周期（秒）
+        from app.data_sources.base import TIMEFRAME_SECONDS
+        timeframe_seconds = TIMEFRAME_SECONDS.get(timeframe, 3600)
+
+        rt = StrategyRuntime(
+            strategy_id=strategy_id,
+            strategy_name=strategy_name,
+            symbol=symbol,
+            timeframe=timeframe,
+            timeframe_seconds=timeframe_seconds,
+            market_type=market_type,
+            leverage=leverage,
+            trade_direction=trade_direction,
+            initial_capital=initial_capital,
+            indicator_code=indicator_code,
+            trading_config=trading_config,
+            ai_model_config=ai_model_config,
+            execution_mode=execution_mode,
+            notification_config=notification_config,
+            df=df,
+            pending_signals=pending_signals,
+            last_kline_time=last_kline_time,
+        )
+        rt.incremental = self.indicator_incremental
+        rt.indicator_env = indicator_env
+        rt.kline_settle_sec = self.candle_settle_sec
+        return rt
+
+    # ---- 状态快照（快速重启） ----
+
+    @staticmethod
+    def _snapshot_state_key(indicator_code: str, trading_config: Dict[str, Any]) -> str:
+        return code_key(f"{indicator_code}\n{json.dumps(trading_config or {}, sort_keys=True, default=str)}")
+
+    @staticmethod
+    def _snapshot_position_key(positions: List[Dict[str, Any]]) -> list:
+        return sorted(
+            [str(p.get('side')), round(float(p.get('size') or 0), 10), round(float(p.get('entry_price') or 0), 10)]
+            for p in positions or []
+        )
+
+    def _restore_klines_from_snapshot(
+        self, strategy_id: int, snapshot: Dict[str, Any], symbol: str, timeframe: str, limit: int = 500
+    ) -> Optional[KlineBatch]:
+        """
+        快照中的K线 + 向上游拉取快照之后的几根K线（与快照重叠的已收盘K线用于校验）。
+        快照品种/周期不符、缺口过大或重叠K线不一致时返回 None（回退全量拉取）。
+        """
+        from app.data_sources.base import TIMEFRAME_SECONDS
+        tf = TIMEFRAME_SECONDS.get(timeframe)
+        cached = snapshot.get('klines')
+        if not tf or snapshot.get('symbol') != symbol or snapshot.get('timeframe') != timeframe or not cached:
+            return None
+        last = int(cached.time[-1])
+        gap = int((time.time() - last) // tf) + 2
+        if gap >= limit // 2:
+            return None
+        tail = self._fetch_latest_kline(symbol, timeframe, limit=gap, refresh=True)
+        if not tail or int(tail.time[0]) > last:
+            return None
+
+        # 校验：快照中已收盘的重叠K线必须与上游一致（最后一根快照K线可能未收盘，不参与校验）
+        overlap = np.isin(tail.time, cached.time[:-1])
+        if not overlap.any():
+            return None
+        mine = cached.take(np.isin(cached.time, tail.time[overlap]))
+        theirs = tail.take(overlap)
+        for col in ('open', 'close'):
+            if not np.allclose(getattr(mine, col), getattr(theirs, col), rtol=1e-6, atol=0.0):
+                logger.info(f"Strategy {strategy_id} snapshot K-lines diverge from upstream; cold start")
+                return None
+
+        merged = KlineBatch.concat([cached.before(int(tail.time[0])), tail])[-limit:]
+        self.kline_service.seed_latest('Crypto', symbol, timeframe, merged)
+        return merged
+
+    def _maybe_snapshot(self, rt: StrategyRuntime, now: float) -> None:
+        """每 STRATEGY_SNAPSHOT_INTERVAL_SEC 秒保存一次策略状态"""
+        store = self.snapshots
+        if not store.enabled or now - rt.snapshot_at < store.interval_sec:
+            return
+        rt.snapshot_at = now
+        df = rt.df
+        if df is None or len(df) < 2 or rt.snapshot_key is None:
+            return
+        try:
+            times = np.asarray((df.index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1), dtype=np.int64)
+            klines = KlineBatch(times, *[df[col].to_numpy(dtype=np.float64) for col in ('open', 'high', 'low', 'close', 'volume')])
+            with self._signal_dedup_lock:
+                dedup = dict(self._signal_dedup.get(int(rt.strategy_id)) or {})
+            store.save(rt.strategy_id, klines, {
+                'symbol': rt.symbol,
+                'timeframe': rt.timeframe,
+                'state_key': rt.snapshot_key,
+                'position_key': self._snapshot_position_key(self._get_current_positions(rt.strategy_id, rt.symbol)),
+                'pending_signals': rt.pending_signals or [],
+                'last_kline_time': int(rt.last_kline_time or 0),
+                'last_kline_update_time': float(rt.last_kline_update_time or 0),
+                'dedup': dedup,
+            })
+        except Exception as e:
+            logger.warning(f"Strategy {rt.strategy_id} snapshot failed: {e}")
+
+    def _evaluate_realtime(
+        self, rt: StrategyRuntime, current_price: float, position_inputs: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        非K线更新 tick 的指标计算（增量模式）。
+
+        1. 脚本定义了 on_tick(df, bar) 时：只把当前价写入上次执行结果的最后一根K线，调用 on_tick
+           让脚本更新最后一行的输出列（可原地修改或返回新的 df），不再执行整段脚本；
+        2. 否则按原方式在K线副本上执行整段脚本，但内置指标（SMA/EMA/RSI/MACD/BOLL/ATR/HAMA）
+           由策略持有的 TailIndicators 只重算最后一根K线；
+        3. 每 INDICATOR_PARITY_CHECK_TICKS 次增量计算做一次全量重算比对，结果不一致时该策略退回全量模式。
+
+        1、2 在本进程内执行，超过 INDICATOR_EXEC_TIMEOUT_SEC 时被看门狗中断，该策略同样退回全量模式
+        （之后每个 tick 都走沙箱进程池）。
+        """
+        result = None
+        env = rt.indicator_env
+        try:
+            if rt.incremental and env is not None and callable(env.get('on_tick')):
+                result = self._run_on_tick(rt, env, current_price, position_inputs)
+
+            if result is None:
+                realtime_df = self._update_dataframe_with_current_price(rt.df.copy(), current_price, rt.timeframe)
+                result = self._execute_indicator_with_prices(
+                    rt.indicator_code, realtime_df, rt.trading_config,
+                    indicators=rt.indicators if rt.incremental else None,
+                    **position_inputs
+                )
+                if result is None:
+                    return None
+                rt.indicator_env = result.pop('exec_env', None)
+        except DeadlineExceeded:
+            if rt.incremental:
+                logger.warning(
+                    f"Strategy {rt.strategy_id} in-process indicator tick exceeded {self.indicator_timeout_sec}s; "
+                    f"interrupted, falling back to sandboxed full recompute"
+                )
+                self._console_print(f"[strategy:{rt.strategy_id}] indicator timeout; incremental mode disabled")
+                rt.incremental = False
+                rt.indicators.reset()
+                rt.indicator_env = None
+            raise
+
+        if not rt.incremental or self.indicator_parity_check_ticks <= 0:
+            return result
+        rt.ticks_since_parity += 1
+        if rt.ticks_since_parity < self.indicator_parity_check_ticks:
+            return result
+
+        # 周期性全量比对
+        rt.ticks_since_parity = 0
+        realtime_df = self._update_dataframe_with_current_price(rt.df.copy(), current_price, rt.timeframe)
+        full = self._execute_indicator_with_prices(rt.indicator_code, realtime_df, rt.trading_config, **position_inputs)
+        if full is None:
+            return result
+        full_env = full.pop('exec_env', None)
+        if self._signal_fingerprint(full) != self._signal_fingerprint(result):
+            logger.warning(
+                f"Strategy {rt.strategy_id} incremental indicator mismatch; falling back to full recompute. "
+                f"incremental={result.get('pending_signals')}, full={full.get('pending_signals')}"
+            )
+            rt.incremental = False
+            rt.indicators.reset()
+            rt.indicator_env = full_env
+            return full
+        return result
+
+    def _run_on_tick(
+        self, rt: StrategyRuntime, env: Dict[str, Any], current_price: float, position_inputs: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """调用脚本的 on_tick(df, bar)；最后一根K线不在当前周期（需要新增K线）时返回 None 走全量路径"""
+        df = env.get('df')
+        if not isinstance(df, pd.DataFrame) or len(df) == 0:
+            return None
+        last_ts = float(df.index[-1].timestamp())
+        if abs(last_ts - int(time.time() // rt.timeframe_seconds) * rt.timeframe_seconds) >= 2:
+            return None
+
+        last = len(df) - 1
+        cols = df.columns
+        df.iloc[last, cols.get_loc('close')] = current_price
+        df.iloc[last, cols.get_loc('high')] = max(float(df['high'].iloc[last]), current_price)
+        df.iloc[last, cols.get_loc('low')] = min(float(df['low'].iloc[last]), current_price)
+        # rt.df 是全量路径的输入，同步最后一根K线
+        rt.df = self._update_dataframe_with_current_price(rt.df, current_price, rt.timeframe)
+
+        bar = {
+            'time': int(last_ts),
+            'open': float(df['open'].iloc[last]),
+            'high': float(df['high'].iloc[last]),
+            'low': float(df['low'].iloc[last]),
+            'close': float(current_price),
+            'volume': float(df['volume'].iloc[last]),
+        }
+        env.update(position_inputs)
+        returned = call_with_deadline(self.indicator_timeout_sec, env['on_tick'], df, bar)
+        if isinstance(returned, pd.DataFrame):
+            df = env['df'] = returned
+        return self._extract_pending_signals(df, env, rt.trading_config)
+
+    @staticmethod
+    def _signal_fingerprint(result: Dict[str, Any]) -> list:
+        return sorted(
+            (str(s.get('type')), int(s.get('timestamp') or 0), round(float(s.get('trigger_price') or 0), 8))
+            for s in (result.get('pending_signals') or [])
+        )
+
+    def _indicator_position_inputs(self, strategy_id: int, symbol: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """读取本地持仓，返回 (持仓列表, 注入指标的持仓状态参数)"""
+        current_pos_list = self._get_current_positions(strategy_id, symbol)
+        inputs = {
+            'initial_highest_price': 0.0,
+            'initial_position': 0,  # 0=无持仓, 1=多头, -1=空头
+            'initial_avg_entry_price': 0.0,
+            'initial_position_count': 0,
+            'initial_last_add_price': 0.0,
+        }
+        if current_pos_list:
+            pos = current_pos_list[0]  # 取第一个持仓（单向持仓模式）
+            entry_price = float(pos.get('entry_price', 0) or 0)
+            inputs.update({
+                'initial_highest_price': float(pos.get('highest_price', 0) or 0),
+                'initial_position': 1 if pos.get('side', 'long') == 'long' else -1,
+                'initial_avg_entry_price': entry_price,
+                'initial_position_count': 1,  # 简化处理，假设是单笔持仓
+                'initial_last_add_price': entry_price,
+            })
+        return current_pos_list, inputs
+
+    def _strategy_tick(
+        self,
+        rt: StrategyRuntime,
+        current_price: float,
+        current_time: float,
+        klines: Optional[KlineBatch] = None,
+        triggers_only: bool = False
+    ) -> None:
+        """
+        单次 tick：按需刷新K线/重算指标、检查触发、执行至多一个信号、更新持仓。
+
+        Args:
+            rt: 策略运行时状态
+            current_price: 本 tick 的当前价格
+            current_time: 本 tick 的时间戳
+            klines: 调度器按 (symbol, timeframe) 分组预取的K线；为空时按需自行拉取
+            triggers_only: 只检查触发（触发索引命中时由调度器调用），不刷新K线、不重算指标
+        """
+        strategy_id = rt.strategy_id
+        symbol = rt.symbol
+        trading_config = rt.trading_config
+        timeframe_seconds = rt.timeframe_seconds
+
+        # ============================================
+        # 1. 检查是否需要更新K线（每根K线收盘后更新一次，从API拉取；调度器模式下由收盘屏障统一拉取）
+        # ============================================
+        if triggers_only:
+            pass
+        elif rt.kline_due(current_time):
+            if klines is None:
+                klines = self._fetch_latest_kline(symbol, rt.timeframe, limit=500, refresh=True)
+            if klines and len(klines) >= 2:
+                df = self._klines_to_dataframe(klines)
+                if len(df) > 0:
+                    rt.df = df
+                    current_pos_list, position_inputs = self._indicator_position_inputs(strategy_id, symbol)
+                    # 新K线：全量重算走沙箱进程池（超时 / 内存上限）；增量状态随之作废，
+                    # 由下一次实时 tick（本进程内、受看门狗限制）按新K线整段重建
+                    indicator_result = self._execute_indicator_with_prices(
+                        rt.indicator_code, df, trading_config, **position_inputs
+                    )
+                    rt.indicators.reset()
+                    if indicator_result:
+                        rt.indicator_env = indicator_result.pop('exec_env', None)
+                        rt.pending_signals = indicator_result.get('pending_signals', [])
+                        rt.last_kline_time = indicator_result.get('last_kline_time', 0)
+                        new_hp = indicator_result.get('new_highest_price', 0)
+
+                        rt.last_kline_update_time = current_time
+
+                        # 更新 highest_price（使用最新 close 作为 current_price 的近似）
+                        if new_hp > 0 and current_pos_list:
+                            current_close = float(df['close'].iloc[-1])
+                            for p in current_pos_list:
+                                self._update_position_extremes(
+                                    strategy_id, p['symbol'], p['side'], current_close,
+                                    highest_price=new_hp,
+                                    lowest_price=float(p.get('lowest_price') or 0.0),
+                                )
+        else:
+            # ============================================
+            # 2. 非K线更新tick：用当前价更新最后一根K线并重算指标（统一tick节奏）
+            # ============================================
+            if rt.df is not None and len(rt.df) > 0:
+                try:
+                    current_pos_list, position_inputs = self._indicator_position_inputs(strategy_id, symbol)
+                    indicator_result = self._evaluate_realtime(rt, current_price, position_inputs)
+                    if indicator_result:
+                        rt.pending_signals = indicator_result.get('pending_signals', [])
+                        new_hp = indicator_result.get('new_highest_price', 0)
+
+                        if new_hp > 0 and current_pos_list:
+                            for p in current_pos_list:
+                                self._update_position_extremes(
+                                    strategy_id, p['symbol'], p['side'], current_price,
+                                    highest_price=new_hp,
+                                    lowest_price=float(p.get('lowest_price') or 0.0),
+                                )
+                except Exception as e:
+                    logger.warning(f"Strategy {strategy_id} realtime indicator recompute failed: {str(e)}")
+        
+        # ============================================
+        # 3. Evaluate triggers once per tick
+        # ============================================
+        # 优化点4: 信号有效期清理 (Signal Expiration)
+        pending_signals = rt.pending_signals
+        current_ts = int(time.time())
+        if pending_signals:
+            expiration_threshold = timeframe_seconds * 2
+            valid_signals = []
+            for s in pending_signals:
+                signal_time = s.get('timestamp', 0)
+                if signal_time == 0 or (current_ts - signal_time) < expiration_threshold:
+                    valid_signals.append(s)
+                else:
+                    logger.warning(f"Signal expired and removed: {s}")
+            if len(valid_signals) != len(pending_signals):
+                pending_signals = rt.pending_signals = valid_signals
+
+        # Unified cadence log: at most once per tick.
+        if pending_signals:
+            logger.info(f"[monitoring] strategy={strategy_id} price={current_price}, pending_signals={len(pending_signals)}")
+
+        # 持仓读自内存缓存；更新最高/最低价后重建本策略在触发索引中的价位
+        positions = self._get_current_positions(strategy_id, symbol)
+        positions = self._track_position_extremes(strategy_id, symbol, positions, float(current_price))
+        self._sync_trigger_levels(rt, positions)
+
+        crossed = [lv for lv in self.trigger_index.levels_of(strategy_id) if lv.crossed(float(current_price))]
+        crossed_signal_ids = {id(lv.signal) for lv in crossed if lv.kind == KIND_SIGNAL}
+
+        # 检查是否有待触发的信号：无价位的（立即触发）+ 价位被穿越的，保持原有顺序
+        triggered_signals = []
+        signals_to_remove = []
+        for signal_info in pending_signals:
+            if self._is_immediate_signal(signal_info, trading_config) or id(signal_info) in crossed_signal_ids:
+                triggered_signals.append(signal_info)
+                signals_to_remove.append(signal_info)
+
+        # ============================================
+        # 3.1 Server-side exits (config-driven): SL / TP / trailing
+        # ============================================
+        # Note: stop-loss is only applied when stop_loss_pct > 0. No default fallback.
+        candle_ts = int(current_ts // int(timeframe_seconds or 60)) * int(timeframe_seconds or 60)
+        for kind in (KIND_TRAILING_STOP, KIND_TAKE_PROFIT, KIND_STOP_LOSS):
+            for lv in crossed:
+                if lv.kind == kind:
+                    risk = dict(lv.signal)
+                    risk['timestamp'] = candle_ts
+                    triggered_signals.append(risk)
+                    break
+
+        # 从待触发列表中移除已触发的信号
+        for signal_info in signals_to_remove:
+            if signal_info in pending_signals:
+                pending_signals.remove(signal_info)
+        if signals_to_remove:
+            self._sync_trigger_levels(rt, positions)
+            
+        # 执行触发的信号
+        if triggered_signals:
+            logger.info(f"Strategy {strategy_id} triggered signals: {triggered_signals}")
+
+            current_positions = self._get_current_positions(strategy_id, symbol)
+            state = self._position_state(current_positions)
+
+            # Strict state machine + priority:
+            # - Only allow signals matching current state (flat/long/short).
+            # - Always prefer close_* over open_*/add_*.
+            # - Execute at most ONE signal per tick to avoid duplicated/re-entrant orders.
+            candidates = [s for s in triggered_signals if self._is_signal_allowed(state, s.get('type'))]
+
+            # If both directions are present while flat, choose by trade_direction (deterministic).
+            if state == "flat" and candidates:
+                td = (rt.trade_direction or "both").strip().lower()
+                if td == "long":
+                    candidates = [s for s in candidates if s.get("type") == "open_long"]
+                elif td == "short":
+                    candidates = [s for s in candidates if s.get("type") == "open_short"]
+
+            candidates = sorted(
+                candidates,
+                key=lambda s: (
+                    self._signal_priority(s.get("type")),
+                    int(s.get("timestamp") or 0),
+                    str(s.get("type") or ""),
+                ),
+            )
+
+            selected = None
+            now_i = int(time.time())
+            for s in candidates:
+                stype = s.get("type")
+                sts = int(s.get("timestamp") or 0)
+                if self._should_skip_signal_once_per_candle(
+                    strategy_id=strategy_id,
+                    symbol=symbol,
+                    signal_type=str(stype or ""),
+                    signal_ts=sts,
+                    timeframe_seconds=int(timeframe_seconds or 60),
+                    now_ts=now_i,
+                ):
+                    continue
+                selected = s
+                break
+
+            if selected:
+                signal_type = selected.get('type')
+                position_size = selected.get('position_size', 0)
+                trigger_price = selected.get('trigger_price', current_price)
+                execute_price = trigger_price if trigger_price > 0 else current_price
+                signal_ts = int(selected.get("timestamp") or 0)
+
+                ok = self._execute_signal(
+                    strategy_id=strategy_id,
+                    strategy_name=rt.strategy_name,
+                    exchange=rt.exchange,
+                    symbol=symbol,
+                    current_price=execute_price,
+                    signal_type=signal_type,
+                    position_size=position_size,
+                    signal_ts=signal_ts,
+                    current_positions=current_positions,
+                    trade_direction=rt.trade_direction,
+                    leverage=rt.leverage,
+                    initial_capital=rt.initial_capital,
+                    market_type=rt.market_type,
+                    execution_mode=rt.execution_mode,
+                    notification_config=rt.notification_config,
+                    trading_config=trading_config,
+                    ai_model_config=rt.ai_model_config,
+                )
+                if ok:
+                    logger.info(f"Strategy {strategy_id} signal executed: {signal_type} @ {execute_price}")
+                else:
+                    logger.warning(f"Strategy {strategy_id} signal rejected/failed: {signal_type}")
+
+        # Update positions once per tick.
+        self._update_positions(strategy_id, symbol, current_price)
+        self._maybe_snapshot(rt, current_time)
+
+        # Heartbeat for UI observability (once per tick).
+        self._console_print(
+            f"[strategy:{strategy_id}] tick price={float(current_price or 0.0):.8f} pending_signals={len(pending_signals or [])}"
+        )
     
     def _sync_positions_with_exchange(self, strategy_id: int, exchange: Any, symbol: str, market_type: str):
         """
@@ -1072,24 +1359,27 @@ class TradingExecutor:
         """(Mock) 信号模式不需要真实交易所连接"""
         return None
     
-    def _fetch_latest_kline(self, symbol: str, timeframe: str, limit: int = 500) -> List[Dict[str, Any]]:
-        """获取最新K线数据（优先从缓存获取）"""
+    def _fetch_latest_kline(self, symbol: str, timeframe: str, limit: int = 500, refresh: bool = False) -> KlineBatch:
+        """获取最新K线数据（优先从缓存获取；refresh=True 时忽略未过期的缓存，用于K线收盘后）"""
         try:
             # 使用 KlineService 获取K线数据（自动处理缓存）
             return self.kline_service.get_kline(
                 market='Crypto',
                 symbol=symbol,
                 timeframe=timeframe,
-                limit=limit
+                limit=limit,
+                refresh=refresh
             )
         except Exception as e:
             logger.error(f"Failed to fetch K-lines: {str(e)}")
-            return []
+            return KlineBatch.empty()
     
     def _fetch_current_price(self, exchange: Any, symbol: str, market_type: str = None) -> Optional[float]:
         """获取当前价格 (改用 DataSource)"""
-        # Local in-memory cache first
+        # Local in-memory cache first (per market: a spot and a swap strategy on one symbol do not share a price)
         cache_key = (symbol or "").strip().upper()
+        if cache_key and market_type:
+            cache_key = f"{str(market_type).strip().lower()}:{cache_key}"
         if cache_key and self._price_cache_ttl_sec > 0:
             now = time.time()
             try:
@@ -1126,135 +1416,94 @@ class TradingExecutor:
             
         return None
 
-    def _server_side_stop_loss_signal(
-        self,
-        strategy_id: int,
-        symbol: str,
-        current_price: float,
-        market_type: str,
-        leverage: float,
-        trading_config: Dict[str, Any],
-        timeframe_seconds: int,
-    ) -> Optional[Dict[str, Any]]:
-        """
-        服务端兜底止损：当价格穿透止损线时，直接生成 close_long/close_short 信号。
-
-        目的：防止“指标回放逻辑导致最后一根K线没有 close_* 信号”或“插针反弹导致二次触发条件不满足”时不止损。
-        """
+    def _is_immediate_signal(self, signal_info: Dict[str, Any], trading_config: Dict[str, Any]) -> bool:
+        """待触发信号是否立即触发（不进入价格触发索引）"""
+        signal_type = signal_info.get('type')  # 'open_long', 'close_long', 'open_short', 'close_short'
         try:
-            if trading_config is None:
-                return None
-
-            enabled = trading_config.get('enable_server_side_stop_loss', True)
-            if str(enabled).lower() in ['0', 'false', 'no', 'off']:
-                return None
-
-            # 获取当前持仓（使用本地数据库记录作为风控依据）
-            current_positions = self._get_current_positions(strategy_id, symbol)
-            if not current_positions:
-                return None
-
-            pos = current_positions[0]
-            side = pos.get('side')
-            if side not in ['long', 'short']:
-                return None
-
-            entry_price = float(pos.get('entry_price', 0) or 0)
-            if entry_price <= 0 or current_price <= 0:
-                return None
-
-            # Stop-loss is config-driven: if stop_loss_pct is not set or <= 0, do NOT stop-loss.
-            sl_cfg = trading_config.get('stop_loss_pct', 0)
-            sl = 0.0
-            try:
-                sl_cfg = float(sl_cfg or 0)
-                if sl_cfg > 1:
-                    sl = sl_cfg / 100.0
-                else:
-                    sl = sl_cfg
-            except Exception:
-                sl = 0.0
-
-            if sl <= 0:
-                return None
-
-            # Align with backtest semantics: risk percentages are defined on margin PnL,
-            # so we convert to price move threshold by dividing by leverage.
-            lev = max(1.0, float(leverage or 1.0))
-            sl = sl / lev
-
-            # Use candle start timestamp to deduplicate exit attempts within a candle.
-            now_ts = int(time.time())
-            tf = int(timeframe_seconds or 60)
-            candle_ts = int(now_ts // tf) * tf
-
-            # 多头：跌破止损线
-            if side == 'long':
-                stop_line = entry_price * (1 - sl)
-                if current_price <= stop_line:
-                    return {
-                        'type': 'close_long',
-                        'trigger_price': 0,  # 立即触发（由 exit_trigger_mode 控制）
-                        'position_size': 0,
-                        'timestamp': candle_ts,
-                        'reason': 'server_stop_loss',
-                        'stop_loss_price': stop_line,
-                    }
-            # 空头：突破止损线
-            elif side == 'short':
-                stop_line = entry_price * (1 + sl)
-                if current_price >= stop_line:
-                    return {
-                        'type': 'close_short',
-                        'trigger_price': 0,
-                        'position_size': 0,
-                        'timestamp': candle_ts,
-                        'reason': 'server_stop_loss',
-                        'stop_loss_price': stop_line,
-                    }
+            trigger_price = float(signal_info.get('trigger_price', 0) or 0)
+        except Exception:
+            trigger_price = 0.0
+        if trigger_price <= 0:
+            return True
+
+        # 【关键修复】平仓/止损止盈信号默认“立即触发”
+        exit_trigger_mode = trading_config.get('exit_trigger_mode', 'immediate')  # 'immediate' or 'price'
+        if signal_type in ['close_long', 'close_short'] and exit_trigger_mode == 'immediate':
+            return True
+
+        # 【可选】开仓/加仓信号是否“立即触发”
+        entry_trigger_mode = trading_config.get('entry_trigger_mode', 'price')  # 'price' or 'immediate'
+        if signal_type in ['open_long', 'open_short', 'add_long', 'add_short'] and entry_trigger_mode == 'immediate':
+            return True
+        return False
 
-            return None
-        except Exception as e:
-            logger.warning(f"Strategy {strategy_id} server-side stop-loss check failed: {str(e)}")
-            return None
+    def _signal_levels(self, rt: StrategyRuntime) -> List[TriggerLevel]:
+        """带触发价的待触发信号 -> 价位（向上突破 / 向下跌破）"""
+        levels = []
+        for signal_info in rt.pending_signals or []:
+            if self._is_immediate_signal(signal_info, rt.trading_config):
+                continue
+            signal_type = signal_info.get('type')
+            if signal_type in ['open_long', 'close_short', 'add_long']:
+                direction = UP
+            elif signal_type in ['open_short', 'close_long', 'add_short']:
+                direction = DOWN
+            else:
+                continue
+            levels.append(TriggerLevel(
+                rt.strategy_id, rt.symbol, float(signal_info['trigger_price']), direction, KIND_SIGNAL, signal_info
+            ))
+        return levels
 
-    def _server_side_take_profit_or_trailing_signal(
-        self,
-        strategy_id: int,
-        symbol: str,
-        current_price: float,
-        market_type: str,
-        leverage: float,
-        trading_config: Dict[str, Any],
-        timeframe_seconds: int,
-    ) -> Optional[Dict[str, Any]]:
+    def _risk_levels(self, rt: StrategyRuntime, positions: List[Dict[str, Any]]) -> List[TriggerLevel]:
         """
-        Server-side exits driven by trading_config (no indicator script required):
-        - Fixed take-profit: take_profit_pct
-        - Trailing stop: trailing_enabled + trailing_stop_pct + trailing_activation_pct
+        服务端止损 / 止盈 / 移动止损价位（由 trading_config 驱动，无需指标脚本）：
+        - 止损：stop_loss_pct（enable_server_side_stop_loss 关闭或 <= 0 时不止损）
+        - 固定止盈：take_profit_pct
+        - 移动止损：trailing_enabled + trailing_stop_pct + trailing_activation_pct
+
+        目的：防止“指标回放逻辑导致最后一根K线没有 close_* 信号”或“插针反弹导致二次触发条件不满足”时不止损。
 
         Semantics align with BacktestService:
         - Percentages are defined on margin PnL; effective price threshold = pct / leverage.
         - When trailing is enabled, fixed take-profit is disabled to avoid ambiguity.
         """
+        trading_config = rt.trading_config
+        if not trading_config or not positions:
+            return []
         try:
-            if not trading_config:
-                return None
-
-            current_positions = self._get_current_positions(strategy_id, symbol)
-            if not current_positions:
-                return None
-
-            pos = current_positions[0]
+            pos = positions[0]
             side = (pos.get('side') or '').strip().lower()
             if side not in ['long', 'short']:
-                return None
-
+                return []
             entry_price = float(pos.get('entry_price', 0) or 0)
-            if entry_price <= 0 or current_price <= 0:
-                return None
+            if entry_price <= 0:
+                return []
+
+            sid, symbol = rt.strategy_id, rt.symbol
+            lev = max(1.0, float(rt.leverage or 1.0))
+            close_type = 'close_long' if side == 'long' else 'close_short'
+            levels = []
 
-            lev = max(1.0, float(leverage or 1.0))
+            def _exit(reason: str, **extra) -> Dict[str, Any]:
+                # timestamp 在触发时填入当前K线起点，用于同一根K线内的去重
+                return {'type': close_type, 'trigger_price': 0, 'position_size': 0, 'timestamp': 0,
+                        'reason': reason, **extra}
+
+            # 1) Stop-loss
+            enabled = trading_config.get('enable_server_side_stop_loss', True)
+            if str(enabled).lower() not in ['0', 'false', 'no', 'off']:
+                sl = self._to_ratio(trading_config.get('stop_loss_pct', 0))
+                if sl > 0:
+                    sl = sl / lev
+                    if side == 'long':
+                        stop_line = entry_price * (1 - sl)
+                        levels.append(TriggerLevel(sid, symbol, stop_line, DOWN, KIND_STOP_LOSS,
+                                                   _exit('server_stop_loss', stop_loss_price=stop_line)))
+                    else:
+                        stop_line = entry_price * (1 + sl)
+                        levels.append(TriggerLevel(sid, symbol, stop_line, UP, KIND_STOP_LOSS,
+                                                   _exit('server_stop_loss', stop_loss_price=stop_line)))
 
             tp = self._to_ratio(trading_config.get('take_profit_pct'))
             trailing_enabled = bool(trading_config.get('trailing_enabled'))
@@ -1272,112 +1521,98 @@ class TradingExecutor:
                 if trailing_act_eff <= 0 and tp > 0:
                     trailing_act_eff = tp / lev
 
-            now_ts = int(time.time())
-            tf = int(timeframe_seconds or 60)
-            candle_ts = int(now_ts // tf) * tf
-
-            # Highest/lowest tracking (persisted in DB so restart continues trailing correctly)
-            try:
-                hp = float(pos.get('highest_price') or 0.0)
-            except Exception:
-                hp = 0.0
-            try:
-                lp = float(pos.get('lowest_price') or 0.0)
-            except Exception:
-                lp = 0.0
-
-            if hp <= 0:
-                hp = entry_price
-            hp = max(hp, float(current_price))
-
-            if lp <= 0:
-                lp = entry_price
-            lp = min(lp, float(current_price))
-
-            # Persist best-effort
-            try:
-                self._update_position(
-                    strategy_id=strategy_id,
-                    symbol=pos.get('symbol') or symbol,
-                    side=side,
-                    size=float(pos.get('size') or 0.0),
-                    entry_price=entry_price,
-                    current_price=float(current_price),
-                    highest_price=hp,
-                    lowest_price=lp,
-                )
-            except Exception:
-                pass
-
-            # 1) Trailing stop
+            # 2) Trailing stop：价位依赖最高/最低价，价格创新高/新低（或到达激活价）时需要重建（REARM）
             if trailing_enabled and trailing_pct_eff > 0:
+                hp = float(pos.get('highest_price') or 0.0) or entry_price
+                lp = float(pos.get('lowest_price') or 0.0) or entry_price
                 if side == 'long':
-                    active = True
-                    if trailing_act_eff > 0:
-                        active = hp >= entry_price * (1 + trailing_act_eff)
+                    act_line = entry_price * (1 + trailing_act_eff)
+                    active = trailing_act_eff <= 0 or hp >= act_line
                     if active:
                         stop_line = hp * (1 - trailing_pct_eff)
-                        if current_price <= stop_line:
-                            return {
-                                'type': 'close_long',
-                                'trigger_price': 0,
-                                'position_size': 0,
-                                'timestamp': candle_ts,
-                                'reason': 'server_trailing_stop',
-                                'trailing_stop_price': stop_line,
-                                'highest_price': hp,
-                            }
+                        levels.append(TriggerLevel(sid, symbol, stop_line, DOWN, KIND_TRAILING_STOP,
+                                                   _exit('server_trailing_stop', trailing_stop_price=stop_line,
+                                                         highest_price=hp)))
+                    levels.append(TriggerLevel(sid, symbol, np.nextafter(hp, np.inf) if active else act_line,
+                                               UP, KIND_REARM))
                 else:
-                    active = True
-                    if trailing_act_eff > 0:
-                        active = lp <= entry_price * (1 - trailing_act_eff)
+                    act_line = entry_price * (1 - trailing_act_eff)
+                    active = trailing_act_eff <= 0 or lp <= act_line
                     if active:
                         stop_line = lp * (1 + trailing_pct_eff)
-                        if current_price >= stop_line:
-                            return {
-                                'type': 'close_short',
-                                'trigger_price': 0,
-                                'position_size': 0,
-                                'timestamp': candle_ts,
-                                'reason': 'server_trailing_stop',
-                                'trailing_stop_price': stop_line,
-                                'lowest_price': lp,
-                            }
+                        levels.append(TriggerLevel(sid, symbol, stop_line, UP, KIND_TRAILING_STOP,
+                                                   _exit('server_trailing_stop', trailing_stop_price=stop_line,
+                                                         lowest_price=lp)))
+                    levels.append(TriggerLevel(sid, symbol, np.nextafter(lp, -np.inf) if active else act_line,
+                                               DOWN, KIND_REARM))
 
-            # 2) Fixed take-profit (only when trailing is disabled)
+            # 3) Fixed take-profit (only when trailing is disabled)
             if tp_eff > 0:
                 if side == 'long':
                     tp_line = entry_price * (1 + tp_eff)
-                    if current_price >= tp_line:
-                        return {
-                            'type': 'close_long',
-                            'trigger_price': 0,
-                            'position_size': 0,
-                            'timestamp': candle_ts,
-                            'reason': 'server_take_profit',
-                            'take_profit_price': tp_line,
-                        }
+                    levels.append(TriggerLevel(sid, symbol, tp_line, UP, KIND_TAKE_PROFIT,
+                                               _exit('server_take_profit', take_profit_price=tp_line)))
                 else:
                     tp_line = entry_price * (1 - tp_eff)
-                    if current_price <= tp_line:
-                        return {
-                            'type': 'close_short',
-                            'trigger_price': 0,
-                            'position_size': 0,
-                            'timestamp': candle_ts,
-                            'reason': 'server_take_profit',
-                            'take_profit_price': tp_line,
-                        }
+                    levels.append(TriggerLevel(sid, symbol, tp_line, DOWN, KIND_TAKE_PROFIT,
+                                               _exit('server_take_profit', take_profit_price=tp_line)))
+            return levels
+        except Exception as e:
+            logger.warning(f"Strategy {rt.strategy_id} server-side risk levels failed: {str(e)}")
+            return []
 
-            return None
+    def _sync_trigger_levels(self, rt: StrategyRuntime, positions: List[Dict[str, Any]]) -> None:
+        """重建策略在触发索引中的价位（价位未变化时跳过）"""
+        levels = self._signal_levels(rt) + self._risk_levels(rt, positions)
+        key = tuple((lv.kind, lv.direction, lv.price, id(lv.signal) if lv.kind == KIND_SIGNAL else None)
+                    for lv in levels)
+        if key == rt.trigger_key:
+            return
+        rt.trigger_key = key
+        self.trigger_index.set_levels(rt.strategy_id, rt.symbol, levels)
+
+    def _track_position_extremes(
+        self, strategy_id: int, symbol: str, positions: List[Dict[str, Any]], current_price: float
+    ) -> List[Dict[str, Any]]:
+        """
+        更新持仓最高/最低价（移动止损依据）。
+        仅在变化时写库（持久化，重启后移动止损可继续）；返回更新后的持仓列表。
+        """
+        if not positions or current_price <= 0:
+            return positions
+        pos = positions[0]
+        try:
+            entry_price = float(pos.get('entry_price', 0) or 0)
+            if entry_price <= 0:
+                return positions
+            old_hp = float(pos.get('highest_price') or 0.0)
+            old_lp = float(pos.get('lowest_price') or 0.0)
+            hp = max(old_hp if old_hp > 0 else entry_price, current_price)
+            lp = min(old_lp if old_lp > 0 else entry_price, current_price)
+            if hp != old_hp or lp != old_lp:
+                self._update_position_extremes(
+                    strategy_id,
+                    pos.get('symbol') or symbol,
+                    (pos.get('side') or '').strip().lower(),
+                    current_price,
+                    highest_price=hp,
+                    lowest_price=lp,
+                )
+                pos = dict(pos, highest_price=hp, lowest_price=lp)
+                return [pos] + list(positions[1:])
         except Exception:
-            return None
-    
-    def _klines_to_dataframe(self, klines: List[Dict[str, Any]]) -> pd.DataFrame:
+            pass
+        return positions
+
+    def _klines_to_dataframe(self, klines: Union[KlineBatch, List[Dict[str, Any]]]) -> pd.DataFrame:
         """将K线数据转换为DataFrame"""
         if not klines:
             # 返回空的 DataFrame，包含正确的列
             return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'])
+
+        if isinstance(klines, KlineBatch):
+            # 列式K线：直接以列数组构建（UTC tz-aware 索引，列已是 float64）
+            return klines.to_dataframe(utc=True).dropna()
         
         # 创建 DataFrame
         df = pd.DataFrame(klines)
@@ -1468,24 +1703,39 @@ class TradingExecutor:
         initial_position: int = 0,
         initial_avg_entry_price: float = 0.0,
         initial_position_count: int = 0,
-        initial_last_add_price: float = 0.0
+        initial_last_add_price: float = 0.0,
+        indicators: Optional[TailIndicators] = None
     ) -> Optional[Dict[str, Any]]:
         """
         执行指标代码并提取待触发的信号和价格
+
+        indicators 为策略持有的 TailIndicators 时，脚本中的内置指标只重算最后一根K线。
+        返回值中的 exec_env 为脚本执行环境（供 on_tick 增量模式复用）。
         """
+        # 执行指标代码
+        executed_df, exec_env = self._execute_indicator_df(
+            indicator_code, df, trading_config, 
+            initial_highest_price=initial_highest_price,
+            initial_position=initial_position,
+            initial_avg_entry_price=initial_avg_entry_price,
+            initial_position_count=initial_position_count,
+            initial_last_add_price=initial_last_add_price,
+            indicators=indicators
+        )
+        if executed_df is None:
+            return None
+        result = self._extract_pending_signals(executed_df, exec_env, trading_config)
+        if result is not None:
+            result['exec_env'] = exec_env
+        return result
+
+    def _extract_pending_signals(
+        self, executed_df: pd.DataFrame, exec_env: Dict[str, Any], trading_config: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """从执行后的 DataFrame 中提取待触发的信号和价格（只读取最后两根K线）"""
         try:
-            # 执行指标代码
-            executed_df, exec_env = self._execute_indicator_df(
-                indicator_code, df, trading_config, 
-                initial_highest_price=initial_highest_price,
-                initial_position=initial_position,
-                initial_avg_entry_price=initial_avg_entry_price,
-                initial_position_count=initial_position_count,
-                initial_last_add_price=initial_last_add_price
-            )
-            if executed_df is None:
-                return None
-            
+            df = executed_df
+
             # 提取最新的 highest_price
             new_highest_price = exec_env.get('highest_price', 0.0)
             
@@ -1709,7 +1959,8 @@ class TradingExecutor:
         initial_position: int = 0,
         initial_avg_entry_price: float = 0.0,
         initial_position_count: int = 0,
-        initial_last_add_price: float = 0.0
+        initial_last_add_price: float = 0.0,
+        indicators: Optional[TailIndicators] = None
     ) -> tuple[Optional[pd.DataFrame], dict]:
         """执行指标代码，返回执行后的DataFrame和执行环境"""
         try:
@@ -1729,25 +1980,13 @@ class TradingExecutor:
                 logger.warning("DataFrame is empty; cannot execute indicator script")
                 return None, {}
             
-            # 初始化信号Series
-            signals = pd.Series(0, index=df.index, dtype='float64')
-            
             # 准备执行环境
             # Expose the full trading config to indicator scripts so frontend parameters
             # (scale-in/out, position sizing, risk params) can be used directly.
             # Also provide a backtest-modal compatible nested config object: cfg.risk/cfg.scale/cfg.position.
             tc = dict(trading_config or {})
             cfg = self._build_cfg_from_trading_config(tc)
-            local_vars = {
-                'df': df,
-                'open': df['open'].astype('float64'),
-                'high': df['high'].astype('float64'),
-                'low': df['low'].astype('float64'),
-                'close': df['close'].astype('float64'),
-                'volume': df['volume'].astype('float64'),
-                'signals': signals,
-                'np': np,
-                'pd': pd,
+            variables = {
                 'trading_config': tc,
                 'config': tc,  # alias
                 'cfg': cfg,    # normalized nested config
@@ -1761,32 +2000,17 @@ class TradingExecutor:
                 'initial_position_count': int(initial_position_count),
                 'initial_last_add_price': float(initial_last_add_price)
             }
-            
-            import builtins
-            def safe_import(name, *args, **kwargs):
-                allowed_modules = ['numpy', 'pandas', 'math', 'json', 'time']
-                if name in allowed_modules or name.split('.')[0] in allowed_modules:
-                    return builtins.__import__(name, *args, **kwargs)
-                raise ImportError(f"不允许导入模块: {name}")
-            
-            safe_builtins = {k: getattr(builtins, k) for k in dir(builtins) 
-                           if not k.startswith('_') and k not in [
-                               'eval', 'exec', 'compile', 'open', 'input',
-                               'help', 'exit', 'quit', '__import__',
-                               'copyright', 'credits', 'license'
-                           ]}
-            safe_builtins['__import__'] = safe_import
-            
-            exec_env = local_vars.copy()
-            exec_env['__builtins__'] = safe_builtins
-            
-            pre_import_code = "import numpy as np\nimport pandas as pd\n"
-            exec(pre_import_code, exec_env)
-            
-            # 这里的 safe_exec_code 假设已存在
-            exec(indicator_code, exec_env)
-            
-            executed_df = exec_env.get('df', df)
+
+            sandbox = get_indicator_sandbox()
+            if indicators is None and sandbox.enabled:
+                # 全量执行放到沙箱进程池（强制超时与内存上限）；增量模式的状态（TailIndicators / on_tick）只能留在本进程
+                result = sandbox.run(indicator_code, df, variables=variables, timeout=self.indicator_timeout_sec)
+                executed_df = result.df if result.df is not None else df
+                exec_env = dict(result.env)
+                exec_env['df'] = executed_df
+                exec_env['output'] = result.output
+            else:
+                executed_df, exec_env = self._exec_indicator_inprocess(indicator_code, df, variables, indicators)
 
             # Validation: if chart signals are provided, df['buy']/df['sell'] must exist for execution normalization.
             output_obj = exec_env.get('output')
@@ -1799,11 +2023,48 @@ class TradingExecutor:
             
             return executed_df, exec_env
             
+        except DeadlineExceeded:
+            # 本进程内执行被看门狗中断：交给调用方降级
+            raise
         except Exception as e:
             logger.error(f"Failed to execute indicator script: {str(e)}")
             logger.error(traceback.format_exc())
             return None, {}
     
+    def _exec_indicator_inprocess(
+        self, indicator_code: str, df: pd.DataFrame, variables: Dict[str, Any],
+        indicators: Optional[TailIndicators] = None
+    ) -> tuple[pd.DataFrame, dict]:
+        """
+        在本进程内执行指标代码（增量模式或 INDICATOR_SANDBOX_ENABLED=false），返回 (executed_df, exec_env)
+
+        Raises:
+            DeadlineExceeded: 执行超过 INDICATOR_EXEC_TIMEOUT_SEC（已被看门狗中断）
+        """
+        # 初始化信号Series
+        signals = pd.Series(0, index=df.index, dtype='float64')
+        local_vars = {
+            'df': df,
+            'open': df['open'].astype('float64'),
+            'high': df['high'].astype('float64'),
+            'low': df['low'].astype('float64'),
+            'close': df['close'].astype('float64'),
+            'volume': df['volume'].astype('float64'),
+            'signals': signals,
+            'np': np,
+            'pd': pd,
+        }
+        local_vars.update(variables)
+        # 内置技术指标函数（与回测一致）；增量模式下使用策略持有的 TailIndicators
+        local_vars.update(indicators.functions() if indicators is not None else get_indicator_functions())
+        
+        # 受限 builtins 模板与编译结果按代码哈希缓存，每个 tick 不再重建 / 重新编译（builtins 每次拿到独立副本）
+        exec_env = local_vars.copy()
+        exec_env['__builtins__'] = get_safe_builtins(INDICATOR_ALLOWED_MODULES)
+        call_with_deadline(self.indicator_timeout_sec, exec, get_code_cache().get(indicator_code).code_obj, exec_env)
+        
+        return exec_env.get('df', df), exec_env
+
     def _execute_indicator(self, indicator_code: str, df: pd.DataFrame, trading_config: Dict[str, Any]) -> Optional[Any]:
         """兼容旧版本"""
         executed_df, _ = self._execute_indicator_df(indicator_code, df, trading_config)
@@ -1812,29 +2073,30 @@ class TradingExecutor:
         return 0
 
     def _get_current_positions(self, strategy_id: int, symbol: str) -> List[Dict[str, Any]]:
-        """获取当前持仓（支持symbol规范化匹配）"""
+        """获取当前持仓（支持symbol规范化匹配；读自内存缓存，未命中时加载该策略的全部持仓）"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                query = """
-                    SELECT id, symbol, side, size, entry_price, highest_price, lowest_price
-                    FROM qd_strategy_positions
-                    WHERE strategy_id = %s
-                """
-                cursor.execute(query, (strategy_id,))
-                all_positions = cursor.fetchall()
-                
-                matched_positions = []
-                for pos in all_positions:
-                    # 简化匹配逻辑：只匹配前缀
-                    if pos['symbol'].split(':')[0] == symbol.split(':')[0]:
-                        matched_positions.append(pos)
-                
-                cursor.close()
-                return matched_positions
+            all_positions = self.position_cache.get(strategy_id, self._load_positions)
         except Exception as e:
             logger.error(f"Failed to fetch positions: {str(e)}")
             return []
+        # 简化匹配逻辑：只匹配前缀
+        base = symbol.split(':')[0]
+        return [pos for pos in all_positions if str(pos.get('symbol') or '').split(':')[0] == base]
+
+    def _load_positions(self, strategy_id: int) -> List[Dict[str, Any]]:
+        # 缓存未命中时先等写入队列落库，避免读到排队中的旧值
+        get_db_write_queue().flush()
+        with get_db_connection() as db:
+            cursor = db.cursor()
+            query = """
+                SELECT id, symbol, side, size, entry_price, highest_price, lowest_price
+                FROM qd_strategy_positions
+                WHERE strategy_id = %s
+            """
+            cursor.execute(query, (strategy_id,))
+            rows = cursor.fetchall() or []
+            cursor.close()
+            return [dict(r) for r in rows]
 
     def _execute_trading_logic(self, *args, **kwargs):
         """已废弃"""
@@ -2439,6 +2701,8 @@ class TradingExecutor:
                 pending_id = cur.lastrowid
                 db.commit()
                 cur.close()
+            # 通知 PendingOrderWorker 立即分发（DB 轮询仅作兜底）
+            notify_pending_order(pending_id)
             return int(pending_id) if pending_id is not None else None
         except Exception as e:
             logger.error(f"enqueue_pending_order failed: {e}")
@@ -2455,20 +2719,19 @@ class TradingExecutor:
         return initial_capital
 
     def _record_trade(self, strategy_id: int, symbol: str, type: str, price: float, amount: float, value: float, profit: float = None, commission: float = None):
-        """记录交易到数据库"""
+        """记录交易到数据库（写入队列，批量提交）"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                query = """
-                    INSERT INTO qd_strategy_trades (
-                        strategy_id, symbol, type, price, amount, value, commission, profit, created_at
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    )
-                """
-                cursor.execute(query, (strategy_id, symbol, type, price, amount, value, commission or 0, profit, int(time.time())))
-                db.commit()
-                cursor.close()
+            query = """
+                INSERT INTO qd_strategy_trades (
+                    strategy_id, symbol, type, price, amount, value, commission, profit, created_at
+                ) VALUES (
+                    %s, %s, %s, %s, %s, %s, %s, %s, %s
+                )
+            """
+            now = int(time.time())
+            get_db_write_queue().insert(query, (strategy_id, symbol, type, price, amount, value, commission or 0, profit, now))
+            # 看板聚合表（日/小时/策略维度）随成交增量更新
+            record_trade_aggregates(strategy_id, profit, now)
         except Exception as e:
             logger.error(f"Failed to record trade: {e}")
 
@@ -2483,54 +2746,101 @@ class TradingExecutor:
         highest_price: float = 0.0,
         lowest_price: float = 0.0,
     ):
-        """更新持仓状态"""
+        """更新持仓状态（成交相关，同步等待写入队列提交，保证与其它写入的先后顺序）"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                # 简化：直接 Update 或 Insert
-                upsert_query = """
-                    INSERT INTO qd_strategy_positions (
-                        strategy_id, symbol, side, size, entry_price, current_price, highest_price, lowest_price, updated_at
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    ) ON CONFLICT(strategy_id, symbol, side) DO UPDATE SET
-                        size = excluded.size,
-                        entry_price = excluded.entry_price,
-                        current_price = excluded.current_price,
-                        highest_price = CASE WHEN excluded.highest_price > 0 THEN excluded.highest_price ELSE highest_price END,
-                        lowest_price = CASE WHEN excluded.lowest_price > 0 THEN excluded.lowest_price ELSE lowest_price END,
-                        updated_at = excluded.updated_at
-                """
-                cursor.execute(upsert_query, (
-                    strategy_id, symbol, side, size, entry_price, current_price, highest_price, lowest_price, int(time.time())
-                ))
-                db.commit()
-                cursor.close()
+            # 简化：直接 Update 或 Insert
+            upsert_query = """
+                INSERT INTO qd_strategy_positions (
+                    strategy_id, symbol, side, size, entry_price, current_price, highest_price, lowest_price, updated_at
+                ) VALUES (
+                    %s, %s, %s, %s, %s, %s, %s, %s, %s
+                ) ON CONFLICT(strategy_id, symbol, side) DO UPDATE SET
+                    size = excluded.size,
+                    entry_price = excluded.entry_price,
+                    current_price = excluded.current_price,
+                    highest_price = CASE WHEN excluded.highest_price > 0 THEN excluded.highest_price ELSE highest_price END,
+                    lowest_price = CASE WHEN excluded.lowest_price > 0 THEN excluded.lowest_price ELSE lowest_price END,
+                    updated_at = excluded.updated_at
+            """
+            get_db_write_queue().insert(upsert_query, (
+                strategy_id, symbol, side, size, entry_price, current_price, highest_price, lowest_price, int(time.time())
+            ), wait=True)
+            # 与上面的 CASE WHEN 保持一致：<= 0 表示不修改
+            fields = {'size': size, 'entry_price': entry_price}
+            if highest_price and highest_price > 0:
+                fields['highest_price'] = highest_price
+            if lowest_price and lowest_price > 0:
+                fields['lowest_price'] = lowest_price
+            self.position_cache.upsert(strategy_id, symbol, side, fields)
         except Exception as e:
+            self.position_cache.invalidate(strategy_id)
             logger.error(f"Failed to update position: {e}")
 
+    def _update_position_extremes(
+        self,
+        strategy_id: int,
+        symbol: str,
+        side: str,
+        current_price: float,
+        highest_price: float = 0.0,
+        lowest_price: float = 0.0,
+    ):
+        """
+        持久化持仓最高/最低价（每 tick 可能触发，走写入队列异步合并）。
+        只 UPDATE 已有行：排队期间持仓若已在别处被删除，不会被重新插入。
+        同一持仓未落库的旧值会被新值覆盖，所以调用方需传入完整的 highest/lowest（<= 0 表示不修改）。
+        """
+        try:
+            get_db_write_queue().upsert(
+                ('position_extremes', int(strategy_id), str(symbol), str(side)),
+                """
+                UPDATE qd_strategy_positions SET
+                    current_price = %s,
+                    highest_price = CASE WHEN %s > 0 THEN %s ELSE highest_price END,
+                    lowest_price = CASE WHEN %s > 0 THEN %s ELSE lowest_price END,
+                    updated_at = %s
+                WHERE strategy_id = %s AND symbol = %s AND side = %s
+                """,
+                (
+                    current_price, highest_price, highest_price, lowest_price, lowest_price, int(time.time()),
+                    strategy_id, symbol, side,
+                ),
+            )
+            fields = {}
+            if highest_price and highest_price > 0:
+                fields['highest_price'] = highest_price
+            if lowest_price and lowest_price > 0:
+                fields['lowest_price'] = lowest_price
+            if fields:
+                self.position_cache.upsert(strategy_id, symbol, side, fields)
+        except Exception as e:
+            self.position_cache.invalidate(strategy_id)
+            logger.error(f"Failed to update position extremes: {e}")
+
     def _close_position(self, strategy_id: int, symbol: str, side: str):
-        """平仓：删除持仓记录"""
+        """平仓：删除持仓记录（同步等待写入队列提交）"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                cursor.execute("DELETE FROM qd_strategy_positions WHERE strategy_id = %s AND symbol = %s AND side = %s", (strategy_id, symbol, side))
-                db.commit()
-                cursor.close()
+            get_db_write_queue().insert(
+                "DELETE FROM qd_strategy_positions WHERE strategy_id = %s AND symbol = %s AND side = %s",
+                (strategy_id, symbol, side),
+                wait=True,
+            )
+            self.position_cache.remove(strategy_id, symbol, side)
         except Exception as e:
+            self.position_cache.invalidate(strategy_id)
             logger.error(f"Failed to close position: {e}")
     
     def _delete_position_by_id(self, position_id: int):
          pass
 
     def _update_positions(self, strategy_id: int, symbol: str, current_price: float):
-        """更新所有持仓的当前价格"""
+        """更新所有持仓的当前价格（每 tick 一次；写入队列中同一策略+币种只保留最新价格）"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                cursor.execute("UPDATE qd_strategy_positions SET current_price = %s WHERE strategy_id = %s AND symbol = %s", (current_price, strategy_id, symbol))
-                db.commit()
-                cursor.close()
+            get_db_write_queue().upsert(
+                ('position_price', int(strategy_id), str(symbol)),
+                "UPDATE qd_strategy_positions SET current_price = %s WHERE strategy_id = %s AND symbol = %s",
+                (current_price, strategy_id, symbol),
+            )
         except Exception:
             pass
             
@@ -0,0 +1,137 @@
+"""
+价格触发索引（所有运行中策略共享）
+
+每个 symbol 维护两条按价格排序的阶梯：
+- up:   价格 >= level 时触发（open_long/add_long/close_short 的触发价、空头止损线、多头止盈线……）
+- down: 价格 <= level 时触发（open_short/add_short/close_long 的触发价、多头止损线、空头止盈线……）
+
+一次价格更新只需两次二分查找即可取出所有被穿越的价位：O(log n + k)。
+每个策略的价位整体替换（set_levels），策略停止时移除。
+"""
+import bisect
+import itertools
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+UP = 'up'
+DOWN = 'down'
+
+# 价位类型
+KIND_SIGNAL = 'signal'              # 指标给出的待触发信号
+KIND_STOP_LOSS = 'stop_loss'        # 服务端止损
+KIND_TAKE_PROFIT = 'take_profit'    # 服务端固定止盈
+KIND_TRAILING_STOP = 'trailing_stop'  # 服务端移动止损
+KIND_REARM = 'rearm'                # 价格穿越后需要重算价位（移动止损的最高/最低价、激活价）
+
+
+class TriggerLevel:
+    __slots__ = ('strategy_id', 'symbol', 'price', 'direction', 'kind', 'signal')
+
+    def __init__(self, strategy_id: int, symbol: str, price: float, direction: str, kind: str,
+                 signal: Optional[Dict[str, Any]] = None):
+        self.strategy_id = strategy_id
+        self.symbol = symbol
+        self.price = float(price)
+        self.direction = direction
+        self.kind = kind
+        # KIND_SIGNAL: 待触发信号本身；风控价位：触发时生成的平仓信号模板
+        self.signal = signal
+
+    def crossed(self, price: float) -> bool:
+        return price >= self.price if self.direction == UP else price <= self.price
+
+    def __repr__(self) -> str:
+        return f"TriggerLevel({self.strategy_id}, {self.kind}, {self.direction} {self.price})"
+
+
+class _Ladders:
+    __slots__ = ('up', 'down')
+
+    def __init__(self):
+        # 按 (price, seq) 升序排列的 (key, level)
+        self.up: List[Tuple[Tuple[float, int], TriggerLevel]] = []
+        self.down: List[Tuple[Tuple[float, int], TriggerLevel]] = []
+
+    def side(self, direction: str) -> list:
+        return self.up if direction == UP else self.down
+
+
+class TriggerIndex:
+    """按 symbol 组织的价格触发索引（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._symbols: Dict[str, _Ladders] = {}
+        # strategy_id -> (symbol, [(direction, key), ...], [levels])
+        self._by_strategy: Dict[int, Tuple[str, List[Tuple[str, Tuple[float, int]]], List[TriggerLevel]]] = {}
+        self._seq = itertools.count()
+        self._queries = 0
+        self._hits = 0
+
+    def set_levels(self, strategy_id: int, symbol: str, levels: List[TriggerLevel]) -> None:
+        """整体替换策略的价位"""
+        with self._lock:
+            self._remove_locked(strategy_id)
+            if not levels:
+                return
+            ladders = self._symbols.get(symbol)
+            if ladders is None:
+                ladders = self._symbols[symbol] = _Ladders()
+            keys = []
+            for level in levels:
+                key = (level.price, next(self._seq))
+                bisect.insort(ladders.side(level.direction), (key, level), key=lambda item: item[0])
+                keys.append((level.direction, key))
+            self._by_strategy[strategy_id] = (symbol, keys, list(levels))
+
+    def remove(self, strategy_id: int) -> None:
+        with self._lock:
+            self._remove_locked(strategy_id)
+
+    def levels_of(self, strategy_id: int) -> List[TriggerLevel]:
+        with self._lock:
+            entry = self._by_strategy.get(strategy_id)
+            return list(entry[2]) if entry else []
+
+    def crossed(self, symbol: str, price: float) -> Dict[int, List[TriggerLevel]]:
+        """当前价格穿越的全部价位，按策略分组：O(log n + k)"""
+        hits: Dict[int, List[TriggerLevel]] = {}
+        with self._lock:
+            self._queries += 1
+            ladders = self._symbols.get(symbol)
+            if ladders is None:
+                return hits
+            # up: level <= price 的前缀
+            end = bisect.bisect_right(ladders.up, (price, float('inf')), key=lambda item: item[0])
+            # down: level >= price 的后缀
+            start = bisect.bisect_left(ladders.down, (price, -1), key=lambda item: item[0])
+            for _, level in itertools.chain(ladders.up[:end], ladders.down[start:]):
+                hits.setdefault(level.strategy_id, []).append(level)
+            self._hits += sum(len(v) for v in hits.values())
+        return hits
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'symbols': len(self._symbols),
+                'strategies': len(self._by_strategy),
+                'levels': sum(len(l.up) + len(l.down) for l in self._symbols.values()),
+                'queries': self._queries,
+                'hits': self._hits,
+            }
+
+    def _remove_locked(self, strategy_id: int) -> None:
+        entry = self._by_strategy.pop(strategy_id, None)
+        if entry is None:
+            return
+        symbol, keys, _ = entry
+        ladders = self._symbols.get(symbol)
+        if ladders is None:
+            return
+        for direction, key in keys:
+            side = ladders.side(direction)
+            i = bisect.bisect_left(side, key, key=lambda item: item[0])
+            if i < len(side) and side[i][0] == key:
+                del side[i]
+        if not ladders.up and not ladders.down:
+            del self._symbols[symbol]
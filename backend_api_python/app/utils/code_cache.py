@@ -0,0 +1,164 @@
+"""
+指标脚本编译缓存
+
+同一份指标代码在实盘中每天要执行成千上万次，每次都做正则安全扫描、遍历 dir(builtins)
+重建受限 builtins、执行 import 前导代码、再把源码交给 exec 重新编译，开销都是重复的。
+
+- CodeCache: 按代码内容 sha256 缓存 compile() 后的 code object 以及安全检查结果（首次需要时才检查），
+  LRU 淘汰（INDICATOR_CODE_CACHE_SIZE，默认 256 条）；
+- get_safe_builtins(): 按允许导入的模块列表缓存受限 builtins 的模板，每次返回新的浅拷贝，
+  脚本改动自己的 builtins 不会影响之后的执行；
+- 指标保存 / 删除时调用 invalidate_indicator_code() 移除旧代码对应的条目。键是代码内容哈希，
+  未失效的旧条目不会被误用，只是占用缓存容量（其他进程中的缓存靠 LRU 淘汰）。
+"""
+import builtins
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 受限 builtins 中移除的函数
+BLOCKED_BUILTINS = (
+    'eval', 'exec', 'compile', 'open', 'input',
+    'help', 'exit', 'quit',
+    'copyright', 'credits', 'license'
+)
+
+
+class CompiledCode:
+    """编译后的指标代码"""
+    __slots__ = ('key', 'code_obj', '_safety', '_lock')
+
+    def __init__(self, key: str, code_obj: Any):
+        self.key = key
+        self.code_obj = code_obj
+        self._safety: Optional[Tuple[bool, Optional[str]]] = None
+        self._lock = threading.Lock()
+
+    def check_safety(self, source: str) -> Tuple[bool, Optional[str]]:
+        """validate_code_safety 的结果（每份代码只检查一次）"""
+        if self._safety is None:
+            with self._lock:
+                if self._safety is None:
+                    from app.utils.safe_exec import validate_code_safety
+                    self._safety = validate_code_safety(source)
+        return self._safety
+
+
+def code_key(code: str) -> str:
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+
+class CodeCache:
+    """按代码哈希缓存编译结果（进程内）"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        try:
+            self.max_entries = max(1, int(max_entries or os.getenv('INDICATOR_CODE_CACHE_SIZE', '256')))
+        except Exception:
+            self.max_entries = 256
+        self._entries: "OrderedDict[str, CompiledCode]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, code: str, filename: str = '<indicator>') -> CompiledCode:
+        """
+        返回编译后的代码；语法错误时抛出 SyntaxError（不缓存）。
+        """
+        key = code_key(code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry
+            self._misses += 1
+
+        entry = CompiledCode(key, compile(code, filename, 'exec'))
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                return existing
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, code: Optional[str]) -> bool:
+        if not code:
+            return False
+        with self._lock:
+            removed = self._entries.pop(code_key(code), None) is not None
+            if removed:
+                self._invalidations += 1
+            return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'invalidations': self._invalidations,
+                'hitRatio': round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_builtins_cache: Dict[Tuple[str, ...], dict] = {}
+_builtins_lock = threading.Lock()
+
+
+def get_safe_builtins(allowed_modules: Sequence[str]) -> dict:
+    """
+    受限 builtins（移除 eval/exec/open 等，__import__ 只允许 allowed_modules），按模块列表缓存。
+
+    返回的是缓存模板的浅拷贝：dict 子类挡不住 dict.__setitem__(__builtins__, ...)，
+    共用同一个对象会让一个脚本改掉之后所有脚本（跨用户、跨沙箱任务）的 builtins。
+    """
+    key = tuple(allowed_modules)
+    cached = _builtins_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+
+    def safe_import(name, *args, **kwargs):
+        if name in key or name.split('.')[0] in key:
+            return builtins.__import__(name, *args, **kwargs)
+        raise ImportError(f"不允许导入模块: {name}")
+
+    safe = {k: getattr(builtins, k) for k in dir(builtins)
+            if not k.startswith('_') and k not in BLOCKED_BUILTINS}
+    safe['__import__'] = safe_import
+    with _builtins_lock:
+        return dict(_builtins_cache.setdefault(key, safe))
+
+
+_code_cache: Optional[CodeCache] = None
+_code_cache_lock = threading.Lock()
+
+
+def get_code_cache() -> CodeCache:
+    global _code_cache
+    if _code_cache is None:
+        with _code_cache_lock:
+            if _code_cache is None:
+                _code_cache = CodeCache()
+    return _code_cache
+
+
+def invalidate_indicator_code(code: Optional[str]) -> None:
+    """qd_indicator_codes 中的代码被修改 / 删除时调用"""
+    if get_code_cache().invalidate(code):
+        logger.debug("Indicator code cache entry invalidated")
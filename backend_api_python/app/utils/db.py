@@ -6,9 +6,11 @@ import sqlite3
 import os
 import threading
 import shutil
+import functools
 from typing import Optional, Any, List, Dict
 from contextlib import contextmanager
 from app.utils.logger import get_logger
+from app.utils.db_migrations import apply_migrations
 
 logger = get_logger(__name__)
 
@@ -374,6 +376,8 @@ def _init_db_schema(conn):
         status TEXT DEFAULT 'success',   -- success/failed
         error_message TEXT DEFAULT '',
         result_json TEXT DEFAULT '',     -- JSON string
+        cache_key TEXT DEFAULT '',       -- content hash (backtest result cache)
+        job_owner TEXT DEFAULT '',       -- host:pid of the process running an async job
         created_at INTEGER
     )
     """)
@@ -395,6 +399,8 @@ def _init_db_schema(conn):
         "status": "TEXT DEFAULT 'success'",
         "error_message": "TEXT DEFAULT ''",
         "result_json": "TEXT DEFAULT ''",
+        "cache_key": "TEXT DEFAULT ''",  # content hash for the backtest result cache
+        "job_owner": "TEXT DEFAULT ''",  # host:pid of the process running an async job
         "created_at": "INTEGER"
     })
 
@@ -423,48 +429,82 @@ def _init_db_schema(conn):
     })
 
     conn.commit()
+
+    # 索引由版本化迁移统一管理（app/utils/db_migrations.py）
+    apply_migrations(conn)
     logger.info("Database schema initialized (SQLite)")
 
 # 初始化一次（按 db_file 维度）
 _has_initialized = False
 _initialized_db_file = None
 
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)) or default)
+    except Exception:
+        return default
+
+
+# 连接参数（进程启动时读取）
+# - SQLITE_WAL: WAL 日志模式，读写互不阻塞（默认开启）
+# - SQLITE_SYNCHRONOUS: WAL 下 NORMAL 足够安全（断电最多丢最近一次提交），比 FULL 少一次 fsync
+# - SQLITE_CACHE_SIZE_KB / SQLITE_MMAP_SIZE_MB: 每个连接的页缓存与内存映射大小
+# - SQLITE_POOL_IDLE_PER_THREAD: 每个线程保留的空闲连接数，0 表示关闭复用（每次新建连接，旧行为）
+_SQLITE_WAL = os.getenv('SQLITE_WAL', 'true').lower() == 'true'
+_SQLITE_SYNCHRONOUS = (os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL') or 'NORMAL').strip().upper()
+if _SQLITE_SYNCHRONOUS not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+    _SQLITE_SYNCHRONOUS = 'NORMAL'
+_SQLITE_CACHE_SIZE_KB = _env_int('SQLITE_CACHE_SIZE_KB', 16384)
+_SQLITE_MMAP_SIZE_MB = _env_int('SQLITE_MMAP_SIZE_MB', 128)
+_SQLITE_BUSY_TIMEOUT_SEC = 30.0
+_POOL_IDLE_PER_THREAD = _env_int('SQLITE_POOL_IDLE_PER_THREAD', 2)
+
+
+@functools.lru_cache(maxsize=1024)
+def _translate_sql(query: str) -> str:
+    """MySQL 风格 SQL -> SQLite（按语句文本缓存，热路径上的同一条 SQL 只转换一次）"""
+    # 1. 替换占位符: %s -> ?
+    query = query.replace('%s', '?')
+    # 2. 替换 INSERT IGNORE -> INSERT OR IGNORE
+    query = query.replace('INSERT IGNORE', 'INSERT OR IGNORE')
+    # 3. 替换 ON DUPLICATE KEY UPDATE -> 简化为 UPSERT (SQLite 3.24+)
+    # 注意：复杂的 ON DUPLICATE KEY UPDATE 很难自动转换，建议业务代码改写
+    # 这里做一个简单的替换尝试，如果失败则需要人工介入代码
+    if 'ON DUPLICATE KEY UPDATE' in query:
+        # 简单的正则替换很难完美，这里记录日志提醒
+        logger.warning(f"Complex SQL may require manual SQLite adaptation: {query}")
+        # 尝试转换为 SQLite 的 ON CONFLICT (id) DO UPDATE SET ...
+        # 但由于不知道主键冲突列，很难自动转换。
+        # 临时方案：如果遇到这种 SQL，可能报错。我们假设主要业务逻辑已经重构。
+    return query
+
+
+def _dict_row_factory(cursor, row):
+    """直接产出 dict（替代 sqlite3.Row + dict() 的二次包装）"""
+    return dict(zip([col[0] for col in cursor.description], row))
+
+
 class SQLiteCursor:
     """模拟 pymysql DictCursor"""
     def __init__(self, cursor):
         self._cursor = cursor
 
     def execute(self, query: str, args: Any = None):
-        # 适配 MySQL -> SQLite 语法
-        # 1. 替换占位符: %s -> ?
-        query = query.replace('%s', '?')
-        # 2. 替换 INSERT IGNORE -> INSERT OR IGNORE
-        query = query.replace('INSERT IGNORE', 'INSERT OR IGNORE')
-        # 3. 替换 ON DUPLICATE KEY UPDATE -> 简化为 UPSERT (SQLite 3.24+) 
-        # 注意：复杂的 ON DUPLICATE KEY UPDATE 很难自动转换，建议业务代码改写
-        # 这里做一个简单的替换尝试，如果失败则需要人工介入代码
-        if 'ON DUPLICATE KEY UPDATE' in query:
-            # 简单的正则替换很难完美，这里记录日志提醒
-            logger.warning(f"Complex SQL may require manual SQLite adaptation: {query}")
-            # 尝试转换为 SQLite 的 ON CONFLICT (id) DO UPDATE SET ...
-            # 但由于不知道主键冲突列，很难自动转换。
-            # 临时方案：如果遇到这种 SQL，可能报错。我们假设主要业务逻辑已经重构。
-            pass
-
+        # 适配 MySQL -> SQLite 语法（见 _translate_sql）
+        query = _translate_sql(query)
         if args:
             return self._cursor.execute(query, args)
         return self._cursor.execute(query)
 
+    def executemany(self, query: str, seq_of_args):
+        return self._cursor.executemany(_translate_sql(query), seq_of_args)
+
     def fetchone(self):
-        row = self._cursor.fetchone()
-        if row is None:
-            return None
-        # Convert sqlite3.Row to dict
-        return dict(row)
+        return self._cursor.fetchone()
 
     def fetchall(self):
-        rows = self._cursor.fetchall()
-        return [dict(row) for row in rows]
+        return self._cursor.fetchall() or []
 
     def close(self):
         self._cursor.close()
@@ -475,10 +515,14 @@ class SQLiteCursor:
 
 class SQLiteConnection:
     """数据库连接包装类"""
-    def __init__(self, db_path):
-        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30.0)
-        # 设置 Row factory 以支持字段名访问
-        self._conn.row_factory = sqlite3.Row
+    def __init__(self, db_path, pooled: bool = False):
+        self.db_path = db_path
+        self.pooled = pooled
+        self.closed = False
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=_SQLITE_BUSY_TIMEOUT_SEC)
+        # 行直接转成 dict，支持字段名访问
+        self._conn.row_factory = _dict_row_factory
+        _apply_pragmas(self._conn)
     
     def cursor(self):
         return SQLiteCursor(self._conn.cursor())
@@ -488,26 +532,40 @@ class SQLiteConnection:
     
     def rollback(self):
         self._conn.rollback()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._conn.in_transaction
     
     def close(self):
+        self.closed = True
         self._conn.close()
 
-@contextmanager
-def get_db_connection():
-    """
-    获取数据库连接 (Context Manager)
-    """
+
+def _apply_pragmas(conn) -> None:
+    """每个连接的调优参数（journal_mode 是库级持久设置，在建表时设置一次）"""
+    try:
+        conn.execute(f"PRAGMA synchronous={_SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size=-{max(0, _SQLITE_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size={max(0, _SQLITE_MMAP_SIZE_MB) * 1024 * 1024}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+    except Exception as e:
+        logger.warning(f"SQLite pragma setup failed: {e}")
+
+
+def _ensure_initialized(db_file: str) -> None:
     global _has_initialized, _initialized_db_file
-    
-    # 简单的连接创建，不使用连接池（SQLite 文件锁机制决定了连接池意义不大）
-    # 使用线程锁防止写冲突（虽然 SQLite 有 WAL 模式，但稳妥起见）
-    # 注意：这里加锁粒度较大，如果是高并发场景可能会慢，但对于个人量化系统足够。
-    
-    # 初始化表结构（确保每个 db_file 都被初始化过）
-    db_file = _get_db_file()
-    if (not _has_initialized) or (_initialized_db_file != db_file):
+    if _has_initialized and _initialized_db_file == db_file:
+        return
+    with _db_lock:
+        if _has_initialized and _initialized_db_file == db_file:
+            return
         try:
-            conn_init = sqlite3.connect(db_file)
+            conn_init = sqlite3.connect(db_file, timeout=_SQLITE_BUSY_TIMEOUT_SEC)
+            if _SQLITE_WAL:
+                mode = conn_init.execute("PRAGMA journal_mode=WAL").fetchone()
+                if not mode or str(mode[0]).lower() != 'wal':
+                    logger.warning(f"SQLite WAL mode unavailable for {db_file}: journal_mode={mode}")
             _init_db_schema(conn_init)
             conn_init.close()
             _has_initialized = True
@@ -515,32 +573,114 @@ def get_db_connection():
         except Exception as e:
             logger.error(f"Failed to initialize database: {e}")
 
-    conn = SQLiteConnection(db_file)
+
+# 线程本地连接复用：每个线程持有少量空闲连接，用完归还而不是关闭。
+# 同一线程内嵌套 get_db_connection() 时拿到的是另一条连接，事务隔离与原来每次新建连接一致。
+_local = threading.local()
+_pool_stats = {'opened': 0, 'reused': 0, 'discarded': 0}
+_pool_stats_lock = threading.Lock()
+
+
+def _count(key: str) -> None:
+    with _pool_stats_lock:
+        _pool_stats[key] += 1
+
+
+def _idle_connections(db_file: str) -> List[SQLiteConnection]:
+    # fork 出来的子进程不能复用父进程的连接（不关闭，交给父进程）
+    if getattr(_local, 'pid', None) != os.getpid() or getattr(_local, 'db_file', None) != db_file:
+        for c in getattr(_local, 'idle', None) or []:
+            if getattr(_local, 'pid', None) == os.getpid():
+                try:
+                    c.close()
+                except Exception:
+                    pass
+        _local.pid = os.getpid()
+        _local.db_file = db_file
+        _local.idle = []
+    return _local.idle
+
+
+def _acquire(db_file: str) -> SQLiteConnection:
+    if _POOL_IDLE_PER_THREAD > 0:
+        idle = _idle_connections(db_file)
+        if idle:
+            _count('reused')
+            return idle.pop()
+    _count('opened')
+    return SQLiteConnection(db_file, pooled=_POOL_IDLE_PER_THREAD > 0)
+
+
+def _release(conn: SQLiteConnection) -> None:
+    if conn.closed:
+        return
+    try:
+        # 未提交的写入在归还前回滚（与原来关闭连接时丢弃未提交事务的语义一致）
+        if conn.in_transaction:
+            conn.rollback()
+    except Exception:
+        conn.closed = True
+    if conn.pooled and not conn.closed:
+        idle = _idle_connections(conn.db_path)
+        if len(idle) < _POOL_IDLE_PER_THREAD:
+            idle.append(conn)
+            return
+    _count('discarded')
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+@contextmanager
+def get_db_connection():
+    """
+    获取数据库连接 (Context Manager)
+
+    连接按线程复用（见 _acquire/_release），退出时未提交的事务会被回滚。
+    """
+    # 初始化表结构（确保每个 db_file 都被初始化过）
+    db_file = _get_db_file()
+    _ensure_initialized(db_file)
+
+    conn = _acquire(db_file)
     try:
-        # with _db_lock: # SQLite 内部有锁，这里如果不跨线程共享连接其实不用强加锁
         yield conn
     except Exception as e:
         logger.error(f"Database operation error: {e}")
-        conn.rollback()
+        try:
+            conn.rollback()
+        except Exception:
+            pass
         raise e
     finally:
-        conn.close()
+        _release(conn)
 
 def get_db_connection_sync():
-    """兼容旧接口"""
-    global _has_initialized, _initialized_db_file
+    """兼容旧接口（返回独立连接，由调用方 close）"""
     db_file = _get_db_file()
-    if (not _has_initialized) or (_initialized_db_file != db_file):
-        try:
-            conn_init = sqlite3.connect(db_file)
-            _init_db_schema(conn_init)
-            conn_init.close()
-            _has_initialized = True
-            _initialized_db_file = db_file
-        except Exception as e:
-            logger.error(f"Failed to initialize database: {e}")
-            
+    _ensure_initialized(db_file)
     return SQLiteConnection(db_file)
 
+def get_db_pool_stats() -> Dict[str, Any]:
+    """连接复用与语句缓存统计"""
+    with _pool_stats_lock:
+        out = dict(_pool_stats)
+    info = _translate_sql.cache_info()
+    out.update({
+        'statementCacheHits': info.hits,
+        'statementCacheMisses': info.misses,
+        'statementCacheSize': info.currsize,
+        'journalMode': 'wal' if _SQLITE_WAL else 'default',
+        'synchronous': _SQLITE_SYNCHRONOUS,
+    })
+    return out
+
 def close_db_connection():
-    pass
+    """关闭当前线程缓存的空闲连接"""
+    for c in getattr(_local, 'idle', None) or []:
+        try:
+            c.close()
+        except Exception:
+            pass
+    _local.idle = []
@@ -0,0 +1,342 @@
+"""
+SQLite 版本化迁移：统一管理热点表的二级索引与派生表
+
+_init_db_schema 建表后调用 apply_migrations()：
+- 已应用的版本记录在 qd_schema_migrations，每个版本只执行一次；
+- 索引一律 CREATE INDEX IF NOT EXISTS，语句同样要求可重复执行，中途失败后重跑是安全的；
+- 新索引/新表请追加新版本，不要修改已发布的版本。
+
+HOT_QUERIES 是热点查询目录（与调用处的 SQL 保持一致），check_query_plans() 对其执行
+EXPLAIN QUERY PLAN，出现全表扫描即视为回归（见 test_query_plans.py）。
+"""
+from __future__ import annotations
+
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class IndexDef:
+    name: str
+    table: str
+    columns: str
+
+    def create_sql(self) -> str:
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table}({self.columns})"
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    indexes: Tuple[IndexDef, ...] = ()
+    statements: Tuple[str, ...] = ()  # run after the indexes, in order
+
+
+# Dashboard aggregates, maintained incrementally by app/services/trade_aggregates.py (strategy_id 0 = all strategies).
+# Days/hours are server local time, like the dashboard used to bucket trades.
+DASHBOARD_AGGREGATE_TABLES: Tuple[str, ...] = (
+    """
+    CREATE TABLE IF NOT EXISTS qd_pnl_daily (
+        strategy_id INTEGER NOT NULL,
+        day TEXT NOT NULL, -- YYYY-MM-DD
+        trades INTEGER DEFAULT 0,
+        wins INTEGER DEFAULT 0,
+        losses INTEGER DEFAULT 0,
+        gross_profit REAL DEFAULT 0,
+        gross_loss REAL DEFAULT 0, -- absolute value
+        pnl REAL DEFAULT 0,
+        PRIMARY KEY (strategy_id, day)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS qd_pnl_hourly (
+        hour INTEGER PRIMARY KEY, -- 0-23
+        trades INTEGER DEFAULT 0,
+        pnl REAL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS qd_pnl_strategy (
+        strategy_id INTEGER PRIMARY KEY,
+        trades INTEGER DEFAULT 0,
+        wins INTEGER DEFAULT 0,
+        losses INTEGER DEFAULT 0,
+        gross_profit REAL DEFAULT 0,
+        gross_loss REAL DEFAULT 0,
+        pnl REAL DEFAULT 0, -- cumulative realized pnl
+        max_win REAL DEFAULT 0,
+        max_loss REAL DEFAULT 0,
+        equity_peak REAL DEFAULT 0, -- running peak of cumulative pnl (starts at 0)
+        max_drawdown REAL DEFAULT 0,
+        updated_at INTEGER
+    )
+    """,
+)
+
+# Recompute every aggregate from qd_strategy_trades (migration backfill and rebuild command).
+# Drawdown is replayed in insertion (id) order with window functions, matching the incremental updates.
+DASHBOARD_AGGREGATE_REBUILD: Tuple[str, ...] = (
+    "DELETE FROM qd_pnl_daily",
+    "DELETE FROM qd_pnl_hourly",
+    "DELETE FROM qd_pnl_strategy",
+    """
+    INSERT INTO qd_pnl_daily (strategy_id, day, trades, wins, losses, gross_profit, gross_loss, pnl)
+    SELECT sid, day, COUNT(*), SUM(p > 0), SUM(p < 0),
+           SUM(CASE WHEN p > 0 THEN p ELSE 0 END), SUM(CASE WHEN p < 0 THEN -p ELSE 0 END), SUM(p)
+    FROM (
+        SELECT strategy_id AS sid, date(created_at, 'unixepoch', 'localtime') AS day, COALESCE(profit, 0) AS p
+        FROM qd_strategy_trades WHERE created_at > 0 AND strategy_id > 0
+        UNION ALL
+        SELECT 0, date(created_at, 'unixepoch', 'localtime'), COALESCE(profit, 0)
+        FROM qd_strategy_trades WHERE created_at > 0
+    )
+    GROUP BY sid, day
+    """,
+    """
+    INSERT INTO qd_pnl_hourly (hour, trades, pnl)
+    SELECT CAST(strftime('%H', created_at, 'unixepoch', 'localtime') AS INTEGER), COUNT(*), SUM(COALESCE(profit, 0))
+    FROM qd_strategy_trades WHERE created_at > 0
+    GROUP BY 1
+    """,
+    """
+    INSERT INTO qd_pnl_strategy (strategy_id, trades, wins, losses, gross_profit, gross_loss, pnl,
+                                 max_win, max_loss, equity_peak, max_drawdown, updated_at)
+    SELECT sid, COUNT(*), SUM(p > 0), SUM(p < 0),
+           SUM(CASE WHEN p > 0 THEN p ELSE 0 END), SUM(CASE WHEN p < 0 THEN -p ELSE 0 END), SUM(p),
+           MAX(p), MIN(p), MAX(0, MAX(cum)), MAX(0, MAX(MAX(0, peak) - cum)),
+           CAST((julianday('now') - 2440587.5) * 86400 AS INTEGER)
+    FROM (
+        SELECT sid, p, cum, MAX(cum) OVER (PARTITION BY sid ORDER BY id ROWS UNBOUNDED PRECEDING) AS peak
+        FROM (
+            SELECT sid, id, p, SUM(p) OVER (PARTITION BY sid ORDER BY id ROWS UNBOUNDED PRECEDING) AS cum
+            FROM (
+                SELECT strategy_id AS sid, id, COALESCE(profit, 0) AS p FROM qd_strategy_trades WHERE strategy_id > 0
+                UNION ALL
+                SELECT 0, id, COALESCE(profit, 0) FROM qd_strategy_trades
+            )
+        )
+    )
+    GROUP BY sid
+    """,
+)
+
+
+MIGRATIONS: Tuple[Migration, ...] = (
+    Migration(1, "backtest result cache lookup", (
+        IndexDef("idx_backtest_runs_cache_key", "qd_backtest_runs", "cache_key"),
+    )),
+    Migration(2, "hot-table indexes: order queue, signal de-dup, trade history, notifications, backtest list", (
+        # PendingOrderWorker: WHERE status='pending' ORDER BY priority DESC, id ASC; stale sweep on status='processing'
+        IndexDef("idx_pending_orders_status_priority", "pending_orders", "status, priority DESC, id"),
+        # TradingExecutor._enqueue_pending_order de-dup: strategy+symbol+signal(+candle) ORDER BY id DESC LIMIT 1
+        IndexDef("idx_pending_orders_signal", "pending_orders", "strategy_id, symbol, signal_type, signal_ts"),
+        # Trade list / equity curve per strategy (ORDER BY created_at)
+        IndexDef("idx_strategy_trades_strategy_created", "qd_strategy_trades", "strategy_id, created_at"),
+        # Dashboard recent trades: ORDER BY created_at DESC LIMIT 500
+        IndexDef("idx_strategy_trades_created", "qd_strategy_trades", "created_at"),
+        # Browser notification polling per strategy (ORDER BY id DESC)
+        IndexDef("idx_strategy_notifications_strategy", "qd_strategy_notifications", "strategy_id"),
+        # Backtest history list per user (ORDER BY id DESC)
+        IndexDef("idx_backtest_runs_user", "qd_backtest_runs", "user_id"),
+    )),
+    Migration(3, "dashboard aggregate tables (daily / hourly / per-strategy realized pnl), backfilled from trades",
+              statements=DASHBOARD_AGGREGATE_TABLES + DASHBOARD_AGGREGATE_REBUILD),
+)
+
+
+def all_indexes() -> List[IndexDef]:
+    return [idx for m in MIGRATIONS for idx in m.indexes]
+
+
+def apply_migrations(conn) -> List[int]:
+    """Apply pending migrations on a raw sqlite3 connection; returns the versions applied now."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS qd_schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT DEFAULT '',
+            applied_at INTEGER
+        )
+        """
+    )
+    applied = {int(r[0]) for r in conn.execute("SELECT version FROM qd_schema_migrations").fetchall()}
+    done: List[int] = []
+    for m in sorted(MIGRATIONS, key=lambda x: x.version):
+        if m.version in applied:
+            continue
+        try:
+            for idx in m.indexes:
+                conn.execute(idx.create_sql())
+            for sql in m.statements:
+                conn.execute(sql)
+            conn.execute(
+                "INSERT INTO qd_schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+                (m.version, m.description, int(time.time())),
+            )
+            conn.commit()
+            done.append(m.version)
+            logger.info(f"Schema migration {m.version} applied: {m.description}")
+        except Exception as e:
+            conn.rollback()
+            # Later versions may depend on this one: stop here and retry on next start.
+            logger.error(f"Schema migration {m.version} failed: {e}")
+            break
+    if done:
+        try:
+            conn.execute("PRAGMA optimize")
+        except Exception:
+            pass
+    return done
+
+
+def missing_indexes(conn) -> List[str]:
+    """Names of managed indexes that do not exist in the database."""
+    present = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()}
+    return [idx.name for idx in all_indexes() if idx.name not in present]
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    name: str
+    sql: str
+    params: Tuple[Any, ...] = ()
+    expect_index: Optional[str] = None
+
+
+# 热点查询目录：SQL 与调用处保持一致（%s 已换成 ?）
+HOT_QUERIES: Tuple[HotQuery, ...] = (
+    HotQuery(
+        "pending_orders.fetch_pending",  # PendingOrderWorker._fetch_pending_orders
+        """
+        SELECT * FROM pending_orders
+        WHERE status = 'pending' AND (attempts < max_attempts)
+        ORDER BY priority DESC, id ASC
+        LIMIT ?
+        """,
+        (50,),
+        "idx_pending_orders_status_priority",
+    ),
+    HotQuery(
+        "pending_orders.requeue_stale",  # PendingOrderWorker._maybe_requeue_stale
+        """
+        UPDATE pending_orders SET status = 'pending', updated_at = ?
+        WHERE status = 'processing' AND (updated_at IS NULL OR updated_at < ?) AND (attempts < max_attempts)
+        """,
+        (0, 0),
+        "idx_pending_orders_status_priority",
+    ),
+    HotQuery(
+        "pending_orders.dedup_candle",  # TradingExecutor._enqueue_pending_order (open signals)
+        """
+        SELECT id, status, created_at FROM pending_orders
+        WHERE strategy_id = ? AND symbol = ? AND signal_type = ? AND signal_ts = ?
+        ORDER BY id DESC LIMIT 1
+        """,
+        (1, "BTC/USDT", "open_long", 0),
+        "idx_pending_orders_signal",
+    ),
+    HotQuery(
+        "pending_orders.dedup_recent",  # TradingExecutor._enqueue_pending_order (other signals)
+        """
+        SELECT id, status, created_at FROM pending_orders
+        WHERE strategy_id = ? AND symbol = ? AND signal_type = ?
+        ORDER BY id DESC LIMIT 1
+        """,
+        (1, "BTC/USDT", "close_long"),
+        "idx_pending_orders_signal",
+    ),
+    HotQuery(
+        "trades.by_strategy",  # routes/strategy.py get_trades
+        """
+        SELECT id, strategy_id, symbol, type, price, amount, value, commission, commission_ccy, profit, created_at
+        FROM qd_strategy_trades WHERE strategy_id = ? ORDER BY id DESC
+        """,
+        (1,),
+        "idx_strategy_trades_strategy_created",
+    ),
+    HotQuery(
+        "trades.equity_curve",  # routes/strategy.py equity curve
+        "SELECT created_at, profit FROM qd_strategy_trades WHERE strategy_id = ? ORDER BY created_at ASC",
+        (1,),
+        "idx_strategy_trades_strategy_created",
+    ),
+    HotQuery(
+        "trades.dashboard_recent",  # routes/dashboard.py recent trades
+        """
+        SELECT t.*, s.strategy_name FROM qd_strategy_trades t
+        LEFT JOIN qd_strategies_trading s ON s.id = t.strategy_id
+        ORDER BY t.created_at DESC LIMIT 100
+        """,
+        (),
+        "idx_strategy_trades_created",
+    ),
+    HotQuery(
+        "pnl_daily.dashboard_overall",  # routes/dashboard.py daily pnl / calendar (aggregate rows)
+        "SELECT day, pnl FROM qd_pnl_daily WHERE strategy_id = 0 ORDER BY day",
+        (),
+    ),
+    HotQuery(
+        "positions.by_strategy",  # TradingExecutor._load_positions
+        """
+        SELECT id, symbol, side, size, entry_price, highest_price, lowest_price
+        FROM qd_strategy_positions WHERE strategy_id = ?
+        """,
+        (1,),
+    ),
+    HotQuery(
+        "positions.by_key",  # live_trading/records.py _fetch_position
+        "SELECT * FROM qd_strategy_positions WHERE strategy_id = ? AND symbol = ? AND side = ?",
+        (1, "BTC/USDT", "long"),
+    ),
+    HotQuery(
+        "notifications.by_strategy",  # routes/strategy.py get_strategy_notifications
+        "SELECT * FROM qd_strategy_notifications WHERE strategy_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+        (1, 0, 50),
+    ),
+    HotQuery(
+        "backtest_runs.by_user",  # routes/backtest.py history list
+        """
+        SELECT id, user_id, indicator_id, market, symbol, timeframe, status, created_at
+        FROM qd_backtest_runs WHERE user_id = ? ORDER BY id DESC LIMIT ? OFFSET ?
+        """,
+        (1, 20, 0),
+        "idx_backtest_runs_user",
+    ),
+    HotQuery(
+        "backtest_runs.cache_lookup",  # services/backtest_cache.py _load_from_db
+        """
+        SELECT result_json FROM qd_backtest_runs
+        WHERE cache_key = ? AND status = 'success' AND result_json != ''
+        ORDER BY id DESC LIMIT 1
+        """,
+        ("k",),
+        "idx_backtest_runs_cache_key",
+    ),
+)
+
+# "SCAN t" / "SCAN TABLE t" without "USING ... INDEX" is a full table scan.
+_FULL_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?:\s+AS\s+\w+)?\s*$")
+
+
+def explain_plan(conn, sql: str, params: Sequence[Any] = ()) -> List[str]:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", tuple(params)).fetchall()
+    return [str(r[-1]) for r in rows]
+
+
+def check_query_plans(conn, queries: Sequence[HotQuery] = HOT_QUERIES) -> List[Dict[str, Any]]:
+    """Run EXPLAIN QUERY PLAN for each hot query; ok=False on a full scan or when the expected index is unused."""
+    out: List[Dict[str, Any]] = []
+    for q in queries:
+        plan = explain_plan(conn, q.sql, q.params)
+        problems = [f"full scan: {line}" for line in plan if _FULL_SCAN_RE.match(line.strip())]
+        if q.expect_index and not any(q.expect_index in line for line in plan):
+            problems.append(f"expected index {q.expect_index} not used")
+        out.append({"name": q.name, "ok": not problems, "problems": problems, "plan": plan})
+    return out
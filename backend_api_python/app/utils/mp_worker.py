@@ -0,0 +1,51 @@
+"""
+子进程 worker 的启动上下文
+
+spawn / forkserver 启动的子进程会先按父进程的 __main__ 重新导入一遍入口脚本（以 __mp_main__ 的名义）。
+以 `python run.py` 启动时，这意味着每个指标沙箱 / 参数扫描 worker 都会再执行一次 run.py 的顶层代码，
+连带启动调度器、挂单 worker 并恢复运行中的策略。
+
+get_worker_context() 返回一个 spawn 上下文：由它启动的子进程把本模块（只依赖标准库）当作 __main__，
+不再导入父进程的入口脚本。worker 的目标函数仍按所在模块路径正常导入；环境变量与 sys.path 照常继承。
+"""
+import multiprocessing
+import multiprocessing.context
+import multiprocessing.spawn as _spawn
+import threading
+
+_local = threading.local()
+_orig_get_preparation_data = _spawn.get_preparation_data
+
+
+def _get_preparation_data(name):
+    data = _orig_get_preparation_data(name)
+    if getattr(_local, 'clean_main', False):
+        data.pop('init_main_from_path', None)
+        data['init_main_from_name'] = __name__
+    return data
+
+
+# Popen 实现在启动时按模块属性查找 spawn.get_preparation_data；只有经由 _WorkerProcess 启动的进程受影响。
+_spawn.get_preparation_data = _get_preparation_data
+
+
+class _WorkerProcess(multiprocessing.context.SpawnProcess):
+    @staticmethod
+    def _Popen(process_obj):
+        _local.clean_main = True
+        try:
+            return multiprocessing.context.SpawnProcess._Popen(process_obj)
+        finally:
+            _local.clean_main = False
+
+
+class _WorkerContext(multiprocessing.context.SpawnContext):
+    Process = _WorkerProcess
+
+
+_context = _WorkerContext()
+
+
+def get_worker_context() -> multiprocessing.context.BaseContext:
+    """供 ProcessPoolExecutor(mp_context=...) 与手动创建 Process/Pipe 使用的 spawn 上下文"""
+    return _context
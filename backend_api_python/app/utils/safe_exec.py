@@ -7,7 +7,8 @@ import sys
 import os
 import threading
 import traceback
-from typing import Dict, Any, Optional, Tuple
+from types import CodeType
+from typing import Dict, Any, Optional, Tuple, Union
 from contextlib import contextmanager
 
 from app.utils.logger import get_logger
@@ -70,7 +71,7 @@ def timeout_context(seconds: int):
 
 
 def safe_exec_code(
-    code: str,
+    code: Union[str, CodeType],
     exec_globals: Dict[str, Any],
     exec_locals: Optional[Dict[str, Any]] = None,
     timeout: int = 30,
@@ -80,7 +81,7 @@ def safe_exec_code(
     安全执行Python代码
     
     Args:
-        code: 要执行的Python代码
+        code: 要执行的Python代码（源码，或 code_cache 中 compile() 后的 code object）
         exec_globals: 全局变量字典
         exec_locals: 局部变量字典（如果为None，则使用exec_globals）
         timeout: 超时时间（秒），默认30秒
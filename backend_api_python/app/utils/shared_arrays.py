@@ -0,0 +1,38 @@
+"""
+共享内存数组打包工具
+
+父进程把多个一维数组打包进同一块 SharedMemory，子进程按 layout 挂载为 numpy 视图，
+数组本身不经过 pickle。共享内存的回收（unlink）统一由创建方负责。
+"""
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def pack_shared_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[shared_memory.SharedMemory, List[tuple]]:
+    """将多个数组打包进同一块共享内存，返回 (shm, layout)；layout 项为 (key, dtype, offset, length)"""
+    layout = []
+    offset = 0
+    for key, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        offset = (offset + 7) // 8 * 8  # 8 字节对齐
+        layout.append((key, arr.dtype.str, offset, len(arr)))
+        offset += arr.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (key, dtype, off, length) in layout:
+        view = np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf, offset=off)
+        view[:] = arrays[key]
+    return shm, layout
+
+
+def attach_shared_arrays(shm_name: str, layout: List[tuple]) -> Tuple[shared_memory.SharedMemory, Dict[str, np.ndarray]]:
+    """在子进程中挂载共享内存并构建只读数组视图"""
+    # spawn 子进程与父进程共用同一个 resource_tracker，共享内存的回收（unlink）统一由父进程负责
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = {}
+    for (key, dtype, off, length) in layout:
+        view = np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf, offset=off)
+        view.flags.writeable = False
+        arrays[key] = view
+    return shm, arrays
@@ -0,0 +1,78 @@
+"""
+Single-flight request coalescing.
+
+Concurrent calls with the same key share one execution: the first caller (leader) runs the
+function, later callers (waiters) block on the leader's Future and receive the same result.
+Exceptions raised by the leader are re-raised in every waiter.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """按 key 合并并发的相同请求（进程内）"""
+
+    def __init__(self, name: str = ''):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._calls = 0
+        self._coalesced = 0
+        self._failures = 0
+        self._max_waiters = 0
+        self._waiters: Dict[Hashable, int] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        执行 fn 或等待同 key 正在执行的调用。
+
+        Returns:
+            (result, shared)；shared=True 表示结果来自其他线程发起的调用
+        """
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self._coalesced += 1
+                n = self._waiters.get(key, 0) + 1
+                self._waiters[key] = n
+                self._max_waiters = max(self._max_waiters, n)
+                leader = False
+            else:
+                fut = Future()
+                self._inflight[key] = fut
+                self._waiters[key] = 0
+                self._calls += 1
+                leader = True
+
+        if not leader:
+            return fut.result(timeout=timeout), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._failures += 1
+                self._inflight.pop(key, None)
+                self._waiters.pop(key, None)
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._waiters.pop(key, None)
+        fut.set_result(result)
+        return result, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._calls + self._coalesced
+            return {
+                'name': self.name,
+                'inflight': len(self._inflight),
+                'waiting': sum(self._waiters.values()),
+                'calls': self._calls,
+                'coalesced': self._coalesced,
+                'failures': self._failures,
+                'maxWaiters': self._max_waiters,
+                'coalesceRatio': round(self._coalesced / total, 4) if total else 0.0,
+            }
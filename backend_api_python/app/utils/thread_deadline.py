@@ -0,0 +1,123 @@
+"""
+线程内执行的墙钟超时（看门狗）
+
+实盘增量计算（TailIndicators / on_tick）的状态只能留在执行器进程里，无法放进沙箱进程池；
+signal.alarm 又只在主线程生效。call_with_deadline() 在调用线程里执行函数，由一个共享的看门狗线程
+在超时后通过 PyThreadState_SetAsyncExc 向该线程注入中断异常：
+
+- 中断异常继承 BaseException，脚本里的 `except Exception` 吞不掉；被裸 except 吞掉时看门狗
+  每 _REFIRE_SEC 秒重新注入，直到调用返回；
+- 调用方拿到的是 DeadlineExceeded（TimeoutError 子类）；
+- 注入的异常只在线程执行 Python 字节码时生效：卡在单个 C 调用（大矩阵运算、time.sleep）里时，
+  要等该调用返回才会中断，调用方应在超时后把对应的策略降级 / 标记为故障。
+"""
+import ctypes
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+_REFIRE_SEC = 0.1
+
+
+class DeadlineExceeded(TimeoutError):
+    """执行超过墙钟时限（已被看门狗中断）"""
+    pass
+
+
+class _Interrupt(BaseException):
+    """看门狗注入的异常（不应被用户代码捕获）"""
+    pass
+
+
+def _set_async_exc(ident: int, exc: Optional[type]) -> int:
+    return ctypes.pythonapi.PyThreadState_SetAsyncExc(
+        ctypes.c_ulong(ident), ctypes.py_object(exc) if exc is not None else ctypes.c_void_p(0)
+    )
+
+
+class _Guard:
+    __slots__ = ('ident', 'deadline', 'fired', 'active')
+
+    def __init__(self, ident: int, deadline: float):
+        self.ident = ident
+        self.deadline = deadline
+        self.fired = False
+        self.active = True
+
+
+class _Watchdog:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._guards: Dict[int, _Guard] = {}
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self.interrupts = 0
+
+    def arm(self, timeout: float) -> int:
+        with self._cond:
+            token = next(self._seq)
+            self._guards[token] = _Guard(threading.get_ident(), time.monotonic() + float(timeout))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='DeadlineWatchdog', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            return token
+
+    def disarm(self, token: int) -> bool:
+        """停止监视；返回是否已触发过中断（并清除尚未送达的中断）"""
+        with self._cond:
+            guard = self._guards.pop(token, None)
+            if guard is None:
+                return False
+            guard.active = False
+            if guard.fired:
+                _set_async_exc(guard.ident, None)
+            return guard.fired
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                for guard in self._guards.values():
+                    if guard.active and guard.deadline <= now:
+                        if _set_async_exc(guard.ident, _Interrupt) == 1:
+                            if not guard.fired:
+                                self.interrupts += 1
+                            guard.fired = True
+                        guard.deadline = now + _REFIRE_SEC
+                wait = min((g.deadline for g in self._guards.values()), default=now + 60.0) - now
+                self._cond.wait(max(0.001, wait))
+
+
+_watchdog = _Watchdog()
+
+
+def call_with_deadline(timeout: Optional[float], fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    在当前线程执行 fn(*args, **kwargs)，超过 timeout 秒后中断并抛出 DeadlineExceeded。
+
+    timeout 为空或 <= 0 时不限制。
+    """
+    if not timeout or timeout <= 0:
+        return fn(*args, **kwargs)
+    token = _watchdog.arm(timeout)
+    fired = False
+    try:
+        return fn(*args, **kwargs)
+    except _Interrupt:
+        fired = True
+    finally:
+        # 中断可能恰好在退出时送达：重试直到解除监视；已触发时以超时异常替换返回值 / 其它异常
+        while True:
+            try:
+                fired = _watchdog.disarm(token) or fired
+                break
+            except _Interrupt:
+                fired = True
+        if fired:
+            raise DeadlineExceeded(f"代码执行超时（超过{timeout}秒）") from None
+
+
+def deadline_stats() -> Dict[str, Any]:
+    return {'interrupts': _watchdog.interrupts}
@@ -76,7 +76,10 @@ from app.config.settings import Config
 
 # Create app instance (for gunicorn use)
 # gunicorn -c gunicorn_config.py "run:app"
-app = create_app()
+# multiprocessing spawn/forkserver children re-import this file as __mp_main__:
+# never boot a second app (schedulers, pending-order worker, strategy restore) there.
+if __name__ != '__mp_main__':
+    app = create_app()
 
 
 def main():
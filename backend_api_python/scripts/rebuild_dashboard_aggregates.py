@@ -0,0 +1,66 @@
+"""
+从 qd_strategy_trades 全量重建仪表盘聚合表（qd_pnl_daily / qd_pnl_hourly / qd_pnl_strategy）。
+
+背景：
+- 仪表盘 summary 不再每次扫描全部成交记录，而是读取随每笔成交增量维护的聚合表
+  （见 app/services/trade_aggregates.py；建表与首次回填由 schema 迁移 v3 完成）。
+- 以下情况需要手动重建：手工修改/删除了历史成交（例如 backfill_zero_trades.py --apply 之后）、
+  修改了服务器时区（日/小时按本地时间分桶），或怀疑聚合与明细不一致。
+
+使用：
+  python backend_api_python/scripts/rebuild_dashboard_aggregates.py
+  python backend_api_python/scripts/rebuild_dashboard_aggregates.py --check   # 只对比，不写入
+
+注意：
+- 重建在一个写事务（BEGIN IMMEDIATE）内完成，期间新成交会等待，不会丢失。
+"""
+
+from __future__ import annotations
+
+import argparse
+from typing import Any, Dict
+
+from app.utils.db import get_db_connection
+
+
+def _overall_from_trades() -> Dict[str, Any]:
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute("SELECT COUNT(*) AS trades, COALESCE(SUM(profit), 0) AS pnl FROM qd_strategy_trades")
+        row = cur.fetchone() or {}
+        cur.close()
+    return {"trades": int(row.get("trades") or 0), "pnl": float(row.get("pnl") or 0.0)}
+
+
+def _overall_from_aggregates() -> Dict[str, Any]:
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute("SELECT trades, pnl FROM qd_pnl_strategy WHERE strategy_id = 0")
+        row = cur.fetchone() or {}
+        cur.close()
+    return {"trades": int(row.get("trades") or 0), "pnl": float(row.get("pnl") or 0.0)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--check", action="store_true", help="只对比明细与聚合的总笔数/总盈亏，不重建")
+    args = ap.parse_args()
+
+    from app.services.db_write_queue import get_db_write_queue
+
+    get_db_write_queue().flush()
+    detail = _overall_from_trades()
+    agg = _overall_from_aggregates()
+    consistent = detail["trades"] == agg["trades"] and abs(detail["pnl"] - agg["pnl"]) < 1e-6
+    print(f"[check] trades={detail['trades']} pnl={detail['pnl']:.8f} | aggregates trades={agg['trades']} pnl={agg['pnl']:.8f} consistent={consistent}")
+    if args.check:
+        return
+
+    from app.services.trade_aggregates import rebuild_aggregates
+
+    result = rebuild_aggregates()
+    print(f"[done] trades={result['trades']} rows={result['rows']} seconds={result['seconds']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+回测引擎一致性测试
+
+对比 NumPy 数组引擎（_simulate_trading_arrays）与旧版逐行引擎（_simulate_trading_new_format）
+在一组策略配置上的交易记录、权益曲线与回测指标，要求完全一致；
+参数扫描（run_sweep）多进程与单进程的结果也要求完全一致；
+扫描通过 BacktestJobManager 以任务方式执行：进度按参数组合计数，排队等待扫描名额（BACKTEST_SWEEP_CONCURRENCY）期间可取消。
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('SQLITE_DATABASE_FILE', os.path.join(tempfile.mkdtemp(), 'backtest_parity.db'))
+
+import app.services.backtest as backtest_module
+from app.services.backtest import BacktestService
+from app.services.backtest_jobs import JOB_CANCELLED, JOB_KIND_SWEEP, JOB_SUCCESS, BacktestJobManager
+
+
+def generate_test_df(count=3000, base_price=30000.0, seed=7):
+    """生成随机游走的 OHLCV 数据（1分钟K线）"""
+    rng = np.random.default_rng(seed)
+    close = base_price * np.exp(np.cumsum(rng.normal(0, 0.004, count)))
+    open_ = np.concatenate(([base_price], close[:-1]))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.006, count))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.006, count))
+    volume = rng.uniform(10, 100, count)
+    index = pd.date_range('2024-01-01', periods=count, freq='1min')
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume}, index=index)
+
+
+def generate_test_signals(df, seed=11):
+    """基于均线交叉 + 随机噪声生成 buy/sell 信号"""
+    rng = np.random.default_rng(seed)
+    fast = df['close'].rolling(5).mean()
+    slow = df['close'].rolling(20).mean()
+    buy = (fast > slow) & (fast.shift(1) <= slow.shift(1))
+    sell = (fast < slow) & (fast.shift(1) >= slow.shift(1))
+    noise = pd.Series(rng.random(len(df)) < 0.01, index=df.index)
+    return {'buy': (buy | noise).fillna(False), 'sell': sell.fillna(False)}
+
+
+STRATEGY_CONFIGS = [
+    None,
+    {'execution': {'signalTiming': 'bar_close'}},
+    {'risk': {'stopLossPct': 0.05, 'takeProfitPct': 0.1}},
+    {'risk': {'stopLossPct': 0.03, 'trailing': {'enabled': True, 'pct': 0.02, 'activationPct': 0.04}}},
+    {'risk': {'takeProfitPct': 0.08, 'trailing': {'enabled': True, 'pct': 0.03}}},
+    {'position': {'entryPct': 30}, 'scale': {'trendAdd': {'enabled': True, 'stepPct': 0.02, 'sizePct': 0.2, 'maxTimes': 3}}},
+    {'position': {'entryPct': 0.5}, 'scale': {'dcaAdd': {'enabled': True, 'stepPct': 0.03, 'sizePct': 0.3, 'maxTimes': 0}}},
+    {'scale': {'trendReduce': {'enabled': True, 'stepPct': 0.02, 'sizePct': 0.5, 'maxTimes': 2},
+               'adverseReduce': {'enabled': True, 'stepPct': 0.02, 'sizePct': 0.3, 'maxTimes': 2}}},
+    {'risk': {'stopLossPct': 0.5}, 'scale': {'trendReduce': {'enabled': True, 'stepPct': 0.01, 'sizePct': 1.0}}},
+    {'execution': {'signalTiming': 'bar_close'}, 'risk': {'stopLossPct': 0.02},
+     'position': {'entryPct': 0.8},
+     'scale': {'trendAdd': {'enabled': True, 'stepPct': 0.01, 'sizePct': 0.5}, 'dcaAdd': {'enabled': True, 'stepPct': 0.01, 'sizePct': 0.5}}},
+]
+
+# (leverage, trade_direction, commission, slippage)
+MARKET_PARAMS = [
+    (1, 'long', 0.001, 0.0),
+    (3, 'short', 0.0005, 0.0002),
+    (10, 'both', 0.0004, 0.0001),
+    (50, 'both', 0.001, 0.0),
+]
+
+
+def run_legacy(service, df, signals, params, strategy_config, initial_capital=10000.0):
+    """旧引擎：iterrows 逐行模拟"""
+    leverage, direction, commission, slippage = params
+    norm = {k: pd.Series(v, index=df.index) for k, v in service._normalize_signals(signals, len(df), direction).items()}
+    curve, trades, total_commission = service._simulate_trading_new_format(
+        df, norm, initial_capital, commission, slippage, leverage, direction, strategy_config
+    )
+    values = [e['value'] for e in curve]
+    metrics = service._calculate_metrics(values, trades, initial_capital, '1m', df.index[0], df.index[-1], total_commission)
+    return values, trades, metrics
+
+
+def run_arrays(service, df, signals, params, strategy_config, initial_capital=10000.0):
+    """新引擎：NumPy 数组模拟"""
+    leverage, direction, commission, slippage = params
+    equity, trades, total_commission = service._simulate_trading(
+        df, signals, initial_capital, commission, slippage, leverage, direction, strategy_config
+    )
+    metrics = service._calculate_metrics(equity, trades, initial_capital, '1m', df.index[0], df.index[-1], total_commission)
+    return equity.tolist(), trades, metrics
+
+
+def test_engine_parity():
+    """所有配置组合下两种引擎的输出完全一致"""
+    service = BacktestService()
+    df = generate_test_df()
+    signals = generate_test_signals(df)
+
+    for strategy_config in STRATEGY_CONFIGS:
+        for params in MARKET_PARAMS:
+            legacy_values, legacy_trades, legacy_metrics = run_legacy(service, df, signals, params, strategy_config)
+            values, trades, metrics = run_arrays(service, df, signals, params, strategy_config)
+
+            label = f"config={strategy_config}, params={params}"
+            assert values == legacy_values, f"权益曲线不一致: {label}"
+            assert trades == legacy_trades, f"交易记录不一致: {label}"
+            assert metrics == legacy_metrics, f"回测指标不一致: {label}"
+
+
+def test_sweep_workers_parity():
+    """参数扫描：进程池（共享内存）与单进程逐个执行的排名结果完全一致"""
+    service = BacktestService()
+    df = generate_test_df(count=2000)
+    signals = generate_test_signals(df)
+    # 不拉真实K线、不执行指标代码
+    service._fetch_kline_data = lambda *args, **kwargs: df
+    service._execute_indicator = lambda *args, **kwargs: signals
+    param_grid = {'risk.stopLossPct': [0.02, 0.05], 'risk.trailing.enabled': [True, False],
+                  'risk.trailing.pct': [0.02, 0.03]}
+
+    def sweep(workers):
+        return service.run_sweep('', 'Crypto', 'BTC/USDT', '1m', df.index[0].to_pydatetime(),
+                                 df.index[-1].to_pydatetime(), param_grid, leverage=3, trade_direction='both',
+                                 max_workers=workers)
+
+    serial = sweep(1)
+    parallel = sweep(2)
+    assert parallel['workers'] == 2 and serial['total'] == parallel['total'] == 8
+    assert parallel['results'] == serial['results'], '多进程扫描结果与单进程不一致'
+
+
+def wait_job(manager, job_id, predicate, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = manager.get_status(job_id, include_result=True)
+        if predicate(status):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"任务 {job_id} 状态未按预期变化: {manager.get_status(job_id)}")
+
+
+def test_sweep_job_progress_and_cancel():
+    """扫描作为后台任务执行：进度按参数组合计数、结果与直接调用一致；等待扫描名额时可取消"""
+    df = generate_test_df(count=1000)
+    signals = generate_test_signals(df)
+    manager = BacktestJobManager(max_workers=2, max_queue=4)
+    manager._service._fetch_kline_data = lambda *args, **kwargs: df
+    manager._service._execute_indicator = lambda *args, **kwargs: signals
+    param_grid = {'risk.stopLossPct': [0.02, 0.05], 'risk.trailing.enabled': [True, False]}
+    params = {
+        'kind': JOB_KIND_SWEEP, 'user_id': 1, 'indicator_id': None, 'indicator_code': '',
+        'market': 'Crypto', 'symbol': 'BTC/USDT', 'timeframe': '1m',
+        'start_date': df.index[0].to_pydatetime(), 'end_date': df.index[-1].to_pydatetime(),
+        'start_date_str': '2024-01-01', 'end_date_str': '2024-01-01',
+        'initial_capital': 10000.0, 'commission': 0.001, 'slippage': 0.0, 'leverage': 2,
+        'trade_direction': 'both', 'strategy_config': {}, 'param_grid': param_grid,
+        'sort_by': 'totalReturn', 'top_n': 10,
+    }
+    expected = manager._service.run_sweep(
+        '', 'Crypto', 'BTC/USDT', '1m', params['start_date'], params['end_date'], param_grid,
+        leverage=2, trade_direction='both', max_workers=1
+    )
+
+    job = manager.submit(params)
+    status = wait_job(manager, job.job_id, lambda st: st['status'] == JOB_SUCCESS)
+    assert status['kind'] == JOB_KIND_SWEEP and status['stage'] == 'sweep'
+    assert status['barsProcessed'] == status['barsTotal'] == 4
+    assert status['result']['results'] == expected['results']
+
+    # 占住唯一的扫描名额：新任务停在 sweep_wait，此时取消不会启动进程池
+    assert backtest_module.SWEEP_CONCURRENCY == 1
+    assert backtest_module._sweep_slots.acquire(timeout=5)
+    try:
+        job = manager.submit(params)
+        wait_job(manager, job.job_id, lambda st: st['stage'] == 'sweep_wait')
+        assert manager.cancel(job.job_id)
+        wait_job(manager, job.job_id, lambda st: st['status'] == JOB_CANCELLED)
+    finally:
+        backtest_module._sweep_slots.release()
+    print("  ✓ 扫描任务：进度按参数组合计数，等待扫描名额时可取消")
+
+
+def test_engine_speed():
+    """打印两种引擎在较长数据上的耗时对比"""
+    service = BacktestService()
+    df = generate_test_df(count=50000)
+    signals = generate_test_signals(df)
+    params = (5, 'both', 0.0005, 0.0)
+    strategy_config = {'risk': {'stopLossPct': 0.05, 'trailing': {'enabled': True, 'pct': 0.03}}}
+
+    t0 = time.perf_counter()
+    run_legacy(service, df, signals, params, strategy_config)
+    t1 = time.perf_counter()
+    run_arrays(service, df, signals, params, strategy_config)
+    t2 = time.perf_counter()
+    print(f"旧引擎: {t1 - t0:.2f}s, 数组引擎: {t2 - t1:.2f}s ({len(df)} 根K线)")
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('回测引擎一致性测试')
+    print('=' * 60)
+    started = datetime.now()
+    test_engine_parity()
+    print(f'✅ {len(STRATEGY_CONFIGS) * len(MARKET_PARAMS)} 组配置全部一致')
+    test_sweep_workers_parity()
+    print('✅ 参数扫描多进程结果与单进程一致')
+    test_sweep_job_progress_and_cancel()
+    test_engine_speed()
+    print(f'总耗时: {(datetime.now() - started).total_seconds():.1f}s')
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+交易所客户端池（ClientPool）测试
+
+只构造客户端、不发请求，验证：
+- 相同 (exchange_id, market_type, 凭证) 复用同一个客户端，字段别名（apiKey / api_key）视为相同；
+- 换凭证、换市场类型得到新的客户端；指纹里不出现明文密钥；
+- 空闲超时与数量上限按 LRU 淘汰，并关闭被淘汰客户端的 keep-alive session；
+- 多线程并发获取同一 key 只注册一个客户端。
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.live_trading.client_pool import ClientPool, client_key
+
+BINANCE = {'exchange_id': 'binance', 'api_key': 'key-1', 'secret_key': 'secret-1'}
+
+
+def test_reuse_and_keying():
+    pool = ClientPool(idle_sec=600, max_clients=16)
+    try:
+        a = pool.get(BINANCE, market_type='swap')
+        b = pool.get({'exchangeId': 'Binance', 'apiKey': 'key-1', 'secret': 'secret-1'}, market_type='swap')
+        assert a is b, '字段别名 / 大小写不同应复用同一客户端'
+        assert pool.get(dict(BINANCE, secret_key='secret-2'), market_type='swap') is not a
+        assert pool.get(BINANCE, market_type='spot') is not a
+        stats = pool.stats()
+        assert stats['clients'] == 3 and stats['hits'] == 1 and stats['created'] == 3, stats
+        assert stats['byExchange'] == {'binance:swap': 2, 'binance:spot': 1}, stats
+        key = client_key(BINANCE, 'swap')
+        assert 'secret-1' not in repr(key) and 'key-1' not in repr(key)
+    finally:
+        pool.clear()
+    print("  ✓ 相同凭证复用客户端，换凭证 / 市场类型新建，指纹不含明文")
+
+
+def test_idle_and_lru_eviction():
+    pool = ClientPool(idle_sec=600, max_clients=2)
+    try:
+        c1 = pool.get(dict(BINANCE, api_key='k1'))
+        c2 = pool.get(dict(BINANCE, api_key='k2'))
+        c1._get_session()  # 建立 keep-alive session
+        c1.last_used_at = time.time() - 5  # c1 最久未用
+        c3 = pool.get(dict(BINANCE, api_key='k3'))
+        assert pool.stats()['clients'] == 2 and pool.stats()['evicted'] == 1
+        assert c1._session is None, '被淘汰的客户端应关闭 session'
+        assert pool.get(dict(BINANCE, api_key='k2')) is c2 and pool.get(dict(BINANCE, api_key='k3')) is c3
+
+        c2.last_used_at = time.time() - 1000
+        assert pool.evict_idle() == 1
+        assert pool.get(dict(BINANCE, api_key='k2')) is not c2
+    finally:
+        pool.clear()
+    print("  ✓ 超过上限按 LRU 淘汰，空闲超时淘汰，淘汰时关闭 session")
+
+
+def test_concurrent_get_registers_one():
+    pool = ClientPool(idle_sec=600, max_clients=16)
+    got = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait(5)
+        got.append(pool.get(BINANCE))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        assert len(got) == 8 and all(c is got[0] for c in got)
+        stats = pool.stats()
+        assert stats['clients'] == 1 and stats['created'] == 1 and stats['hits'] == 7, stats
+    finally:
+        pool.clear()
+    print("  ✓ 并发获取同一 key 只注册一个客户端")
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('交易所客户端池测试')
+    print('=' * 60)
+    test_reuse_and_keying()
+    test_idle_and_lru_eviction()
+    test_concurrent_get_registers_one()
+    print('✅ 全部通过')
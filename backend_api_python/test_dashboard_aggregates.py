@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+仪表盘聚合表一致性测试
+
+在临时库上通过写队列逐笔写入成交并增量维护 qd_pnl_daily / qd_pnl_hourly / qd_pnl_strategy，
+再用 rebuild_aggregates() 从明细全量重建，两者必须完全一致；总盈亏与按时间顺序计算的最大回撤也要与明细吻合。
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ['SQLITE_DATABASE_FILE'] = os.path.join(tempfile.mkdtemp(), 'agg.db')
+
+from app.services.db_write_queue import get_db_write_queue
+from app.services.trade_aggregates import rebuild_aggregates, record_trade_aggregates
+from app.utils.db import get_db_connection
+
+TABLES = (("qd_pnl_daily", "strategy_id, day"), ("qd_pnl_hourly", "hour"), ("qd_pnl_strategy", "strategy_id"))
+
+
+def dump():
+    out = {}
+    with get_db_connection() as db:
+        cur = db.cursor()
+        for table, order in TABLES:
+            cur.execute(f"SELECT * FROM {table} ORDER BY {order}")
+            out[table] = [
+                {k: (round(v, 6) if isinstance(v, float) else v) for k, v in r.items() if k != 'updated_at'}
+                for r in cur.fetchall()
+            ]
+        cur.close()
+    return out
+
+
+def test_incremental_matches_rebuild():
+    q = get_db_write_queue()
+    rng = random.Random(7)
+    base = int(time.time()) - 86400 * 60
+    trades = []
+    for i in range(800):
+        sid = rng.randint(1, 4)
+        ts = base + i * 6000
+        profit = None if i % 9 == 0 else round(rng.uniform(-40, 50), 2)
+        q.insert(
+            "INSERT INTO qd_strategy_trades (strategy_id, symbol, type, price, amount, value, profit, created_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            (sid, 'BTC/USDT', 'close_long', 1.0, 1.0, 1.0, profit, ts),
+        )
+        record_trade_aggregates(sid, profit, ts)
+        trades.append(profit or 0.0)
+    assert q.flush()
+
+    incremental = dump()
+    result = rebuild_aggregates()
+    rebuilt = dump()
+    for table, _ in TABLES:
+        assert incremental[table] == rebuilt[table], table
+    assert result['trades'] == 800
+
+    cum = peak = mdd = 0.0
+    for p in trades:
+        cum += p
+        peak = max(peak, cum)
+        mdd = max(mdd, peak - cum)
+    overall = [r for r in rebuilt['qd_pnl_strategy'] if r['strategy_id'] == 0][0]
+    assert abs(overall['pnl'] - cum) < 1e-6 and abs(overall['max_drawdown'] - mdd) < 1e-6, overall
+    print(f"  ✓ 增量聚合与全量重建一致: {result['rows']}，总盈亏 {cum:.2f}，最大回撤 {mdd:.2f}")
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('仪表盘聚合表一致性测试')
+    print('=' * 60)
+    test_incremental_matches_rebuild()
+    print('✅ 全部通过')
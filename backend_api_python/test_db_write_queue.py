@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SQLite 写队列（DbWriteQueue）测试
+
+使用临时库文件（db_path 参数）验证：
+- insert 按入队顺序落库；
+- 同 key 的 upsert 合并（后写覆盖），并移到队尾，仍排在其间入队的写入之后；
+- wait=True 的写入从不合并；
+- 批量失败时逐条重放：坏行不影响其它行，wait=True 的坏行把异常抛回调用方；
+- flush 返回时之前入队的写入都已提交；关闭队列时退回同步写入。
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.db_write_queue import DbWriteQueue
+
+INSERT_SQL = "INSERT INTO log (tag, val) VALUES (%s, %s)"
+
+
+def make_db():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE log (id INTEGER PRIMARY KEY AUTOINCREMENT, tag TEXT NOT NULL, val INTEGER)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def read_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [(tag, val) for tag, val in conn.execute("SELECT tag, val FROM log ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_insert_order_and_upsert_coalescing():
+    path = make_db()
+    q = DbWriteQueue(flush_ms=200, enabled=True)
+    try:
+        q.insert(INSERT_SQL, ('a', 1), db_path=path)
+        q.upsert('price', INSERT_SQL, ('p', 1), db_path=path)
+        q.insert(INSERT_SQL, ('b', 2), db_path=path)
+        q.upsert('price', INSERT_SQL, ('p', 2), db_path=path)
+        q.upsert('price', INSERT_SQL, ('p', 3), db_path=path)
+        q.insert(INSERT_SQL, ('c', 3), db_path=path)
+        assert q.flush(5)
+        # 只保留最后一次 upsert，且位置在最后一次入队时刻
+        assert read_rows(path) == [('a', 1), ('b', 2), ('p', 3), ('c', 3)], read_rows(path)
+        stats = q.stats()
+        assert stats['coalesced'] == 2 and stats['written'] == 4 and stats['pending'] == 0, stats
+    finally:
+        q.stop()
+        os.remove(path)
+    print("  ✓ insert 按序落库，同 key upsert 后写覆盖并移到队尾")
+
+
+def test_wait_never_coalesces():
+    path = make_db()
+    q = DbWriteQueue(flush_ms=200, enabled=True)
+    try:
+        q.upsert('k', INSERT_SQL, ('k', 1), db_path=path)
+        q.upsert('k', INSERT_SQL, ('k', 2), wait=True, db_path=path)
+        # wait=True 返回即已提交
+        assert read_rows(path) == [('k', 1), ('k', 2)], read_rows(path)
+        assert q.stats()['coalesced'] == 0
+    finally:
+        q.stop()
+        os.remove(path)
+    print("  ✓ wait=True 的写入不参与合并，返回时已提交")
+
+
+def test_failed_batch_replay():
+    path = make_db()
+    q = DbWriteQueue(flush_ms=200, enabled=True)
+    try:
+        q.insert(INSERT_SQL, ('a', 1), db_path=path)
+        q.insert(INSERT_SQL, (None, 2), db_path=path)  # 违反 NOT NULL，且不等待：只记失败
+        q.insert(INSERT_SQL, ('b', 3), db_path=path)
+        raised = None
+        try:
+            q.insert(INSERT_SQL, (None, 4), wait=True, db_path=path)
+        except sqlite3.IntegrityError as e:
+            raised = e
+        assert raised is not None, 'wait=True 的失败写入应抛回调用方'
+        assert q.flush(5)
+        assert read_rows(path) == [('a', 1), ('b', 3)], read_rows(path)
+        assert q.stats()['failed'] == 2
+    finally:
+        q.stop()
+        os.remove(path)
+    print("  ✓ 批量失败逐条重放：坏行不拖累其它行，wait=True 的坏行抛出异常")
+
+
+def test_disabled_writes_inline():
+    path = make_db()
+    q = DbWriteQueue(enabled=False)
+    try:
+        q.upsert('k', INSERT_SQL, ('k', 1), db_path=path)
+        q.upsert('k', INSERT_SQL, ('k', 2), db_path=path)
+        assert read_rows(path) == [('k', 1), ('k', 2)]
+        assert q._thread is None and q.flush() is True
+        try:
+            q.insert(INSERT_SQL, (None, 3), db_path=path)
+            assert False, '同步写入失败应直接抛出'
+        except sqlite3.IntegrityError:
+            pass
+    finally:
+        q.stop()
+        os.remove(path)
+    print("  ✓ DB_WRITE_QUEUE_ENABLED=false 时同步写入")
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('SQLite 写队列测试')
+    print('=' * 60)
+    test_insert_order_and_upsert_coalescing()
+    test_wait_never_coalesces()
+    test_failed_batch_replay()
+    test_disabled_writes_inline()
+    print('✅ 全部通过')
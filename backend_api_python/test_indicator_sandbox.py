@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+指标脚本沙箱测试
+
+- IndicatorSandbox：共享内存往返（含时区索引、非数值列）、用户代码异常、死循环超时 kill、
+  超内存 kill、执行 max_runs 次后回收 worker；
+- /api/indicator/verifyCode 经由沙箱执行，死循环脚本按超时返回错误；
+- 实盘路径：收盘全量重算走沙箱，本进程内的增量 tick（整段脚本 / on_tick）死循环时被看门狗中断，
+  策略退回全量模式（之后由沙箱 kill）。
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('SQLITE_DATABASE_FILE', os.path.join(tempfile.mkdtemp(), 'sandbox_test.db'))
+os.environ.setdefault('KLINE_STORE_ENABLED', 'false')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from app.services.indicator_sandbox import (
+    IndicatorSandbox, SandboxCodeError, SandboxMemoryError, SandboxTimeoutError,
+)
+
+LOOP_CODE = "while True:\n    pass\n"
+
+
+def make_df(count=300, tf_sec=60, end=None):
+    """以当前周期为最后一根K线的 OHLCV（UTC 索引）"""
+    end = end if end is not None else int(time.time() // tf_sec) * tf_sec
+    index = pd.to_datetime(np.arange(end - (count - 1) * tf_sec, end + 1, tf_sec), unit='s', utc=True)
+    rng = np.random.default_rng(5)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.003, count)))
+    return pd.DataFrame({
+        'open': close * 0.999, 'high': close * 1.002, 'low': close * 0.998, 'close': close,
+        'volume': rng.uniform(1, 10, count),
+    }, index=index)
+
+
+def test_round_trip_and_code_errors():
+    sandbox = IndicatorSandbox(workers=1)
+    sandbox.start()
+    try:
+        df = make_df(50)
+        df['tag'] = ['a'] * len(df)  # 非数值列走 pickle
+        result = sandbox.run(
+            "df['sma'] = SMA(df['close'], 5)\n"
+            "n = len(df)\n"
+            "tz = str(df.index.tz)\n"
+            "output = {'last': float(df['close'].iloc[-1]), 'tags': sorted(set(df['tag']))}\n",
+            df, variables={'factor': 2},
+        )
+        assert result.env['n'] == 50 and result.env['tz'] == 'UTC' and result.env['factor'] == 2
+        assert result.df.index.equals(df.index)
+        assert np.allclose(result.df['close'], df['close'])
+        assert np.allclose(result.df['sma'], df['close'].rolling(5).mean(), equal_nan=True)
+        assert result.output == {'last': float(df['close'].iloc[-1]), 'tags': ['a']}
+
+        try:
+            sandbox.run("x = 1 / 0\n", df)
+            assert False, '应抛出 SandboxCodeError'
+        except SandboxCodeError as e:
+            assert e.error_type == 'ZeroDivisionError'
+        try:
+            sandbox.run("def f(:\n", df)
+            assert False, '应抛出 SandboxCodeError'
+        except SandboxCodeError as e:
+            assert e.error_type == 'SyntaxError' and e.lineno == 1
+        # 受限 builtins：不允许导入 os
+        try:
+            sandbox.run("import os\n", df)
+            assert False, '受限模式下 import os 应失败'
+        except SandboxCodeError:
+            pass
+        assert sandbox.stats()['codeErrors'] == 3 and sandbox.stats()['spawned'] == 1
+    finally:
+        sandbox.shutdown()
+    print("  ✓ 共享内存往返、用户代码异常、受限 builtins")
+
+
+def test_timeout_and_memory_kill():
+    sandbox = IndicatorSandbox(workers=1, max_rss_mb=300)
+    sandbox.start()
+    df = make_df(50)
+    try:
+        t0 = time.time()
+        try:
+            sandbox.run(LOOP_CODE, df, timeout=1.0)
+            assert False, '死循环应超时'
+        except SandboxTimeoutError:
+            pass
+        assert time.time() - t0 < 5
+        try:
+            sandbox.run("x = np.ones(80_000_000)\nwhile True:\n    pass\n", df, timeout=30.0)
+            assert False, '超内存应被 kill'
+        except SandboxMemoryError:
+            pass
+        # 被 kill 的 worker 已补充，后续执行正常
+        assert sandbox.run("output = 1\n", df).output == 1
+        stats = sandbox.stats()
+        assert stats['timeouts'] == 1 and stats['memoryKills'] == 1 and stats['spawned'] == 3, stats
+    finally:
+        sandbox.shutdown()
+    print("  ✓ 死循环超时 kill、超内存 kill，worker 自动补充")
+
+
+def test_recycle_after_max_runs():
+    sandbox = IndicatorSandbox(workers=1, max_runs=2)
+    sandbox.start()
+    df = make_df(20)
+    code = "import os\npid = os.getpid()\n"
+    try:
+        pids = [sandbox.run(code, df, allowed_modules=None).env['pid'] for _ in range(3)]
+        assert pids[0] == pids[1] != pids[2], pids
+        assert sandbox.stats()['recycled'] == 1
+    finally:
+        sandbox.shutdown()
+    print("  ✓ 执行 max_runs 次后回收 worker")
+
+
+def test_verify_code_route():
+    from flask import Flask
+    import app.routes.indicator as indicator_routes
+
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(indicator_routes.indicator_bp, url_prefix='/api/indicator')
+    client = flask_app.test_client()
+    old_timeout = indicator_routes.VERIFY_CODE_TIMEOUT_SEC
+    indicator_routes.VERIFY_CODE_TIMEOUT_SEC = 1
+    try:
+        ok = client.post('/api/indicator/verifyCode', json={
+            'code': "output = {'plots': [{'name': 'c', 'data': df['close'].tolist()}], 'signals': []}\n"
+        }).get_json()
+        assert ok['code'] == 1, ok
+        t0 = time.time()
+        res = client.post('/api/indicator/verifyCode', json={'code': LOOP_CODE}).get_json()
+        assert res['code'] == 0 and res['data']['type'] == 'SandboxTimeoutError', res
+        assert time.time() - t0 < 5
+        res = client.post('/api/indicator/verifyCode', json={'code': "def f(:\n"}).get_json()
+        assert res['data']['type'] == 'SyntaxError', res
+    finally:
+        indicator_routes.VERIFY_CODE_TIMEOUT_SEC = old_timeout
+    print("  ✓ verifyCode 经由沙箱执行，死循环按超时返回")
+
+
+def make_executor_runtime(code):
+    from app.services.strategy_scheduler import StrategyRuntime
+    from app.services.trading_executor import TradingExecutor
+
+    executor = TradingExecutor()
+    executor.indicator_timeout_sec = 1.0
+    executor.indicator_parity_check_ticks = 0
+    rt = StrategyRuntime(
+        strategy_id=1, strategy_name='s1', symbol='BTC/USDT', timeframe='1m', timeframe_seconds=60,
+        market_type='swap', leverage=1, trade_direction='long', initial_capital=1000.0,
+        indicator_code=code, trading_config={}, ai_model_config={}, execution_mode='signal',
+        notification_config={}, df=make_df(), pending_signals=[],
+    )
+    rt.incremental = True
+    return executor, rt
+
+
+def test_live_path_interrupts_runaway_script():
+    from app.utils.thread_deadline import DeadlineExceeded
+
+    inputs = {'initial_highest_price': 0.0, 'initial_position': 0, 'initial_avg_entry_price': 0.0,
+              'initial_position_count': 0, 'initial_last_add_price': 0.0}
+
+    # 1. 整段脚本的增量 tick：本进程内执行，超时被中断并退回全量模式
+    executor, rt = make_executor_runtime(
+        "df['buy'] = False\ndf['sell'] = False\n"
+        "if float(df['close'].iloc[-1]) > 1e6:\n    while True:\n        pass\n"
+    )
+    assert executor._evaluate_realtime(rt, 100.0, inputs) is not None
+    t0 = time.time()
+    try:
+        executor._evaluate_realtime(rt, 2e6, inputs)
+        assert False, '死循环的增量 tick 应被中断'
+    except DeadlineExceeded:
+        pass
+    assert time.time() - t0 < 5 and rt.incremental is False and rt.indicator_env is None
+
+    # 之后的 tick 走沙箱进程池：同样的死循环由沙箱 kill
+    from app.services.indicator_sandbox import get_indicator_sandbox
+    before = get_indicator_sandbox().stats()
+    t0 = time.time()
+    assert executor._evaluate_realtime(rt, 2e6, inputs) is None
+    assert time.time() - t0 < 5
+    after = get_indicator_sandbox().stats()
+    assert after['timeouts'] == before['timeouts'] + 1, (before, after)
+
+    # 2. on_tick：首个 tick 建立执行环境，on_tick 死循环同样被中断
+    executor, rt = make_executor_runtime(
+        "df['buy'] = False\ndf['sell'] = False\n"
+        "def on_tick(df, bar):\n    while True:\n        pass\n"
+    )
+    assert executor._evaluate_realtime(rt, 100.0, inputs) is not None
+    assert callable(rt.indicator_env.get('on_tick'))
+    t0 = time.time()
+    try:
+        executor._evaluate_realtime(rt, 101.0, inputs)
+        assert False, 'on_tick 死循环应被中断'
+    except DeadlineExceeded:
+        pass
+    assert time.time() - t0 < 5 and rt.incremental is False
+
+    # 3. 收盘全量重算走沙箱（不受增量模式影响）
+    executor, rt = make_executor_runtime("df['buy'] = False\ndf['sell'] = False\n")
+    before = get_indicator_sandbox().stats()['runs']
+    result = executor._execute_indicator_with_prices(rt.indicator_code, rt.df, {})
+    assert result is not None and get_indicator_sandbox().stats()['runs'] == before + 1
+    print("  ✓ 实盘增量 tick 死循环被中断并退回沙箱模式，收盘全量重算走沙箱")
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('指标脚本沙箱测试')
+    print('=' * 60)
+    test_round_trip_and_code_errors()
+    test_timeout_and_memory_kill()
+    test_recycle_after_max_runs()
+    test_verify_code_route()
+    test_live_path_interrupts_runaway_script()
+    print('✅ 全部通过')
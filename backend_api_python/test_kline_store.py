@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地K线存储（KlineStore）测试
+
+用假数据源（记录每次上游请求）和临时库文件验证：
+- 冷启动整段拉取并登记覆盖区间，重复请求不再访问上游；
+- 尾部缺口只拉取缺少的几根，并与已有覆盖区间合并；
+- 头部不足 limit 根时只向前补缺少部分，上游无更早数据后标记 head_complete，不再重复请求；
+- 不相邻的覆盖区间在补齐后合并为一个；
+- updated_at 只在 OHLCV 实际变化时推进（data_version 不因重复拉取而改变）。
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.data_sources.base import BaseDataSource
+from app.data_sources.kline_batch import KlineBatch
+from app.data_sources.kline_store import KlineStore
+
+TF = 3600
+KEY = ('Crypto', 'BTC/USDT', '1H')
+# 远离当前时间的整点，所有请求的K线都已稳定
+T = (int(time.time()) // TF - 2000) * TF
+
+
+class FakeSource(BaseDataSource):
+    name = 'fake'
+
+    def __init__(self, first_time, last_time):
+        self.first_time = first_time
+        self.last_time = last_time
+        self.overrides = {}  # time -> close
+        self.calls = []
+
+    def bar(self, t):
+        close = self.overrides.get(t, 100.0 + (t - T) / TF)
+        return {'time': t, 'open': close - 0.5, 'high': close + 1, 'low': close - 1, 'close': close, 'volume': 10.0}
+
+    def get_kline(self, symbol, timeframe, limit, before_time=None):
+        self.calls.append((limit, before_time))
+        end = min(int(before_time), self.last_time + TF) if before_time else self.last_time + TF
+        times = list(range(self.first_time, end, TF))[-limit:]
+        return KlineBatch.from_records([self.bar(t) for t in times])
+
+    def expected(self, limit, before_time):
+        times = list(range(self.first_time, before_time, TF))[-limit:]
+        return [self.bar(t) for t in times]
+
+
+def make_store():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    return KlineStore(db_path=path, settle_bars=2), path
+
+
+def remove_store(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def as_list(batch):
+    return [{k: (int(v) if k == 'time' else float(v)) for k, v in row.items()} for row in batch]
+
+
+def test_cold_fetch_and_tail_gap():
+    store, path = make_store()
+    src = FakeSource(T - 1000 * TF, T + 500 * TF)
+    try:
+        got = store.get_kline(src, *KEY, 100, T)
+        assert as_list(got) == src.expected(100, T)
+        assert src.calls == [(100, T)], src.calls
+
+        # 重复请求：完全由本地提供
+        src.calls.clear()
+        assert as_list(store.get_kline(src, *KEY, 100, T)) == src.expected(100, T)
+        assert src.calls == [], src.calls
+
+        # 尾部缺口 10 根：只拉缺口（+ 稳定窗口余量），并与原区间合并
+        got = store.get_kline(src, *KEY, 100, T + 10 * TF)
+        assert as_list(got) == src.expected(100, T + 10 * TF)
+        assert src.calls == [(10 + 2 + 2, T + 10 * TF)], src.calls
+        coverage = store.stats(*KEY)['coverage']
+        assert coverage == [{'start': T - 100 * TF, 'end': T + 10 * TF, 'headComplete': False}], coverage
+    finally:
+        remove_store(path)
+    print("  ✓ 冷启动整段拉取，重复请求不访问上游，尾部缺口增量补齐")
+
+
+def test_head_extension_and_head_complete():
+    store, path = make_store()
+    src = FakeSource(T - 120 * TF, T + 500 * TF)  # 上游只有 T 之前 120 根
+    try:
+        store.get_kline(src, *KEY, 100, T)
+        src.calls.clear()
+
+        # 需要 150 根：向前补 T-100h 之前的部分，上游只剩 20 根
+        got = store.get_kline(src, *KEY, 150, T)
+        assert as_list(got) == src.expected(150, T) and len(got) == 120
+        assert src.calls == [(51, T - 100 * TF)], src.calls
+        assert store.stats(*KEY)['coverage'][0]['start'] == T - 120 * TF
+
+        # 再次请求：上游已无更早数据 -> 标记 head_complete
+        src.calls.clear()
+        assert len(store.get_kline(src, *KEY, 150, T)) == 120
+        assert src.calls == [(31, T - 120 * TF)], src.calls
+        assert store.stats(*KEY)['coverage'][0]['headComplete'] is True
+
+        # 之后不再向上游要更早的数据
+        src.calls.clear()
+        assert len(store.get_kline(src, *KEY, 150, T)) == 120
+        assert src.calls == [], src.calls
+    finally:
+        remove_store(path)
+    print("  ✓ 头部只补缺少部分，上游无更早数据后标记 head_complete")
+
+
+def test_interval_merging():
+    store, path = make_store()
+    src = FakeSource(T - 1000 * TF, T + 500 * TF)
+    try:
+        store.get_kline(src, *KEY, 20, T)
+        store.get_kline(src, *KEY, 20, T + 100 * TF)  # 缺口大于 limit：整段拉取，另起一个区间
+        coverage = store.stats(*KEY)['coverage']
+        assert [(c['start'], c['end']) for c in coverage] == [
+            (T - 20 * TF, T), (T + 80 * TF, T + 100 * TF)
+        ], coverage
+
+        # 第二个区间向前补 110 根，跨过并衔接第一个区间
+        got = store.get_kline(src, *KEY, 130, T + 100 * TF)
+        assert as_list(got) == src.expected(130, T + 100 * TF)
+        coverage = store.stats(*KEY)['coverage']
+        assert len(coverage) == 1 and coverage[0]['end'] == T + 100 * TF, coverage
+        assert coverage[0]['start'] <= T - 20 * TF
+        assert store.stats(*KEY)['bars'] == len(range(coverage[0]['start'], T + 100 * TF, TF))
+    finally:
+        remove_store(path)
+    print("  ✓ 不相邻的覆盖区间补齐后合并为一个")
+
+
+def test_updated_at_only_on_change():
+    store, path = make_store()
+    src = FakeSource(T - 1000 * TF, T + 500 * TF)
+    try:
+        store.get_kline(src, *KEY, 50, T)
+        v1 = store.data_version(*KEY, T - 50 * TF, T)
+        assert v1[0] == 50 and v1[1] > 0, v1
+
+        # 重复拉取相同数据：版本不变
+        with store._connect() as conn:
+            store._fetch_and_store(conn, src, KEY, 50, T, T)
+        assert store.data_version(*KEY, T - 50 * TF, T) == v1
+
+        # 上游修正其中一根K线：根数不变，updated_at 推进；其它区间的版本不受影响
+        other = store.data_version(*KEY, T - 50 * TF, T - 20 * TF)
+        src.overrides[T - 10 * TF] = 12345.0
+        with store._connect() as conn:
+            store._fetch_and_store(conn, src, KEY, 50, T, T)
+        v2 = store.data_version(*KEY, T - 50 * TF, T)
+        assert v2[0] == v1[0] and v2[1] > v1[1], (v1, v2)
+        assert store.data_version(*KEY, T - 50 * TF, T - 20 * TF) == other
+        got = store.get_kline(src, *KEY, 50, T)
+        assert float(got.close[-10]) == 12345.0
+    finally:
+        remove_store(path)
+    print("  ✓ updated_at 只在 OHLCV 变化时推进")
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('本地K线存储测试')
+    print('=' * 60)
+    test_cold_fetch_and_tail_gap()
+    test_head_extension_and_head_complete()
+    test_interval_merging()
+    test_updated_at_only_on_change()
+    print('✅ 全部通过')
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+挂单分发器（OrderDispatcher）测试
+
+用假的 handler 验证：
+- 同一 lane 内严格串行、按提交顺序执行；
+- 不同 lane 并行执行，慢 lane 不阻塞其它 lane；
+- 已在队列中的订单 id 不会重复入队，执行完成后从 queued_ids 移除；
+- handler 抛错只记入 errors，同 lane 的后续订单照常执行。
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.order_dispatcher import OrderDispatcher
+
+
+def wait_until(pred, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if pred():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_lane_order_and_serial():
+    lock = threading.Lock()
+    done = []
+    running = {}
+    overlaps = []
+
+    def handler(o):
+        lane = o['lane']
+        with lock:
+            running[lane] = running.get(lane, 0) + 1
+            if running[lane] > 1:
+                overlaps.append(lane)
+        time.sleep(0.002)
+        with lock:
+            done.append((lane, o['id']))
+            running[lane] -= 1
+
+    d = OrderDispatcher(handler, workers=4, name='test-dispatch')
+    try:
+        oid = 0
+        for i in range(20):
+            for lane in ('a', 'b', 'c'):
+                oid += 1
+                assert d.submit(lane, {'id': oid, 'lane': lane, 'seq': i})
+        assert wait_until(lambda: len(done) == 60)
+        for lane in ('a', 'b', 'c'):
+            ids = [i for l, i in done if l == lane]
+            assert ids == sorted(ids), (lane, ids)
+        assert not overlaps, overlaps
+        assert d.queued_ids() == [] and d.stats()['dispatched'] == 60
+    finally:
+        d.shutdown()
+    print("  ✓ 3 个 lane × 20 单：lane 内按提交顺序串行执行")
+
+
+def test_slow_lane_does_not_block_others():
+    release = threading.Event()
+    done = []
+
+    def handler(o):
+        if o['lane'] == 'slow':
+            release.wait(5)
+        done.append(o['id'])
+
+    d = OrderDispatcher(handler, workers=2, name='test-dispatch')
+    try:
+        d.submit('slow', {'id': 1, 'lane': 'slow'})
+        d.submit('slow', {'id': 2, 'lane': 'slow'})
+        for i in range(3, 13):
+            d.submit('fast', {'id': i, 'lane': 'fast'})
+        # 慢 lane 占住一个线程，快 lane 仍能在另一个线程上跑完
+        assert wait_until(lambda: len(done) == 10)
+        assert done == list(range(3, 13)), done
+        assert sorted(d.queued_ids()) == [1, 2]
+        release.set()
+        assert wait_until(lambda: len(done) == 12)
+        assert done[-2:] == [1, 2]
+    finally:
+        release.set()
+        d.shutdown()
+    print("  ✓ 慢 lane 不阻塞其它 lane")
+
+
+def test_duplicate_and_errors():
+    release = threading.Event()
+    done = []
+
+    def handler(o):
+        release.wait(5)
+        if o.get('boom'):
+            raise RuntimeError('boom')
+        done.append(o['id'])
+
+    d = OrderDispatcher(handler, workers=2, name='test-dispatch')
+    try:
+        assert d.submit('a', {'id': 1, 'boom': True})
+        assert d.submit('a', {'id': 2})
+        assert not d.submit('a', {'id': 2}), '已排队的订单 id 不应重复入队'
+        assert not d.submit('b', {'id': 1})
+        release.set()
+        assert wait_until(lambda: d.stats()['dispatched'] == 2)
+        assert done == [2] and d.stats()['errors'] == 1
+        # 执行完成后同一 id 可以再次入队（例如被重新置为 pending）
+        assert d.submit('a', {'id': 2})
+        assert wait_until(lambda: done == [2, 2])
+    finally:
+        release.set()
+        d.shutdown()
+    print("  ✓ 重复 id 被拒绝，handler 出错不影响同 lane 后续订单")
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('挂单分发器测试')
+    print('=' * 60)
+    test_lane_order_and_serial()
+    test_slow_lane_does_not_block_others()
+    test_duplicate_and_errors()
+    print('✅ 全部通过')
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+热点查询执行计划回归测试
+
+在临时库上执行建表 + 版本化迁移，写入一批数据并 ANALYZE，然后对 HOT_QUERIES 目录逐条执行
+EXPLAIN QUERY PLAN：任何一条退化为全表扫描（或没用上预期索引）即失败。
+新增热点查询时请同时把它加入 app/utils/db_migrations.py 的 HOT_QUERIES。
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.db import _init_db_schema
+from app.utils.db_migrations import HOT_QUERIES, MIGRATIONS, apply_migrations, check_query_plans, missing_indexes
+
+
+def build_db(path, rows=2000):
+    conn = sqlite3.connect(path)
+    _init_db_schema(conn)
+    for i in range(rows):
+        sid = i % 20 + 1
+        conn.execute(
+            "INSERT INTO pending_orders (strategy_id, symbol, signal_type, signal_ts, status, priority, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (sid, 'BTC/USDT', 'open_long', i, 'sent' if i % 10 else 'pending', i % 3, i),
+        )
+        conn.execute(
+            "INSERT INTO qd_strategy_trades (strategy_id, symbol, type, price, amount, value, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (sid, 'BTC/USDT', 'open_long', 100.0, 1.0, 100.0, i),
+        )
+        conn.execute(
+            "INSERT INTO qd_strategy_notifications (strategy_id, symbol, signal_type, created_at) VALUES (?, ?, ?, ?)",
+            (sid, 'BTC/USDT', 'open_long', i),
+        )
+        conn.execute(
+            "INSERT INTO qd_backtest_runs (user_id, market, symbol, timeframe, start_date, end_date, cache_key, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (sid % 3 + 1, 'Crypto', 'BTC/USDT', '1h', '2024-01-01', '2024-06-01', f'k{i}', i),
+        )
+    conn.commit()
+    conn.execute("ANALYZE")
+    return conn
+
+
+def report(results):
+    for r in results:
+        mark = '✓' if r['ok'] else '✗'
+        print(f"  {mark} {r['name']}: {' | '.join(r['plan'])}")
+        for p in r['problems']:
+            print(f"      -> {p}")
+
+
+def test_migrations_idempotent():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'plan.db')
+        conn = sqlite3.connect(path)
+        _init_db_schema(conn)
+        versions = [r[0] for r in conn.execute("SELECT version FROM qd_schema_migrations ORDER BY version")]
+        assert versions == [m.version for m in MIGRATIONS], versions
+        assert missing_indexes(conn) == []
+        assert apply_migrations(conn) == []
+        conn.close()
+    print(f"  ✓ 迁移版本 {versions}，重复执行无副作用")
+
+
+def test_hot_query_plans():
+    with tempfile.TemporaryDirectory() as d:
+        conn = build_db(os.path.join(d, 'plan.db'))
+        results = check_query_plans(conn)
+        report(results)
+        conn.close()
+    failed = [r['name'] for r in results if not r['ok']]
+    assert not failed, f"query plan regressions: {failed}"
+    print(f"  ✓ {len(HOT_QUERIES)} 条热点查询均走索引")
+
+
+def test_regression_detected():
+    """删除索引后必须能检测到全表扫描（确保 harness 本身有效）"""
+    with tempfile.TemporaryDirectory() as d:
+        conn = build_db(os.path.join(d, 'plan.db'), rows=200)
+        conn.execute("DROP INDEX idx_pending_orders_status_priority")
+        results = {r['name']: r for r in check_query_plans(conn)}
+        conn.close()
+    r = results['pending_orders.fetch_pending']
+    assert not r['ok'] and any(p.startswith('full scan') for p in r['problems']), r
+    print("  ✓ 删除索引后检测到回归: " + '; '.join(r['problems']))
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('热点查询执行计划回归测试')
+    print('=' * 60)
+    test_migrations_idempotent()
+    test_hot_query_plans()
+    test_regression_detected()
+    print('✅ 全部通过')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+交易所客户端限流器（RateLimiter）测试
+
+不发真实请求，直接调用 acquire/observe 验证：
+- 桶内有余量时立即放行，余量用尽后按补充速率排队等待；
+- 预计等待超过 LIVE_RATE_LIMIT_MAX_WAIT_SEC 时抛 LiveTradingError，且退还已预留的令牌；
+- 账户级规则按 API key 分桶，IP 级规则全进程共享；
+- 用量响应头修正本地估计，429 + Retry-After 暂停对应的桶。
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.live_trading.base import LiveTradingError
+from app.services.live_trading.rate_limit import RateLimiter
+
+
+def make_limiter(max_wait_sec=30.0):
+    limiter = RateLimiter()
+    limiter.enabled = True
+    limiter.safety = 1.0  # 按文档额度计算，便于断言
+    limiter.max_wait_sec = max_wait_sec
+    return limiter
+
+
+def test_waits_when_exhausted():
+    limiter = make_limiter()
+    # coinbase_exchange public: 10 次 / 1 秒
+    waits = [limiter.acquire('coinbase_exchange', 'GET', '/products') for _ in range(10)]
+    assert all(w == 0.0 for w in waits), waits
+    t0 = time.monotonic()
+    w = limiter.acquire('coinbase_exchange', 'GET', '/products')
+    elapsed = time.monotonic() - t0
+    assert 0.05 <= w <= 0.15 and elapsed >= w * 0.9, (w, elapsed)
+    stats = limiter.stats()['buckets']['coinbase_exchange:public']
+    assert stats['acquired'] == 11 and stats['delayed'] == 1, stats
+    # 未匹配任何规则的请求不限流
+    assert limiter.acquire('coinbase_exchange', 'GET', '/unknown') == 0.0
+    print(f"  ✓ 10 次立即放行，第 11 次排队 {w * 1000:.0f}ms")
+
+
+def test_raises_when_queue_too_long():
+    limiter = make_limiter(max_wait_sec=0.05)
+    for _ in range(10):
+        limiter.acquire('coinbase_exchange', 'GET', '/products')
+    before = limiter.stats()['buckets']['coinbase_exchange:public']['tokens']
+    try:
+        for _ in range(5):
+            limiter.acquire('coinbase_exchange', 'GET', '/products')
+        assert False, '等待超过上限时应抛 LiveTradingError'
+    except LiveTradingError as e:
+        assert 'Rate limit queue too long' in str(e)
+    after = limiter.stats()['buckets']['coinbase_exchange:public']['tokens']
+    # 失败的请求退还令牌：不会把桶越压越深
+    assert after >= before - 1.0, (before, after)
+    print("  ✓ 排队超过上限时抛出异常并退还令牌")
+
+
+def test_account_scope():
+    limiter = make_limiter(max_wait_sec=0.05)
+    # okx account: 每账户 10 次 / 2 秒
+    for _ in range(10):
+        limiter.acquire('okx', 'GET', '/api/v5/account/balance', account='a')
+    try:
+        limiter.acquire('okx', 'GET', '/api/v5/account/balance', account='a')
+        assert False, '账户 a 应已用尽额度'
+    except LiveTradingError:
+        pass
+    assert limiter.acquire('okx', 'GET', '/api/v5/account/balance', account='b') == 0.0
+    buckets = limiter.stats()['buckets']
+    assert 'okx:account:a' in buckets and 'okx:account:b' in buckets, list(buckets)
+    print("  ✓ 账户级规则按账户分桶")
+
+
+def test_observe_headers_and_429():
+    limiter = make_limiter()
+    limiter.acquire('binance_futures', 'GET', '/fapi/v1/ticker/price')
+    # 服务端报告本窗口已用 2390 权重：本地余量不高于 10
+    limiter.observe('binance_futures', 'GET', '/fapi/v1/ticker/price', '', 200, {'X-MBX-USED-WEIGHT-1M': '2390'})
+    assert limiter.stats()['buckets']['binance_futures:weight']['tokens'] <= 10.5
+
+    limiter.acquire('coinbase_exchange', 'GET', '/products')
+    limiter.observe('coinbase_exchange', 'GET', '/products', '', 429, {'Retry-After': '0.3'})
+    t0 = time.monotonic()
+    w = limiter.acquire('coinbase_exchange', 'GET', '/products')
+    assert w >= 0.25 and time.monotonic() - t0 >= 0.25, w
+    assert limiter.stats()['buckets']['coinbase_exchange:public']['throttled'] == 1
+    print(f"  ✓ 用量头修正余量，429 后暂停 {w * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('交易所客户端限流器测试')
+    print('=' * 60)
+    test_waits_when_exhausted()
+    test_raises_when_queue_too_long()
+    test_account_scope()
+    test_observe_headers_and_429()
+    print('✅ 全部通过')
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+策略调度器（时间轮 + K线收盘屏障）离线测试
+
+用假执行器替代交易所与指标计算，验证：
+- 同一币种的策略落在时间轮的同一个槽位，每个 tick 每个市场类型只取一次价格；
+- 同一币种的现货与合约策略各自按本市场价格评估，触发价位也只按本市场价格判断；
+- 收盘屏障每个K线边界只触发一次（同一 (symbol, timeframe) 只拉一次K线）；
+- _tick_symbol 在部分评估任务已提交后出错时，只释放未提交的策略，不会让同一策略被并发评估两次。
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.strategy_scheduler import StrategyRuntime, StrategyScheduler
+
+
+class FakeKlines:
+    def __init__(self, last_time):
+        self.time = [last_time - 1, last_time]
+
+    def __len__(self):
+        return len(self.time)
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.price_fetches = []
+        self.kline_fetches = []
+        self.evaluations = []
+        self.prices = {}  # market_type -> 价格，默认 100
+        self.hits = set()
+        self.kline_error_tf = set()  # 这些周期拉K线时抛错
+        self.release_eval = threading.Event()
+        self.release_eval.set()
+        self.running = {}
+        self.overlaps = 0
+        self.evaluated_prices = {}
+
+        executor = self
+
+        class Triggers:
+            def crossed(self, symbol, price):
+                return {sid: [] for sid in executor.hits}
+
+        self.trigger_index = Triggers()
+
+    def _fetch_current_price(self, exchange, symbol, market_type=None):
+        with self.lock:
+            self.price_fetches.append((symbol, market_type))
+        return self.prices.get(market_type, 100.0)
+
+    def _fetch_latest_kline(self, symbol, timeframe, limit=500, refresh=False):
+        with self.lock:
+            self.kline_fetches.append((symbol, timeframe))
+        if timeframe in self.kline_error_tf:
+            raise RuntimeError(f'kline boom {timeframe}')
+        return FakeKlines(int(time.time()))
+
+    def _strategy_tick(self, rt, current_price, now, klines=None, triggers_only=False):
+        with self.lock:
+            self.running[rt.strategy_id] = self.running.get(rt.strategy_id, 0) + 1
+            if self.running[rt.strategy_id] > 1:
+                self.overlaps += 1
+        try:
+            self.release_eval.wait(5)
+            if klines is not None:
+                rt.last_kline_update_time = time.time()
+            with self.lock:
+                self.evaluations.append((rt.strategy_id, triggers_only))
+                self.evaluated_prices[rt.strategy_id] = current_price
+        finally:
+            with self.lock:
+                self.running[rt.strategy_id] -= 1
+
+    def _console_print(self, msg):
+        pass
+
+    def _on_strategy_exit(self, strategy_id):
+        pass
+
+
+def make_runtime(sid, symbol='BTC/USDT', timeframe='1m', tf_seconds=60, stale=False, market_type='swap'):
+    rt = StrategyRuntime(
+        strategy_id=sid, strategy_name=f's{sid}', symbol=symbol, timeframe=timeframe,
+        timeframe_seconds=tf_seconds, market_type=market_type, leverage=1, trade_direction='long',
+        initial_capital=1000.0, indicator_code='', trading_config={}, ai_model_config={},
+        execution_mode='signal', notification_config={}, df=None, pending_signals=[],
+    )
+    if not stale:
+        # 刚刷新过K线：当前K线未到期
+        rt.last_kline_update_time = time.time()
+    else:
+        rt.last_kline_update_time = time.time() - 10 * tf_seconds
+    return rt
+
+
+def register(sched, rt, wheel=True):
+    with sched._lock:
+        sched._runtimes[rt.strategy_id] = rt
+        if wheel:
+            sched._wheel[sched._slot_of(rt.symbol)].setdefault(rt.symbol, set()).add(rt.strategy_id)
+
+
+def wait_until(pred, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if pred():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_wheel_groups_symbol():
+    ex = FakeExecutor()
+    sched = StrategyScheduler(ex, workers=4, tick_interval_sec=10)
+    sched._pool = ThreadPoolExecutor(max_workers=4)
+    try:
+        for sid, sym in [(1, 'BTC/USDT'), (2, 'BTC/USDT'), (3, 'BTC/USDT'), (4, 'ETH/USDT')]:
+            register(sched, make_runtime(sid, symbol=sym))
+        slot = sched._slot_of('BTC/USDT')
+        assert sched._wheel[slot]['BTC/USDT'] == {1, 2, 3}
+        assert 0 <= sched._slot_of('ETH/USDT') < sched.slots
+
+        sched._tick_symbol('BTC/USDT', [1, 2, 3], time.time())
+        assert wait_until(lambda: len(ex.evaluations) == 3)
+        assert ex.price_fetches == [('BTC/USDT', 'swap')], ex.price_fetches
+        assert ex.kline_fetches == []  # 无策略K线到期：不拉K线
+    finally:
+        sched._pool.shutdown(wait=True)
+    print(f"  ✓ 同币种 3 个策略同槽位 (slot={slot})，一次取价、三次评估")
+
+
+def test_prices_per_market_type():
+    ex = FakeExecutor()
+    ex.prices = {'swap': 100.0, 'spot': 90.0}
+    sched = StrategyScheduler(ex, workers=4, tick_interval_sec=10)
+    sched._pool = ThreadPoolExecutor(max_workers=4)
+    try:
+        register(sched, make_runtime(1, market_type='swap'))
+        register(sched, make_runtime(2, market_type='spot'))
+        register(sched, make_runtime(3, market_type='spot'))
+        # 策略 1、2 的价位都被穿越：只有本市场的策略算命中
+        ex.hits = {1, 2}
+        sched._tick_symbol('BTC/USDT', [1, 2, 3], time.time())
+        assert wait_until(lambda: len(ex.evaluations) == 3)
+        assert sorted(ex.price_fetches) == [('BTC/USDT', 'spot'), ('BTC/USDT', 'swap')], ex.price_fetches
+        assert ex.evaluated_prices == {1: 100.0, 2: 90.0, 3: 90.0}, ex.evaluated_prices
+        assert sched.stats()['triggerHits'] == 2
+
+        # on_price 指定市场类型时不评估其它市场的策略
+        ex.evaluations.clear()
+        assert sched.on_price('BTC/USDT', 95.0, market_type='spot') == 1
+        assert wait_until(lambda: len(ex.evaluations) == 1) and ex.evaluations[0][0] == 2
+    finally:
+        sched._pool.shutdown(wait=True)
+    print("  ✓ 同币种现货 / 合约策略各取一次本市场价格")
+
+
+def test_barrier_fires_once_per_boundary():
+    ex = FakeExecutor()
+    sched = StrategyScheduler(ex, workers=4, tick_interval_sec=10, candle_settle_sec=0.05)
+    boundaries = []
+    orig = sched._close_candle
+
+    def close_candle(symbol, timeframe, boundary, sids):
+        boundaries.append((symbol, timeframe, boundary))
+        orig(symbol, timeframe, boundary, sids)
+
+    sched._close_candle = close_candle
+    # 屏障只处理 _runtimes，不放进时间轮（避免槽位 tick 查库）
+    for sid in (1, 2):
+        register(sched, make_runtime(sid, timeframe='1s', tf_seconds=1, stale=True), wheel=False)
+    register(sched, make_runtime(3, symbol='ETH/USDT', timeframe='2s', tf_seconds=2, stale=True), wheel=False)
+    sched.start()
+    try:
+        time.sleep(4.3)
+    finally:
+        sched.stop()
+
+    btc = [b for s, tf, b in boundaries if s == 'BTC/USDT']
+    eth = [b for s, tf, b in boundaries if s == 'ETH/USDT']
+    assert len(btc) == len(set(btc)) and len(eth) == len(set(eth)), boundaries
+    assert len(btc) >= 3 and all(b2 - b1 == 1 for b1, b2 in zip(btc, btc[1:])), btc
+    assert eth and all(b % 2 == 0 for b in eth) and all(b2 - b1 == 2 for b1, b2 in zip(eth, eth[1:])), eth
+    # 每个边界每组只拉一次K线
+    assert ex.kline_fetches.count(('BTC/USDT', '1s')) == len(btc)
+    print(f"  ✓ 收盘屏障: 1s 组 {len(btc)} 个边界、2s 组 {len(eth)} 个边界，各触发一次")
+
+
+def test_tick_error_keeps_submitted_busy():
+    ex = FakeExecutor()
+    sched = StrategyScheduler(ex, workers=4, tick_interval_sec=10)
+    sched._pool = ThreadPoolExecutor(max_workers=4)
+    try:
+        first = make_runtime(1, timeframe='1m', tf_seconds=60, stale=True)    # 1m 组K线正常 -> 评估已提交
+        second = make_runtime(2, timeframe='5m', tf_seconds=300, stale=True)  # 5m 组拉K线出错
+        register(sched, first)
+        register(sched, second)
+        ex.kline_error_tf = {'5m'}
+        ex.release_eval.clear()  # 让已提交的评估停在执行中
+
+        sched._tick_symbol('BTC/USDT', [1, 2], time.time())
+        assert first.busy, '已提交评估的策略在出错路径中被错误释放'
+        assert not second.busy
+
+        # 再来一次 tick：仍在评估中的策略必须被跳过，而不是再评估一次
+        ex.kline_error_tf = set()
+        sched._tick_symbol('BTC/USDT', [1], time.time())
+        assert sched.stats()['skippedBusy'] == 1
+        ex.release_eval.set()
+        assert wait_until(lambda: not first.busy)
+        assert ex.overlaps == 0 and ex.evaluations == [(1, False)], ex.evaluations
+    finally:
+        ex.release_eval.set()
+        sched._pool.shutdown(wait=True)
+    print("  ✓ tick 出错只释放未提交的策略，已提交的不会被并发评估")
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('策略调度器离线测试')
+    print('=' * 60)
+    test_wheel_groups_symbol()
+    test_prices_per_market_type()
+    test_barrier_fires_once_per_boundary()
+    test_tick_error_keeps_submitted_busy()
+    print('✅ 全部通过')
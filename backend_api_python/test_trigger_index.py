@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+价格触发索引与持仓缓存测试
+
+- TriggerIndex.crossed 与逐个价位暴力判断的结果一致（含价格恰好等于价位的边界）；
+- 返回顺序：up 阶梯按价格升序，同价位按登记顺序；down 阶梯同理；
+- set_levels 整体替换、remove 移除、不同 symbol 互不影响；
+- PositionCache：加载期间发生 invalidate 时不缓存旧数据；upsert/remove 同步更新缓存行。
+"""
+import os
+import random
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.position_cache import PositionCache
+from app.services.trigger_index import (
+    DOWN, UP, KIND_SIGNAL, KIND_STOP_LOSS, KIND_TAKE_PROFIT, TriggerIndex, TriggerLevel,
+)
+
+
+def test_crossed_matches_bruteforce():
+    rng = random.Random(3)
+    idx = TriggerIndex()
+    all_levels = {}
+    for sid in range(1, 201):
+        levels = [
+            TriggerLevel(sid, 'BTC/USDT', round(rng.uniform(90, 110), 1), rng.choice((UP, DOWN)), KIND_SIGNAL)
+            for _ in range(rng.randint(1, 4))
+        ]
+        idx.set_levels(sid, 'BTC/USDT', levels)
+        all_levels[sid] = levels
+    checked = 0
+    for _ in range(300):
+        price = round(rng.uniform(88, 112), 1)
+        hits = idx.crossed('BTC/USDT', price)
+        expected = {}
+        for sid, levels in all_levels.items():
+            for lv in levels:
+                if lv.crossed(price):
+                    expected.setdefault(sid, set()).add(id(lv))
+        assert {sid: {id(lv) for lv in lvs} for sid, lvs in hits.items()} == expected, price
+        checked += 1
+    # 价格恰好等于价位：两个方向都算穿越
+    idx2 = TriggerIndex()
+    idx2.set_levels(1, 'X', [TriggerLevel(1, 'X', 100.0, UP, KIND_SIGNAL)])
+    idx2.set_levels(2, 'X', [TriggerLevel(2, 'X', 100.0, DOWN, KIND_SIGNAL)])
+    assert set(idx2.crossed('X', 100.0)) == {1, 2}
+    assert set(idx2.crossed('X', 100.1)) == {1} and set(idx2.crossed('X', 99.9)) == {2}
+    print(f"  ✓ {checked} 次随机价格与暴力判断一致，等于价位时触发")
+
+
+def test_crossed_ordering():
+    idx = TriggerIndex()
+    sl = TriggerLevel(1, 'BTC/USDT', 95.0, DOWN, KIND_STOP_LOSS)
+    tp_low = TriggerLevel(1, 'BTC/USDT', 105.0, UP, KIND_TAKE_PROFIT)
+    tp_high = TriggerLevel(1, 'BTC/USDT', 110.0, UP, KIND_TAKE_PROFIT)
+    idx.set_levels(1, 'BTC/USDT', [tp_high, sl, tp_low])
+    a = TriggerLevel(2, 'BTC/USDT', 105.0, UP, KIND_SIGNAL, {'type': 'first'})
+    b = TriggerLevel(2, 'BTC/USDT', 105.0, UP, KIND_SIGNAL, {'type': 'second'})
+    idx.set_levels(2, 'BTC/USDT', [a, b])
+
+    hits = idx.crossed('BTC/USDT', 120.0)
+    assert hits[1] == [tp_low, tp_high], hits[1]   # 价格升序
+    assert hits[2] == [a, b]                         # 同价位按登记顺序
+    assert idx.crossed('BTC/USDT', 90.0) == {1: [sl]}
+    assert idx.crossed('BTC/USDT', 100.0) == {}
+    print("  ✓ 穿越价位按价格升序返回，同价位保持登记顺序")
+
+
+def test_replace_and_remove():
+    idx = TriggerIndex()
+    idx.set_levels(1, 'BTC/USDT', [TriggerLevel(1, 'BTC/USDT', 100.0, UP, KIND_SIGNAL)])
+    idx.set_levels(2, 'ETH/USDT', [TriggerLevel(2, 'ETH/USDT', 100.0, UP, KIND_SIGNAL)])
+    # 整体替换：旧价位不再触发
+    idx.set_levels(1, 'BTC/USDT', [TriggerLevel(1, 'BTC/USDT', 200.0, UP, KIND_SIGNAL)])
+    assert idx.crossed('BTC/USDT', 150.0) == {}
+    assert set(idx.crossed('BTC/USDT', 200.0)) == {1}
+    assert set(idx.crossed('ETH/USDT', 150.0)) == {2}
+    idx.remove(1)
+    idx.set_levels(2, 'ETH/USDT', [])
+    assert idx.crossed('BTC/USDT', 1e9) == {} and idx.crossed('ETH/USDT', 1e9) == {}
+    stats = idx.stats()
+    assert stats['symbols'] == 0 and stats['levels'] == 0 and stats['strategies'] == 0, stats
+    print("  ✓ set_levels 整体替换、remove 后索引清空")
+
+
+def test_position_cache_invalidate_during_load():
+    cache = PositionCache(ttl_sec=60)
+    loading = threading.Event()
+    proceed = threading.Event()
+    old_rows = [{'symbol': 'BTC/USDT', 'side': 'long', 'size': 1.0}]
+    new_rows = [{'symbol': 'BTC/USDT', 'side': 'long', 'size': 2.0}]
+
+    def slow_loader(sid):
+        loading.set()
+        proceed.wait(5)
+        return old_rows
+
+    t = threading.Thread(target=lambda: cache.get(1, slow_loader))
+    t.start()
+    assert loading.wait(5)
+    cache.invalidate(1)  # 加载期间库已被修改
+    proceed.set()
+    t.join(5)
+    assert cache.get(1, lambda sid: new_rows)[0]['size'] == 2.0
+    assert cache.stats()['staleLoads'] == 1
+
+    # 命中缓存；upsert 更新已有行，remove 删除行
+    assert cache.get(1, lambda sid: 1 / 0)[0]['size'] == 2.0
+    cache.upsert(1, 'BTC/USDT', 'long', {'highest_price': 123.0})
+    assert cache.get(1, lambda sid: 1 / 0)[0]['highest_price'] == 123.0
+    cache.remove(1, 'BTC/USDT', 'long')
+    assert cache.get(1, lambda sid: 1 / 0) == []
+    print("  ✓ 持仓缓存：加载期间失效不会缓存旧数据，upsert/remove 同步更新")
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('价格触发索引与持仓缓存测试')
+    print('=' * 60)
+    test_crossed_matches_bruteforce()
+    test_crossed_ordering()
+    test_replace_and_remove()
+    test_position_cache_invalidate_during_load()
+    print('✅ 全部通过')
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+用户数据流（websocket 订单/成交推送）离线测试
+
+本地起一个模拟交易所：
+- HTTP：Binance listenKey 创建/续期、下单查询（REST 兜底，统计调用次数）
+- websocket：Binance /ws/<listenKey> 推送 ORDER_TRADE_UPDATE；OKX /ws/v5/private 处理 login/subscribe/ping 并推送 orders
+
+验证 wait_for_fill 在推送到达后立即返回、不再轮询 REST；未见过的订单和断线时退回 REST 轮询；断线后自动重连。
+"""
+import asyncio
+import http.server
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import websockets
+
+os.environ['LIVE_USER_STREAM_ENABLED'] = 'true'
+os.environ['LIVE_RATE_LIMIT_ENABLED'] = 'false'
+
+
+class MockExchange:
+    """REST + websocket mock for Binance futures and OKX private streams."""
+
+    LISTEN_KEY = 'mock-listen-key'
+
+    def __init__(self):
+        self.rest_calls = []
+        self.rest_orders = {}
+        self.connections = {}  # 'binance' / 'okx' -> ws
+        self.okx_logins = 0
+        self._loop = None
+        self._ready = threading.Event()
+
+        exchange = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self):
+                path = self.path.split('?')[0]
+                exchange.rest_calls.append((self.command, path))
+                if path == '/fapi/v1/listenKey':
+                    body = {'listenKey': exchange.LISTEN_KEY} if self.command == 'POST' else {}
+                elif path == '/fapi/v1/order':
+                    body = exchange.rest_orders.get('binance') or {'status': 'NEW', 'executedQty': '0', 'avgPrice': '0'}
+                else:
+                    body = {}
+                raw = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _reply
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.http = Server(('127.0.0.1', 0), Handler)
+        self.http_port = self.http.server_address[1]
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+        threading.Thread(target=self._run_ws, daemon=True).start()
+        self._ready.wait(5)
+
+    # ---- websocket side ----
+
+    def _run_ws(self):
+        asyncio.run(self._ws_main())
+
+    async def _ws_main(self):
+        self._loop = asyncio.get_running_loop()
+        async with websockets.serve(self._handler, '127.0.0.1', 0) as server:
+            self.ws_port = list(server.sockets)[0].getsockname()[1]
+            self._ready.set()
+            await asyncio.Future()
+
+    async def _handler(self, ws, path=None):
+        path = path or getattr(getattr(ws, 'request', None), 'path', '') or getattr(ws, 'path', '')
+        if path.startswith('/ws/v5/private'):
+            async for raw in ws:
+                if raw == 'ping':
+                    await ws.send('pong')
+                    continue
+                msg = json.loads(raw)
+                if msg.get('op') == 'login':
+                    self.okx_logins += 1
+                    await ws.send(json.dumps({'event': 'login', 'code': '0'}))
+                elif msg.get('op') == 'subscribe':
+                    self.connections['okx'] = ws
+                    await ws.send(json.dumps({'event': 'subscribe', 'arg': msg['args'][0]}))
+        elif path == f'/ws/{self.LISTEN_KEY}':
+            self.connections['binance'] = ws
+            await ws.wait_closed()
+
+    def push(self, venue, msg):
+        ws = self.connections[venue]
+        asyncio.run_coroutine_threadsafe(ws.send(json.dumps(msg)), self._loop).result(5)
+
+    def drop(self, venue):
+        ws = self.connections.pop(venue)
+        asyncio.run_coroutine_threadsafe(ws.close(), self._loop).result(5)
+
+    def order_queries(self):
+        return sum(1 for m, p in self.rest_calls if p in ('/fapi/v1/order', '/api/v5/trade/order') and m == 'GET')
+
+
+def binance_update(order_id, status, filled, avg, exec_type='TRADE', fee='0.01'):
+    return {'e': 'ORDER_TRADE_UPDATE', 'o': {
+        's': 'BTCUSDT', 'c': f'cid-{order_id}', 'i': order_id, 'X': status, 'x': exec_type,
+        'z': str(filled), 'ap': str(avg), 'n': fee, 'N': 'USDT',
+    }}
+
+
+def wait_until(pred, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if pred():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def _run_binance_stream(mock):
+    from app.services.live_trading.binance import BinanceFuturesClient
+    from app.services.live_trading.user_stream import ensure_user_stream
+
+    os.environ['LIVE_USER_STREAM_BINANCE_FUTURES_WS_URL'] = f'ws://127.0.0.1:{mock.ws_port}/ws'
+    client = BinanceFuturesClient(api_key='k', secret_key='s', base_url=f'http://127.0.0.1:{mock.http_port}')
+    stream = ensure_user_stream(client)
+    assert stream.wait_live(5), 'binance stream did not connect'
+    assert wait_until(lambda: 'binance' in mock.connections)
+
+    # 1) NEW then FILLED 0.2s later: wait_for_fill returns on the push, no REST order queries
+    mock.push('binance', binance_update(1001, 'NEW', 0, 0, exec_type='NEW', fee='0'))
+    threading.Timer(0.2, lambda: mock.push('binance', binance_update(1001, 'FILLED', 0.5, 30000.5))).start()
+    t0 = time.time()
+    q = client.wait_for_fill(symbol='BTC/USDT', order_id='1001', client_order_id='cid-1001', max_wait_sec=5)
+    took = time.time() - t0
+    assert q['source'] == 'stream' and q['status'] == 'FILLED' and q['filled'] == 0.5 and q['avg_price'] == 30000.5, q
+    assert took < 0.5, took
+    assert mock.order_queries() == 0
+    assert stream.table.get('1001')['fee'] == 0.01
+    print(f"  ✓ Binance 推送成交: {took * 1000:.0f}ms, REST 查询 0 次")
+
+    # 2) fill pushed before wait_for_fill starts (market order race), looked up by client order id
+    mock.push('binance', binance_update(1002, 'FILLED', 1.0, 30001))
+    assert wait_until(lambda: stream.table.get('1002') is not None)
+    q = client.wait_for_fill(symbol='BTC/USDT', order_id='', client_order_id='cid-1002', max_wait_sec=5)
+    assert q['source'] == 'stream' and q['filled'] == 1.0
+    print("  ✓ 先到的推送按 clientOrderId 命中")
+
+    # 3) order the stream never saw -> REST fallback after the grace period
+    mock.rest_orders['binance'] = {'status': 'FILLED', 'executedQty': '2', 'avgPrice': '29999'}
+    t0 = time.time()
+    q = client.wait_for_fill(symbol='BTC/USDT', order_id='999', client_order_id='', max_wait_sec=10)
+    assert 'source' not in q and q['filled'] == 2.0 and q['status'] == 'FILLED', q
+    assert time.time() - t0 < 4
+    print(f"  ✓ 未见过的订单 {time.time() - t0:.1f}s 后退回 REST")
+
+    # 4) disconnect -> reconnect with a fresh listenKey
+    mock.drop('binance')
+    assert wait_until(lambda: not stream.is_live() or stream.connects >= 2)
+    assert wait_until(lambda: stream.is_live() and stream.connects >= 2, timeout=8), stream.stats()
+    creates = sum(1 for m, p in mock.rest_calls if p == '/fapi/v1/listenKey' and m == 'POST')
+    assert creates >= 2
+    print(f"  ✓ 断线重连 (connects={stream.connects}, listenKey 创建 {creates} 次)")
+
+
+def _run_okx_stream(mock):
+    from app.services.live_trading.okx import OkxClient
+    from app.services.live_trading.user_stream import ensure_user_stream
+
+    os.environ['LIVE_USER_STREAM_OKX_WS_URL'] = f'ws://127.0.0.1:{mock.ws_port}/ws/v5/private'
+    client = OkxClient(api_key='k', secret_key='s', passphrase='p', base_url=f'http://127.0.0.1:{mock.http_port}')
+    stream = ensure_user_stream(client)
+    assert stream.wait_live(5), 'okx stream did not connect'
+    assert mock.okx_logins == 1
+
+    def push(state, acc, avg, fee):
+        mock.push('okx', {'arg': {'channel': 'orders', 'instType': 'ANY'}, 'data': [{
+            'instId': 'BTC-USDT', 'ordId': '77', 'clOrdId': 'c77', 'state': state,
+            'accFillSz': str(acc), 'avgPx': str(avg), 'fee': str(fee), 'feeCcy': 'USDT',
+        }]})
+
+    push('live', 0, 0, 0)
+    threading.Timer(0.15, lambda: push('filled', 0.3, 65000, -0.0195)).start()
+    before = len(mock.rest_calls)
+    t0 = time.time()
+    q = client.wait_for_fill(symbol='BTC/USDT', ord_id='77', cl_ord_id='c77', market_type='spot', max_wait_sec=5)
+    took = time.time() - t0
+    assert q['source'] == 'stream' and q['state'] == 'filled' and q['filled'] == 0.3, q
+    assert abs(q['fee'] - 0.0195) < 1e-12 and q['fee_ccy'] == 'USDT'
+    assert len(mock.rest_calls) == before, mock.rest_calls[before:]
+    print(f"  ✓ OKX 推送成交（含手续费）: {took * 1000:.0f}ms, REST 调用 0 次")
+
+
+_mock = None
+
+
+def _get_mock():
+    """模拟交易所在同一进程内共用（两个场景各自连接不同的 websocket 路径）"""
+    global _mock
+    if _mock is None:
+        _mock = MockExchange()
+    return _mock
+
+
+def test_binance_stream():
+    _run_binance_stream(_get_mock())
+
+
+def test_okx_stream():
+    _run_okx_stream(_get_mock())
+
+
+if __name__ == '__main__':
+    print('=' * 60)
+    print('用户数据流离线测试')
+    print('=' * 60)
+    test_binance_stream()
+    test_okx_stream()
+    from app.services.live_trading.user_stream import stop_user_streams, user_stream_stats
+    print(json.dumps(user_stream_stats(), ensure_ascii=False))
+    stop_user_streams()
+    print('✅ 全部通过')